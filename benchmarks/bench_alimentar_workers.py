@@ -0,0 +1,43 @@
+"""
+Benchmark alimentar con workers
+
+Mide transformar los renglones de la explotación en filas de nómina, como nominas alimentar --workers,
+con una hoja sintética en memoria y con 1, 2 y 4 procesos. La carga a la base de datos no se mide,
+siempre se hace en un solo lote desde el proceso principal.
+
+    python -m benchmarks.bench_alimentar_workers --filas 100000
+
+"""
+
+import time
+from datetime import date
+
+import click
+
+from benchmarks.bench_explotacion import HojaSintetica
+from cli.commands.explotacion import Explotacion, transformar_en_paralelo
+
+
+@click.command()
+@click.option("--filas", default=100000, type=int, help="Cantidad de filas en la hoja")
+@click.option("--workers", default="1,2,4", type=str, help="Cantidades de procesos separadas por comas")
+def cli(filas, workers):
+    """Comparar el tiempo para transformar los renglones con varios procesos"""
+    hoja = HojaSintetica(filas)
+    fecha_final = date(2024, 1, 15)
+
+    # Leer la hoja una sola vez, como lo hace el comando
+    inicio = time.perf_counter()
+    renglones = Explotacion(hoja).columnas_nominas()
+    click.echo(f"Leer {filas} filas de explotación: {time.perf_counter() - inicio:.3f} s")
+
+    # Transformar con cada cantidad de procesos
+    for procesos in (int(cantidad) for cantidad in workers.split(",")):
+        inicio = time.perf_counter()
+        cantidad = len(transformar_en_paralelo(renglones, fecha_final, procesos))
+        segundos = time.perf_counter() - inicio
+        click.echo(f"  workers {procesos:<3} {segundos:8.3f} s  {cantidad} filas")
+
+
+if __name__ == "__main__":
+    cli()
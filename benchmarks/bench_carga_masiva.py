@@ -0,0 +1,75 @@
+"""
+Benchmark carga masiva
+
+Compara las formas de insertar percepciones-deducciones, como lo hacen los comandos alimentar,
+con una base de datos SQLite temporal. En PostgreSQL la carga masiva usa COPY FROM STDIN.
+
+- objetos: agregar un objeto PercepcionDeduccion por renglón a la sesión y hacer commit
+- carga_masiva: juntar los renglones con CargaMasiva y mandarlos en lote
+
+    python -m benchmarks.bench_carga_masiva --filas 50000
+
+"""
+
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+MODOS = ["objetos", "carga_masiva"]
+
+
+@click.command()
+@click.option("--filas", default=50000, type=int, help="Cantidad de percepciones-deducciones")
+def cli(filas):
+    """Comparar el tiempo para insertar percepciones-deducciones"""
+
+    with tempfile.TemporaryDirectory() as directorio:
+        # Usar una base de datos SQLite temporal, se define antes de cargar la aplicación
+        os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{Path(directorio, 'bench.db')}"
+
+        # Cargar la aplicación, el contexto lo inicia el módulo common de los generadores
+        from pjecz_perseo_flask.blueprints.nominas.generators.common import database
+        from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
+        from pjecz_perseo_flask.lib.carga_masiva import CargaMasiva
+
+        # Crear las tablas
+        database.create_all()
+        sesion = database.session
+
+        click.echo(f"Insertar {filas} percepciones-deducciones")
+        for modo in MODOS:
+            # Vaciar la tabla y la sesión
+            sesion.execute(database.delete(PercepcionDeduccion))
+            sesion.commit()
+            sesion.expunge_all()
+
+            inicio = time.perf_counter()
+            carga = CargaMasiva(PercepcionDeduccion)
+            for numero in range(filas):
+                valores = {
+                    "centro_trabajo_id": 1,
+                    "concepto_id": numero % 40 + 1,
+                    "persona_id": numero // 10 + 1,
+                    "plaza_id": 1,
+                    "quincena_id": 1,
+                    "importe": 100 + numero % 7,
+                    "tipo": "SALARIO",
+                }
+                if modo == "objetos":
+                    sesion.add(PercepcionDeduccion(**valores))
+                else:
+                    carga.agregar(**valores)
+            carga.guardar()
+            sesion.commit()
+            segundos = time.perf_counter() - inicio
+
+            # Validar que se insertaron todos los renglones
+            insertados = sesion.execute(database.select(database.func.count()).select_from(PercepcionDeduccion)).scalar()
+            click.echo(f"  {modo:<12} {segundos:8.3f} s  {insertados} insertados")
+
+
+if __name__ == "__main__":
+    cli()
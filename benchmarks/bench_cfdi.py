@@ -0,0 +1,197 @@
+"""
+Benchmark CFDI
+
+Compara las formas de leer los XML de los CFDI de nómina, con archivos generados en un directorio temporal
+que tienen los nodos y el tamaño de los sellos de un CFDI 4.0 real.
+
+- iter: ET.parse y recorrer todo el árbol con root.iter comparando cada tag y atributo, en un diccionario, como antes
+- pull: leer_cfdi de lib/cfdi.py, con XMLPullParser por bloques, diccionarios por tag y CFDI inmutable
+
+También se mide cuanto pesa cada resultado con pickle, que es lo que leer_cfdis manda de cada proceso.
+
+    python -m benchmarks.bench_cfdi --cfdis 2000
+
+"""
+
+import pickle
+import random
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+import click
+
+from pjecz_perseo_flask.lib.cfdi import XML_TAG_CFD_PREFIX, XML_TAG_NOMINA_PREFIX, XML_TAG_TFD_PREFIX, leer_cfdi, leer_importe
+
+
+def crear_cfdi(numero: int, aleatorio: random.Random) -> str:
+    """Crear el XML de un CFDI de nómina con percepciones, deducciones y otros pagos al azar"""
+    sello = "".join(aleatorio.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/") for _ in range(344))
+    percepciones = "".join(
+        f'<nomina12:Percepcion TipoPercepcion="0{p:02d}" Clave="P{p:02d}" Concepto="PERCEPCION {p}" '
+        f'ImporteGravado="{aleatorio.randint(100, 90000)}.50" ImporteExento="0.00"/>'
+        for p in range(aleatorio.randint(5, 15))
+    )
+    deducciones = "".join(
+        f'<nomina12:Deduccion TipoDeduccion="0{d:02d}" Clave="D{d:02d}" Concepto="DEDUCCION {d}" '
+        f'Importe="{aleatorio.randint(10, 9000)}.25"/>'
+        for d in range(aleatorio.randint(3, 10))
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital"
+ xmlns:nomina12="http://www.sat.gob.mx/nomina12" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" Version="4.0"
+ Serie="N" Folio="{numero}" Fecha="2024-01-15T10:00:00" SubTotal="20000.00" Descuento="3000.00" Moneda="MXN"
+ Total="17000.00" TipoDeComprobante="N" Exportacion="01" MetodoPago="PUE" LugarExpedicion="25000"
+ Sello="{sello}" Certificado="{sello * 5}" NoCertificado="00001000000500000000">
+<cfdi:Emisor Rfc="EMI010101AAA" Nombre="EMISOR" RegimenFiscal="603"/>
+<cfdi:Receptor Rfc="RFC{numero:06d}XXX" Nombre="NOMBRE {numero}" DomicilioFiscalReceptor="25000"
+ RegimenFiscalReceptor="605" UsoCFDI="CN01"/>
+<cfdi:Conceptos><cfdi:Concepto ClaveProdServ="84111505" Cantidad="1" ClaveUnidad="ACT" Descripcion="Pago de nómina"
+ ValorUnitario="20000.00" Importe="20000.00" Descuento="3000.00" ObjetoImp="01"/></cfdi:Conceptos>
+<cfdi:Complemento>
+<tfd:TimbreFiscalDigital Version="1.1" UUID="{numero:08d}-0000-0000-0000-000000000000" FechaTimbrado="2024-01-17T14:19:16"
+ RfcProvCertif="SAT970701NN3" SelloCFD="{sello}" NoCertificadoSAT="00001000000500000001" SelloSAT="{sello}"/>
+<nomina12:Nomina Version="1.2" TipoNomina="O" FechaPago="2024-01-15" FechaInicialPago="2024-01-01"
+ FechaFinalPago="2024-01-15" NumDiasPagados="15" TotalPercepciones="20000.00" TotalDeducciones="3000.00"
+ TotalOtrosPagos="0.01">
+<nomina12:Emisor RegistroPatronal="A0000000000"><nomina12:EntidadSNCF OrigenRecurso="IP"/></nomina12:Emisor>
+<nomina12:Receptor Curp="CURP{numero:014d}" NumSeguridadSocial="00000000000" FechaInicioRelLaboral="2010-01-01"
+ Antigüedad="P730W" TipoContrato="01" TipoJornada="01" TipoRegimen="02" NumEmpleado="{numero}" Departamento="D"
+ Puesto="P" RiesgoPuesto="1" PeriodicidadPago="04" SalarioDiarioIntegrado="1000.00" ClaveEntFed="COA"/>
+<nomina12:Percepciones TotalSueldos="20000.00" TotalGravado="20000.00" TotalExento="0.00">{percepciones}</nomina12:Percepciones>
+<nomina12:Deducciones TotalOtrasDeducciones="3000.00">{deducciones}</nomina12:Deducciones>
+<nomina12:OtrosPagos><nomina12:OtroPago TipoOtroPago="002" Clave="OP1" Concepto="SUBSIDIO" Importe="0.01">
+<nomina12:SubsidioAlEmpleo SubsidioCausado="0.00"/></nomina12:OtroPago></nomina12:OtrosPagos>
+</nomina12:Nomina>
+</cfdi:Complemento>
+</cfdi:Comprobante>
+"""
+
+
+def leer_fecha_strptime(texto: str):
+    """Convertir el texto a fecha como antes, con strptime"""
+    try:
+        return datetime.strptime(texto, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+CONCEPTOS_NODOS = {
+    f"{XML_TAG_NOMINA_PREFIX}Percepcion": ("PERCEPCION", "TipoPercepcion"),
+    f"{XML_TAG_NOMINA_PREFIX}Deduccion": ("DEDUCCION", "TipoDeduccion"),
+    f"{XML_TAG_NOMINA_PREFIX}OtroPago": ("OTRO PAGO", "TipoOtroPago"),
+}
+
+
+def leer_concepto_iter(element: ET.Element) -> dict:
+    """Leer un concepto como antes, en un diccionario"""
+    tipo, atributo_tipo = CONCEPTOS_NODOS[element.tag]
+    concepto = {
+        "tipo": tipo,
+        "tipo_sat": element.attrib.get(atributo_tipo, ""),
+        "clave": element.attrib.get("Clave", ""),
+        "concepto": element.attrib.get("Concepto", ""),
+        "importe_gravado": Decimal("0"),
+        "importe_exento": Decimal("0"),
+        "importe": Decimal("0"),
+    }
+    if tipo == "PERCEPCION":
+        concepto["importe_gravado"] = leer_importe(element.attrib.get("ImporteGravado", "0")) or Decimal("0")
+        concepto["importe_exento"] = leer_importe(element.attrib.get("ImporteExento", "0")) or Decimal("0")
+        concepto["importe"] = leer_importe(float(concepto["importe_gravado"]) + float(concepto["importe_exento"]))
+    else:
+        concepto["importe"] = leer_importe(element.attrib.get("Importe", "0")) or Decimal("0")
+    return concepto
+
+
+def leer_con_iter(ruta: Path) -> dict:
+    """Leer como antes, con ET.parse y root.iter, entrega un diccionario"""
+    root = ET.parse(ruta).getroot()
+    if root.tag != f"{XML_TAG_CFD_PREFIX}Comprobante":
+        return {"conceptos": []}
+    datos = {"conceptos": []}
+    for element in root.iter():
+        if element.tag == f"{XML_TAG_CFD_PREFIX}Emisor":
+            for atributo, llave in (
+                ("Rfc", "cfdi_emisor_rfc"),
+                ("Nombre", "cfdi_emisor_nombre"),
+                ("RegimenFiscal", "cfdi_emisor_regimen_fiscal"),
+            ):
+                if atributo in element.attrib:
+                    datos[llave] = element.attrib[atributo]
+        if element.tag == f"{XML_TAG_CFD_PREFIX}Receptor":
+            for atributo, llave in (("Rfc", "cfdi_receptor_rfc"), ("Nombre", "cfdi_receptor_nombre")):
+                if atributo in element.attrib:
+                    datos[llave] = element.attrib[atributo]
+        if element.tag == f"{XML_TAG_TFD_PREFIX}TimbreFiscalDigital":
+            for atributo, llave in (
+                ("Version", "tfd_version"),
+                ("UUID", "tfd_uuid"),
+                ("FechaTimbrado", "tfd_fecha_timbrado"),
+                ("SelloCFD", "tfd_sello_cfd"),
+                ("NoCertificadoSAT", "tfd_num_cert_sat"),
+                ("SelloSAT", "tfd_sello_sat"),
+            ):
+                if atributo in element.attrib:
+                    datos[llave] = element.attrib[atributo]
+        if element.tag == f"{XML_TAG_NOMINA_PREFIX}Nomina":
+            for atributo, llave in (("Version", "nomina12_nomina_version"), ("TipoNomina", "nomina12_nomina_tipo_nomina")):
+                if atributo in element.attrib:
+                    datos[llave] = element.attrib[atributo]
+            for atributo, llave in (
+                ("FechaPago", "nomina12_nomina_fecha_pago"),
+                ("FechaInicialPago", "nomina12_nomina_fecha_inicial_pago"),
+                ("FechaFinalPago", "nomina12_nomina_fecha_final_pago"),
+            ):
+                if atributo in element.attrib:
+                    datos[llave] = leer_fecha_strptime(element.attrib[atributo])
+            for atributo, llave in (
+                ("TotalPercepciones", "nomina12_nomina_total_percepciones"),
+                ("TotalDeducciones", "nomina12_nomina_total_deducciones"),
+                ("TotalOtrosPagos", "nomina12_nomina_total_otros_pagos"),
+            ):
+                if atributo in element.attrib:
+                    datos[llave] = leer_importe(element.attrib[atributo])
+        if element.tag in CONCEPTOS_NODOS:
+            datos["conceptos"].append(leer_concepto_iter(element))
+    return datos
+
+
+@click.command()
+@click.option("--cfdis", default=2000, type=int, help="Cantidad de archivos XML a generar")
+@click.option("--repeticiones", default=3, type=int, help="Veces que se lee el directorio, se toma la más rápida")
+def cli(cfdis, repeticiones):
+    """Comparar cuantos CFDI por segundo se leen con cada forma"""
+    aleatorio = random.Random(1)
+    with tempfile.TemporaryDirectory() as directorio:
+        # Generar los archivos XML
+        rutas = []
+        for numero in range(cfdis):
+            ruta = Path(directorio, f"{numero:06d}.xml")
+            ruta.write_text(crear_cfdi(numero, aleatorio), encoding="utf8")
+            rutas.append(ruta)
+        tamano = sum(ruta.stat().st_size for ruta in rutas) / cfdis
+        click.echo(f"Leer {cfdis} CFDI de {tamano / 1024:.1f} KiB en promedio, la mejor de {repeticiones} veces")
+
+        # Leer con cada forma
+        for modo, funcion in (("iter", leer_con_iter), ("pull", leer_cfdi)):
+            mejor = None
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                resultados = [funcion(ruta) for ruta in rutas]
+                segundos = time.perf_counter() - inicio
+                mejor = segundos if mejor is None else min(mejor, segundos)
+
+            # Contar los conceptos y medir lo que pesa cada resultado al mandarlo entre procesos, como en leer_cfdis
+            cantidad = sum(len(resultado["conceptos"] if modo == "iter" else resultado.conceptos) for resultado in resultados)
+            pesos = len(pickle.dumps(resultados)) / cfdis
+            click.echo(
+                f"  {modo:<6} {mejor:8.3f} s  {cfdis / mejor:8.0f} CFDI/s  {pesos / 1024:5.1f} KiB por resultado  {cantidad} conceptos"
+            )
+
+
+if __name__ == "__main__":
+    cli()
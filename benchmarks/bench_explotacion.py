@@ -0,0 +1,122 @@
+"""
+Benchmark explotación
+
+Compara las formas de leer la hoja de explotación, con una hoja sintética en memoria
+que tiene la misma interfaz que la de xlrd.
+
+- celdas: leer celda por celda con cell_value y recorrer los bloques de conceptos con while, como antes
+- explotacion: cargar la hoja una sola vez con Explotacion y sacar todo columna por columna
+
+    python -m benchmarks.bench_explotacion --filas 20000
+
+"""
+
+import random
+import time
+
+import click
+
+from cli.commands.explotacion import QUINQUENIOS, Explotacion
+from pjecz_perseo_flask.lib.safe_string import safe_clave, safe_string
+
+COLUMNAS = 242
+
+
+class HojaSintetica:
+    """Hoja con la interfaz de xlrd, los renglones tienen bloques de percepciones-deducciones al azar"""
+
+    def __init__(self, filas: int):
+        """Llenar los renglones, el primero es el de encabezados"""
+        aleatorio = random.Random(1)
+        self.renglones = [[""] * COLUMNAS]
+        for numero in range(filas):
+            renglon = [""] * COLUMNAS
+            renglon[1] = f"CT{numero % 50}"
+            renglon[2] = f"RFC{numero:06d}XX"
+            renglon[3] = f"APELLIDO APELLIDO NOMBRE {numero}"
+            renglon[8] = f"PZ{numero % 300}"
+            renglon[9] = float(numero % 9 + 1)
+            renglon[12], renglon[13], renglon[14] = 1000000.0, 100000.0, 900000.0
+            renglon[16], renglon[17], renglon[19] = 202401.0, 202401.0, 200001.0
+            renglon[20] = f"PU{numero % 40}"
+            renglon[236] = float(numero % 3 + 1)
+            renglon[240] = float(numero)
+            for bloque in range(aleatorio.randint(5, 25)):
+                renglon[26 + 6 * bloque] = aleatorio.choice("PD")
+                renglon[27 + 6 * bloque] = aleatorio.choice(["01", "07", "Q2", "ME", "62", "AZ"])
+                renglon[29 + 6 * bloque] = float(aleatorio.randint(100, 100000))
+            self.renglones.append(renglon)
+        self.nrows = len(self.renglones)
+        self.ncols = COLUMNAS
+
+    def cell_value(self, fila: int, columna: int):
+        """Entregar el valor de una celda"""
+        return self.renglones[fila][columna]
+
+    def row_values(self, fila: int) -> list:
+        """Entregar los valores de un renglón"""
+        return self.renglones[fila]
+
+
+def leer_celdas(hoja) -> int:
+    """Leer como antes, celda por celda, entrega la cantidad de percepciones-deducciones"""
+    cantidad = 0
+    for fila in range(1, hoja.nrows):
+        hoja.cell_value(fila, 1), hoja.cell_value(fila, 2), hoja.cell_value(fila, 3), hoja.cell_value(fila, 8)
+        int(hoja.cell_value(fila, 12)) / 100.0, int(hoja.cell_value(fila, 13)) / 100.0, int(hoja.cell_value(fila, 14)) / 100.0
+        str(int(hoja.cell_value(fila, 16))), str(int(hoja.cell_value(fila, 17))), str(int(hoja.cell_value(fila, 19)))
+        safe_clave(hoja.cell_value(fila, 20)), int(hoja.cell_value(fila, 9))
+        int(hoja.cell_value(fila, 236)), int(hoja.cell_value(fila, 240))
+        col_num = 26
+        while True:
+            p_o_d = safe_string(hoja.cell_value(fila, col_num))
+            conc = safe_string(hoja.cell_value(fila, col_num + 1))
+            if p_o_d == "" or (p_o_d == "P" and (conc == "ME" or conc in QUINQUENIOS)):
+                break
+            col_num += 6
+        col_num = 26
+        while True:
+            p_o_d = safe_string(hoja.cell_value(fila, col_num))
+            if p_o_d == "":
+                break
+            safe_string(hoja.cell_value(fila, col_num + 1))
+            int(hoja.cell_value(fila, col_num + 3)) / 100.0
+            cantidad += 1
+            col_num += 6
+            if col_num > 236:
+                break
+    return cantidad
+
+
+def leer_explotacion(hoja) -> int:
+    """Leer con Explotacion, entrega la cantidad de percepciones-deducciones"""
+    explotacion = Explotacion(hoja)
+    for columna in (1, 2, 3, 8):
+        explotacion.textos(columna)
+    for columna in (12, 13, 14):
+        explotacion.importes(columna)
+    for columna in (16, 17, 19):
+        explotacion.quincenas(columna)
+    explotacion.claves(20)
+    for columna in (9, 236, 240):
+        explotacion.enteros(columna)
+    explotacion.concepto_quinquenio()
+    explotacion.es_despensa()
+    return len(explotacion.conceptos)
+
+
+@click.command()
+@click.option("--filas", default=20000, type=int, help="Cantidad de filas en la hoja")
+def cli(filas):
+    """Comparar el tiempo para leer la hoja de explotación"""
+    hoja = HojaSintetica(filas)
+    click.echo(f"Leer {filas} filas de explotación")
+    for modo, funcion in (("celdas", leer_celdas), ("explotacion", leer_explotacion)):
+        inicio = time.perf_counter()
+        cantidad = funcion(hoja)
+        segundos = time.perf_counter() - inicio
+        click.echo(f"  {modo:<12} {segundos:8.3f} s  {cantidad} percepciones-deducciones")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,101 @@
+"""
+Benchmark números de cheque
+
+Compara las formas de fijar los números de cheque en las nóminas,
+con una base de datos SQLite temporal llena de nóminas sintéticas.
+
+- objetos: cambiar num_cheque en cada objeto Nomina y hacer commit, el ORM manda un UPDATE por renglón
+- renglon: ejecutar un UPDATE por cada nómina
+- executemany: juntar los pares id y num_cheque y fijarlos con una sola sentencia
+
+    python -m benchmarks.bench_num_cheque --filas 20000
+
+"""
+
+import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import click
+
+MODOS = ["objetos", "renglon", "executemany"]
+
+
+def llenar_nominas(database, Nomina, filas: int) -> list:
+    """Insertar nóminas sintéticas, entrega sus ids"""
+    database.session.execute(
+        Nomina.__table__.insert(),
+        [
+            {
+                "centro_trabajo_id": 1,
+                "persona_id": numero + 1,
+                "plaza_id": 1,
+                "quincena_id": 1,
+                "tipo": "SALARIO",
+                "desde": date(2024, 1, 1),
+                "desde_clave": "240101",
+                "hasta": date(2024, 1, 15),
+                "hasta_clave": "240115",
+                "percepcion": 100,
+                "deduccion": 10,
+                "importe": 90,
+                "fecha_pago": date(2024, 1, 15),
+            }
+            for numero in range(filas)
+        ],
+    )
+    database.session.commit()
+    return list(database.session.execute(database.select(Nomina.id).order_by(Nomina.id)).scalars())
+
+
+@click.command()
+@click.option("--filas", default=20000, type=int, help="Cantidad de nóminas")
+def cli(filas):
+    """Comparar el tiempo para fijar los números de cheque"""
+
+    with tempfile.TemporaryDirectory() as directorio:
+        # Usar una base de datos SQLite temporal, se define antes de cargar la aplicación
+        os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{Path(directorio, 'bench.db')}"
+
+        # Cargar la aplicación, el contexto lo inicia el módulo common de los generadores
+        from pjecz_perseo_flask.blueprints.nominas.generators.common import database, fijar_nums_cheques
+        from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+
+        # Crear las tablas y llenar las nóminas
+        database.create_all()
+        ids = llenar_nominas(database, Nomina, filas)
+        sesion = database.session
+
+        click.echo(f"Fijar {filas} números de cheque")
+        for modo in MODOS:
+            # Reiniciar los números de cheque y la sesión
+            sesion.execute(database.update(Nomina).values(num_cheque=""))
+            sesion.commit()
+            sesion.expunge_all()
+
+            # En el modo objetos las nóminas se cargan en la sesión, como en los generadores que usan el ORM
+            if modo == "objetos":
+                nominas = Nomina.query.order_by(Nomina.id).all()
+
+            inicio = time.perf_counter()
+            if modo == "objetos":
+                for numero, nomina in enumerate(nominas):
+                    nomina.num_cheque = f"01{numero:07}"
+                    sesion.add(nomina)
+            elif modo == "renglon":
+                for numero, nomina_id in enumerate(ids):
+                    sesion.execute(database.update(Nomina).where(Nomina.id == nomina_id).values(num_cheque=f"01{numero:07}"))
+            else:
+                fijar_nums_cheques([{"id": nomina_id, "num_cheque": f"01{numero:07}"} for numero, nomina_id in enumerate(ids)])
+            sesion.commit()
+            segundos = time.perf_counter() - inicio
+
+            # Validar que se fijaron todos los números de cheque
+            fijados = sesion.execute(database.select(database.func.count()).where(Nomina.num_cheque != "")).scalar()
+            click.echo(f"  {modo:<12} {segundos:8.3f} s  {fijados} fijados")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,110 @@
+"""
+Benchmark paginación
+
+Compara las formas de paginar el listado de nóminas, como lo pide DataTables,
+con una base de datos SQLite temporal llena de nóminas sintéticas repartidas en varias quincenas.
+
+- offset: ordenar por la clave de la quincena y saltar los renglones de las páginas anteriores, como antes
+- cursor: paginate_datatable de lib/datatables.py con el cursor del último renglón de la página anterior
+
+Se mide cuanto tarda una página a distintas profundidades del listado.
+
+    python -m benchmarks.bench_paginacion --filas 200000
+
+"""
+
+import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import click
+
+
+def llenar(database, Quincena, Nomina, filas: int, quincenas: int):
+    """Insertar quincenas y nóminas sintéticas, las nóminas se reparten entre las quincenas"""
+    database.session.execute(
+        Quincena.__table__.insert(),
+        [{"clave": f"{2000 + numero // 24}{numero % 24 + 1:02d}", "estado": "CERRADA"} for numero in range(quincenas)],
+    )
+    database.session.execute(
+        Nomina.__table__.insert(),
+        [
+            {
+                "centro_trabajo_id": 1,
+                "persona_id": numero + 1,
+                "plaza_id": 1,
+                "quincena_id": numero % quincenas + 1,
+                "tipo": "SALARIO",
+                "desde": date(2024, 1, 1),
+                "desde_clave": "240101",
+                "hasta": date(2024, 1, 15),
+                "hasta_clave": "240115",
+                "percepcion": 100,
+                "deduccion": 10,
+                "importe": 90,
+                "fecha_pago": date(2024, 1, 15),
+            }
+            for numero in range(filas)
+        ],
+    )
+    database.session.commit()
+
+
+@click.command()
+@click.option("--filas", default=200000, type=int, help="Cantidad de nóminas")
+@click.option("--quincenas", default=48, type=int, help="Cantidad de quincenas")
+@click.option("--renglones", default=25, type=int, help="Renglones por página")
+@click.option("--repeticiones", default=5, type=int, help="Veces que se pide cada página, se toma la más rápida")
+def cli(filas, quincenas, renglones, repeticiones):
+    """Comparar el tiempo para entregar una página a distintas profundidades"""
+
+    with tempfile.TemporaryDirectory() as directorio:
+        # Usar una base de datos SQLite temporal, se define antes de cargar la aplicación
+        os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{Path(directorio, 'bench.db')}"
+
+        # Cargar la aplicación
+        from pjecz_perseo_flask.blueprints.nominas.generators.common import database
+        from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+        from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
+        from pjecz_perseo_flask.lib.datatables import paginate_datatable
+
+        # Crear las tablas y llenar las quincenas y las nóminas
+        database.create_all()
+        llenar(database, Quincena, Nomina, filas, quincenas)
+        consulta = Nomina.query.join(Quincena).filter(Nomina.estatus == "A")
+        columnas = (Quincena.clave, Nomina.id)
+
+        click.echo(f"Entregar {renglones} de {filas} nóminas en {quincenas} quincenas, la mejor de {repeticiones} veces")
+        for profundidad in (0, filas // 10, filas // 2, filas - renglones):
+            # El cursor es el del último renglón de la página anterior, como lo manda DataTables al pedir la que sigue
+            cursor = None
+            if profundidad > 0:
+                anterior = consulta.add_columns(*columnas).order_by(*[columna.desc() for columna in columnas])
+                renglon = anterior.offset(profundidad - 1).limit(1).one()
+                cursor = list(renglon[1:])
+
+            # Pedir la página con cada forma
+            tiempos = {}
+            for modo in ("offset", "cursor"):
+                mejor = None
+                for _ in range(repeticiones):
+                    database.session.expunge_all()
+                    inicio = time.perf_counter()
+                    if modo == "offset":
+                        registros = consulta.order_by(Quincena.clave.desc()).offset(profundidad).limit(renglones).all()
+                    else:
+                        registros, _ = paginate_datatable(consulta, columnas, profundidad, renglones, cursor)
+                    segundos = time.perf_counter() - inicio
+                    mejor = segundos if mejor is None else min(mejor, segundos)
+                tiempos[modo] = mejor
+                if len(registros) != renglones:
+                    raise click.ClickException(f"La página en {profundidad} con {modo} tiene {len(registros)} renglones")
+            click.echo(
+                f"  renglón {profundidad:>9}  offset {tiempos['offset'] * 1000:8.2f} ms  cursor {tiempos['cursor'] * 1000:8.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    cli()
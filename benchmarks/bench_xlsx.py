@@ -0,0 +1,83 @@
+"""
+Benchmark XLSX
+
+Compara el libro XLSX en memoria contra el libro en modo de solo escritura,
+con un archivo sintético con las columnas de los timbrados.
+Cada modo se ejecuta en un proceso aparte para medir su memoria máxima (RSS).
+
+    python -m benchmarks.bench_xlsx --filas 50000
+
+"""
+
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import click
+from openpyxl import Workbook
+
+from pjecz_perseo_flask.lib.xlsx import iniciar_libro_xlsx
+
+MODOS = ["memoria", "streaming"]
+COLUMNAS_PARTE_1 = 42  # Columnas de datos de la persona en los timbrados
+COLUMNAS_CONCEPTOS = 60  # Columnas de percepciones y deducciones
+COLUMNAS_PARTE_3 = 7  # Columnas finales
+
+
+def elaborar_fila(numero: int) -> list:
+    """Elaborar una fila sintética parecida a las de los timbrados"""
+    parte_1 = [numero, f"RFC{numero:010d}", "APELLIDO", "APELLIDO", "NOMBRES", "CURP", "NSS", "2024-01-01"]
+    parte_1 += [f"DATO {columna}" for columna in range(COLUMNAS_PARTE_1 - len(parte_1))]
+    parte_2 = [Decimal(numero % 1000) + Decimal("0.25") * columna for columna in range(COLUMNAS_CONCEPTOS)]
+    parte_3 = ["IP", "100", "00000", 1, "", "PLAZA", 0]
+    return parte_1 + parte_2 + parte_3
+
+
+def escribir(modo: str, filas: int, ruta: str) -> None:
+    """Escribir el archivo XLSX en el modo dado"""
+    encabezados = [f"COLUMNA {columna}" for columna in range(COLUMNAS_PARTE_1 + COLUMNAS_CONCEPTOS + COLUMNAS_PARTE_3)]
+    if modo == "memoria":
+        libro = Workbook()
+        hoja = libro.active
+        hoja.append(encabezados)
+    else:
+        libro, hoja = iniciar_libro_xlsx(encabezados)
+    for numero in range(filas):
+        hoja.append(elaborar_fila(numero))
+    libro.save(ruta)
+
+
+@click.command()
+@click.option("--filas", default=50000, type=int, help="Cantidad de filas")
+@click.option("--modo", default="", type=click.Choice([""] + MODOS), help="Ejecutar solo un modo (uso interno)")
+def cli(filas, modo):
+    """Comparar memoria máxima y tiempo al escribir un XLSX"""
+
+    # Si se da el modo, ejecutarlo en este proceso y entregar segundos y memoria máxima en KB
+    if modo != "":
+        with tempfile.TemporaryDirectory() as directorio:
+            inicio = time.perf_counter()
+            escribir(modo, filas, str(Path(directorio, f"{modo}.xlsx")))
+            segundos = time.perf_counter() - inicio
+        click.echo(f"{segundos} {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}")
+        return
+
+    # Ejecutar cada modo en un proceso aparte
+    click.echo(f"Escribir {filas} filas de {COLUMNAS_PARTE_1 + COLUMNAS_CONCEPTOS + COLUMNAS_PARTE_3} columnas")
+    for cada_modo in MODOS:
+        salida = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_xlsx", "--filas", str(filas), "--modo", cada_modo],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        segundos, maxrss_kb = salida.stdout.split()
+        click.echo(f"  {cada_modo:<10} {float(segundos):8.2f} s  {int(maxrss_kb) / 1024:8.1f} MB RSS máximo")
+
+
+if __name__ == "__main__":
+    cli()
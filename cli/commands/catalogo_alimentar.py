@@ -0,0 +1,58 @@
+"""
+Catálogo para alimentar
+
+Carga una sola vez en diccionarios los centros de trabajo, conceptos, plazas y puestos por su clave,
+las personas por su RFC y los tabuladores por puesto, modelo, nivel y quinquenio,
+así cada fila de la explotación se resuelve sin consultar la base de datos
+
+Los registros nuevos se agregan a la sesión sin hacer commit,
+se insertan en lote cuando el comando hace el commit al final
+"""
+
+from sqlalchemy import select
+
+from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
+from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
+from pjecz_perseo_flask.blueprints.personas.models import Persona
+from pjecz_perseo_flask.blueprints.plazas.models import Plaza
+from pjecz_perseo_flask.blueprints.puestos.models import Puesto
+from pjecz_perseo_flask.blueprints.tabuladores.models import Tabulador
+from pjecz_perseo_flask.config.extensions import database
+
+
+class CatalogoAlimentar:
+    """Catálogo en memoria para los comandos que alimentan la explotación de una quincena"""
+
+    def __init__(self):
+        """Cargar cada tabla con una sola consulta"""
+        sesion = database.session
+        self.centros_trabajos = {c.clave: c for c in sesion.execute(select(CentroTrabajo)).scalars()}
+        self.conceptos = {c.clave: c for c in sesion.execute(select(Concepto)).scalars()}
+        self.personas = {p.rfc: p for p in sesion.execute(select(Persona)).scalars()}
+        self.plazas = {p.clave: p for p in sesion.execute(select(Plaza)).scalars()}
+        self.puestos = {p.clave: p for p in sesion.execute(select(Puesto)).scalars()}
+
+        # Los tabuladores por su id y por puesto, modelo, nivel y quinquenio, si se repiten se conserva el de menor id
+        self.tabuladores_por_id = {}
+        self.tabuladores = {}
+        for tabulador in sesion.execute(select(Tabulador).order_by(Tabulador.id)).scalars():
+            self.tabuladores_por_id[tabulador.id] = tabulador
+            llave = (tabulador.puesto_id, tabulador.modelo, tabulador.nivel, tabulador.quinquenio)
+            self.tabuladores.setdefault(llave, tabulador)
+
+    def consultar_tabulador(self, puesto_id: int, modelo: int, nivel: int, quinquenio: int) -> Tabulador:
+        """Consultar el tabulador que coincida con el puesto, modelo, nivel y quinquenio, si no hay entrega None"""
+        return self.tabuladores.get((puesto_id, modelo, nivel, quinquenio))
+
+    def agregar(self, registro):
+        """Agregar un registro nuevo a la sesión y a su diccionario, se inserta con el commit del comando"""
+        database.session.add(registro)
+        if isinstance(registro, CentroTrabajo):
+            self.centros_trabajos[registro.clave] = registro
+        elif isinstance(registro, Concepto):
+            self.conceptos[registro.clave] = registro
+        elif isinstance(registro, Persona):
+            self.personas[registro.rfc] = registro
+        elif isinstance(registro, Plaza):
+            self.plazas[registro.clave] = registro
+        return registro
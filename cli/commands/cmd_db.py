@@ -7,6 +7,8 @@ import sys
 
 import click
 from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 
 from cli.commands.alimentar_autoridades import alimentar_autoridades
 from cli.commands.alimentar_distritos import alimentar_distritos
@@ -24,9 +26,13 @@ from pjecz_perseo_flask.blueprints.autoridades.models import Autoridad
 from pjecz_perseo_flask.blueprints.bitacoras.models import Bitacora
 from pjecz_perseo_flask.blueprints.distritos.models import Distrito
 from pjecz_perseo_flask.blueprints.entradas_salidas.models import EntradaSalida
+from pjecz_perseo_flask.blueprints.importaciones.models import Importacion
 from pjecz_perseo_flask.blueprints.modulos.models import Modulo
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
 from pjecz_perseo_flask.blueprints.permisos.models import Permiso
 from pjecz_perseo_flask.blueprints.roles.models import Rol
+from pjecz_perseo_flask.blueprints.timbrados_conceptos.models import TimbradoConcepto
 from pjecz_perseo_flask.blueprints.usuarios.models import Usuario
 from pjecz_perseo_flask.blueprints.usuarios_roles.models import UsuarioRol
 from pjecz_perseo_flask.config.extensions import database
@@ -61,6 +67,64 @@ def alimentar():
     click.echo("Termina alimentar.")
 
 
+@click.command()
+def agregar_columna_huella():
+    """Agregar la columna huella a quincenas_productos si no existe"""
+    database.session.execute(
+        text("ALTER TABLE quincenas_productos ADD COLUMN IF NOT EXISTS huella VARCHAR(64) NOT NULL DEFAULT ''")
+    )
+    database.session.commit()
+    click.echo("  Columna quincenas_productos.huella lista.")
+    click.echo("Termina agregar columna huella.")
+
+
+@click.command()
+def agregar_columnas_fuente():
+    """Agregar la columna fuente a nominas y percepciones_deducciones si no existe"""
+    for tabla in ("nominas", "percepciones_deducciones"):
+        database.session.execute(text(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS fuente VARCHAR(16) NOT NULL DEFAULT ''"))
+        click.echo(f"  Columna {tabla}.fuente lista.")
+    database.session.commit()
+    click.echo("Termina agregar columnas fuente.")
+
+
+@click.command()
+def crear_indices_paginacion():
+    """Crear los índices por quincena e id de nominas y percepciones-deducciones si no existen"""
+    for modelo in (Nomina, PercepcionDeduccion):
+        indice = next(indice for indice in modelo.__table__.indexes if indice.name.endswith("_quincena_id_id"))
+        indice.create(bind=database.engine, checkfirst=True)
+        click.echo(f"  Índice {indice.name} listo.")
+    click.echo("Termina crear índices de paginación.")
+
+
+@click.command()
+def crear_llaves_naturales():
+    """Crear los índices únicos de las llaves naturales de nominas y percepciones-deducciones si no existen"""
+    for modelo in (Nomina, PercepcionDeduccion):
+        for indice in modelo.__table__.indexes:
+            if not indice.unique:
+                continue
+            try:
+                indice.create(bind=database.engine, checkfirst=True)
+            except IntegrityError:
+                click.echo(
+                    f"ERROR: Hay registros repetidos en {modelo.__tablename__}, se deben eliminar para crear {indice.name}"
+                )
+                sys.exit(1)
+            click.echo(f"  Índice {indice.name} listo.")
+    click.echo("Termina crear llaves naturales.")
+
+
+@click.command()
+def crear_tablas_faltantes():
+    """Crear las tablas agregadas después de inicializar la base de datos si no existen"""
+    for modelo in (Importacion, TimbradoConcepto):
+        modelo.__table__.create(bind=database.engine, checkfirst=True)
+        click.echo(f"  Tabla {modelo.__tablename__} lista.")
+    click.echo("Termina crear tablas faltantes.")
+
+
 @click.command()
 def inicializar():
     """Inicializar"""
@@ -92,7 +156,12 @@ def respaldar(ctx):
     click.echo("Termina respaldar.")
 
 
+cli.add_command(agregar_columna_huella)
+cli.add_command(agregar_columnas_fuente)
 cli.add_command(alimentar)
+cli.add_command(crear_indices_paginacion)
+cli.add_command(crear_llaves_naturales)
+cli.add_command(crear_tablas_faltantes)
 cli.add_command(inicializar)
 cli.add_command(reiniciar)
 cli.add_command(respaldar)
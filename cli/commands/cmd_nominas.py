@@ -13,7 +13,11 @@ import click
 import xlrd
 from dotenv import load_dotenv
 from openpyxl import load_workbook
+from sqlalchemy import select
 
+from cli.commands.conciliacion_explotacion import ConciliacionExplotacion
+from cli.commands.huella_archivo import HuellaArchivo
+from cli.commands.tablas_temporales import alimentar_quincena_con_tablas_temporales
 from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
 from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
 from pjecz_perseo_flask.blueprints.nominas.generators.aguinaldos import crear_aguinaldos
@@ -22,18 +26,19 @@ from pjecz_perseo_flask.blueprints.nominas.generators.monederos import crear_mon
 from pjecz_perseo_flask.blueprints.nominas.generators.nominas import crear_nominas
 from pjecz_perseo_flask.blueprints.nominas.generators.pensionados import crear_pensionados
 from pjecz_perseo_flask.blueprints.nominas.generators.primas_vacacionales import crear_primas_vacacionales
+from pjecz_perseo_flask.blueprints.nominas.generators.productos_quincena import PRODUCTOS, crear_productos_quincena
 from pjecz_perseo_flask.blueprints.nominas.generators.timbrados import crear_timbrados
 from pjecz_perseo_flask.blueprints.nominas.models import Nomina
 from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
 from pjecz_perseo_flask.blueprints.personas.models import Persona
 from pjecz_perseo_flask.blueprints.plazas.models import Plaza
-from pjecz_perseo_flask.blueprints.puestos.models import Puesto
 from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
 from pjecz_perseo_flask.blueprints.quincenas_productos.models import QuincenaProducto
-from pjecz_perseo_flask.blueprints.tabuladores.models import Tabulador
 from pjecz_perseo_flask.blueprints.timbrados.models import Timbrado
 from pjecz_perseo_flask.config.extensions import database
-from pjecz_perseo_flask.lib.fechas import crear_clave_quincena, quincena_to_fecha, quinquenio_count
+from pjecz_perseo_flask.lib.carga_masiva import CargaMasiva
+from pjecz_perseo_flask.lib.exceptions import MyAnyError
+from pjecz_perseo_flask.lib.fechas import crear_clave_quincena, quincena_to_fecha
 from pjecz_perseo_flask.lib.safe_string import QUINCENA_REGEXP, safe_clave, safe_quincena, safe_rfc, safe_string
 from pjecz_perseo_flask.main import app
 
@@ -262,12 +267,17 @@ def actualizar_timbrados(quincena_clave: str, probar: bool = False):
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+@click.option("--workers", type=int, default=1, help="Cantidad de procesos para transformar las filas.")
+def alimentar(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False, workers: int = 1):
     """Alimentar nominas"""
 
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones para mandarlos en lote, si ya existen por su llave natural solo se actualizan las diferencias
+    carga_nominas = CargaMasiva(Nomina, llave=Nomina.LLAVE_NATURAL, sumar=("percepcion", "deduccion", "importe"))
+
     # Validar quincena
     if re.match(QUINCENA_REGEXP, quincena_clave) is None:
         click.echo("ERROR: Quincena inválida.")
@@ -301,6 +311,12 @@ def alimentar(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -326,280 +342,246 @@ def alimentar(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
     # Obtener la primera hoja
     hoja = libro.sheet_by_index(0)
 
-    # Definir el puesto generico al que se van a relacionar las personas que no tengan su puesto
-    puesto_generico = Puesto.query.filter_by(clave="ND").first()
-    if puesto_generico is None:
-        click.echo("ERROR: Falta el puesto con clave ND.")
+    # Leer la hoja una sola vez y cargar el catálogo para conciliar las filas
+    # Con --workers mayor a uno, la validación de quincenas, los nombres y los quinquenios se reparten entre varios procesos
+    try:
+        conciliacion = ConciliacionExplotacion(hoja, fecha_final, workers)
+    except MyAnyError as error:
+        click.echo(click.style(f"ERROR: {error}", fg="red"))
         sys.exit(1)
 
-    # Definir el tabulador generico al que se van a relacionar los puestos que no tengan su tabulador
-    tabulador_generico = Tabulador.query.filter_by(puesto_id=puesto_generico.id).first()
-    if tabulador_generico is None:
-        click.echo("ERROR: Falta el tabulador del puesto con clave ND.")
+    # Iniciar contador
+    contador = 0
+
+    # Bucle por cada fila conciliada con el catálogo
+    click.echo(f"Alimentar Nominas a la quincena {quincena.clave}: ", nl=False)
+    for conciliada in conciliacion.conciliar():
+        renglon = conciliada.fila
+
+        # Si la fila tiene el concepto PME, entonces es DESPENSA, de lo contrario es SALARIO
+        if renglon.es_despensa:
+            nomina_tipo = Nomina.TIPOS["DESPENSA"]
+        else:
+            nomina_tipo = Nomina.TIPOS["SALARIO"]
+
+        # Alimentar nomina
+        if probar is False:
+            carga_nominas.agregar(
+                centro_trabajo=conciliada.centro_trabajo,
+                persona=conciliada.persona,
+                plaza=conciliada.plaza,
+                quincena=quincena,
+                desde=renglon.desde,
+                desde_clave=renglon.desde_clave,
+                hasta=renglon.hasta,
+                hasta_clave=renglon.hasta_clave,
+                percepcion=renglon.percepcion,
+                deduccion=renglon.deduccion,
+                importe=renglon.impte,
+                tipo=nomina_tipo,
+                fecha_pago=fecha_pago,
+                fuente=Nomina.FUENTE_EXPLOTACION,
+            )
+
+        # Incrementar contador
+        contador += 1
+
+        # Mostrar el avance con el modelo
+        click.echo(click.style(renglon.modelo, fg="cyan"), nl=False)
+
+    # Poner avance de linea
+    click.echo("")
+
+    # Si contador es cero, mostrar mensaje de error y terminar
+    if contador == 0:
+        click.echo(click.style("ERROR: No se alimentaron registros en nominas.", fg="red"))
         sys.exit(1)
 
-    # Inicializar los listados con las anomalias
-    personas_actualizadas_del_tabulador = []
-    personas_actualizadas_del_modelo = []
-    personas_actualizadas_del_num_empleado = []
-    personas_sin_puestos = []
-    personas_sin_tabulador = []
+    # Tomar los RFC de las filas con la misma llave natural que otra, antes de cerrar la sesion
+    nominas_repetidas = sorted({valores["persona"].rfc for valores in carga_nominas.repetidos})
 
-    # Iniciar contadores
-    contador = 0
-    centros_trabajos_insertados_contador = 0
-    personas_actualizadas_contador = 0
-    personas_insertadas_contador = 0
-    plazas_insertadas_contador = 0
+    # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    # Las nóminas de la quincena que alimentó la explotación y que ya no vienen en el archivo se dan de baja
+    nominas_bajas = 0
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        nominas_bajas = carga_nominas.dar_de_baja_ausentes(
+            {
+                "quincena_id": quincena.id,
+                "tipo": (Nomina.TIPOS["SALARIO"], Nomina.TIPOS["DESPENSA"]),
+                "fuente": Nomina.FUENTE_EXPLOTACION,
+            }
+        )
+        huella.registrar("nominas alimentar", quincena, contador, nominas_contador)
+        sesion.commit()
+        sesion.close()
 
-    # Bucle por cada fila
-    click.echo(f"Alimentar Nominas a la quincena {quincena.clave}: ", nl=False)
-    for fila in range(1, hoja.nrows):
-        # Tomar las columnas
-        centro_trabajo_clave = hoja.cell_value(fila, 1)
-        plaza_clave = hoja.cell_value(fila, 8)
-        percepcion = int(hoja.cell_value(fila, 12)) / 100.0
-        deduccion = int(hoja.cell_value(fila, 13)) / 100.0
-        impte = int(hoja.cell_value(fila, 14)) / 100.0
-        desde_s = str(int(hoja.cell_value(fila, 16)))
-        hasta_s = str(int(hoja.cell_value(fila, 17)))
+    # Mostrar los contadores y las anomalías de la conciliación
+    conciliacion.mostrar_resumen()
 
-        # Tomar las columnas con datos de la Persona
-        rfc = hoja.cell_value(fila, 2)
-        modelo = int(hoja.cell_value(fila, 236))
-        nombre_completo = hoja.cell_value(fila, 3)
-        num_empleado = int(hoja.cell_value(fila, 240))
+    # Si hubo filas con la misma llave natural, se sumaron en una sola nómina
+    if len(nominas_repetidas) > 0:
+        click.echo(
+            click.style(f"  Hubo {len(carga_nominas.repetidos)} filas con la misma llave que otra, se sumaron:", fg="yellow")
+        )
+        click.echo(click.style(f"  {', '.join(nominas_repetidas)}", fg="yellow"))
 
-        # Tomar las columnas necesarias para el timbrado
-        puesto_clave = safe_clave(hoja.cell_value(fila, 20))
-        nivel = int(hoja.cell_value(fila, 9))
-        quincena_ingreso = str(int(hoja.cell_value(fila, 19)))
+    # Si hubo nóminas que ya no vienen en el archivo, mostrar contador
+    if nominas_bajas > 0:
+        click.echo(click.style(f"  Se dieron de baja {nominas_bajas} nóminas que ya no vienen en el archivo.", fg="yellow"))
 
-        # Validar desde y hasta
-        try:
-            desde_clave = safe_quincena(desde_s)
-            desde = quincena_to_fecha(desde_clave, dame_ultimo_dia=False)
-            hasta_clave = safe_quincena(hasta_s)
-            hasta = quincena_to_fecha(hasta_clave, dame_ultimo_dia=True)
-        except ValueError:
-            click.echo(click.style(f"ERROR: Quincena inválida en '{desde_s}' o '{hasta_s}'", fg="red"))
-            sys.exit(1)
+    # Mensaje termino
+    click.echo(click.style(f"  Alimentar Nominas: {contador} insertadas.", fg="green"))
 
-        # Consultar el Centro de Trabajo, si no existe se agrega
-        centro_trabajo = CentroTrabajo.query.filter_by(clave=centro_trabajo_clave).first()
-        if centro_trabajo is None:
-            centro_trabajo = CentroTrabajo(clave=centro_trabajo_clave, descripcion="ND")
-            sesion.add(centro_trabajo)
-            sesion.commit()
-            centros_trabajos_insertados_contador += 1
 
-        # Consultar la Plaza, si no existe se agrega
-        plaza = Plaza.query.filter_by(clave=plaza_clave).first()
-        if plaza is None:
-            plaza = Plaza(clave=plaza_clave, descripcion="ND")
-            sesion.add(plaza)
-            sesion.commit()
-            plazas_insertadas_contador += 1
+@click.command()
+@click.argument("quincena_clave", type=str)
+@click.argument("fecha_pago_str", type=str)
+@click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
+@click.option("--tablas-temporales", is_flag=True, help="Conciliar en la base de datos con tablas temporales.")
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_quincena(
+    quincena_clave: str, fecha_pago_str: str, probar: bool = False, tablas_temporales: bool = False, forzar: bool = False
+):
+    """Alimentar nominas y percepciones-deducciones de una quincena leyendo una sola vez la explotación"""
 
-        # Si el modelo es 2, entonces en SINDICALIZADO, se toman 4 caracteres del puesto y se busca quinquenios
-        quinquenios = None
-        if modelo == 2:
-            puesto_clave = puesto_clave[:4]
-
-            # Inicializar la bandera para saltar la fila si el concepto es PME
-            es_concepto_pme = False
-
-            # Bucle entre las columnas de los conceptos para encontrar PQ1, PQ2, PQ3, PQ4, PQ5, PQ6
-            col_num = 26
-            while True:
-                # Tomar el p_o_d
-                p_o_d = safe_string(hoja.cell_value(fila, col_num))
-                # Tomar el conc
-                conc = safe_string(hoja.cell_value(fila, col_num + 1))
-                # Si 'P' o 'D' es un texto vacio, se rompe el ciclo
-                if p_o_d == "":
-                    break
-                # Si NO es P, se salta
-                if p_o_d != "P":
-                    col_num += 6
-                    continue
-                # Si conc es ME es monedero, se rompe el ciclo porque aqui no hay quinquenios
-                if conc == "ME":
-                    es_concepto_pme = True
-                    break
-                # Si el concepto no es PQ1, PQ2, PQ3, PQ4, PQ5, PQ6, se salta
-                if conc not in ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6"]:
-                    col_num += 6
-                    continue
-                # Tomar el tercer caracter del concepto y convertirlo a entero porque es la cantidad de quinquenios
-                quinquenios = int(conc[1])
-                break
+    # Iniciar sesion con la base de datos para que la alimentacion sea rapida
+    sesion = database.session
 
-            # Si es PME, entonces en esta fila NO esta el quinquenio, se mantiene en None
-            if es_concepto_pme:
-                quinquenios = None
+    # Juntar los renglones para mandarlos en lote, si ya existen por su llave natural solo se actualizan las diferencias
+    carga_nominas = CargaMasiva(Nomina, llave=Nomina.LLAVE_NATURAL, sumar=("percepcion", "deduccion", "importe"))
+    carga_percepciones_deducciones = CargaMasiva(
+        PercepcionDeduccion, llave=PercepcionDeduccion.LLAVE_NATURAL, sumar=("importe",)
+    )
 
-        else:
-            # Entonces NO es SINDICALIZADO, se define quinquenios en cero
-            quinquenios = 0
+    # Validar quincena
+    if re.match(QUINCENA_REGEXP, quincena_clave) is None:
+        click.echo("ERROR: Quincena inválida.")
+        sys.exit(1)
 
-        # Consultar el Puesto, si no existe se agrega a personas_sin_puestos y se le asigna el puesto_generico
-        puesto = Puesto.query.filter_by(clave=puesto_clave).first()
-        if puesto is None:
-            personas_sin_puestos.append(rfc)
-            puesto = puesto_generico
+    # Definir la fecha_final en base a la clave de la quincena
+    try:
+        fecha_final = quincena_to_fecha(quincena_clave, dame_ultimo_dia=True)
+    except ValueError:
+        click.echo("ERROR: Quincena inválida.")
+        sys.exit(1)
 
-        # Consultar la Persona
-        persona = Persona.query.filter_by(rfc=rfc).first()
+    # Validar fecha_pago
+    try:
+        fecha_pago = datetime.strptime(fecha_pago_str, "%Y-%m-%d")
+    except ValueError:
+        click.echo("ERROR: Fecha de pago inválida")
+        sys.exit(1)
 
-        # Si NO existe la Persona, se agrega
-        if persona is None:
-            # Separar nombre_completo, en apellido_primero, apellido_segundo y nombres
-            separado = safe_string(nombre_completo, save_enie=True).split(" ")
-            apellido_primero = separado[0]
-            apellido_segundo = separado[1]
-            nombres = " ".join(separado[2:])
-
-            # Si el modelo es 2 y quinquenios es None, entonces es SINDICALIZADO y se calculan los quinquenios
-            if modelo == 2 and quinquenios is None:
-                # Calcular la cantidad de quinquenios
-                fecha_ingreso = quincena_to_fecha(quincena_ingreso, dame_ultimo_dia=False)
-                quinquenios = quinquenio_count(fecha_ingreso, fecha_final)
-
-            # Consultar el tabulador que coincida con puesto_clave, modelo, nivel y quinquenios
-            tabulador = (
-                Tabulador.query.filter_by(puesto_id=puesto.id)
-                .filter_by(modelo=modelo)
-                .filter_by(nivel=nivel)
-                .filter_by(quinquenio=quinquenios)
-                .first()
-            )
+    # Validar el directorio donde espera encontrar los archivos de explotacion
+    if EXPLOTACION_BASE_DIR == "":
+        click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
+        sys.exit(1)
 
-            # Si no existe el tabulador, se agrega a personas_sin_tabulador y se le asigna tabulador_generico
-            if tabulador is None:
-                personas_sin_tabulador.append(rfc)
-                tabulador = tabulador_generico
-
-            # Insertar a la Persona
-            persona = Persona(
-                tabulador_id=tabulador.id,
-                rfc=rfc,
-                nombres=nombres,
-                apellido_primero=apellido_primero,
-                apellido_segundo=apellido_segundo,
-                modelo=modelo,
-                num_empleado=num_empleado,
-            )
-            sesion.add(persona)
-            sesion.commit()
-            personas_insertadas_contador += 1
+    # Validar si existe el archivo
+    ruta = Path(EXPLOTACION_BASE_DIR, quincena_clave, NOMINAS_FILENAME_XLS)
+    if not ruta.exists():
+        click.echo(f"ERROR: {str(ruta)} no se encontró.")
+        sys.exit(1)
+    if not ruta.is_file():
+        click.echo(f"ERROR: {str(ruta)} no es un archivo.")
+        sys.exit(1)
 
-        # De lo contrario, se revisa si cambia la Persona de tabulador, modelo o num_empleado
-        else:
-            # Inicializar hay_cambios
-            hay_cambios = False
-
-            # Si la fila es concepto PME NO va tener los quinquenios, entonces se define con la Persona
-            if quinquenios is None:
-                quinquenios = persona.tabulador.quinquenio
-
-            # Consultar el tabulador que coincida con puesto_clave, modelo, nivel y quinquenios
-            tabulador = (
-                Tabulador.query.filter_by(puesto_id=puesto.id)
-                .filter_by(modelo=modelo)
-                .filter_by(nivel=nivel)
-                .filter_by(quinquenio=quinquenios)
-                .first()
-            )
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-quincena"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
 
-            # Si NO existe el tabulador, se agrega a personas_sin_tabulador y se le asigna tabulador_generico
-            if tabulador is None:
-                personas_sin_tabulador.append(rfc)
-                tabulador = tabulador_generico
+    # Consultar quincena
+    quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
-            # Revisar si hay que actualizar el tabulador a la Persona
-            if persona.tabulador_id != tabulador.id:
-                personas_actualizadas_del_tabulador.append(
-                    f"{rfc} {persona.nombre_completo}: Tabulador: {persona.tabulador_id} -> {tabulador.id}"
-                )
-                persona.tabulador_id = tabulador.id
-                hay_cambios = True
-
-            # Revisar si hay que actualizar el modelo a la Persona
-            # if persona.modelo != modelo:
-            #     personas_actualizadas_del_modelo.append(
-            #         f"{rfc} {persona.nombre_completo}: Modelo: {persona.modelo} -> {modelo}"
-            #     )
-            #     persona.modelo = modelo
-            #     hay_cambios = True
-
-            # Revisar si hay que actualizar el numero de empleado a la Persona
-            if persona.num_empleado != num_empleado:
-                personas_actualizadas_del_num_empleado.append(
-                    f"{rfc} {persona.nombre_completo}: Num. Emp. {persona.num_empleado} -> {num_empleado}"
-                )
-                persona.num_empleado = num_empleado
-                hay_cambios = True
+    # Si existe la quincena, pero no esta ABIERTA, entonces se termina
+    if quincena and quincena.estado != "ABIERTA":
+        click.echo(f"ERROR: Quincena {quincena_clave} no esta ABIERTA.")
+        sys.exit(1)
 
-            # Si hay cambios, guardar la Persona
-            if hay_cambios:
-                if probar is False:
-                    persona.save()
-                personas_actualizadas_contador += 1
+    # Si existe la quincena, pero ha sido eliminada, entonces se termina
+    if quincena and quincena.estatus != "A":
+        click.echo(f"ERROR: Quincena {quincena_clave} esta sido eliminada.")
+        sys.exit(1)
 
-        # Bucle entre P-D para determinar el tipo entre SALARIO y DESPENSA
-        nomina_tipo = None
-        col_num = 26
-        while True:
-            # Tomar el tipo y el conc para armar la clave del concepto
-            tipo = safe_string(hoja.cell_value(fila, col_num))
-            conc = safe_string(hoja.cell_value(fila, col_num + 1))
-            concepto_clave = f"{tipo}{conc}"
+    # Si no existe la quincena, se agrega
+    if quincena is None:
+        quincena = Quincena(clave=quincena_clave, estado="ABIERTA")
+        sesion.add(quincena)
+        sesion.commit()
 
-            # Si el tipo es un texto vacio, se rompe el ciclo
-            if tipo == "":
-                break
+    # Abrir el archivo XLS con xlrd
+    libro = xlrd.open_workbook(str(ruta))
 
-            # Si el concepto_clave es PME, entonces es DESPENSA y se termina este ciclo
-            if concepto_clave == "PME":
-                nomina_tipo = Nomina.TIPOS["DESPENSA"]
-                break
+    # Obtener la primera hoja
+    hoja = libro.sheet_by_index(0)
 
-            # Incrementar col_num en SEIS
-            col_num += 6
+    # Si se pide, conciliar en la base de datos con tablas temporales en lugar de fila por fila
+    if tablas_temporales:
+        alimentar_quincena_con_tablas_temporales(hoja, quincena, fecha_final, fecha_pago, probar, huella)
+        return
 
-            # Romper el ciclo cuando se llega a la columna
-            if col_num > 236:
-                break
+    # Leer la hoja una sola vez y cargar el catálogo para conciliar las filas
+    try:
+        conciliacion = ConciliacionExplotacion(hoja, fecha_final)
+    except MyAnyError as error:
+        click.echo(click.style(f"ERROR: {error}", fg="red"))
+        sys.exit(1)
+
+    # Iniciar contador
+    contador = 0
 
-        # Si no se encontro el tipo, entonces es SALARIO
-        if nomina_tipo is None:
+    # Bucle por cada fila conciliada con el catálogo, con sus percepciones-deducciones
+    click.echo(f"Alimentar Nominas y Percepciones-Deducciones a la quincena {quincena.clave}: ", nl=False)
+    for conciliada in conciliacion.conciliar(con_conceptos=True):
+        renglon = conciliada.fila
+
+        # Si la fila tiene el concepto PME, entonces es DESPENSA, de lo contrario es SALARIO
+        if renglon.es_despensa:
+            nomina_tipo = Nomina.TIPOS["DESPENSA"]
+        else:
             nomina_tipo = Nomina.TIPOS["SALARIO"]
 
         # Alimentar nomina
         if probar is False:
-            nomina = Nomina(
-                centro_trabajo=centro_trabajo,
-                persona=persona,
-                plaza=plaza,
+            carga_nominas.agregar(
+                centro_trabajo=conciliada.centro_trabajo,
+                persona=conciliada.persona,
+                plaza=conciliada.plaza,
                 quincena=quincena,
-                desde=desde,
-                desde_clave=desde_clave,
-                hasta=hasta,
-                hasta_clave=hasta_clave,
-                percepcion=percepcion,
-                deduccion=deduccion,
-                importe=impte,
+                desde=renglon.desde,
+                desde_clave=renglon.desde_clave,
+                hasta=renglon.hasta,
+                hasta_clave=renglon.hasta_clave,
+                percepcion=renglon.percepcion,
+                deduccion=renglon.deduccion,
+                importe=renglon.impte,
                 tipo=nomina_tipo,
                 fecha_pago=fecha_pago,
+                fuente=Nomina.FUENTE_EXPLOTACION,
             )
-            sesion.add(nomina)
+
+        # Alimentar las percepciones y deducciones de la fila, son de tipo SALARIO como en percepciones_deducciones alimentar
+        if probar is False:
+            for concepto, impt in conciliada.conceptos:
+                carga_percepciones_deducciones.agregar(
+                    centro_trabajo=conciliada.centro_trabajo,
+                    concepto=concepto,
+                    persona=conciliada.persona,
+                    plaza=conciliada.plaza,
+                    quincena=quincena,
+                    importe=impt,
+                    tipo=PercepcionDeduccion.TIPOS["SALARIO"],
+                    fuente=PercepcionDeduccion.FUENTE_EXPLOTACION,
+                )
 
         # Incrementar contador
         contador += 1
 
         # Mostrar el avance con el modelo
-        click.echo(click.style(modelo, fg="cyan"), nl=False)
+        click.echo(click.style(renglon.modelo, fg="cyan"), nl=False)
 
     # Poner avance de linea
     click.echo("")
@@ -609,52 +591,83 @@ def alimentar(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
         click.echo(click.style("ERROR: No se alimentaron registros en nominas.", fg="red"))
         sys.exit(1)
 
-    # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    # Tomar los RFC de las filas con la misma llave natural que otra, antes de cerrar la sesion
+    nominas_repetidas = sorted({valores["persona"].rfc for valores in carga_nominas.repetidos})
+    percepciones_deducciones_repetidas = sorted(
+        {valores["persona"].rfc for valores in carga_percepciones_deducciones.repetidos}
+    )
+
+    # Cerrar la sesion para que se guarden nominas y percepciones-deducciones en la misma transacción
+    # Las de la quincena que alimentó la explotación y que ya no vienen en el archivo se dan de baja,
+    # las percepciones-deducciones de los conceptos del archivo
+    percepciones_deducciones_contador = 0
+    nominas_bajas = 0
+    percepciones_deducciones_bajas = 0
     if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        percepciones_deducciones_contador = carga_percepciones_deducciones.guardar()
+        nominas_bajas = carga_nominas.dar_de_baja_ausentes(
+            {
+                "quincena_id": quincena.id,
+                "tipo": (Nomina.TIPOS["SALARIO"], Nomina.TIPOS["DESPENSA"]),
+                "fuente": Nomina.FUENTE_EXPLOTACION,
+            }
+        )
+        percepciones_deducciones_bajas = carga_percepciones_deducciones.dar_de_baja_ausentes(
+            {
+                "quincena_id": quincena.id,
+                "tipo": PercepcionDeduccion.TIPOS["SALARIO"],
+                "fuente": PercepcionDeduccion.FUENTE_EXPLOTACION,
+            },
+            por=("concepto_id",),
+        )
+        huella.registrar("nominas alimentar-quincena", quincena, contador, nominas_contador + percepciones_deducciones_contador)
         sesion.commit()
         sesion.close()
 
-    # Si hubo centros_trabajos_insertados, mostrar contador
-    if centros_trabajos_insertados_contador > 0:
-        click.echo(click.style(f"  Se insertaron {centros_trabajos_insertados_contador} Centros de Trabajo", fg="green"))
-
-    # Si hubo personas actualizadas, mostrar contador
-    if personas_actualizadas_contador > 0:
-        click.echo(click.style(f"  Se actualizaron {personas_actualizadas_contador} Personas", fg="green"))
-        for item in personas_actualizadas_del_tabulador:
-            click.echo(click.style(f"  {item}", fg="yellow"))
-        for item in personas_actualizadas_del_modelo:
-            click.echo(click.style(f"  {item}", fg="yellow"))
-        for item in personas_actualizadas_del_num_empleado:
-            click.echo(click.style(f"  {item}", fg="yellow"))
-
-    # Si hubo personas insertadas, mostrar contador
-    if personas_insertadas_contador > 0:
-        click.echo(click.style(f"  Se insertaron {personas_insertadas_contador} Personas", fg="green"))
+    # Mostrar los contadores y las anomalías de la conciliación
+    conciliacion.mostrar_resumen()
 
-    # Si hubo plazas insertadas, mostrar contador
-    if plazas_insertadas_contador > 0:
-        click.echo(click.style(f"  Se insertaron {plazas_insertadas_contador} Plazas", fg="green"))
-
-    # Si hubo personas_sin_puestos, mostrarlas en pantalla
-    if len(personas_sin_puestos) > 0:
-        click.echo(click.style(f"  Hubo {len(personas_sin_puestos)} Personas sin puestos.", fg="yellow"))
-        click.echo(click.style(f"  {', '.join(personas_sin_puestos)}", fg="yellow"))
-
-    # Si hubo personas_sin_tabulador, mostrarlas en pantalla
-    if len(personas_sin_tabulador) > 0:
-        click.echo(click.style(f"  Hubo {len(personas_sin_tabulador)} Personas sin tabulador.", fg="yellow"))
-        click.echo(click.style(f"  {', '.join(personas_sin_tabulador)}", fg="yellow"))
+    # Si hubo filas con la misma llave natural, se sumaron en una sola nómina
+    if len(nominas_repetidas) > 0:
+        click.echo(
+            click.style(f"  Hubo {len(carga_nominas.repetidos)} filas con la misma llave que otra, se sumaron:", fg="yellow")
+        )
+        click.echo(click.style(f"  {', '.join(nominas_repetidas)}", fg="yellow"))
+
+    # Si hubo percepciones-deducciones con la misma llave natural, se sumaron en una sola
+    if len(percepciones_deducciones_repetidas) > 0:
+        click.echo(
+            click.style(
+                f"  Hubo {len(carga_percepciones_deducciones.repetidos)} P-D con la misma llave que otra, se sumaron:",
+                fg="yellow",
+            )
+        )
+        click.echo(click.style(f"  {', '.join(percepciones_deducciones_repetidas)}", fg="yellow"))
+
+    # Si hubo nóminas o percepciones-deducciones que ya no vienen en el archivo, mostrar contadores
+    if nominas_bajas > 0:
+        click.echo(click.style(f"  Se dieron de baja {nominas_bajas} nóminas que ya no vienen en el archivo.", fg="yellow"))
+    if percepciones_deducciones_bajas > 0:
+        click.echo(
+            click.style(
+                f"  Se dieron de baja {percepciones_deducciones_bajas} P-D que ya no vienen en el archivo.", fg="yellow"
+            )
+        )
 
     # Mensaje termino
     click.echo(click.style(f"  Alimentar Nominas: {contador} insertadas.", fg="green"))
+    click.echo(
+        click.style(f"  Alimentar Percepciones-Deducciones: {percepciones_deducciones_contador} insertadas.", fg="green")
+    )
 
 
 @click.command()
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar aguinaldos"""
 
     # Validar quincena
@@ -681,6 +694,9 @@ def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool
     # Iniciar sesión con la base de datos para que la alimentación sea rápida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+
     # Validar el directorio donde espera encontrar los archivos de explotación
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -695,6 +711,12 @@ def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-aguinaldos"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -773,7 +795,7 @@ def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -788,7 +810,6 @@ def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool
                 tipo="AGUINALDO",
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
 
         # Incrementar contador
         contador += 1
@@ -804,6 +825,9 @@ def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool
         sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        huella.registrar("nominas alimentar-aguinaldos", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -833,7 +857,8 @@ def alimentar_aguinaldos(quincena_clave: str, fecha_pago_str: str, probar: bool
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar apoyos anuales"""
 
     # Validar quincena
@@ -858,6 +883,10 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -872,6 +901,12 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-apoyos-anuales"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -937,6 +972,7 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
     contador = 0
     centros_trabajos_inexistentes = []
     nominas_existentes = []
+    personas_alimentadas = set()
     personas_inexistentes = []
     plazas_inexistentes = []
 
@@ -1036,7 +1072,7 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
             .filter_by(estatus="A")
             .all()
         )
-        if len(nominas_posibles) > 0:
+        if persona.id in personas_alimentadas or len(nominas_posibles) > 0:
             nominas_existentes.append(rfc)
             continue
 
@@ -1046,7 +1082,7 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
         # Alimentar impte_concepto_paz, con concepto PAZ
         if impte_concepto_paz != 0.0:
             if probar is False:
-                percepcion_deduccion_paz = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_paz,
                     persona=persona,
@@ -1055,13 +1091,12 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
                     importe=impte_concepto_paz,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_paz)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_dpl, con concepto DPL
         if impte_concepto_dpl != 0.0:
             if probar is False:
-                percepcion_deduccion_paz = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_dpl,
                     persona=persona,
@@ -1070,13 +1105,12 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
                     importe=impte_concepto_dpl,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_paz)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar impte_concepto_d62, con concepto D62
         if impte_concepto_d62 != 0.0:
             if probar is False:
-                percepcion_deduccion_d62 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d62,
                     persona=persona,
@@ -1085,13 +1119,12 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
                     importe=impte_concepto_d62,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d62)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar impte_concepto_dpa, con concepto DPA
         if impte_concepto_dpa != 0.0:
             if probar is False:
-                percepcion_deduccion_dpa = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_dpa,
                     persona=persona,
@@ -1100,13 +1133,12 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
                     importe=impte_concepto_dpa,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_dpa)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar impte_concepto_dpj, con concepto DPJ
         if impte_concepto_dpj != 0.0:
             if probar is False:
-                percepcion_deduccion_dpj = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_dpj,
                     persona=persona,
@@ -1115,13 +1147,12 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
                     importe=impte_concepto_dpj,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_dpj)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar impte_concepto_daz, con concepto DAZ
         if impte_concepto_daz != 0.0:
             if probar is False:
-                percepcion_deduccion_daz = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_daz,
                     persona=persona,
@@ -1130,12 +1161,11 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
                     importe=impte_concepto_daz,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_daz)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -1150,7 +1180,9 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
                 tipo=TIPO,
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
+
+            # Recordar la persona, su nomina no esta en la base de datos hasta guardar el lote
+            personas_alimentadas.add(persona.id)
         click.echo(click.style("a", fg="green"), nl=False)
 
         # Incrementar contador
@@ -1165,6 +1197,10 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
         # sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-apoyos-anuales", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -1200,7 +1236,8 @@ def alimentar_apoyos_anuales(quincena_clave: str, fecha_pago_str: str, probar: b
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar aguinaldos retroactivos"""
 
     # Validar quincena
@@ -1225,6 +1262,10 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -1239,6 +1280,12 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-aguinaldos-retroactivos"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -1304,6 +1351,7 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
     contador = 0
     centros_trabajos_inexistentes = []
     nominas_existentes = []
+    personas_alimentadas = set()
     personas_inexistentes = []
     plazas_inexistentes = []
 
@@ -1411,7 +1459,7 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
             .filter_by(estatus="A")
             .all()
         )
-        if len(nominas_posibles) > 0:
+        if persona.id in personas_alimentadas or len(nominas_posibles) > 0:
             nominas_existentes.append(rfc)
             continue
 
@@ -1421,7 +1469,7 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
         # Alimentar impte_concepto_pga, con concepto PGA
         if impte_concepto_pga != 0.0:
             if probar is False:
-                percepcion_deduccion_pga = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pga,
                     persona=persona,
@@ -1430,13 +1478,12 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
                     importe=impte_concepto_pga,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_pga)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_p22, con concepto P22
         if impte_concepto_p22 != 0.0:
             if probar is False:
-                percepcion_deduccion_p22 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_p22,
                     persona=persona,
@@ -1445,13 +1492,12 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
                     importe=impte_concepto_p22,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_p22)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_pgv, con concepto PGV
         if impte_concepto_pgv != 0.0:
             if probar is False:
-                percepcion_deduccion_pgv = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pgv,
                     persona=persona,
@@ -1460,13 +1506,12 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
                     importe=impte_concepto_pgv,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_pgv)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_p28, con concepto P28
         if impte_concepto_p28 != 0.0:
             if probar is False:
-                percepcion_deduccion_p28 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_p28,
                     persona=persona,
@@ -1475,13 +1520,12 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
                     importe=impte_concepto_p28,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_p28)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_d01, con concepto D01
         if impte_concepto_d01 != 0.0:
             if probar is False:
-                percepcion_deduccion_d01 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d01,
                     persona=persona,
@@ -1490,13 +1534,12 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
                     importe=impte_concepto_d01,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d01)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar impte_concepto_d62, con concepto D62
         if impte_concepto_d62 != 0.0:
             if probar is False:
-                percepcion_deduccion_d62 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d62,
                     persona=persona,
@@ -1505,12 +1548,11 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
                     importe=impte_concepto_d62,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d62)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -1525,7 +1567,9 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
                 tipo=TIPO,
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
+
+            # Recordar la persona, su nomina no esta en la base de datos hasta guardar el lote
+            personas_alimentadas.add(persona.id)
         click.echo(click.style("a", fg="green"), nl=False)
 
         # Incrementar contador
@@ -1540,6 +1584,10 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
         sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-aguinaldos-retroactivos", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -1575,7 +1623,8 @@ def alimentar_aguinaldos_retroactivos(quincena_clave: str, fecha_pago_str: str,
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar apoyos del dia de la madre"""
 
     # Validar quincena
@@ -1600,6 +1649,10 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -1614,6 +1667,12 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-apoyos-madres"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -1661,6 +1720,7 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
     contador = 0
     centros_trabajos_inexistentes = []
     nominas_existentes = []
+    personas_alimentadas = set()
     personas_inexistentes = []
     plazas_inexistentes = []
 
@@ -1742,7 +1802,7 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
             .filter_by(estatus="A")
             .all()
         )
-        if len(nominas_posibles) > 0:
+        if persona.id in personas_alimentadas or len(nominas_posibles) > 0:
             nominas_existentes.append(rfc)
             continue
 
@@ -1752,7 +1812,7 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
         # Alimentar impte_concepto_paz, con concepto PAZ
         if impte_concepto_pa5 != 0.0:
             if probar is False:
-                percepcion_deduccion_paz = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pa5,
                     persona=persona,
@@ -1761,13 +1821,12 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
                     importe=impte_concepto_pa5,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_paz)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_dpl, con concepto DPL
         if impte_concepto_dpl != 0.0:
             if probar is False:
-                percepcion_deduccion_dpl = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_dpl,
                     persona=persona,
@@ -1776,13 +1835,12 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
                     importe=impte_concepto_dpl,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_dpl)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar impte_concepto_d62, con concepto D62
         if impte_concepto_d62 != 0.0:
             if probar is False:
-                percepcion_deduccion_d62 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d62,
                     persona=persona,
@@ -1791,12 +1849,11 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
                     importe=impte_concepto_d62,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d62)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -1811,7 +1868,9 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
                 tipo=TIPO,
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
+
+            # Recordar la persona, su nomina no esta en la base de datos hasta guardar el lote
+            personas_alimentadas.add(persona.id)
         click.echo(click.style("a", fg="green"), nl=False)
 
         # Incrementar contador
@@ -1826,6 +1885,10 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
         sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-apoyos-madres", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -1861,7 +1924,8 @@ def alimentar_apoyos_madres(quincena_clave: str, fecha_pago_str: str, probar: bo
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar asimilados"""
 
     # Validar quincena
@@ -1886,6 +1950,10 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -1900,6 +1968,12 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-asimilados"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -1947,6 +2021,7 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
     contador = 0
     centros_trabajos_inexistentes = []
     nominas_existentes = []
+    personas_alimentadas = set()
     personas_inexistentes = []
     plazas_inexistentes = []
 
@@ -2028,7 +2103,7 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
             .filter_by(estatus="A")
             .all()
         )
-        if len(nominas_posibles) > 0:
+        if persona.id in personas_alimentadas or len(nominas_posibles) > 0:
             nominas_existentes.append(rfc)
             continue
 
@@ -2038,7 +2113,7 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
         # Alimentar impte_concepto_pss, con concepto PSS
         if impte_concepto_pss != 0.0:
             if probar is False:
-                percepcion_deduccion_pss = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pss,
                     persona=persona,
@@ -2047,13 +2122,12 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_pss,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_pss)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_d01, con concepto D01
         if impte_concepto_d01 != 0.0:
             if probar is False:
-                percepcion_deduccion_d01 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d01,
                     persona=persona,
@@ -2062,13 +2136,12 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_d01,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d01)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar impte_concepto_d62, con concepto D62
         if impte_concepto_d62 != 0.0:
             if probar is False:
-                percepcion_deduccion_d62 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d62,
                     persona=persona,
@@ -2077,12 +2150,11 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_d62,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d62)
             click.echo(click.style("d", fg="blue"), nl=False)
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -2097,7 +2169,9 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
                 tipo=TIPO,
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
+
+            # Recordar la persona, su nomina no esta en la base de datos hasta guardar el lote
+            personas_alimentadas.add(persona.id)
         click.echo(click.style("a", fg="green"), nl=False)
 
         # Incrementar contador
@@ -2112,6 +2186,10 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
         sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-asimilados", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -2146,12 +2224,17 @@ def alimentar_asimilados(quincena_clave: str, fecha_pago_str: str, probar: bool
 @click.command()
 @click.argument("archivo_xlsx", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False, forzar: bool = False):
     """Alimentar extraordinarios"""
 
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos
     if EXTRAORDINARIOS_BASE_DIR is None:
         click.echo("ERROR: Variable de entorno EXTRAORDINARIOS_BASE_DIR no definida.")
@@ -2166,6 +2249,12 @@ def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-extraordinarios"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # El archivo debe tener los siguientes encabezados
     # 01: RFC
     # 02: QUINCENA
@@ -2315,7 +2404,7 @@ def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
         # Si probar es falso
         if probar is False:
             # Alimentar nomina
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -2330,7 +2419,6 @@ def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
                 tipo="EXTRAORDINARIO",
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
         click.echo(click.style(f"  {rfc} {quincena_clave}: ", fg="cyan"), nl=False)
 
         # Tomar los valores de la hoja de calculo y alimentar las percepciones y deducciones
@@ -2346,7 +2434,7 @@ def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
                 click.echo(click.style("0", fg="yellow"), nl=False)
                 continue
             if probar is False:
-                percepcion_deduccion = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto,
                     persona=persona,
@@ -2355,7 +2443,6 @@ def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
                     importe=valor,
                     tipo="EXTRAORDINARIO",
                 )
-                sesion.add(percepcion_deduccion)
             click.echo(click.style("+", fg="green"), nl=False)
 
         # Incrementar contador
@@ -2363,6 +2450,10 @@ def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
         click.echo("")
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-extraordinarios", None, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -2398,11 +2489,13 @@ def alimentar_extraordinarios(archivo_xlsx: str, probar: bool = False):
 @click.argument("quincena_clave", type=str)
 @click.option("--tipo", type=click.Choice(["AGUINALDO", "APOYO ANUAL", "APOYO DIA DE LA MADRE", "SALARIO"]), default="SALARIO")
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
 def alimentar_pensiones_alimenticias(
     archivo_xlsx: str,
     quincena_clave: str,
     tipo: str,
     probar: bool = True,
+    forzar: bool = False,
 ):
     """Alimentar pensiones alimenticias"""
 
@@ -2425,6 +2518,12 @@ def alimentar_pensiones_alimenticias(
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado(f"nominas alimentar-pensiones-alimenticias {tipo}"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar la quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
     if quincena is None:
@@ -2493,6 +2592,27 @@ def alimentar_pensiones_alimenticias(
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Consultar las llaves de las nóminas de pensiones alimenticias que ya tiene la quincena
+    # El número de cheque distingue las de SALARIO de las de AGUINALDO o APOYO, que tienen el mismo tipo de nómina
+    existentes = set(
+        sesion.execute(
+            select(Nomina.persona_id, Nomina.plaza_id, Nomina.desde_clave, Nomina.hasta_clave, Nomina.num_cheque)
+            .where(Nomina.quincena_id == quincena.id)
+            .where(Nomina.tipo == "PENSION ALIMENTICIA")
+            .where(Nomina.estatus == "A")
+        ).all()
+    )
+
+    # Juntar los renglones para mandarlos en lote, si ya existen por su llave solo se actualizan las diferencias
+    # Las percepciones-deducciones de tipo SALARIO tienen llave natural, las de la misma persona y plaza se suman
+    carga_nominas = CargaMasiva(Nomina, llave=Nomina.LLAVE_PENSION_ALIMENTICIA, sumar=("percepcion", "deduccion", "importe"))
+    if tipo == PercepcionDeduccion.TIPOS["SALARIO"]:
+        carga_percepciones_deducciones = CargaMasiva(
+            PercepcionDeduccion, llave=PercepcionDeduccion.LLAVE_NATURAL, sumar=("importe",)
+        )
+    else:
+        carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Bucle por los renglones de la hoja
     contador = 0
     click.echo("Alimentando Pensiones Alimenticias:")
@@ -2513,7 +2633,7 @@ def alimentar_pensiones_alimenticias(
         percepcion = fila[7]
         deduccion = fila[8]
         importe = fila[9]
-        num_cheque = fila[10]
+        num_cheque = str(fila[10])
         fecha_pago = fila[11]
         importe_concepto = fila[12]
 
@@ -2547,11 +2667,16 @@ def alimentar_pensiones_alimenticias(
             hasta_no_validos.append(hasta_clave)
             continue
 
+        # Si ya existe la nómina de este renglón, ya se alimentó antes
+        ya_existe = (persona.id, plaza.id, desde_clave, hasta_clave, num_cheque) in existentes
+
         # Si tiene importe_concepto, alimentar registro en PercepcionDeduccion
-        if importe_concepto > 0:
+        # Las de tipo SALARIO se mandan siempre, porque la llave natural las junta y actualiza con la suma del archivo
+        # Las de otro tipo no tienen llave natural, si la nómina ya existía se omiten para no duplicarlas
+        if importe_concepto > 0 and (tipo == PercepcionDeduccion.TIPOS["SALARIO"] or not ya_existe):
             concepto = conceptos[tipo]
             if probar is False:
-                percepcion_deduccion = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto,
                     persona=persona,
@@ -2560,15 +2685,14 @@ def alimentar_pensiones_alimenticias(
                     importe=importe_concepto,
                     tipo=tipo,
                 )
-                sesion.add(percepcion_deduccion)
                 click.echo(click.style("p", fg="green"), nl=False)
             else:
                 click.echo(click.style(f"{concepto.clave}: {importe_concepto}, ", fg="green"), nl=False)
 
         # Si probar es falso
         if probar is False:
-            # Alimentar nomina
-            nomina = Nomina(
+            # Alimentar nomina, si ya existe por su llave solo se actualiza si cambió
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -2584,7 +2708,6 @@ def alimentar_pensiones_alimenticias(
                 fecha_pago=fecha_pago,
                 num_cheque=num_cheque,
             )
-            sesion.add(nomina)
             click.echo(click.style("n", fg="cyan"), nl=False)
         else:
             click.echo(click.style(f"{rfc}: {importe}, ", fg="cyan"), nl=False)
@@ -2595,7 +2718,14 @@ def alimentar_pensiones_alimenticias(
     # Poner avance de linea
     click.echo("")
 
+    # Tomar los RFC de los renglones con la misma llave que otro, antes de cerrar la sesion
+    nominas_repetidas = sorted({valores["persona"].rfc for valores in carga_nominas.repetidos})
+
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar(f"nominas alimentar-pensiones-alimenticias {tipo}", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -2614,6 +2744,15 @@ def alimentar_pensiones_alimenticias(
         click.echo(click.style(f"  Hubo {len(hasta_no_validos)} Hasta no validos.", fg="yellow"))
         click.echo(click.style(f"  {', '.join(hasta_no_validos)}", fg="yellow"))
 
+    # Si hubo renglones con la misma llave, se sumaron en una sola nómina
+    if len(carga_nominas.repetidos) > 0:
+        click.echo(
+            click.style(
+                f"  Hubo {len(carga_nominas.repetidos)} renglones con la misma llave que otro, se sumaron:", fg="yellow"
+            )
+        )
+        click.echo(click.style(f"  {', '.join(nominas_repetidas)}", fg="yellow"))
+
     # Mensaje termino
     if probar:
         click.echo(click.style(f"Alimentar Pensiones Alimenticias: modo PROBAR {contador} pueden insertarse.", fg="green"))
@@ -2625,7 +2764,8 @@ def alimentar_pensiones_alimenticias(
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar primas vacacionales"""
 
     # Validar quincena
@@ -2650,6 +2790,10 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -2664,6 +2808,12 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-primas-vacacionales"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = sesion.query(Quincena).filter_by(clave=quincena_clave).first()
 
@@ -2852,7 +3002,7 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
         # Alimentar percepcion en PercepcionDeduccion, con concepto P20
         if impt_concepto_p20 > 0:
             if probar is False:
-                percepcion_deduccion_p20 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_p20,
                     persona=persona,
@@ -2861,13 +3011,12 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
                     importe=impt_concepto_p20,
                     tipo="PRIMA VACACIONAL",
                 )
-                sesion.add(percepcion_deduccion_p20)
             click.echo(click.style("[P20]", fg="blue"), nl=False)
 
         # Alimentar percepcion en PercepcionDeduccion, con concepto PGP
         if impt_concepto_pgp > 0:
             if probar is False:
-                percepcion_deduccion_pgp = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pgp,
                     persona=persona,
@@ -2876,13 +3025,12 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
                     importe=impt_concepto_pgp,
                     tipo="PRIMA VACACIONAL",
                 )
-                sesion.add(percepcion_deduccion_pgp)
             click.echo(click.style("[PGP]", fg="blue"), nl=False)
 
         # Alimentar percepcion en PercepcionDeduccion, con concepto PGV
         if impt_concepto_pgv > 0:
             if probar is False:
-                percepcion_deduccion_pgv = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pgv,
                     persona=persona,
@@ -2891,13 +3039,12 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
                     importe=impt_concepto_pgv,
                     tipo="PRIMA VACACIONAL",
                 )
-                sesion.add(percepcion_deduccion_pgv)
             click.echo(click.style("[PGV]", fg="blue"), nl=False)
 
         # Alimentar percepcion en PercepcionDeduccion, con concepto D1R
         if impt_concepto_d1r > 0:
             if probar is False:
-                percepcion_deduccion_d1r = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d1r,
                     persona=persona,
@@ -2906,13 +3053,12 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
                     importe=impt_concepto_d1r,
                     tipo="PRIMA VACACIONAL",
                 )
-                sesion.add(percepcion_deduccion_d1r)
             click.echo(click.style("[D1R]", fg="blue"), nl=False)
 
         # Alimentar percepcion en PercepcionDeduccion, con concepto D62
         if impt_concepto_d62 > 0:
             if probar is False:
-                percepcion_deduccion_d62 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d62,
                     persona=persona,
@@ -2921,12 +3067,11 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
                     importe=impt_concepto_d62,
                     tipo="PRIMA VACACIONAL",
                 )
-                sesion.add(percepcion_deduccion_d62)
             click.echo(click.style("[D62]", fg="blue"), nl=False)
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -2941,13 +3086,8 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
                 tipo="PRIMA VACACIONAL",
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
         click.echo(click.style("+", fg="green"), nl=False)
 
-        # Cerrar la sesion para que se guarden todos los datos en la base de datos
-        sesion.commit()
-        sesion.close()
-
         # Incrementar contador
         contador += 1
 
@@ -2959,6 +3099,14 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
         click.echo(click.style("ERROR: No se alimentaron registros en nominas.", fg="red"))
         sys.exit(1)
 
+    # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-primas-vacacionales", quincena, contador, nominas_contador)
+    sesion.commit()
+    sesion.close()
+
     # Actualizar la quincena para poner en verdadero el campo tiene_apoyos_anuales
     quincena.tiene_primas = True
     quincena.save()
@@ -2993,7 +3141,8 @@ def alimentar_primas_vacacionales(quincena_clave: str, fecha_pago_str: str, prob
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar salarios RL"""
 
     # Validar quincena
@@ -3011,6 +3160,10 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -3025,6 +3178,12 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-salarios-rl"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -3084,6 +3243,7 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
     contador = 0
     centros_trabajos_inexistentes = []
     nominas_existentes = []
+    personas_alimentadas = set()
     personas_inexistentes = []
     plazas_inexistentes = []
 
@@ -3177,7 +3337,7 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
             .filter_by(estatus="A")
             .all()
         )
-        if len(nominas_posibles) > 0:
+        if persona.id in personas_alimentadas or len(nominas_posibles) > 0:
             nominas_existentes.append(rfc)
             continue
 
@@ -3187,7 +3347,7 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
         # Alimentar impte_concepto_p01, con concepto P01
         if impte_concepto_p01 != 0.0:
             if probar is False:
-                percepcion_deduccion_p01 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_p01,
                     persona=persona,
@@ -3196,13 +3356,12 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_p01,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_p01)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_p03, con concepto P03
         if impte_concepto_p03 != 0.0:
             if probar is False:
-                percepcion_deduccion_p03 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_p03,
                     persona=persona,
@@ -3211,13 +3370,12 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_p03,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_p03)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_d01, con concepto D01
         if impte_concepto_d01 != 0.0:
             if probar is False:
-                percepcion_deduccion_d01 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d01,
                     persona=persona,
@@ -3226,13 +3384,12 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_d01,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d01)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_d02, con concepto D02
         if impte_concepto_d02 != 0.0:
             if probar is False:
-                percepcion_deduccion_d02 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d02,
                     persona=persona,
@@ -3241,13 +3398,12 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_d02,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d02)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_d03, con concepto D03
         if impte_concepto_d03 != 0.0:
             if probar is False:
-                percepcion_deduccion_d03 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d03,
                     persona=persona,
@@ -3256,12 +3412,11 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
                     importe=impte_concepto_d03,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d03)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -3276,7 +3431,9 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
                 tipo=TIPO,
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
+
+            # Recordar la persona, su nomina no esta en la base de datos hasta guardar el lote
+            personas_alimentadas.add(persona.id)
         click.echo(click.style("a", fg="green"), nl=False)
 
         # Incrementar contador
@@ -3291,6 +3448,10 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
         sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-salarios-rl", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -3326,7 +3487,8 @@ def alimentar_salarios_rl(quincena_clave: str, fecha_pago_str: str, probar: bool
 @click.argument("quincena_clave", type=str)
 @click.argument("fecha_pago_str", type=str)
 @click.option("--probar", is_flag=True, help="Solo probar la lectura del archivo.")
-def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: str, probar: bool = False):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: str, probar: bool = False, forzar: bool = False):
     """Alimentar primas vacacionales alterno"""
 
     # Validar quincena
@@ -3344,6 +3506,10 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_nominas = CargaMasiva(Nomina)
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR == "":
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -3358,6 +3524,12 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("nominas alimentar-primas-vacacionales-alterno"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -3417,6 +3589,7 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
     contador = 0
     centros_trabajos_inexistentes = []
     nominas_existentes = []
+    personas_alimentadas = set()
     personas_inexistentes = []
     plazas_inexistentes = []
 
@@ -3510,7 +3683,7 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
             .filter_by(estatus="A")
             .all()
         )
-        if len(nominas_posibles) > 0:
+        if persona.id in personas_alimentadas or len(nominas_posibles) > 0:
             nominas_existentes.append(rfc)
             continue
 
@@ -3520,7 +3693,7 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
         # Alimentar impte_concepto_p20, con concepto P20
         if impte_concepto_p20 != 0.0:
             if probar is False:
-                percepcion_deduccion_p20 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_p20,
                     persona=persona,
@@ -3529,13 +3702,12 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
                     importe=impte_concepto_p20,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_p20)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_pgp, con concepto PGP
         if impte_concepto_pgp != 0.0:
             if probar is False:
-                percepcion_deduccion_pgp = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pgp,
                     persona=persona,
@@ -3544,13 +3716,12 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
                     importe=impte_concepto_pgp,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_pgp)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_pgv, con concepto PGV
         if impte_concepto_pgv != 0.0:
             if probar is False:
-                percepcion_deduccion_pgv = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_pgv,
                     persona=persona,
@@ -3559,13 +3730,12 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
                     importe=impte_concepto_pgv,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_pgv)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_d1r, con concepto D1R
         if impte_concepto_d1r != 0.0:
             if probar is False:
-                percepcion_deduccion_d1r = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d1r,
                     persona=persona,
@@ -3574,13 +3744,12 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
                     importe=impte_concepto_d1r,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d1r)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar impte_concepto_d62, con concepto D62
         if impte_concepto_d62 != 0.0:
             if probar is False:
-                percepcion_deduccion_d62 = PercepcionDeduccion(
+                carga_percepciones_deducciones.agregar(
                     centro_trabajo=centro_trabajo,
                     concepto=concepto_d62,
                     persona=persona,
@@ -3589,12 +3758,11 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
                     importe=impte_concepto_d62,
                     tipo=TIPO,
                 )
-                sesion.add(percepcion_deduccion_d62)
             click.echo(click.style("p", fg="cyan"), nl=False)
 
         # Alimentar registro en Nomina
         if probar is False:
-            nomina = Nomina(
+            carga_nominas.agregar(
                 centro_trabajo=centro_trabajo,
                 persona=persona,
                 plaza=plaza,
@@ -3609,7 +3777,9 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
                 tipo=TIPO,
                 fecha_pago=fecha_pago,
             )
-            sesion.add(nomina)
+
+            # Recordar la persona, su nomina no esta en la base de datos hasta guardar el lote
+            personas_alimentadas.add(persona.id)
         click.echo(click.style("a", fg="green"), nl=False)
 
         # Incrementar contador
@@ -3624,6 +3794,10 @@ def alimentar_primas_vacacionales_alterno(quincena_clave: str, fecha_pago_str: s
         sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    if probar is False:
+        nominas_contador = carga_nominas.guardar()
+        carga_percepciones_deducciones.guardar()
+        huella.registrar("nominas alimentar-primas-vacacionales-alterno", quincena, contador, nominas_contador)
     sesion.commit()
     sesion.close()
 
@@ -3781,7 +3955,8 @@ def cambiar_fecha_pago(quincena_clave, tipo, fecha_pago_str):
 @click.argument("quincena_clave", type=str)
 @click.option("--fijar-num-cheque", is_flag=True, help="Definir números de cheque")
 @click.option("--modelos-separados-por-comas", help="Por defecto 1,2", default="1,2")
-def crear_archivo_xlsx_aguinaldos(quincena_clave, fijar_num_cheque, modelos_separados_por_comas):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_aguinaldos(quincena_clave, fijar_num_cheque, modelos_separados_por_comas, forzar):
     """Crear archivo XLSX con los aguinaldos de una quincena"""
 
     # Validar quincena_clave
@@ -3812,6 +3987,7 @@ def crear_archivo_xlsx_aguinaldos(quincena_clave, fijar_num_cheque, modelos_sepa
             quincena_producto_id=quincena_producto.id,
             fijar_num_cheque=fijar_num_cheque,
             modelos_separados_por_comas=modelos_separados_por_comas,
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -3823,7 +3999,8 @@ def crear_archivo_xlsx_aguinaldos(quincena_clave, fijar_num_cheque, modelos_sepa
 
 @click.command()
 @click.argument("quincena_clave", type=str)
-def crear_archivo_xlsx_dispersiones_pensionados(quincena_clave):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_dispersiones_pensionados(quincena_clave, forzar):
     """Crear archivo XLSX con las dispersiones para pensionados"""
 
     # Validar quincena_clave
@@ -3852,6 +4029,7 @@ def crear_archivo_xlsx_dispersiones_pensionados(quincena_clave):
         mensaje_termino = crear_dispersiones_pensionados(
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -3864,7 +4042,8 @@ def crear_archivo_xlsx_dispersiones_pensionados(quincena_clave):
 @click.command()
 @click.argument("quincena_clave", type=str)
 @click.option("--fijar-num-cheque", is_flag=True, help="Definir números de cheque")
-def crear_archivo_xlsx_monederos(quincena_clave, fijar_num_cheque):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_monederos(quincena_clave, fijar_num_cheque, forzar):
     """Crear archivo XLSX con los monederos de una quincena"""
 
     # Validar quincena_clave
@@ -3894,6 +4073,7 @@ def crear_archivo_xlsx_monederos(quincena_clave, fijar_num_cheque):
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
             fijar_num_cheque=fijar_num_cheque,
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -3906,7 +4086,8 @@ def crear_archivo_xlsx_monederos(quincena_clave, fijar_num_cheque):
 @click.command()
 @click.argument("quincena_clave", type=str)
 @click.option("--fijar-num-cheque", is_flag=True, help="Definir números de cheque")
-def crear_archivo_xlsx_nominas(quincena_clave, fijar_num_chque):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_nominas(quincena_clave, fijar_num_cheque, forzar):
     """Crear archivo XLSX con las nominas de una quincena"""
 
     # Validar quincena_clave
@@ -3935,7 +4116,8 @@ def crear_archivo_xlsx_nominas(quincena_clave, fijar_num_chque):
         mensaje_termino = crear_nominas(
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
-            fijar_num_cheque=fijar_num_chque,
+            fijar_num_cheque=fijar_num_cheque,
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -3948,7 +4130,8 @@ def crear_archivo_xlsx_nominas(quincena_clave, fijar_num_chque):
 @click.command()
 @click.argument("quincena_clave", type=str)
 @click.option("--fijar-num-cheque", is_flag=True, help="Definir números de cheque")
-def crear_archivo_xlsx_pensionados(quincena_clave, fijar_num_cheque):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_pensionados(quincena_clave, fijar_num_cheque, forzar):
     """Crear archivo XLSX con los pensionados de una quincena"""
 
     # Validar quincena_clave
@@ -3978,6 +4161,7 @@ def crear_archivo_xlsx_pensionados(quincena_clave, fijar_num_cheque):
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
             fijar_num_cheque=fijar_num_cheque,
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -3990,7 +4174,8 @@ def crear_archivo_xlsx_pensionados(quincena_clave, fijar_num_cheque):
 @click.command()
 @click.argument("quincena_clave", type=str)
 @click.option("--fijar-num-cheque", is_flag=True, help="Definir números de cheque")
-def crear_archivo_xlsx_primas_vacacionales(quincena_clave, fijar_num_cheque):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_primas_vacacionales(quincena_clave, fijar_num_cheque, forzar):
     """Crear archivo XLSX con las primas vacacionales de una quincena"""
 
     # Validar quincena_clave
@@ -4020,6 +4205,54 @@ def crear_archivo_xlsx_primas_vacacionales(quincena_clave, fijar_num_cheque):
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
             fijar_num_cheque=fijar_num_cheque,
+            forzar=forzar,
+        )
+    except Exception as error:
+        click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
+        sys.exit(1)
+
+    # Terminar la tarea en el fondo y entregar el mensaje de termino
+    click.echo(click.style(mensaje_termino, fg="green"))
+
+
+@click.command()
+@click.argument("quincena_clave", type=str)
+@click.option("--fijar-num-cheque", is_flag=True, help="Definir números de cheque")
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivos_xlsx_productos(quincena_clave, fijar_num_cheque, forzar):
+    """Crear en un solo recorrido los archivos XLSX de nóminas, monederos, pensionados y dispersiones pensionados"""
+
+    # Validar quincena_clave
+    if re.match(QUINCENA_REGEXP, quincena_clave) is None:
+        click.echo(click.style("ERROR: Clave de la quincena inválida.", fg="red"))
+        sys.exit(1)
+
+    # Consultar quincena
+    quincena = Quincena.query.filter_by(clave=quincena_clave).first()
+
+    # Si no existe la quincena o ha sido eliminada, causa error
+    if quincena is None or quincena.estatus != "A":
+        click.echo(click.style("ERROR: No existe o ha sido eliminada la quincena.", fg="red"))
+        sys.exit(1)
+
+    # Crear un producto para la quincena por cada fuente
+    quincenas_productos_ids = {}
+    for fuente in PRODUCTOS:
+        quincena_producto = QuincenaProducto(
+            quincena_id=quincena.id,
+            fuente=fuente,
+            mensajes="Crear en un solo recorrido los archivos XLSX de la quincena",
+        )
+        quincena_producto.save()
+        quincenas_productos_ids[fuente] = quincena_producto.id
+
+    # Ejecutar crear_productos_quincena
+    try:
+        mensaje_termino = crear_productos_quincena(
+            quincena_clave=quincena_clave,
+            quincenas_productos_ids=quincenas_productos_ids,
+            fijar_num_cheque=fijar_num_cheque,
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -4031,7 +4264,8 @@ def crear_archivo_xlsx_primas_vacacionales(quincena_clave, fijar_num_cheque):
 
 @click.command()
 @click.argument("quincena_clave", type=str)
-def crear_archivo_xlsx_timbrados_empleados_activos(quincena_clave):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_timbrados_empleados_activos(quincena_clave, forzar):
     """Crear archivo XLSX con los timbrados de los empleados activos"""
 
     # Validar quincena_clave
@@ -4061,6 +4295,7 @@ def crear_archivo_xlsx_timbrados_empleados_activos(quincena_clave):
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
             modelos=[1, 2],
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -4072,7 +4307,8 @@ def crear_archivo_xlsx_timbrados_empleados_activos(quincena_clave):
 
 @click.command()
 @click.argument("quincena_clave", type=str)
-def crear_archivo_xlsx_timbrados_pensionados(quincena_clave):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_timbrados_pensionados(quincena_clave, forzar):
     """Crear archivo XLSX con los timbrados de los pensionados"""
 
     # Validar quincena_clave
@@ -4102,6 +4338,7 @@ def crear_archivo_xlsx_timbrados_pensionados(quincena_clave):
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
             modelos=[3],
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -4113,7 +4350,8 @@ def crear_archivo_xlsx_timbrados_pensionados(quincena_clave):
 
 @click.command()
 @click.argument("quincena_clave", type=str)
-def crear_archivo_xlsx_timbrados_primas_vacacionales(quincena_clave):
+@click.option("--forzar", is_flag=True, help="Generar aunque no hayan cambiado las entradas")
+def crear_archivo_xlsx_timbrados_primas_vacacionales(quincena_clave, forzar):
     """Crear archivo XLSX con los timbrados de las primas vacacionales"""
 
     # Validar quincena_clave
@@ -4148,6 +4386,7 @@ def crear_archivo_xlsx_timbrados_primas_vacacionales(quincena_clave):
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto.id,
             tipo="PRIMA VACACIONAL",
+            forzar=forzar,
         )
     except Exception as error:
         click.echo(click.style(f"ERROR: {str(error)}", fg="red"))
@@ -4230,6 +4469,7 @@ cli.add_command(alimentar_extraordinarios)
 cli.add_command(alimentar_pensiones_alimenticias)
 cli.add_command(alimentar_primas_vacacionales)
 cli.add_command(alimentar_primas_vacacionales_alterno)
+cli.add_command(alimentar_quincena)
 cli.add_command(alimentar_salarios_rl)
 cli.add_command(generar_issste)
 cli.add_command(cambiar_fecha_pago)
@@ -4239,6 +4479,7 @@ cli.add_command(crear_archivo_xlsx_monederos)
 cli.add_command(crear_archivo_xlsx_nominas)
 cli.add_command(crear_archivo_xlsx_pensionados)
 cli.add_command(crear_archivo_xlsx_primas_vacacionales)
+cli.add_command(crear_archivos_xlsx_productos)
 cli.add_command(crear_archivo_xlsx_timbrados_empleados_activos)
 cli.add_command(crear_archivo_xlsx_timbrados_pensionados)
 cli.add_command(crear_archivo_xlsx_timbrados_primas_vacacionales)
@@ -11,6 +11,8 @@ from pathlib import Path
 import click
 import xlrd
 
+from cli.commands.conciliacion_explotacion import ConciliacionExplotacion
+from cli.commands.huella_archivo import HuellaArchivo
 from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
 from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
 from pjecz_perseo_flask.blueprints.conceptos_productos.models import ConceptoProducto
@@ -19,11 +21,11 @@ from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import Percep
 from pjecz_perseo_flask.blueprints.personas.models import Persona
 from pjecz_perseo_flask.blueprints.plazas.models import Plaza
 from pjecz_perseo_flask.blueprints.productos.models import Producto
-from pjecz_perseo_flask.blueprints.puestos.models import Puesto
 from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
-from pjecz_perseo_flask.blueprints.tabuladores.models import Tabulador
 from pjecz_perseo_flask.config.extensions import database
-from pjecz_perseo_flask.lib.fechas import quincena_to_fecha, quinquenio_count
+from pjecz_perseo_flask.lib.carga_masiva import CargaMasiva
+from pjecz_perseo_flask.lib.exceptions import MyAnyError
+from pjecz_perseo_flask.lib.fechas import quincena_to_fecha
 from pjecz_perseo_flask.lib.safe_string import QUINCENA_REGEXP, safe_clave, safe_rfc, safe_string
 from pjecz_perseo_flask.main import app
 
@@ -47,7 +49,8 @@ def cli():
 @click.option(
     "--tipo", type=click.Choice(["", "SALARIO", "DESPENSA", "AGUINALDO", "APOYO ANUAL", "APOYO DIA DE LA MADRE"]), default=""
 )
-def alimentar(quincena_clave: str, tipo: str):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar(quincena_clave: str, tipo: str, forzar: bool = False):
     """Alimentar percepciones-deducciones"""
 
     # Iniciar sesión con la base de datos para que la alimentación sea rápida
@@ -62,6 +65,14 @@ def alimentar(quincena_clave: str, tipo: str):
     if tipo == "":
         tipo = "SALARIO"
 
+    # Juntar los renglones para mandarlos en lote, las de tipo SALARIO por su llave natural solo actualizan las diferencias
+    if tipo == PercepcionDeduccion.TIPOS["SALARIO"]:
+        carga_percepciones_deducciones = CargaMasiva(
+            PercepcionDeduccion, llave=PercepcionDeduccion.LLAVE_NATURAL, sumar=("importe",)
+        )
+    else:
+        carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Definir la fecha_final en base a la clave de la quincena
     try:
         fecha_final = quincena_to_fecha(quincena_clave, dame_ultimo_dia=True)
@@ -88,6 +99,12 @@ def alimentar(quincena_clave: str, tipo: str):
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios con el mismo tipo, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado(f"percepciones_deducciones alimentar {tipo}"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -113,266 +130,37 @@ def alimentar(quincena_clave: str, tipo: str):
     # Obtener la primera hoja
     hoja = libro.sheet_by_index(0)
 
-    # Iniciar listado de conceptos que no existen
-    conceptos_no_existentes = []
-
-    # Definir el puesto genérico al que se van a relacionar las personas que no tengan su puesto
-    puesto_generico = Puesto.query.filter_by(clave="ND").first()
-    if puesto_generico is None:
-        click.echo("ERROR: Falta el puesto con clave ND.")
-        sys.exit(1)
-
-    # Definir el tabulador genérico al que se van a relacionar los puestos que no tengan su tabulador
-    tabulador_generico = Tabulador.query.filter_by(puesto_id=puesto_generico.id).first()
-    if tabulador_generico is None:
-        click.echo("ERROR: Falta el tabulador del puesto con clave ND.")
+    # Leer la hoja una sola vez y cargar el catálogo para conciliar las filas
+    try:
+        conciliacion = ConciliacionExplotacion(hoja, fecha_final)
+    except MyAnyError as error:
+        click.echo(click.style(f"ERROR: {error}", fg="red"))
         sys.exit(1)
 
-    # Iniciar contadores
+    # Iniciar contador
     contador = 0
-    centros_trabajos_insertados_contador = 0
-    personas_actualizadas_contador = 0
-    personas_actualizadas_del_tabulador = []
-    personas_actualizadas_del_modelo = []
-    personas_actualizadas_del_num_empleado = []
-    personas_insertadas_contador = 0
-    personas_sin_puestos = []
-    personas_sin_tabulador = []
-    plazas_insertadas_contador = 0
 
-    # Bucle por cada fila
+    # Bucle por cada fila conciliada con el catálogo, con sus percepciones-deducciones
     click.echo(f"Alimentando Percepciones-Deducciones a la quincena {quincena.clave}: ", nl=False)
-    for fila in range(1, hoja.nrows):
-        # Tomar las columnas
-        centro_trabajo_clave = hoja.cell_value(fila, 1)
-        plaza_clave = hoja.cell_value(fila, 8)
-
-        # Tomar las columnas con datos de la Persona
-        rfc = hoja.cell_value(fila, 2)
-        modelo = int(hoja.cell_value(fila, 236))
-        nombre_completo = hoja.cell_value(fila, 3)
-        num_empleado = int(hoja.cell_value(fila, 240))
-
-        # Tomar las columnas necesarias para el timbrado
-        puesto_clave = safe_clave(hoja.cell_value(fila, 20))
-        nivel = int(hoja.cell_value(fila, 9))
-        quincena_ingreso = str(int(hoja.cell_value(fila, 19)))
-
-        # Consultar el Centro de Trabajo, si no existe se agrega
-        centro_trabajo = CentroTrabajo.query.filter_by(clave=centro_trabajo_clave).first()
-        if centro_trabajo is None:
-            centro_trabajo = CentroTrabajo(clave=centro_trabajo_clave, descripcion="ND")
-            sesion.add(centro_trabajo)
-            sesion.commit()
-            centros_trabajos_insertados_contador += 1
-
-        # Consultar la Plaza, si no existe se agrega
-        plaza = Plaza.query.filter_by(clave=plaza_clave).first()
-        if plaza is None:
-            plaza = Plaza(clave=plaza_clave, descripcion="ND")
-            sesion.add(plaza)
-            sesion.commit()
-            plazas_insertadas_contador += 1
-
-        # Si el modelo es 2, entonces en SINDICALIZADO y se toman 4 caracteres del puesto
-        quinquenios = None
-        if modelo == 2:
-            puesto_clave = puesto_clave[:4]
-
-            # Inicializar la bandera para saltar la fila si el concepto es PME
-            es_concepto_pme = False
-
-            # Bucle entre las columnas de los conceptos para encontrar PQ1, PQ2, PQ3, PQ4, PQ5, PQ6
-            col_num = 26
-            while True:
-                # Tomar el p_o_d
-                p_o_d = safe_string(hoja.cell_value(fila, col_num))
-                # Tomar el conc
-                conc = safe_string(hoja.cell_value(fila, col_num + 1))
-                # Si 'P' o 'D' es un texto vacio, se rompe el ciclo
-                if p_o_d == "":
-                    break
-                # Si NO es P, se salta
-                if p_o_d != "P":
-                    col_num += 6
-                    continue
-                # Si conc es ME es monedero, se rompe el ciclo porque aqui no hay quinquenios
-                if conc == "ME":
-                    es_concepto_pme = True
-                    break
-                # Si el concepto no es PQ1, PQ2, PQ3, PQ4, PQ5, PQ6, se salta
-                if conc not in ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6"]:
-                    col_num += 6
-                    continue
-                # Tomar el tercer carácter del concepto y convertirlo a entero porque es la cantidad de quinquenios
-                quinquenios = int(conc[1])
-                break
-
-            # Si es PME, entonces en esta fila NO esta el quinquenio, se mantiene en None
-            if es_concepto_pme:
-                quinquenios = None
-
-        else:
-            # Entonces NO es SINDICALIZADO, se define quinquenios en cero
-            quinquenios = 0
-
-        # Consultar el Puesto, si no existe se agrega a personas_sin_puestos y se le asigna el puesto_generico
-        puesto = Puesto.query.filter_by(clave=puesto_clave).first()
-        if puesto is None:
-            personas_sin_puestos.append(puesto_clave)
-            puesto = puesto_generico
-
-        # Consultar la Persona
-        persona = Persona.query.filter_by(rfc=rfc).first()
-
-        # Si NO existe la Persona, se agrega
-        if persona is None:
-            # Separar nombre_completo, en apellido_primero, apellido_segundo y nombres
-            separado = safe_string(nombre_completo, save_enie=True).split(" ")
-            apellido_primero = separado[0]
-            apellido_segundo = separado[1]
-            nombres = " ".join(separado[2:])
-
-            # Si el modelo es 2 y quinquenios es None, entonces es SINDICALIZADO y se calculan los quinquenios
-            if modelo == 2 and quinquenios is None:
-                # Calcular la cantidad de quinquenios
-                fecha_ingreso = quincena_to_fecha(quincena_ingreso, dame_ultimo_dia=False)
-                quinquenios = quinquenio_count(fecha_ingreso, fecha_final)
-
-            # Consultar el tabulador que coincida con puesto_clave, modelo, nivel y quinquenios
-            tabulador = (
-                Tabulador.query.filter_by(puesto_id=puesto.id)
-                .filter_by(modelo=modelo)
-                .filter_by(nivel=nivel)
-                .filter_by(quinquenio=quinquenios)
-                .first()
-            )
-
-            # Si no existe el tabulador, se agrega a personas_sin_tabulador y se le asigna tabulador_generico
-            if tabulador is None:
-                personas_sin_tabulador.append(rfc)
-                tabulador = tabulador_generico
-
-            # Insertar a la Persona
-            persona = Persona(
-                tabulador_id=tabulador.id,
-                rfc=rfc,
-                nombres=nombres,
-                apellido_primero=apellido_primero,
-                apellido_segundo=apellido_segundo,
-                modelo=modelo,
-                num_empleado=num_empleado,
-            )
-            sesion.add(persona)
-            sesion.commit()
-            personas_insertadas_contador += 1
-
-        # De lo contrario, se revisa si cambia la Persona de tabulador, modelo o num_empleado
-        else:
-            # Inicializar hay_cambios
-            hay_cambios = False
-
-            # Si la fila es concepto PME NO va tener los quinquenios, entonces se define con la Persona
-            if quinquenios is None:
-                quinquenios = persona.tabulador.quinquenio
-
-            # Consultar el tabulador que coincida con puesto_clave, modelo, nivel y quinquenios
-            tabulador = (
-                Tabulador.query.filter_by(puesto_id=puesto.id)
-                .filter_by(modelo=modelo)
-                .filter_by(nivel=nivel)
-                .filter_by(quinquenio=quinquenios)
-                .first()
-            )
-
-            # Si NO existe el tabulador, se agrega a personas_sin_tabulador y se le asigna tabulador_generico
-            if tabulador is None:
-                personas_sin_tabulador.append(rfc)
-                tabulador = tabulador_generico
-
-            # Revisar si hay que actualizar el tabulador a la Persona
-            if persona.tabulador_id != tabulador.id:
-                personas_actualizadas_del_tabulador.append(
-                    f"{rfc} {persona.nombre_completo}: Tabulador: {persona.tabulador_id} -> {tabulador.id}"
-                )
-                persona.tabulador_id = tabulador.id
-                hay_cambios = True
-
-            # Revisar si hay que actualizar el modelo a la Persona
-            # if persona.modelo != modelo:
-            #     personas_actualizadas_del_modelo.append(
-            #         f"{rfc} {persona.nombre_completo}: Modelo: {persona.modelo} -> {modelo}"
-            #     )
-            #     persona.modelo = modelo
-            #     hay_cambios = True
-
-            # Revisar si hay que actualizar el numero de empleado a la Persona
-            if persona.num_empleado != num_empleado:
-                personas_actualizadas_del_num_empleado.append(
-                    f"{rfc} {persona.nombre_completo}: No. Emp. {persona.num_empleado} -> {num_empleado}"
-                )
-                persona.num_empleado = num_empleado
-                hay_cambios = True
-
-            # Si hay cambios, guardar la Persona
-            if hay_cambios:
-                persona.save()
-                personas_actualizadas_contador += 1
-
-        # Buscar percepciones y deducciones
-        percepciones_deducciones_agregadas_contador = 0
-        col_num = 26
-        while True:
-            # Tomar 'P' o 'D', primero
-            p_o_d = safe_string(hoja.cell_value(fila, col_num))
-
-            # Si 'P' o 'D' es un texto vacio, se rompe el ciclo
-            if p_o_d == "":
-                break
-
-            # Tomar los dos caracteres adicionales del concepto
-            conc = safe_string(hoja.cell_value(fila, col_num + 1))
-
-            # Tomar el importe
-            try:
-                impt = int(hoja.cell_value(fila, col_num + 3)) / 100.0
-            except ValueError:
-                impt = 0.0
-
-            # Revisar si el Concepto existe, de lo contrario se agrega
-            concepto_clave = f"{p_o_d}{conc}"
-            concepto = Concepto.query.filter_by(clave=concepto_clave).first()
-            if concepto is None and concepto_clave not in conceptos_no_existentes:
-                conceptos_no_existentes.append(concepto_clave)
-                concepto = Concepto(clave=concepto_clave, descripcion="DESCONOCIDO")
-                sesion.add(concepto)
-                sesion.commit()
-
-            # Alimentar percepcion-deduccion
-            percepcion_deduccion = PercepcionDeduccion(
-                centro_trabajo=centro_trabajo,
+    for conciliada in conciliacion.conciliar(con_conceptos=True):
+        # Alimentar las percepciones y deducciones de la fila
+        for concepto, impt in conciliada.conceptos:
+            carga_percepciones_deducciones.agregar(
+                centro_trabajo=conciliada.centro_trabajo,
                 concepto=concepto,
-                persona=persona,
-                plaza=plaza,
+                persona=conciliada.persona,
+                plaza=conciliada.plaza,
                 quincena=quincena,
                 importe=impt,
                 tipo=tipo,
+                fuente=PercepcionDeduccion.FUENTE_EXPLOTACION,
             )
-            sesion.add(percepcion_deduccion)
-            percepciones_deducciones_agregadas_contador += 1
-
-            # Incrementar col_num en SEIS
-            col_num += 6
-
-            # Romper el ciclo cuando se llega a la columna
-            if col_num > 236:
-                break
 
         # Incrementar contador
         contador += 1
 
-        # Mostrar un cero en rojo si no se agregaron percepciones-deducciones
-        if percepciones_deducciones_agregadas_contador == 0:
+        # Mostrar un cero en amarillo si la fila no tiene percepciones-deducciones
+        if len(conciliada.conceptos) == 0:
             click.echo(click.style("0", fg="yellow"), nl=False)
         else:
             click.echo(click.style(".", fg="cyan"), nl=False)
@@ -380,46 +168,44 @@ def alimentar(quincena_clave: str, tipo: str):
     # Poner avance de linea
     click.echo("")
 
+    # Tomar los RFC de las percepciones-deducciones con la misma llave natural que otra, antes de cerrar la sesion
+    percepciones_deducciones_repetidas = sorted(
+        {valores["persona"].rfc for valores in carga_percepciones_deducciones.repetidos}
+    )
+
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    # Las de tipo SALARIO de la quincena que alimentó la explotación y que ya no vienen en el archivo,
+    # de los conceptos del archivo, se dan de baja
+    percepciones_deducciones_contador = carga_percepciones_deducciones.guardar()
+    percepciones_deducciones_bajas = 0
+    if tipo == PercepcionDeduccion.TIPOS["SALARIO"]:
+        percepciones_deducciones_bajas = carga_percepciones_deducciones.dar_de_baja_ausentes(
+            {"quincena_id": quincena.id, "tipo": tipo, "fuente": PercepcionDeduccion.FUENTE_EXPLOTACION}, por=("concepto_id",)
+        )
+    huella.registrar(f"percepciones_deducciones alimentar {tipo}", quincena, contador, percepciones_deducciones_contador)
     sesion.commit()
     sesion.close()
 
-    # Si hubo centros trabajos insertados, mostrar contador
-    if centros_trabajos_insertados_contador > 0:
-        click.echo(click.style(f"  Se insertaron {centros_trabajos_insertados_contador} Centros de Trabajo", fg="green"))
-
-    # Si hubo personas actualizadas, mostrar contador
-    if personas_actualizadas_contador > 0:
-        click.echo(click.style(f"  Se actualizaron {personas_actualizadas_contador} Personas", fg="green"))
-        for item in personas_actualizadas_del_tabulador:
-            click.echo(click.style(f"  {item}", fg="yellow"))
-        for item in personas_actualizadas_del_modelo:
-            click.echo(click.style(f"  {item}", fg="yellow"))
-        for item in personas_actualizadas_del_num_empleado:
-            click.echo(click.style(f"  {item}", fg="yellow"))
-
-    # Si hubo personas insertadas, mostrar contador
-    if personas_insertadas_contador > 0:
-        click.echo(click.style(f"  Se insertaron {personas_insertadas_contador} Personas", fg="green"))
-
-    # Si hubo plazas insertadas, mostrar contador
-    if plazas_insertadas_contador > 0:
-        click.echo(click.style(f"  Se insertaron {plazas_insertadas_contador} Plazas", fg="green"))
-
-    # Si hubo conceptos no existentes, mostrarlos
-    if len(conceptos_no_existentes) > 0:
-        click.echo(click.style(f"  Hubo {len(conceptos_no_existentes)} Conceptos que no existen:", fg="yellow"))
-        click.echo(click.style(f"  {','.join(conceptos_no_existentes)}", fg="yellow"))
-
-    # Si hubo personas sin puestos, mostrarlos
-    if personas_insertadas_contador > 0 and len(personas_sin_puestos) > 0:
-        click.echo(click.style(f"  Hubo {len(personas_sin_puestos)} Personas sin reconocer su Puesto:", fg="yellow"))
-        # click.echo(click.style(f"  {','.join(personas_sin_puestos)}", fg="yellow"))
-
-    # Si hubo personas_sin_tabulador, mostrarlas en pantalla
-    if personas_insertadas_contador > 0 and len(personas_sin_tabulador) > 0:
-        click.echo(click.style(f"  Hubo {len(personas_sin_tabulador)} Personas sin reconocer su Tabulador.", fg="yellow"))
-        # click.echo(click.style(f"  {', '.join(personas_sin_tabulador)}", fg="yellow"))
+    # Mostrar los contadores y las anomalías de la conciliación
+    conciliacion.mostrar_resumen()
+
+    # Si hubo percepciones-deducciones con la misma llave natural, se sumaron en una sola
+    if len(percepciones_deducciones_repetidas) > 0:
+        click.echo(
+            click.style(
+                f"  Hubo {len(carga_percepciones_deducciones.repetidos)} P-D con la misma llave que otra, se sumaron:",
+                fg="yellow",
+            )
+        )
+        click.echo(click.style(f"  {', '.join(percepciones_deducciones_repetidas)}", fg="yellow"))
+
+    # Si hubo percepciones-deducciones que ya no vienen en el archivo, mostrar contador
+    if percepciones_deducciones_bajas > 0:
+        click.echo(
+            click.style(
+                f"  Se dieron de baja {percepciones_deducciones_bajas} P-D que ya no vienen en el archivo.", fg="yellow"
+            )
+        )
 
     # Mensaje termino
     click.echo(click.style(f"  Alimentar Percepciones-Deducciones: {contador} insertadas.", fg="green"))
@@ -427,7 +213,8 @@ def alimentar(quincena_clave: str, tipo: str):
 
 @click.command()
 @click.argument("quincena_clave", type=str)
-def alimentar_apoyos_anuales(quincena_clave: str):
+@click.option("--forzar", is_flag=True, help="Alimentar aunque el archivo ya se haya alimentado sin cambios.")
+def alimentar_apoyos_anuales(quincena_clave: str, forzar: bool = False):
     """Alimentar percepciones-deducciones para apoyos anuales"""
 
     # Validar quincena
@@ -438,6 +225,9 @@ def alimentar_apoyos_anuales(quincena_clave: str):
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
+    # Juntar los renglones nuevos para insertarlos en lote
+    carga_percepciones_deducciones = CargaMasiva(PercepcionDeduccion)
+
     # Validar el directorio donde espera encontrar los archivos de explotacion
     if EXPLOTACION_BASE_DIR is None:
         click.echo("ERROR: Variable de entorno EXPLOTACION_BASE_DIR no definida.")
@@ -452,6 +242,12 @@ def alimentar_apoyos_anuales(quincena_clave: str):
         click.echo(f"ERROR: {str(ruta)} no es un archivo.")
         sys.exit(1)
 
+    # Si el archivo ya se alimentó sin cambios, se omite sin leerlo
+    huella = HuellaArchivo(ruta)
+    if forzar is False and huella.ya_fue_importado("percepciones_deducciones alimentar-apoyos-anuales"):
+        click.echo(f"AVISO: {str(ruta)} ya se alimentó sin cambios, se omite. Use --forzar para alimentarlo de nuevo.")
+        return
+
     # Consultar quincena
     quincena = Quincena.query.filter_by(clave=quincena_clave).first()
 
@@ -558,7 +354,7 @@ def alimentar_apoyos_anuales(quincena_clave: str):
             continue
 
         # Alimentar percepcion en PercepcionDeduccion, con concepto PAZ
-        percepcion_deduccion_paz = PercepcionDeduccion(
+        carga_percepciones_deducciones.agregar(
             centro_trabajo=centro_trabajo,
             concepto=concepto_paz,
             persona=persona,
@@ -567,10 +363,9 @@ def alimentar_apoyos_anuales(quincena_clave: str):
             importe=percepcion,
             tipo="APOYO ANUAL",
         )
-        sesion.add(percepcion_deduccion_paz)
 
         # Alimentar deduccion en PercepcionDeduccion, con concepto DAZ
-        percepcion_deduccion_daz = PercepcionDeduccion(
+        carga_percepciones_deducciones.agregar(
             centro_trabajo=centro_trabajo,
             concepto=concepto_daz,
             persona=persona,
@@ -579,11 +374,10 @@ def alimentar_apoyos_anuales(quincena_clave: str):
             importe=deduccion,
             tipo="APOYO ANUAL",
         )
-        sesion.add(percepcion_deduccion_daz)
 
         # Si tiene concepto_d62, alimentar registro en PercepcionDeduccion
         if impte_concepto_d62 > 0:
-            percepcion_deduccion_d62 = PercepcionDeduccion(
+            carga_percepciones_deducciones.agregar(
                 centro_trabajo=centro_trabajo,
                 concepto=concepto_d62,
                 persona=persona,
@@ -592,7 +386,6 @@ def alimentar_apoyos_anuales(quincena_clave: str):
                 importe=impte_concepto_d62,
                 tipo="APOYO ANUAL",
             )
-            sesion.add(percepcion_deduccion_d62)
 
             # Sumar a deduccion el impte_concepto_d62
             deduccion += impte_concepto_d62
@@ -617,6 +410,8 @@ def alimentar_apoyos_anuales(quincena_clave: str):
         sys.exit(1)
 
     # Cerrar la sesion para que se guarden todos los datos en la base de datos
+    percepciones_deducciones_contador = carga_percepciones_deducciones.guardar()
+    huella.registrar("percepciones_deducciones alimentar-apoyos-anuales", quincena, contador, percepciones_deducciones_contador)
     sesion.commit()
     sesion.close()
 
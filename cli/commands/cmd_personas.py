@@ -10,10 +10,12 @@ from datetime import datetime
 from pathlib import Path
 
 import click
+import pandas as pd
 import requests
 import xlrd
 from dotenv import load_dotenv
 
+from cli.commands.explotacion import QUINQUENIOS, Explotacion
 from pjecz_perseo_flask.blueprints.nominas.models import Nomina
 from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
 from pjecz_perseo_flask.blueprints.personas.models import Persona
@@ -460,15 +462,28 @@ def actualizar_tabuladores(quincena_clave: str):
     niveles_no_validos_contador = 0
     personas_actualizadas_contador = 0
 
+    # Leer la hoja una sola vez y tomar las columnas y los quinquenios de todas las filas
+    explotacion = Explotacion(hoja)
+    columnas = pd.DataFrame(
+        {
+            "rfc": explotacion.textos(2),
+            "modelo": explotacion.enteros(236),
+            "puesto_clave": explotacion.claves(20),
+            "nivel": explotacion.enteros(9),
+            "num_empleado": explotacion.enteros(240),
+            "concepto_quinquenio": explotacion.concepto_quinquenio(),
+        }
+    )
+
     # Bucle por cada fila
     click.echo(f"Actualizando Tabuladores de las Personas con {quincena_clave}: ", nl=False)
-    for fila in range(1, hoja.nrows):
+    for renglon in columnas.itertuples(index=False):
         # Tomar las columnas
-        rfc = hoja.cell_value(fila, 2)
-        modelo = int(hoja.cell_value(fila, 236))
-        puesto_clave = safe_clave(hoja.cell_value(fila, 20))
-        nivel = int(hoja.cell_value(fila, 9))
-        num_empleado = int(hoja.cell_value(fila, 240))
+        rfc = renglon.rfc
+        modelo = renglon.modelo
+        puesto_clave = renglon.puesto_clave
+        nivel = renglon.nivel
+        num_empleado = renglon.num_empleado
 
         # Consultar a la persona
         persona = Persona.query.filter_by(rfc=rfc).first()
@@ -478,44 +493,17 @@ def actualizar_tabuladores(quincena_clave: str):
             personas_no_encontradas.append(rfc)
             continue
 
-        # Inicializar la bandera para saltar la fila si el concepto es PME
-        es_concepto_pme = False
-
         # Si el modelo es 2, entonces en SINDICALIZADO, se toman 4 caracteres del puesto
         if modelo == 2:
             puesto_clave = puesto_clave[:4]
 
-        # Bucle entre las columnas de los conceptos para encontrar PQ1, PQ2, PQ3, PQ4, PQ5, PQ6 o PME
-        quinquenios = 0
-        col_num = 26
-        while True:
-            # Tomar el p_o_d
-            p_o_d = safe_string(hoja.cell_value(fila, col_num))
-            # Tomar el conc
-            conc = safe_string(hoja.cell_value(fila, col_num + 1))
-            # Si 'P' o 'D' es un texto vacio, se rompe el ciclo
-            if p_o_d == "":
-                break
-            # Si NO es P, se salta
-            if p_o_d != "P":
-                col_num += 6
-                continue
-            # Si conc es ME es monedero, se rompe el ciclo porque aqui no hay quinquenios
-            if conc == "ME":
-                es_concepto_pme = True
-                break
-            # Si el concepto no es PQ1, PQ2, PQ3, PQ4, PQ5, PQ6, se salta
-            if conc not in ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6"]:
-                col_num += 6
-                continue
-            # Tomar el tercer caracter del concepto y convertirlo a entero porque es la cantidad de quinquenios
-            quinquenios = int(conc[1])
-            break
-
         # Si el concepto es PME, entonces en esta fila se salta
-        if es_concepto_pme:
+        if renglon.concepto_quinquenio == "ME":
             continue
 
+        # Tomar la cantidad de quinquenios del concepto PQ1 a PQ6, si no lo tiene es cero
+        quinquenios = QUINQUENIOS.get(renglon.concepto_quinquenio, 0)
+
         # Consultar el puesto
         puesto = Puesto.query.filter_by(clave=puesto_clave).first()
 
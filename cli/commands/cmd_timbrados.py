@@ -8,40 +8,36 @@ import re
 import sys
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from decimal import Decimal, InvalidOperation
 from pathlib import Path
 
 import click
 import pytz
 from dotenv import load_dotenv
 from openpyxl import Workbook
+from sqlalchemy import and_, case, delete, func, inspect
 from sqlalchemy.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy.orm import defer
 
 from pjecz_perseo_flask.blueprints.nominas.models import Nomina
 from pjecz_perseo_flask.blueprints.personas.models import Persona
 from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
 from pjecz_perseo_flask.blueprints.timbrados.models import Timbrado
 from pjecz_perseo_flask.blueprints.timbrados.tasks import exportar_xlsx as task_exportar_xlsx
-from pjecz_perseo_flask.lib.exceptions import (
-    MyBucketNotFoundError,
-    MyFileNotAllowedError,
-    MyFileNotFoundError,
-    MyUploadError,
-)
-from pjecz_perseo_flask.lib.google_cloud_storage import (
-    check_file_exists_from_gcs,
-    get_public_url_from_gcs,
-    upload_file_to_gcs,
-)
+from pjecz_perseo_flask.blueprints.timbrados_conceptos.models import TimbradoConcepto
+from pjecz_perseo_flask.config.extensions import database
+from pjecz_perseo_flask.lib.carga_masiva import CargaMasiva
+from pjecz_perseo_flask.lib.cfdi import leer_cfdi_texto, leer_cfdis
+from pjecz_perseo_flask.lib.exceptions import MyBucketNotFoundError
+from pjecz_perseo_flask.lib.google_cloud_storage import get_storage_backend
 from pjecz_perseo_flask.lib.safe_string import QUINCENA_REGEXP, RFC_REGEXP, safe_string
+from pjecz_perseo_flask.lib.subidas import HILOS, Manifiesto, subir_archivos
 from pjecz_perseo_flask.main import app
 
 TIMEZONE = "America/Mexico_City"
 
 CARPETA = "timbrados"
-XML_TAG_CFD_PREFIX = "{http://www.sat.gob.mx/cfd/4}"
-XML_TAG_TFD_PREFIX = "{http://www.sat.gob.mx/TimbreFiscalDigital}"
-XML_TAG_NOMINA_PREFIX = "{http://www.sat.gob.mx/nomina12}"
+MANIFIESTO_SUBIDAS = ".subidas.jsonl"  # Archivo en el directorio de los timbrados con las subidas terminadas
+TIMBRADOS_POR_LOTE = 500  # Cantidad de timbrados nuevos o cambiados que se mandan a la vez a la base de datos
 
 GCS_TIMBRADOS_URL_BASE = "https://storage.googleapis.com/pjecz-consultas/timbrados"
 
@@ -57,6 +53,27 @@ TIMBRADOS_BASE_DIR = os.getenv("TIMBRADOS_BASE_DIR", "")
 app.app_context().push()
 
 
+def guardar_lote_timbrados(por_relacionar: dict):
+    """Mandar los timbrados de la sesion en un lote y poner su ID en las nominas, se recargan de la base de datos si se vuelven a usar"""
+    database.session.flush()
+    timbrados_ids = []
+    carga_conceptos = CargaMasiva(TimbradoConcepto)
+    for nomina, timbrado, conceptos in por_relacionar.values():
+        nomina.timbrado_id = timbrado.id
+        timbrados_ids.append(timbrado.id)
+        for concepto in conceptos:
+            carga_conceptos.agregar(timbrado_id=timbrado.id, **concepto.columnas())
+        database.session.expire(timbrado)
+    # Reemplazar los conceptos de los timbrados del lote por los leidos del XML
+    database.session.execute(
+        delete(TimbradoConcepto).where(TimbradoConcepto.timbrado_id.in_(timbrados_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    carga_conceptos.guardar()
+    database.session.flush()
+    por_relacionar.clear()
+
+
 @click.group()
 def cli():
     """Timbrados"""
@@ -70,8 +87,18 @@ def cli():
 @click.option("--poner_en_ceros", is_flag=True, default=False, help="Poner en ceros el campo timbrado_id")
 @click.option("--sobreescribir", is_flag=True, default=False, help="Sin importar el valor de timbrado_id")
 @click.option("--subdir", type=str, default=None)
+@click.option("--workers", type=int, default=os.cpu_count(), help="Cantidad de procesos para leer los archivos XML.")
+@click.option("--hilos", type=int, default=HILOS, help="Cantidad de subidas al mismo tiempo al depósito.")
 def actualizar(
-    quincena_clave: str, tipo: str, desde_clave: str, hasta_clave: str, poner_en_ceros: bool, sobreescribir: bool, subdir: str
+    quincena_clave: str,
+    tipo: str,
+    desde_clave: str,
+    hasta_clave: str,
+    poner_en_ceros: bool,
+    sobreescribir: bool,
+    subdir: str,
+    workers: int,
+    hilos: int,
 ):
     """Actualizar los timbrados de una quincena a partir de archivos XML y PDF"""
 
@@ -161,174 +188,126 @@ def actualizar(
     errores_xml = 0
     procesados_contador = 0
 
-    # Recorrer los archivos con extension xml
-    click.echo(f"Actualizar los timbrados de las nominas {quincena_clave} y {tipo}: ", nl=False)
+    # Juntar los archivos con extension xml, si no existe su archivo PDF se agrega a la lista de errores y se omite
+    archivos = []
     for archivo in timbrados_dir.glob("*.xml"):
-        # Obtener el nombre del archivo
-        archivo_nombre = archivo.name
-        # click.echo(f"  {archivo_nombre}")
+        ruta_pdf = Path(timbrados_dir, archivo.name.replace(".xml", ".pdf"))
+        if not ruta_pdf.is_file:
+            archivos_pdf_no_encontrados.append(archivo.name)
+            continue
+        archivos.append(archivo)
+
+    # Leer los archivos XML repartidos entre varios procesos
+    click.echo(f"Leer {len(archivos)} archivos XML con {workers} procesos")
+    cfdis = leer_cfdis(archivos, workers)
+
+    # Consultar de una vez las nominas de los RFC de los Receptores, de la quincena y del tipo
+    rfcs = {datos.cfdi_receptor_rfc for datos in cfdis if datos.es_comprobante and datos.cfdi_receptor_rfc}
+    consulta = (
+        database.session.query(Nomina, Persona.rfc)
+        .join(Persona)
+        .join(Quincena)
+        .filter(Persona.rfc.in_(rfcs))
+        .filter(Quincena.clave == quincena_clave)
+        .filter(Nomina.tipo == tipo)
+    )
 
-        # Definir ruta al archivo XML
-        ruta_xml = Path(timbrados_dir, archivo_nombre)
+    # Si sobreescribir es falso, se filtra por los registros con timbrado_id igual a CERO
+    if sobreescribir is False:
+        consulta = consulta.filter(Nomina.timbrado_id == 0)
+
+    # Si viene desde_clave, se filtra
+    if desde_clave != "":
+        consulta = consulta.filter(Nomina.desde_clave == desde_clave)
+
+    # Si viene hasta_clave, se filtra
+    if hasta_clave != "":
+        consulta = consulta.filter(Nomina.hasta_clave == hasta_clave)
+
+    # Juntar las nominas por RFC, ordenadas por desde_clave
+    nominas_por_rfc = {}
+    for nomina, rfc in consulta.filter(Nomina.estatus == "A").order_by(Persona.rfc, Nomina.desde_clave).all():
+        nominas_por_rfc.setdefault(rfc, []).append(nomina)
+
+    # Consultar de una vez los timbrados que ya existen con los UUID de los archivos, sin cargar el XML
+    uuids = {datos.tfd_uuid for datos in cfdis if datos.es_comprobante and datos.tfd_uuid}
+    timbrados_por_uuid = {
+        timbrado.tfd_uuid: timbrado
+        for timbrado in Timbrado.query.options(defer(Timbrado.tfd)).filter(Timbrado.tfd_uuid.in_(uuids)).all()
+    }
+
+    # Si esta definido el deposito, subir antes con varios hilos los XML y PDF que se van a relacionar con una nomina
+    subidas = {}
+    if CLOUD_STORAGE_DEPOSITO != "":
+        # Juntar los archivos por subir, el blob lleva el UUID
+        por_subir = []
+        for ruta_xml, datos in zip(archivos, cfdis):
+            if datos.es_comprobante is False or datos.tfd_uuid is None:
+                continue
+            if datos.cfdi_receptor_rfc != ruta_xml.name[:13] or datos.cfdi_receptor_rfc not in nominas_por_rfc:
+                continue
+            if (
+                (CFDI_EMISOR_RFC != "" and datos.cfdi_emisor_rfc != CFDI_EMISOR_RFC)
+                or (CFDI_EMISOR_NOMBRE != "" and datos.cfdi_emisor_nombre != CFDI_EMISOR_NOMBRE)
+                or (CFDI_EMISOR_REGFIS != "" and datos.cfdi_emisor_regimen_fiscal != CFDI_EMISOR_REGFIS)
+            ):
+                continue
+            ruta_pdf = Path(timbrados_dir, ruta_xml.name.replace(".xml", ".pdf"))
+            por_subir.append((f"{CARPETA}/{directorio}/{datos.tfd_uuid}.xml", "application/xml", ruta_xml))
+            por_subir.append((f"{CARPETA}/{directorio}/{datos.tfd_uuid}.pdf", "application/pdf", ruta_pdf))
+
+        # Tomar el deposito, con file:// es un directorio local
+        try:
+            backend = get_storage_backend(CLOUD_STORAGE_DEPOSITO)
+        except MyBucketNotFoundError:
+            click.echo(f"ERROR: No se encontró el depósito {CLOUD_STORAGE_DEPOSITO}")
+            sys.exit(1)
+
+        # Subir con varios hilos, lo que ya se subió en una ejecución anterior se toma del manifiesto
+        manifiesto = Manifiesto(Path(timbrados_dir, MANIFIESTO_SUBIDAS), CLOUD_STORAGE_DEPOSITO)
+        click.echo(f"Subir {len(por_subir)} archivos XML y PDF con {hilos} hilos, {len(manifiesto.urls)} en el manifiesto")
+        subidas = subir_archivos(backend, por_subir, manifiesto, hilos)
+
+    # Los timbrados nuevos y cambiados se mandan por lotes, al mandarlos se relacionan con sus nominas
+    por_relacionar = {}
+
+    # Recorrer los archivos XML con sus datos
+    click.echo(f"Actualizar los timbrados de las nominas {quincena_clave} y {tipo}: ", nl=False)
+    for ruta_xml, datos in zip(archivos, cfdis):
+        # Obtener el nombre del archivo
+        archivo_nombre = ruta_xml.name
 
         # Definir ruta al archivo PDF
         ruta_pdf = Path(timbrados_dir, archivo_nombre.replace(".xml", ".pdf"))
 
-        # Si no existe el archivo PDF, se agrega a la lista de errores y se omite
-        if not ruta_pdf.is_file:
-            archivos_pdf_no_encontrados.append(archivo_nombre)
-            continue
-
         # Obtener el RFC que esta en los primeros 13 caracteres del nombre del archivo
         rfc_en_nombre = archivo_nombre[:13]
 
-        # Parsear el archivo XML
-        tree = ET.parse(ruta_xml)
-        root = tree.getroot()
-
-        # Estructura del CFDI version 4.0
-        # - cfdi:Comprobante [xmlns:xsi, xmlns:nomina12, xmlns:cfdi, Version, Serie, Folio, Fecha, SubTotal, Descuento, Moneda,
-        #     Total, TipoDeComprobante, Exportacion, MetodoPago, LugarExpedicion, Sello, Certificado, NoCertificado]
-        #   - cfdi:Emisor [Rfc, Nombre, RegimenFiscal]
-        #   - cfdi:Receptor [Rfc, Nombre, DomicilioFiscalReceptor, RegimenFiscalReceptor, UsoCFDI]
-        #   - cfdi:Conceptos
-        #     - cfdi:Concepto [ClaveProdServ, Cantidad, ClaveUnidad, Descripcion, ValorUnitario, Importe, Descuento, ObjetoImp]
-        #   - cfdi:Complemento
-        #     - tfd:TimbreFiscalDigital [Version, UUID, FechaTimbrado, RfcProvCertif, SelloCFD, NoCertificadoSAT, SelloSAT]
-        #     - nomina12:Nomina [Version, TipoNomina, FechaPago, FechaInicialPago, FechaFinalPago, NumDiasPagados,
-        #         TotalPercepciones, TotalDeducciones, TotalOtrosPagos]
-        #       - nomina12:Emisor [RegistroPatronal]
-        #         - nomina12:EntidadSNCF [OrigenRecurso]
-        #       - nomina12:Receptor [Curp, NumSeguridadSocial, FechaInicioRelLaboral, Antigüedad, TipoContrato, Sindicalizado,
-        #           TipoJornada, TipoRegimen, NumEmpleado, Departamento, Puesto, RiesgoPuesto, PeriodicidadPago, Banco,
-        #           CuentaBancaria, SalarioBaseCotApor, SalarioDiarioIntegrado, ClaveEntFed]
-        #       - nomina12:Percepciones [TotalSueldos, TotalGravado, TotalExento]
-        #         - nomina12:Percepcion [TipoPercepcion, Clave, Concepto, ImporteGravado, ImporteExento]
-        #       - nomina12:Deducciones [TotalOtrasDeducciones]
-        #         - nomina12:Deduccion [TipoDeduccion, Clave, Concepto, Importe]
-        #       - nomina12:OtrosPagos
-        #         - nomina12:OtroPago [TipoOtroPago, Clave, Concepto, Importe]
-
         # Validar que el tag raiz sea cfdi:Comprobante
-        if root.tag != f"{XML_TAG_CFD_PREFIX}Comprobante":
+        if datos.es_comprobante is False:
             errores_xml += 1
             continue
 
-        # Obtener datos de cfdi:Comprobante
-        # cfdi_comprobante_version = None
-        # if "Version" in root.attrib:
-        #     cfdi_comprobante_version = root.attrib["Version"]
-        # click.echo(click.style(f"    Version: {cfdi_comprobante_version}", fg="green"))
-        # cfdi_comprobante_serie = None
-        # if "Serie" in root.attrib:
-        #     cfdi_comprobante_serie = root.attrib["Serie"]
-        # click.echo(click.style(f"    Serie: {cfdi_comprobante_serie}", fg="green"))
-        # cfdi_comprobante_folio = None
-        # if "Folio" in root.attrib:
-        #     cfdi_comprobante_folio = root.attrib["Folio"]
-        # click.echo(click.style(f"    Folio: {cfdi_comprobante_folio}", fg="green"))
-        # cfdi_comprobante_fecha = None
-        # if "Fecha" in root.attrib:
-        #     cfdi_comprobante_fecha = root.attrib["Fecha"]
-        # click.echo(click.style(f"    Fecha: {cfdi_comprobante_fecha}", fg="green"))
-
-        # Inicializar variables de los datos que se van a obtener
-        cfdi_emisor_rfc = None  # cfdi:Emisor [Rfc]
-        cfdi_emisor_nombre = None  # cfdi:Emisor [Nombre]
-        cfdi_emisor_regimen_fiscal = None  # cfdi:Emisor [RegimenFiscal]
-        cfdi_receptor_rfc = None  # cfdi:Receptor [Rfc]
-        cfdi_receptor_nombre = None  # cfdi:Receptor [Nombre]
-        tfd_version = None  # tfd:TimbreFiscalDigital [Version]
-        tfd_uuid = None  # tfd:TimbreFiscalDigital [UUID]
-        tfd_fecha_timbrado = None  # tfd:TimbreFiscalDigital [FechaTimbrado]
-        tfd_sello_cfd = None  # tfd:TimbreFiscalDigital [SelloCFD]
-        tfd_num_cert_sat = None  # tfd:TimbreFiscalDigital [NoCertificadoSAT]
-        tfd_sello_sat = None  # tfd:TimbreFiscalDigital [SelloSAT]
-        nomina12_nomina_version = None  # nomina12:Nomina [Version]
-        nomina12_nomina_tipo_nomina = None  # nomina12:Nomina [TipoNomina]
-        nomina12_nomina_fecha_pago = None  # nomina12:Nomina [FechaPago]
-        nomina12_nomina_fecha_inicial_pago = None  # nomina12:Nomina [FechaInicialPago]
-        nomina12_nomina_fecha_final_pago = None  # nomina12:Nomina [FechaFinalPago]
-        nomina12_nomina_total_percepciones = None  # nomina12:Nomina [TotalPercepciones]
-        nomina12_nomina_total_deducciones = None  # nomina12:Nomina [TotalDeducciones]
-        nomina12_nomina_total_otros_pagos = None  # nomina12:Nomina [TotalOtrosPagos]
-
-        # Bucle por los elementos de root
-        for element in root.iter():
-            # Mostrar el tag
-            # click.echo(click.style(f"    {element.tag}", fg="blue"))
-
-            # Obtener datos de Emisor
-            if element.tag == f"{XML_TAG_CFD_PREFIX}Emisor":
-                if "Rfc" in element.attrib:
-                    cfdi_emisor_rfc = element.attrib["Rfc"]
-                if "Nombre" in element.attrib:
-                    cfdi_emisor_nombre = element.attrib["Nombre"]
-                if "RegimenFiscal" in element.attrib:
-                    cfdi_emisor_regimen_fiscal = element.attrib["RegimenFiscal"]
-
-            # Obtener datos de Receptor
-            if element.tag == f"{XML_TAG_CFD_PREFIX}Receptor":
-                if "Rfc" in element.attrib:
-                    cfdi_receptor_rfc = element.attrib["Rfc"]
-                if "Nombre" in element.attrib:
-                    cfdi_receptor_nombre = element.attrib["Nombre"]
-
-            # Obtener datos de TimbreFiscalDigital
-            if element.tag == f"{XML_TAG_TFD_PREFIX}TimbreFiscalDigital":
-                if "Version" in element.attrib:
-                    tfd_version = element.attrib["Version"]
-                if "UUID" in element.attrib:
-                    tfd_uuid = element.attrib["UUID"]
-                if "FechaTimbrado" in element.attrib:
-                    tfd_fecha_timbrado = element.attrib["FechaTimbrado"]
-                if "SelloCFD" in element.attrib:
-                    tfd_sello_cfd = element.attrib["SelloCFD"]
-                if "NoCertificadoSAT" in element.attrib:
-                    tfd_num_cert_sat = element.attrib["NoCertificadoSAT"]
-                if "SelloSAT" in element.attrib:
-                    tfd_sello_sat = element.attrib["SelloSAT"]
-
-            # Obtener datos de Nomina
-            if element.tag == f"{XML_TAG_NOMINA_PREFIX}Nomina":
-                if "Version" in element.attrib:
-                    nomina12_nomina_version = element.attrib["Version"]
-                if "TipoNomina" in element.attrib:
-                    nomina12_nomina_tipo_nomina = element.attrib["TipoNomina"]
-                if "FechaPago" in element.attrib:
-                    try:
-                        nomina12_nomina_fecha_pago = datetime.strptime(element.attrib["FechaPago"], "%Y-%m-%d").date()
-                    except ValueError:
-                        nomina12_nomina_fecha_pago = None
-                if "FechaInicialPago" in element.attrib:
-                    try:
-                        nomina12_nomina_fecha_inicial_pago = datetime.strptime(
-                            element.attrib["FechaInicialPago"], "%Y-%m-%d"
-                        ).date()
-                    except ValueError:
-                        nomina12_nomina_fecha_inicial_pago = None
-                if "FechaFinalPago" in element.attrib:
-                    try:
-                        nomina12_nomina_fecha_final_pago = datetime.strptime(
-                            element.attrib["FechaFinalPago"], "%Y-%m-%d"
-                        ).date()
-                    except ValueError:
-                        nomina12_nomina_fecha_final_pago = None
-                if "TotalPercepciones" in element.attrib:
-                    try:
-                        nomina12_nomina_total_percepciones = Decimal(format(float(element.attrib["TotalPercepciones"]), ".4f"))
-                    except InvalidOperation:
-                        nomina12_nomina_total_percepciones = None
-                if "TotalDeducciones" in element.attrib:
-                    try:
-                        nomina12_nomina_total_deducciones = Decimal(format(float(element.attrib["TotalDeducciones"]), ".4f"))
-                    except InvalidOperation:
-                        nomina12_nomina_total_deducciones = None
-                if "TotalOtrosPagos" in element.attrib:
-                    try:
-                        nomina12_nomina_total_otros_pagos = Decimal(format(float(element.attrib["TotalOtrosPagos"]), ".4f"))
-                    except InvalidOperation:
-                        nomina12_nomina_total_otros_pagos = None
+        # Tomar los datos leidos del XML
+        cfdi_emisor_rfc = datos.cfdi_emisor_rfc
+        cfdi_emisor_nombre = datos.cfdi_emisor_nombre
+        cfdi_emisor_regimen_fiscal = datos.cfdi_emisor_regimen_fiscal
+        cfdi_receptor_rfc = datos.cfdi_receptor_rfc
+        cfdi_receptor_nombre = datos.cfdi_receptor_nombre
+        tfd_version = datos.tfd_version
+        tfd_uuid = datos.tfd_uuid
+        tfd_fecha_timbrado = datos.tfd_fecha_timbrado
+        tfd_sello_cfd = datos.tfd_sello_cfd
+        tfd_num_cert_sat = datos.tfd_num_cert_sat
+        tfd_sello_sat = datos.tfd_sello_sat
+        nomina12_nomina_version = datos.nomina12_nomina_version
+        nomina12_nomina_tipo_nomina = datos.nomina12_nomina_tipo_nomina
+        nomina12_nomina_fecha_pago = datos.nomina12_nomina_fecha_pago
+        nomina12_nomina_fecha_inicial_pago = datos.nomina12_nomina_fecha_inicial_pago
+        nomina12_nomina_fecha_final_pago = datos.nomina12_nomina_fecha_final_pago
+        nomina12_nomina_total_percepciones = datos.nomina12_nomina_total_percepciones
+        nomina12_nomina_total_deducciones = datos.nomina12_nomina_total_deducciones
+        nomina12_nomina_total_otros_pagos = datos.nomina12_nomina_total_otros_pagos
 
         # Si NO se encontro el Receptor RFC, se agrega a la lista de errores y se omite
         if cfdi_receptor_rfc is None:
@@ -365,29 +344,8 @@ def actualizar(
             nomina_total_deducciones_no_encontrado.append(archivo_nombre)
             continue
 
-        # Consultar las nominas del RFC del Receptor, de la quincena, del tipo y sin timbrado_id
-        nominas = (
-            Nomina.query.join(Persona)
-            .join(Quincena)
-            .filter(Persona.rfc == cfdi_receptor_rfc)
-            .filter(Quincena.clave == quincena_clave)
-            .filter(Nomina.tipo == tipo)
-        )
-
-        # Si sobreescribir es falso, se filtra por los registros con timbrado_id igual a CERO
-        if sobreescribir is False:
-            nominas = nominas.filter(Nomina.timbrado_id == 0)
-
-        # Si viene desde_clave, se filtra
-        if desde_clave != "":
-            nominas = nominas.filter(Nomina.desde_clave == desde_clave)
-
-        # Si viene hasta_clave, se filtra
-        if hasta_clave != "":
-            nominas = nominas.filter(Nomina.hasta_clave == hasta_clave)
-
-        # Consultar las nominas, ordenar
-        nominas = nominas.filter(Nomina.estatus == "A").order_by(Persona.rfc, Nomina.desde_clave).all()
+        # Tomar las nominas del RFC del Receptor
+        nominas = nominas_por_rfc.get(cfdi_receptor_rfc, [])
 
         # Si NO se encuentra registro en Nomina
         if len(nominas) == 0:
@@ -419,13 +377,19 @@ def actualizar(
         # Inicializar bandera hay_cambios
         hay_cambios = False
 
-        # Puede existir el registro de Timbrado, consultar por el UUID
-        timbrado = Timbrado.query.filter(Timbrado.tfd_uuid == tfd_uuid).first()
+        # Puede existir el registro de Timbrado, tomarlo por el UUID
+        timbrado = timbrados_por_uuid.get(tfd_uuid)
+
+        # Si el timbrado se agregó o cambió en el lote que aún no se manda, mandar el lote para tomarlo de la base de datos
+        if timbrado is not None and (inspect(timbrado).pending or inspect(timbrado).modified):
+            guardar_lote_timbrados(por_relacionar)
 
         # Si NO existe el registro de Timbrado, se crea
         es_nuevo = False
         if timbrado is None:
             timbrado = Timbrado(nomina=nomina, estado="TIMBRADO", archivo_pdf="", url_pdf="", archivo_xml="", url_xml="")
+            if tfd_uuid is not None:
+                timbrados_por_uuid[tfd_uuid] = timbrado
             es_nuevo = True
             hay_cambios = True
 
@@ -565,79 +529,39 @@ def actualizar(
         archivo_pdf = timbrado.archivo_pdf
         url_pdf = timbrado.url_pdf
 
-        # Si esta definido el deposito GCS
+        # Si esta definido el deposito, tomar los resultados de las subidas
         if CLOUD_STORAGE_DEPOSITO != "":
-            # Bloque try-except para contar errores en subida de archivos XML
-            try:
-                # Definir el nombre de descarga del archivo XML
-                if archivo_sufijo == "":
-                    archivo_xml = f"{cfdi_receptor_rfc}-{quincena_clave}.xml"
-                else:
-                    archivo_xml = f"{cfdi_receptor_rfc}-{quincena_clave}-{archivo_sufijo}.xml"
-                # Definir la ruta del archivo XML en el deposito GCS
-                blob_nombre_xml = f"{CARPETA}/{directorio}/{tfd_uuid}.xml"
-                # Si existe el archivo XML en el deposito GCS
-                if check_file_exists_from_gcs(CLOUD_STORAGE_DEPOSITO, blob_nombre_xml):
-                    # Obtener la URL del archivo XML
-                    url_xml = get_public_url_from_gcs(CLOUD_STORAGE_DEPOSITO, blob_nombre_xml)
-                # De lo contrario, NO existe el archivo XML en el deposito GCS
-                else:
-                    # Si NO existe el archivo XML, causa error
-                    if not ruta_xml.is_file():
-                        click.echo(click.style(f"[{ruta_xml.name}]", fg="yellow"), nl=False)  # raise MyFileNotFoundError
-                    else:
-                        # Cargar el contenido del archivo XML
-                        with open(ruta_xml, "r", encoding="utf8") as f:
-                            data_xml = f.read()
-                        # Subir el archivo XML
-                        url_xml = upload_file_to_gcs(
-                            bucket_name=CLOUD_STORAGE_DEPOSITO,
-                            blob_name=blob_nombre_xml,
-                            content_type="application/xml",
-                            data=data_xml,
-                        )
-                        click.echo(click.style("(XML)", fg="green"), nl=False)
-            except Exception:
+            # Definir los nombres de descarga de los archivos XML y PDF
+            if archivo_sufijo == "":
+                archivo_xml = f"{cfdi_receptor_rfc}-{quincena_clave}.xml"
+                archivo_pdf = f"{cfdi_receptor_rfc}-{quincena_clave}.pdf"
+            else:
+                archivo_xml = f"{cfdi_receptor_rfc}-{quincena_clave}-{archivo_sufijo}.xml"
+                archivo_pdf = f"{cfdi_receptor_rfc}-{quincena_clave}-{archivo_sufijo}.pdf"
+
+            # Tomar la URL del archivo XML, si no se pudo subir se cuenta el error
+            subida_xml = subidas.get(f"{CARPETA}/{directorio}/{tfd_uuid}.xml")
+            if isinstance(subida_xml, Exception):
                 archivo_xml = ""
                 url_xml = ""
                 errores_cargas_xml_contador += 1
                 click.echo(click.style("(XML)", fg="red"), nl=False)
+            elif subida_xml is None:
+                click.echo(click.style(f"[{ruta_xml.name}]", fg="yellow"), nl=False)
+            else:
+                url_xml = subida_xml
 
-            # Bloque try-except para contar errores en subida de archivos PDF
-            try:
-                # Definir el nombre de descarga del archivo PDF
-                if archivo_sufijo == "":
-                    archivo_pdf = f"{cfdi_receptor_rfc}-{quincena_clave}.pdf"
-                else:
-                    archivo_pdf = f"{cfdi_receptor_rfc}-{quincena_clave}-{archivo_sufijo}.pdf"
-                # Definir la ruta del archivo PDF en el deposito GCS
-                blob_nombre_pdf = f"{CARPETA}/{directorio}/{tfd_uuid}.pdf"
-                # Si existe el archivo PDF en el deposito GCS
-                if check_file_exists_from_gcs(CLOUD_STORAGE_DEPOSITO, blob_nombre_pdf):
-                    # Obtener la URL del archivo PDF
-                    url_pdf = get_public_url_from_gcs(CLOUD_STORAGE_DEPOSITO, blob_nombre_pdf)
-                # De lo contrario, NO existe el archivo PDF en el deposito GCS
-                else:
-                    # Si NO existe el archivo XML, causa error
-                    if not ruta_pdf.is_file():
-                        click.echo(click.style(f"[{ruta_pdf.name}]", fg="yellow"), nl=False)  # raise MyFileNotFoundError
-                    else:
-                        # Cargar el contenido del archivo PDF
-                        with open(ruta_pdf, "rb") as f:
-                            data_pdf = f.read()
-                        # Subir el archivo PDF
-                        url_pdf = upload_file_to_gcs(
-                            bucket_name=CLOUD_STORAGE_DEPOSITO,
-                            blob_name=blob_nombre_pdf,
-                            content_type="application/pdf",
-                            data=data_pdf,
-                        )
-                        click.echo(click.style("(PDF)", fg="green"), nl=False)
-            except (MyBucketNotFoundError, MyFileNotAllowedError, MyFileNotFoundError, MyUploadError):
+            # Tomar la URL del archivo PDF, si no se pudo subir se cuenta el error
+            subida_pdf = subidas.get(f"{CARPETA}/{directorio}/{tfd_uuid}.pdf")
+            if isinstance(subida_pdf, Exception):
                 archivo_pdf = ""
                 url_pdf = ""
                 errores_cargas_pdf_contador += 1
                 click.echo(click.style("(PDF)", fg="red"), nl=False)
+            elif subida_pdf is None:
+                click.echo(click.style(f"[{ruta_pdf.name}]", fg="yellow"), nl=False)
+            else:
+                url_pdf = subida_pdf
 
         # Si archivo_xml es diferente
         if timbrado.archivo_xml != archivo_xml:
@@ -665,20 +589,31 @@ def actualizar(
             with open(ruta_xml, "r", encoding="utf8") as f:
                 timbrado.tfd = f.read()
 
-            # Guardar timbrado
-            timbrado.save()
+            # Agregar el timbrado a la sesion, se manda con el lote
+            database.session.add(timbrado)
+
+            # Si la nomina ya tiene un timbrado en el lote, mandar el lote para tomar su timbrado_id
+            if nomina.id in por_relacionar:
+                guardar_lote_timbrados(por_relacionar)
 
             # Si nomina.timbrado_id tiene un valor diferente a CERO
             if nomina and nomina.timbrado_id:
-                timbrado_por_eliminar = Timbrado.query.get(nomina.timbrado_id)
+                timbrado_por_eliminar = database.session.get(Timbrado, nomina.timbrado_id)
                 if timbrado_por_eliminar and timbrado_por_eliminar.estatus == "A":
                     # Eliminar el timbrado anterior
-                    timbrado_por_eliminar.delete()
+                    timbrado_por_eliminar.estatus = "B"
                     click.echo(click.style("x", fg="red"), nl=False)
 
-            # Actualizar nomina con el ID del timbrado
-            nomina.timbrado_id = timbrado.id
-            nomina.save()
+            # La nomina se actualiza con el ID del timbrado al mandar el lote
+            por_relacionar[nomina.id] = (nomina, timbrado, datos.conceptos)
+
+            # Si sobreescribir es falso, la nomina ya no tiene timbrado_id igual a CERO y no se vuelve a tomar
+            if sobreescribir is False:
+                nominas.remove(nomina)
+
+            # Si se juntó el tamaño del lote, mandarlo
+            if len(por_relacionar) >= TIMBRADOS_POR_LOTE:
+                guardar_lote_timbrados(por_relacionar)
 
             # Si es_nuevo, incrementar agregados_contador
             if es_nuevo:
@@ -695,6 +630,10 @@ def actualizar(
         if not hay_cambios:
             click.echo(click.style("-", fg="yellow"), nl=False)
 
+    # Mandar el último lote y guardar
+    guardar_lote_timbrados(por_relacionar)
+    database.session.commit()
+
     # Poner avance de linea
     click.echo("")
 
@@ -1047,7 +986,6 @@ def exportar_aguinaldos_xlsx(aguinaldos_csv):
     nombre_archivo_xlsx = f"{exportar_aguinaldos_str}.xlsx"
 
     # Inicializar contadores
-    errores_al_parsear_xml = []
     nominas_multiples_encontradas = []
     nominas_no_encontradas = []
     nominas_sin_timbrado = []
@@ -1055,6 +993,7 @@ def exportar_aguinaldos_xlsx(aguinaldos_csv):
     quincenas_no_validas = []
     rfc_no_validos = []
     timbrados_no_encontrados = []
+    timbrados_sin_conceptos = []
     tipos_no_validos = []
     contador = 0
 
@@ -1134,56 +1073,51 @@ def exportar_aguinaldos_xlsx(aguinaldos_csv):
 
                 # Consultar el (o los) timbrado(s)
                 try:
-                    timbrado = Timbrado.query.filter(Timbrado.id == nomina.timbrado_id).filter(Timbrado.estatus == "A").one()
+                    timbrado = (
+                        Timbrado.query.options(defer(Timbrado.tfd))
+                        .filter(Timbrado.id == nomina.timbrado_id)
+                        .filter(Timbrado.estatus == "A")
+                        .one()
+                    )
                 except (MultipleResultsFound, NoResultFound):
                     timbrados_no_encontrados.append(f"{rfc} ({quincena_clave} {tipo})")
                     click.echo(click.style("T", fg="yellow"), nl=False)
                     continue
 
-                # Parsear el contenido XML del timbrado
-                tree = ET.ElementTree(ET.fromstring(timbrado.tfd))
-                root = tree.getroot()
+                # Sumar los importes del aguinaldo con los conceptos del timbrado, P22 exento y PGA gravado
+                importe_exento_aguinaldo, importe_gravado_aguinaldo, conceptos_contador = (
+                    database.session.query(
+                        func.sum(
+                            case(
+                                (
+                                    and_(TimbradoConcepto.clave == "P22", TimbradoConcepto.concepto == "AGUINALDO EXCENTO"),
+                                    TimbradoConcepto.importe_exento,
+                                ),
+                                else_=0,
+                            )
+                        ),
+                        func.sum(
+                            case(
+                                (
+                                    and_(TimbradoConcepto.clave == "PGA", TimbradoConcepto.concepto == "AGUINALDO GRAVABLE"),
+                                    TimbradoConcepto.importe_gravado,
+                                ),
+                                else_=0,
+                            )
+                        ),
+                        func.count(TimbradoConcepto.id),
+                    )
+                    .filter(TimbradoConcepto.timbrado_id == timbrado.id)
+                    .filter(TimbradoConcepto.estatus == "A")
+                    .one()
+                )
 
-                # Validar que el tag raiz sea cfdi:Comprobante
-                if root is None or root.tag != f"{XML_TAG_CFD_PREFIX}Comprobante":
-                    errores_al_parsear_xml.append(f"{rfc} ({quincena_clave} {tipo})")
-                    click.echo(click.style("E", fg="yellow"), nl=False)
+                # Si el timbrado NO tiene conceptos, se deben guardar con actualizar-conceptos
+                if conceptos_contador == 0:
+                    timbrados_sin_conceptos.append(f"{rfc} ({quincena_clave} {tipo})")
+                    click.echo(click.style("C", fg="yellow"), nl=False)
                     continue
 
-                # Estructura del CFDI version 4.0
-                # - cfdi:Comprobante [xmlns:xsi, xmlns:nomina12, xmlns:cfdi, Version, Serie, Folio, Fecha, SubTotal, Descuento, Moneda,
-                #     Total, TipoDeComprobante, Exportacion, MetodoPago, LugarExpedicion, Sello, Certificado, NoCertificado]
-                #   - cfdi:Complemento
-                #     - nomina12:Nomina [Version, TipoNomina, FechaPago, FechaInicialPago, FechaFinalPago, NumDiasPagados,
-                #         TotalPercepciones, TotalDeducciones, TotalOtrosPagos]
-                #       - nomina12:Percepciones [TotalSueldos, TotalGravado, TotalExento]
-                #         - nomina12:Percepcion [TipoPercepcion, Clave, Concepto, ImporteGravado, ImporteExento]
-
-                # Inicializar variables para los importes del aguinaldo
-                importe_exento_aguinaldo = "0.00"
-                importe_gravado_aguinaldo = "0.00"
-
-                # Bucle por los elementos de root
-                for element in root.iter():
-                    # Si es Percepcion
-                    if element.tag == f"{XML_TAG_NOMINA_PREFIX}Percepcion":
-                        # Obtener el importe exento del aguinaldo
-                        if (
-                            "Clave" in element.attrib
-                            and element.attrib["Clave"] == "P22"
-                            and "Concepto" in element.attrib
-                            and element.attrib["Concepto"] == "AGUINALDO EXCENTO"
-                        ):
-                            importe_exento_aguinaldo = element.attrib.get("ImporteExento", "0.00")
-                        # Obtener el importe gravado del aguinaldo
-                        if (
-                            "Clave" in element.attrib
-                            and element.attrib["Clave"] == "PGA"
-                            and "Concepto" in element.attrib
-                            and element.attrib["Concepto"] == "AGUINALDO GRAVABLE"
-                        ):
-                            importe_gravado_aguinaldo = element.attrib.get("ImporteGravado", "0.00")
-
                 # Definir el subdirectorio segun el tipo de nomina
                 subdir = quincena_clave
                 if nomina.tipo == "AGUINALDO":
@@ -1250,9 +1184,6 @@ def exportar_aguinaldos_xlsx(aguinaldos_csv):
 
     # Mensaje de termino
     click.echo()
-    if len(errores_al_parsear_xml) > 0:
-        click.echo(click.style(f"Errores al parsear el XML {len(errores_al_parsear_xml)}: ", fg="white"), nl=False)
-        click.echo(click.style({", ".join(errores_al_parsear_xml)}, fg="yellow"))
     if len(quincenas_no_validas) > 0:
         click.echo(click.style(f"Quincenas NO válidas {len(quincenas_no_validas)}: ", fg="white"), nl=False)
         click.echo(click.style({", ".join(quincenas_no_validas)}, fg="yellow"))
@@ -1277,6 +1208,10 @@ def exportar_aguinaldos_xlsx(aguinaldos_csv):
     if len(timbrados_no_encontrados) > 0:
         click.echo(click.style(f"Timbrados NO encontrados {len(timbrados_no_encontrados)}: ", fg="yellow"), nl=False)
         click.echo(click.style(", ".join(timbrados_no_encontrados), fg="yellow"))
+    if len(timbrados_sin_conceptos) > 0:
+        click.echo(click.style(f"Timbrados sin conceptos {len(timbrados_sin_conceptos)}: ", fg="yellow"), nl=False)
+        click.echo(click.style(", ".join(timbrados_sin_conceptos), fg="yellow"))
+        click.echo(click.style("Guarde sus conceptos con: cli timbrados actualizar-conceptos QUINCENA", fg="yellow"))
     click.echo(click.style(f"Archivo XLSX generado con {contador} filas: {nombre_archivo_xlsx}", fg="green"))
 
 
@@ -1354,8 +1289,86 @@ def actualizar_timbrados_nominas(quincena_clave: str, tipo: str, probar: bool =
         )
 
 
+@click.command()
+@click.argument("quincena_clave", type=str)
+@click.option("--tipo", type=str, default="", help="Tipo de nómina, por defecto todos.")
+@click.option("--probar", is_flag=True, help="Solo probar sin cambiar la base de datos.")
+def actualizar_conceptos(quincena_clave: str, tipo: str, probar: bool = False):
+    """Guardar los conceptos de los timbrados de una quincena que no los tienen, leyendo el XML guardado en tfd"""
+
+    # Validar quincena
+    if re.match(QUINCENA_REGEXP, quincena_clave) is None:
+        click.echo("ERROR: Quincena inválida.")
+        sys.exit(1)
+
+    # Consultar los ID de los timbrados de la quincena que no tienen conceptos
+    consulta = (
+        database.session.query(Timbrado.id)
+        .join(Nomina, Timbrado.nomina_id == Nomina.id)
+        .join(Quincena)
+        .filter(Quincena.clave == quincena_clave)
+        .filter(Timbrado.estatus == "A")
+        .filter(~Timbrado.timbrados_conceptos.any())
+    )
+
+    # Si viene el tipo, se filtra
+    if tipo != "":
+        tipo = safe_string(tipo)
+        if tipo not in Nomina.TIPOS:
+            click.echo("ERROR: Tipo inválido.")
+            sys.exit(1)
+        consulta = consulta.filter(Nomina.tipo == tipo)
+    timbrados_ids = [timbrado_id for (timbrado_id,) in consulta.order_by(Timbrado.id).all()]
+
+    # Inicializar la carga masiva y los contadores
+    carga_conceptos = CargaMasiva(TimbradoConcepto)
+    errores_xml = []
+    contador = 0
+
+    # Leer el XML de los timbrados por lotes, para no tener todos en memoria
+    click.echo(f"Guardar los conceptos de {len(timbrados_ids)} timbrados de la quincena {quincena_clave}: ", nl=False)
+    for inicio in range(0, len(timbrados_ids), TIMBRADOS_POR_LOTE):
+        lote_ids = timbrados_ids[inicio : inicio + TIMBRADOS_POR_LOTE]
+        for timbrado_id, tfd in database.session.query(Timbrado.id, Timbrado.tfd).filter(Timbrado.id.in_(lote_ids)).all():
+            # Leer los conceptos del XML, si no se puede leer se agrega a los errores
+            try:
+                datos = leer_cfdi_texto(tfd)
+            except (ET.ParseError, ValueError):
+                datos = None
+            if datos is None or datos.es_comprobante is False:
+                errores_xml.append(str(timbrado_id))
+                click.echo(click.style("E", fg="yellow"), nl=False)
+                continue
+
+            # Agregar los conceptos a la carga masiva
+            for concepto in datos.conceptos:
+                carga_conceptos.agregar(timbrado_id=timbrado_id, **concepto.columnas())
+            contador += 1
+
+        # Mandar los conceptos del lote
+        carga_conceptos.guardar()
+        click.echo(click.style(".", fg="green"), nl=False)
+
+    # Si NO esta en modo probar, se guarda
+    if probar:
+        database.session.rollback()
+    else:
+        database.session.commit()
+
+    # Mensaje de termino
+    click.echo()
+    if len(errores_xml) > 0:
+        click.echo(click.style(f"No se pudo leer el XML de {len(errores_xml)} timbrados: ", fg="white"), nl=False)
+        click.echo(click.style(", ".join(errores_xml), fg="yellow"))
+    if probar:
+        click.echo(click.style(f"Se encontraron {contador} timbrados para guardar sus conceptos.", fg="green"))
+    else:
+        click.echo(click.style(f"Se guardaron {carga_conceptos.contador} conceptos de {contador} timbrados.", fg="green"))
+
+
 cli.add_command(actualizar)
 cli.add_command(exportar_xlsx)
 cli.add_command(exportar_auditoria_xlsx)
 cli.add_command(exportar_aguinaldos_xlsx)
 cli.add_command(actualizar_timbrados_nominas)
+cli.add_command(actualizar_conceptos)
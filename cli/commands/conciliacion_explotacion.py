@@ -0,0 +1,246 @@
+"""
+Conciliación de la explotación
+
+Resuelve cada fila de la explotación con el catálogo: toma o agrega el centro de trabajo, la plaza y los conceptos,
+agrega a las personas nuevas y actualiza el tabulador y el número de empleado de las que cambiaron
+
+La usan nominas alimentar, nominas alimentar-quincena y percepciones_deducciones alimentar,
+cada comando solo decide qué registros agrega con las filas conciliadas
+"""
+
+from datetime import date
+from typing import Iterator, NamedTuple
+
+import click
+
+from cli.commands.catalogo_alimentar import CatalogoAlimentar
+from cli.commands.explotacion import Explotacion, FilaNomina, transformar_en_paralelo
+from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
+from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
+from pjecz_perseo_flask.blueprints.personas.models import Persona
+from pjecz_perseo_flask.blueprints.plazas.models import Plaza
+from pjecz_perseo_flask.lib.exceptions import MyNotExistsError, MyNotValidParamError
+from pjecz_perseo_flask.lib.fechas import quincena_to_fecha, quinquenio_count
+
+
+class FilaConciliada(NamedTuple):
+    """Fila de la explotación con sus registros del catálogo, los conceptos son tuplas (concepto, importe)"""
+
+    fila: FilaNomina
+    centro_trabajo: CentroTrabajo
+    plaza: Plaza
+    persona: Persona
+    conceptos: list
+
+
+class ConciliacionExplotacion:
+    """Filas de la explotación de una quincena conciliadas con el catálogo, con los contadores y las anomalías"""
+
+    def __init__(self, hoja, fecha_final: date, workers: int = 1):
+        """Leer la hoja una sola vez y cargar el catálogo, provoca MyNotValidParamError si hay una quincena inválida"""
+        self.fecha_final = fecha_final
+
+        # Leer la hoja, validar las quincenas y calcular nombres y quinquenios de todas las filas
+        # Con workers mayor a uno, estos cálculos se reparten entre varios procesos
+        self.explotacion = Explotacion(hoja)
+        try:
+            self.filas = transformar_en_paralelo(self.explotacion.columnas_nominas(), fecha_final, workers)
+        except ValueError as error:
+            raise MyNotValidParamError(str(error)) from error
+
+        # Cargar el catálogo con los centros de trabajo, conceptos, plazas, puestos, personas y tabuladores
+        self.catalogo = CatalogoAlimentar()
+
+        # Definir el puesto genérico al que se van a relacionar las personas que no tengan su puesto
+        self.puesto_generico = self.catalogo.puestos.get("ND")
+        if self.puesto_generico is None:
+            raise MyNotExistsError("Falta el puesto con clave ND.")
+
+        # Definir el tabulador genérico al que se van a relacionar los puestos que no tengan su tabulador
+        self.tabulador_generico = next(
+            (t for t in self.catalogo.tabuladores_por_id.values() if t.puesto_id == self.puesto_generico.id), None
+        )
+        if self.tabulador_generico is None:
+            raise MyNotExistsError("Falta el tabulador del puesto con clave ND.")
+
+        # Inicializar los listados con las anomalías
+        self.conceptos_no_existentes = []
+        self.personas_actualizadas_del_tabulador = []
+        self.personas_actualizadas_del_modelo = []
+        self.personas_actualizadas_del_num_empleado = []
+        self.personas_sin_puestos = []
+        self.personas_sin_tabulador = []
+
+        # Iniciar contadores
+        self.centros_trabajos_insertados_contador = 0
+        self.personas_actualizadas_contador = 0
+        self.personas_insertadas_contador = 0
+        self.plazas_insertadas_contador = 0
+
+    def conciliar(self, con_conceptos: bool = False) -> Iterator[FilaConciliada]:
+        """Conciliar cada fila en el orden de la hoja, con_conceptos también toma o agrega sus conceptos"""
+        conceptos_por_fila = self.explotacion.conceptos_por_fila() if con_conceptos else {}
+        for indice, fila in zip(self.explotacion.tabla.index, self.filas):
+            centro_trabajo = self.tomar_centro_trabajo(fila.centro_trabajo_clave)
+            plaza = self.tomar_plaza(fila.plaza_clave)
+            persona = self.tomar_persona(fila)
+            conceptos = [
+                (self.tomar_concepto(f"{p_o_d}{conc}"), impt) for p_o_d, conc, impt in conceptos_por_fila.get(indice, [])
+            ]
+            yield FilaConciliada(fila, centro_trabajo, plaza, persona, conceptos)
+
+    def tomar_centro_trabajo(self, centro_trabajo_clave: str) -> CentroTrabajo:
+        """Tomar del catálogo el Centro de Trabajo, si no existe se agrega"""
+        centro_trabajo = self.catalogo.centros_trabajos.get(centro_trabajo_clave)
+        if centro_trabajo is None:
+            centro_trabajo = self.catalogo.agregar(CentroTrabajo(clave=centro_trabajo_clave, descripcion="ND"))
+            self.centros_trabajos_insertados_contador += 1
+        return centro_trabajo
+
+    def tomar_plaza(self, plaza_clave: str) -> Plaza:
+        """Tomar del catálogo la Plaza, si no existe se agrega"""
+        plaza = self.catalogo.plazas.get(plaza_clave)
+        if plaza is None:
+            plaza = self.catalogo.agregar(Plaza(clave=plaza_clave, descripcion="ND"))
+            self.plazas_insertadas_contador += 1
+        return plaza
+
+    def tomar_concepto(self, concepto_clave: str) -> Concepto:
+        """Tomar del catálogo el Concepto, si no existe se agrega como DESCONOCIDO"""
+        concepto = self.catalogo.conceptos.get(concepto_clave)
+        if concepto is None:
+            self.conceptos_no_existentes.append(concepto_clave)
+            concepto = self.catalogo.agregar(Concepto(clave=concepto_clave, descripcion="DESCONOCIDO"))
+        return concepto
+
+    def tomar_persona(self, fila: FilaNomina) -> Persona:
+        """Tomar del catálogo la Persona, si no existe se agrega, si existe se actualiza su tabulador y número de empleado"""
+        rfc = fila.rfc
+        quinquenios = fila.quinquenios
+
+        # Tomar del catálogo el Puesto, si no existe se agrega a personas_sin_puestos y se le asigna el puesto_generico
+        # Si el modelo es 2 el puesto ya tiene 4 caracteres
+        puesto = self.catalogo.puestos.get(fila.puesto_clave)
+        if puesto is None:
+            self.personas_sin_puestos.append(rfc)
+            puesto = self.puesto_generico
+
+        # Tomar del catálogo la Persona
+        persona = self.catalogo.personas.get(rfc)
+
+        # Si NO existe la Persona, se agrega
+        if persona is None:
+            # Si el modelo es 2 y quinquenios es None, entonces es SINDICALIZADO y se toman los quinquenios desde el ingreso
+            if fila.modelo == 2 and quinquenios is None:
+                quinquenios = fila.quinquenios_ingreso
+                if quinquenios is None:
+                    fecha_ingreso = quincena_to_fecha(fila.quincena_ingreso, dame_ultimo_dia=False)
+                    quinquenios = quinquenio_count(fecha_ingreso, self.fecha_final)
+
+            # Tomar del catálogo el tabulador que coincida con puesto_clave, modelo, nivel y quinquenios
+            tabulador = self.catalogo.consultar_tabulador(puesto.id, fila.modelo, fila.nivel, quinquenios)
+
+            # Si no existe el tabulador, se agrega a personas_sin_tabulador y se le asigna tabulador_generico
+            if tabulador is None:
+                self.personas_sin_tabulador.append(rfc)
+                tabulador = self.tabulador_generico
+
+            # Insertar a la Persona, se guarda con el commit del comando
+            persona = Persona(
+                tabulador_id=tabulador.id,
+                rfc=rfc,
+                nombres=fila.nombres,
+                apellido_primero=fila.apellido_primero,
+                apellido_segundo=fila.apellido_segundo,
+                modelo=fila.modelo,
+                num_empleado=fila.num_empleado,
+            )
+            self.catalogo.agregar(persona)
+            self.personas_insertadas_contador += 1
+            return persona
+
+        # De lo contrario, se revisa si cambia la Persona de tabulador, modelo o num_empleado
+        hay_cambios = False
+
+        # Si la fila es concepto PME NO va tener los quinquenios, entonces se define con la Persona
+        if quinquenios is None:
+            quinquenios = self.catalogo.tabuladores_por_id[persona.tabulador_id].quinquenio
+
+        # Tomar del catálogo el tabulador que coincida con puesto_clave, modelo, nivel y quinquenios
+        tabulador = self.catalogo.consultar_tabulador(puesto.id, fila.modelo, fila.nivel, quinquenios)
+
+        # Si NO existe el tabulador, se agrega a personas_sin_tabulador y se le asigna tabulador_generico
+        if tabulador is None:
+            self.personas_sin_tabulador.append(rfc)
+            tabulador = self.tabulador_generico
+
+        # Revisar si hay que actualizar el tabulador a la Persona
+        if persona.tabulador_id != tabulador.id:
+            self.personas_actualizadas_del_tabulador.append(
+                f"{rfc} {persona.nombre_completo}: Tabulador: {persona.tabulador_id} -> {tabulador.id}"
+            )
+            persona.tabulador_id = tabulador.id
+            hay_cambios = True
+
+        # Revisar si hay que actualizar el modelo a la Persona
+        # if persona.modelo != fila.modelo:
+        #     self.personas_actualizadas_del_modelo.append(
+        #         f"{rfc} {persona.nombre_completo}: Modelo: {persona.modelo} -> {fila.modelo}"
+        #     )
+        #     persona.modelo = fila.modelo
+        #     hay_cambios = True
+
+        # Revisar si hay que actualizar el numero de empleado a la Persona
+        if persona.num_empleado != fila.num_empleado:
+            self.personas_actualizadas_del_num_empleado.append(
+                f"{rfc} {persona.nombre_completo}: Num. Emp. {persona.num_empleado} -> {fila.num_empleado}"
+            )
+            persona.num_empleado = fila.num_empleado
+            hay_cambios = True
+
+        # Si hay cambios, la Persona se guarda con el commit del comando
+        if hay_cambios:
+            self.personas_actualizadas_contador += 1
+        return persona
+
+    def mostrar_resumen(self):
+        """Mostrar en pantalla los contadores y las anomalías de la conciliación"""
+
+        # Si hubo centros_trabajos_insertados, mostrar contador
+        if self.centros_trabajos_insertados_contador > 0:
+            click.echo(
+                click.style(f"  Se insertaron {self.centros_trabajos_insertados_contador} Centros de Trabajo", fg="green")
+            )
+
+        # Si hubo personas actualizadas, mostrar contador
+        if self.personas_actualizadas_contador > 0:
+            click.echo(click.style(f"  Se actualizaron {self.personas_actualizadas_contador} Personas", fg="green"))
+            for item in self.personas_actualizadas_del_tabulador:
+                click.echo(click.style(f"  {item}", fg="yellow"))
+            for item in self.personas_actualizadas_del_modelo:
+                click.echo(click.style(f"  {item}", fg="yellow"))
+            for item in self.personas_actualizadas_del_num_empleado:
+                click.echo(click.style(f"  {item}", fg="yellow"))
+
+        # Si hubo personas insertadas, mostrar contador
+        if self.personas_insertadas_contador > 0:
+            click.echo(click.style(f"  Se insertaron {self.personas_insertadas_contador} Personas", fg="green"))
+
+        # Si hubo plazas insertadas, mostrar contador
+        if self.plazas_insertadas_contador > 0:
+            click.echo(click.style(f"  Se insertaron {self.plazas_insertadas_contador} Plazas", fg="green"))
+
+        # Si hubo conceptos no existentes, mostrarlos
+        if len(self.conceptos_no_existentes) > 0:
+            click.echo(click.style(f"  Hubo {len(self.conceptos_no_existentes)} Conceptos que no existen:", fg="yellow"))
+            click.echo(click.style(f"  {','.join(self.conceptos_no_existentes)}", fg="yellow"))
+
+        # Si hubo personas_sin_puestos, mostrarlas en pantalla
+        if len(self.personas_sin_puestos) > 0:
+            click.echo(click.style(f"  Hubo {len(self.personas_sin_puestos)} Personas sin puestos.", fg="yellow"))
+            click.echo(click.style(f"  {', '.join(self.personas_sin_puestos)}", fg="yellow"))
+
+        # Si hubo personas_sin_tabulador, mostrarlas en pantalla
+        if len(self.personas_sin_tabulador) > 0:
+            click.echo(click.style(f"  Hubo {len(self.personas_sin_tabulador)} Personas sin tabulador.", fg="yellow"))
+            click.echo(click.style(f"  {', '.join(self.personas_sin_tabulador)}", fg="yellow"))
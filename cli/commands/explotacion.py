@@ -0,0 +1,280 @@
+"""
+Explotación
+
+Lee una sola vez la hoja del archivo de explotación a una tabla de pandas,
+las columnas fijas y los bloques de percepciones-deducciones se sacan columna por columna
+en lugar de consultar celda por celda con hoja.cell_value
+
+Los bloques de percepciones-deducciones empiezan en la columna 26 y ocupan seis columnas cada uno,
+en la primera está P o D, en la segunda los dos caracteres del concepto y en la cuarta el importe en centavos,
+se toman hasta el primer bloque vacío
+
+Las fechas, nombres y quinquenios de las nóminas se calculan renglón por renglón con transformar_renglones,
+con transformar_en_paralelo los renglones se reparten en bloques entre varios procesos
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import cached_property
+from itertools import repeat
+from typing import NamedTuple
+
+import pandas as pd
+
+from pjecz_perseo_flask.lib.fechas import quincena_to_fecha, quinquenio_count
+from pjecz_perseo_flask.lib.safe_string import safe_clave, safe_quincena, safe_string
+
+CONCEPTOS_PRIMER_COLUMNA = 26
+CONCEPTOS_ULTIMA_COLUMNA = 236
+CONCEPTOS_COLUMNAS_POR_BLOQUE = 6
+QUINQUENIOS = {"Q1": 1, "Q2": 2, "Q3": 3, "Q4": 4, "Q5": 5, "Q6": 6}
+BLOQUES_POR_PROCESO = 4  # Cantidad de bloques de renglones por cada proceso, para repartir mejor la carga
+
+
+class FilaNomina(NamedTuple):
+    """Renglón de la explotación listo para alimentar la nómina, sin consultar el catálogo"""
+
+    centro_trabajo_clave: str
+    plaza_clave: str
+    percepcion: float
+    deduccion: float
+    impte: float
+    desde: date
+    desde_clave: str
+    hasta: date
+    hasta_clave: str
+    rfc: str
+    modelo: int
+    apellido_primero: str
+    apellido_segundo: str
+    nombres: str
+    num_empleado: int
+    puesto_clave: str
+    nivel: int
+    quincena_ingreso: str
+    quinquenios: int | None
+    quinquenios_ingreso: int | None
+    es_despensa: bool
+
+
+def limpiar(serie: pd.Series, funcion) -> pd.Series:
+    """Aplicar la función de limpieza, como safe_string, una sola vez por cada valor distinto de la columna"""
+    return serie.map({valor: funcion(valor) for valor in serie.unique()})
+
+
+def calcular_quinquenios_ingreso(quincena_ingreso: str, fecha_final: date) -> int | None:
+    """Calcular los quinquenios desde la quincena de ingreso hasta la fecha final, si la quincena no es válida entrega None"""
+    try:
+        return quinquenio_count(quincena_to_fecha(quincena_ingreso, dame_ultimo_dia=False), fecha_final)
+    except ValueError:
+        return None
+
+
+def separar_nombre_completo(nombre_completo) -> tuple[str, str, str]:
+    """Separar el nombre completo en apellido primero, apellido segundo y nombres"""
+    separado = safe_string(nombre_completo, save_enie=True).split(" ")
+    return separado[0], separado[1] if len(separado) > 1 else "", " ".join(separado[2:])
+
+
+def transformar_renglones(renglones: list, fecha_final: date) -> list[FilaNomina]:
+    """Transformar los renglones de columnas_nominas en FilaNomina, provoca ValueError si hay una quincena inválida"""
+    filas = []
+    for (
+        centro_trabajo_clave,
+        plaza_clave,
+        percepcion,
+        deduccion,
+        impte,
+        desde_s,
+        hasta_s,
+        rfc,
+        modelo,
+        nombre_completo,
+        num_empleado,
+        puesto_clave,
+        nivel,
+        quincena_ingreso,
+        concepto_quinquenio,
+        es_despensa,
+    ) in renglones:
+        # Validar desde y hasta
+        try:
+            desde_clave = safe_quincena(desde_s)
+            desde = quincena_to_fecha(desde_clave, dame_ultimo_dia=False)
+            hasta_clave = safe_quincena(hasta_s)
+            hasta = quincena_to_fecha(hasta_clave, dame_ultimo_dia=True)
+        except ValueError as error:
+            raise ValueError(f"Quincena inválida en '{desde_s}' o '{hasta_s}'") from error
+
+        # Si el modelo es 2 es SINDICALIZADO, se toman 4 caracteres del puesto y los quinquenios de PQ1 a PQ6
+        # Si es PME en esta fila NO estan los quinquenios y quedan en None, si no es SINDICALIZADO son cero
+        quinquenios_ingreso = None
+        if modelo == 2:
+            puesto_clave = puesto_clave[:4]
+            quinquenios = QUINQUENIOS.get(concepto_quinquenio)
+            if quinquenios is None:
+                quinquenios_ingreso = calcular_quinquenios_ingreso(quincena_ingreso, fecha_final)
+        else:
+            quinquenios = 0
+
+        # Separar nombre_completo, en apellido_primero, apellido_segundo y nombres
+        apellido_primero, apellido_segundo, nombres = separar_nombre_completo(nombre_completo)
+
+        # Juntar la fila
+        filas.append(
+            FilaNomina(
+                centro_trabajo_clave=centro_trabajo_clave,
+                plaza_clave=plaza_clave,
+                percepcion=percepcion,
+                deduccion=deduccion,
+                impte=impte,
+                desde=desde,
+                desde_clave=desde_clave,
+                hasta=hasta,
+                hasta_clave=hasta_clave,
+                rfc=rfc,
+                modelo=modelo,
+                apellido_primero=apellido_primero,
+                apellido_segundo=apellido_segundo,
+                nombres=nombres,
+                num_empleado=num_empleado,
+                puesto_clave=puesto_clave,
+                nivel=nivel,
+                quincena_ingreso=quincena_ingreso,
+                quinquenios=quinquenios,
+                quinquenios_ingreso=quinquenios_ingreso,
+                es_despensa=es_despensa,
+            )
+        )
+    return filas
+
+
+def transformar_en_paralelo(renglones: list, fecha_final: date, procesos: int = 1) -> list[FilaNomina]:
+    """Transformar los renglones repartidos en bloques entre varios procesos, con uno solo se hace en este proceso"""
+
+    # Con un solo proceso, o pocos renglones, no vale la pena repartir
+    if procesos <= 1 or len(renglones) < procesos:
+        return transformar_renglones(renglones, fecha_final)
+
+    # Repartir en bloques consecutivos, los resultados se juntan en el mismo orden de los renglones
+    tamano = -(-len(renglones) // (procesos * BLOQUES_POR_PROCESO))
+    bloques = [renglones[inicio : inicio + tamano] for inicio in range(0, len(renglones), tamano)]
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        return [fila for filas in ejecutor.map(transformar_renglones, bloques, repeat(fecha_final)) for fila in filas]
+
+
+class Explotacion:
+    """Hoja de explotación cargada en una tabla de pandas, sin el renglón de encabezados"""
+
+    def __init__(self, hoja):
+        """Cargar todos los renglones de la hoja, el índice es el número de fila en la hoja"""
+        self.tabla = pd.DataFrame(
+            [hoja.row_values(fila) for fila in range(1, hoja.nrows)],
+            index=pd.RangeIndex(1, max(hoja.nrows, 1)),
+            columns=range(hoja.ncols),
+            dtype=object,
+        )
+
+    def textos(self, columna: int) -> pd.Series:
+        """Tomar la columna tal cual viene en la hoja"""
+        return self.tabla[columna]
+
+    def claves(self, columna: int) -> pd.Series:
+        """Tomar la columna limpia con safe_clave"""
+        return limpiar(self.tabla[columna], safe_clave)
+
+    def enteros(self, columna: int) -> pd.Series:
+        """Tomar la columna como enteros, si hay una celda que no es número provoca ValueError"""
+        return self.tabla[columna].astype("int64")
+
+    def importes(self, columna: int) -> pd.Series:
+        """Tomar la columna de centavos como importe en pesos"""
+        return self.enteros(columna) / 100.0
+
+    def quincenas(self, columna: int) -> pd.Series:
+        """Tomar la columna de quincenas, como 202401.0, como texto 202401"""
+        return self.enteros(columna).astype(str)
+
+    def columnas_nominas(self) -> list[tuple]:
+        """Tomar las columnas que necesitan las nóminas como tuplas, una por renglón, para transformar_renglones"""
+        return list(
+            pd.DataFrame(
+                {
+                    "centro_trabajo_clave": self.textos(1),
+                    "plaza_clave": self.textos(8),
+                    "percepcion": self.importes(12),
+                    "deduccion": self.importes(13),
+                    "impte": self.importes(14),
+                    "desde_s": self.quincenas(16),
+                    "hasta_s": self.quincenas(17),
+                    "rfc": self.textos(2),
+                    "modelo": self.enteros(236),
+                    "nombre_completo": self.textos(3),
+                    "num_empleado": self.enteros(240),
+                    "puesto_clave": self.claves(20),
+                    "nivel": self.enteros(9),
+                    "quincena_ingreso": self.quincenas(19),
+                    "concepto_quinquenio": self.concepto_quinquenio(),
+                    "es_despensa": self.es_despensa(),
+                }
+            ).itertuples(index=False, name=None)
+        )
+
+    @cached_property
+    def conceptos(self) -> pd.DataFrame:
+        """Bloques de percepciones-deducciones en formato largo, con fila, bloque, p_o_d, conc e importe"""
+
+        # Rellenar con textos vacíos las columnas de los bloques que no vengan en la hoja
+        tabla = self.tabla.reindex(columns=range(CONCEPTOS_ULTIMA_COLUMNA + 4), fill_value="")
+
+        # Apilar los bloques, uno debajo de otro
+        columnas = range(CONCEPTOS_PRIMER_COLUMNA, CONCEPTOS_ULTIMA_COLUMNA + 1, CONCEPTOS_COLUMNAS_POR_BLOQUE)
+        largo = pd.concat(
+            [
+                pd.DataFrame(
+                    {
+                        "fila": tabla.index,
+                        "bloque": bloque,
+                        "p_o_d": tabla[columna].to_numpy(),
+                        "conc": tabla[columna + 1].to_numpy(),
+                        "importe": tabla[columna + 3].to_numpy(),
+                    }
+                )
+                for bloque, columna in enumerate(columnas)
+            ],
+            ignore_index=True,
+        )
+
+        # Limpiar P o D y el concepto, los valores que no son texto quedan vacíos
+        largo["p_o_d"] = limpiar(largo["p_o_d"], safe_string)
+        largo["conc"] = limpiar(largo["conc"], safe_string)
+
+        # Convertir los centavos a pesos, lo que no es número queda en cero
+        largo["importe"] = pd.to_numeric(largo["importe"], errors="coerce").fillna(0).astype("int64") / 100.0
+
+        # Conservar los bloques antes del primer bloque vacío de cada fila
+        primer_vacio = largo.loc[largo["p_o_d"] == ""].groupby("fila")["bloque"].min()
+        limite = largo["fila"].map(primer_vacio).fillna(len(columnas))
+        largo = largo.loc[largo["bloque"] < limite]
+
+        # Entregar ordenado por fila y bloque
+        return largo.sort_values(["fila", "bloque"], kind="stable").reset_index(drop=True)
+
+    def conceptos_por_fila(self) -> dict:
+        """Entregar un diccionario con la fila y su listado de tuplas (p_o_d, conc, importe)"""
+        por_fila = {}
+        for fila, p_o_d, conc, importe in self.conceptos[["fila", "p_o_d", "conc", "importe"]].itertuples(index=False):
+            por_fila.setdefault(fila, []).append((p_o_d, conc, importe))
+        return por_fila
+
+    def concepto_quinquenio(self) -> pd.Series:
+        """Por cada fila, el primer concepto de percepción entre ME y Q1 a Q6, es texto vacío si no tiene"""
+        conceptos = self.conceptos
+        marcas = conceptos.loc[(conceptos["p_o_d"] == "P") & conceptos["conc"].isin(["ME", *QUINQUENIOS])]
+        return marcas.groupby("fila")["conc"].first().reindex(self.tabla.index, fill_value="")
+
+    def es_despensa(self) -> pd.Series:
+        """Por cada fila, verdadero si tiene el concepto PME de DESPENSA"""
+        conceptos = self.conceptos
+        filas = conceptos.loc[(conceptos["p_o_d"] + conceptos["conc"]) == "PME", "fila"]
+        return pd.Series(self.tabla.index.isin(filas), index=self.tabla.index)
@@ -0,0 +1,56 @@
+"""
+Huella de archivo
+
+Toma el tamaño y el SHA-256 de un archivo para consultarlo y registrarlo en las importaciones,
+si el mismo comando ya alimentó el archivo sin cambios se puede omitir sin leerlo con xlrd
+
+Si el archivo cambió se vuelve a alimentar, los comandos que usan la llave natural solo aplican las diferencias
+
+Al volver a alimentar la explotación, los registros que alimentó y que ya no vienen en el archivo se dan de baja,
+los comandos que no usan la llave natural, como los de aguinaldos, apoyos y extraordinarios, no dan de baja ni actualizan
+"""
+
+import hashlib
+from pathlib import Path
+
+from pjecz_perseo_flask.blueprints.importaciones.models import Importacion
+from pjecz_perseo_flask.config.extensions import database
+
+TAMANO_BLOQUE = 1024 * 1024  # Cantidad de bytes que se leen a la vez para calcular el SHA-256
+
+
+class HuellaArchivo:
+    """Ruta, tamaño y SHA-256 de un archivo"""
+
+    def __init__(self, ruta: Path):
+        """Leer el archivo por bloques para calcular el SHA-256"""
+        self.ruta = str(ruta)
+        self.tamano = ruta.stat().st_size
+        sha256 = hashlib.sha256()
+        with open(ruta, "rb") as archivo:
+            for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b""):
+                sha256.update(bloque)
+        self.sha256 = sha256.hexdigest()
+
+    def consultar_importacion(self, comando: str) -> Importacion:
+        """Consultar la última importación del comando con la misma ruta, si no hay entrega None"""
+        return Importacion.query.filter_by(comando=comando, ruta=self.ruta, estatus="A").order_by(Importacion.id.desc()).first()
+
+    def ya_fue_importado(self, comando: str) -> bool:
+        """Verdadero si la última importación del comando tiene el mismo tamaño y SHA-256"""
+        importacion = self.consultar_importacion(comando)
+        return importacion is not None and importacion.tamano == self.tamano and importacion.sha256 == self.sha256
+
+    def registrar(self, comando: str, quincena, renglones: int, registros: int) -> Importacion:
+        """Agregar la importación a la sesión, se guarda con el commit del comando junto con lo alimentado"""
+        importacion = Importacion(
+            quincena=quincena,
+            comando=comando,
+            ruta=self.ruta,
+            tamano=self.tamano,
+            sha256=self.sha256,
+            renglones=renglones,
+            registros=registros,
+        )
+        database.session.add(importacion)
+        return importacion
@@ -0,0 +1,667 @@
+"""
+Tablas temporales
+
+Alimenta una quincena cargando las filas de la explotación y sus percepciones-deducciones
+a tablas temporales, luego la conciliación se hace en la base de datos con sentencias sobre conjuntos
+
+- INSERT ... SELECT para los centros de trabajo, plazas, conceptos y personas que faltan
+- UPDATE con subconsultas para tomar los id, el puesto y el tabulador de cada fila
+- INSERT ... SELECT ... ON CONFLICT para las nóminas y las percepciones-deducciones, por su llave natural
+- UPDATE con NOT EXISTS para dar de baja las de la quincena que alimentó la explotación y ya no vienen en el archivo
+
+De cada persona decide la última fila que trae los quinquenios, si ninguna los trae decide la última fila,
+los reportes de cambios de tabulador y de número de empleado salen de comparar esas filas con las personas
+"""
+
+import sys
+
+import click
+import pandas as pd
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    Integer,
+    MetaData,
+    Numeric,
+    String,
+    Table,
+    case,
+    cast,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+)
+
+from cli.commands.explotacion import QUINQUENIOS, Explotacion, calcular_quinquenios_ingreso, separar_nombre_completo
+from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
+from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
+from pjecz_perseo_flask.blueprints.personas.models import Persona
+from pjecz_perseo_flask.blueprints.plazas.models import Plaza
+from pjecz_perseo_flask.blueprints.puestos.models import Puesto
+from pjecz_perseo_flask.blueprints.tabuladores.models import Tabulador
+from pjecz_perseo_flask.config.extensions import database
+from pjecz_perseo_flask.lib.carga_masiva import CargaMasiva, insertar_con_llave
+from pjecz_perseo_flask.lib.fechas import quincena_to_fecha
+from pjecz_perseo_flask.lib.safe_string import safe_quincena
+
+# Las tablas temporales tienen su propio MetaData para que create_all de la aplicación no las cree
+METADATA_TEMPORAL = MetaData()
+
+EXPLOTACION_FILAS = Table(
+    "tmp_explotacion_filas",
+    METADATA_TEMPORAL,
+    Column("fila", Integer, primary_key=True, autoincrement=False),
+    Column("centro_trabajo_clave", String(16)),
+    Column("plaza_clave", String(24)),
+    Column("rfc", String(13)),
+    Column("nombres", String(256)),
+    Column("apellido_primero", String(256)),
+    Column("apellido_segundo", String(256)),
+    Column("modelo", Integer),
+    Column("nivel", Integer),
+    Column("num_empleado", Integer),
+    Column("puesto_clave", String(16)),
+    Column("quinquenios", Integer),
+    Column("quinquenios_ingreso", Integer),
+    Column("desde", Date),
+    Column("desde_clave", String(6)),
+    Column("hasta", Date),
+    Column("hasta_clave", String(6)),
+    Column("percepcion", Numeric(precision=24, scale=4)),
+    Column("deduccion", Numeric(precision=24, scale=4)),
+    Column("importe", Numeric(precision=24, scale=4)),
+    Column("tipo", String(16)),
+    Column("centro_trabajo_id", Integer),
+    Column("plaza_id", Integer),
+    Column("puesto_id", Integer),
+    Column("tabulador_id", Integer),
+    Column("persona_id", Integer),
+    Column("persona_nueva", Boolean),
+    Column("decisiva", Boolean),
+    prefixes=["TEMPORARY"],
+)
+
+EXPLOTACION_CONCEPTOS = Table(
+    "tmp_explotacion_conceptos",
+    METADATA_TEMPORAL,
+    Column("fila", Integer, primary_key=True, autoincrement=False),
+    Column("bloque", Integer, primary_key=True, autoincrement=False),
+    Column("concepto_clave", String(16)),
+    Column("importe", Numeric(precision=24, scale=4)),
+    prefixes=["TEMPORARY"],
+)
+
+
+def preparar_filas(explotacion: Explotacion, fecha_final) -> pd.DataFrame:
+    """Preparar las filas para la tabla temporal, provoca ValueError si hay una quincena desde o hasta inválida"""
+
+    # Tomar las columnas
+    modelo = explotacion.enteros(236)
+    puesto_clave = explotacion.claves(20)
+    concepto_quinquenio = explotacion.concepto_quinquenio()
+    quincena_ingreso = explotacion.quincenas(19)
+
+    # Validar las quincenas desde y hasta y convertirlas a fechas
+    desde_clave = explotacion.quincenas(16).map(safe_quincena)
+    hasta_clave = explotacion.quincenas(17).map(safe_quincena)
+    desde = desde_clave.map({clave: quincena_to_fecha(clave, dame_ultimo_dia=False) for clave in desde_clave.unique()})
+    hasta = hasta_clave.map({clave: quincena_to_fecha(clave, dame_ultimo_dia=True) for clave in hasta_clave.unique()})
+
+    # Separar los nombres completos
+    nombres = explotacion.textos(3).map({valor: separar_nombre_completo(valor) for valor in explotacion.textos(3).unique()})
+
+    # Si el modelo es 2 es SINDICALIZADO, se toman 4 caracteres del puesto y los quinquenios de PQ1 a PQ6, si no es cero
+    es_sindicalizado = modelo == 2
+    quinquenios = concepto_quinquenio.map(QUINQUENIOS).astype("Int64").where(es_sindicalizado, 0)
+    quinquenios_ingreso = quincena_ingreso.map(
+        {clave: calcular_quinquenios_ingreso(clave, fecha_final) for clave in quincena_ingreso.unique()}
+    ).astype("Int64")
+
+    # Juntar las columnas, los valores faltantes quedan en None
+    filas = pd.DataFrame(
+        {
+            "fila": explotacion.tabla.index,
+            "centro_trabajo_clave": explotacion.textos(1),
+            "plaza_clave": explotacion.textos(8),
+            "rfc": explotacion.textos(2),
+            "nombres": nombres.str[2],
+            "apellido_primero": nombres.str[0],
+            "apellido_segundo": nombres.str[1],
+            "modelo": modelo,
+            "nivel": explotacion.enteros(9),
+            "num_empleado": explotacion.enteros(240),
+            "puesto_clave": puesto_clave.where(~es_sindicalizado, puesto_clave.str[:4]),
+            "quinquenios": quinquenios,
+            "quinquenios_ingreso": quinquenios_ingreso.where(es_sindicalizado),
+            "desde": desde,
+            "desde_clave": desde_clave,
+            "hasta": hasta,
+            "hasta_clave": hasta_clave,
+            "percepcion": explotacion.importes(12),
+            "deduccion": explotacion.importes(13),
+            "importe": explotacion.importes(14),
+            "tipo": explotacion.es_despensa().map({True: Nomina.TIPOS["DESPENSA"], False: Nomina.TIPOS["SALARIO"]}),
+        }
+    ).astype(object)
+    return filas.where(filas.notna(), None)
+
+
+def preparar_conceptos(explotacion: Explotacion) -> pd.DataFrame:
+    """Preparar las percepciones-deducciones para la tabla temporal"""
+    conceptos = explotacion.conceptos
+    return pd.DataFrame(
+        {
+            "fila": conceptos["fila"],
+            "bloque": conceptos["bloque"],
+            "concepto_clave": conceptos["p_o_d"] + conceptos["conc"],
+            "importe": conceptos["importe"],
+        }
+    ).astype(object)
+
+
+def alimentar_con_tablas_temporales(
+    filas: pd.DataFrame,
+    conceptos: pd.DataFrame,
+    quincena_id: int,
+    fecha_pago,
+    puesto_generico_id: int,
+    tabulador_generico_id: int,
+) -> dict:
+    """Alimentar nóminas y percepciones-deducciones conciliando en la base de datos, entrega los contadores y reportes"""
+
+    # Usar la conexión de la transacción de la sesión, el commit lo hace el comando
+    sesion = database.session
+    conexion = sesion.connection()
+
+    # Crear las tablas temporales, si quedaron de otra ejecución en la misma conexión se eliminan antes
+    METADATA_TEMPORAL.drop_all(conexion, checkfirst=True)
+    METADATA_TEMPORAL.create_all(conexion)
+
+    # Cargar las filas y las percepciones-deducciones en lote
+    for tabla, datos in ((EXPLOTACION_FILAS, filas), (EXPLOTACION_CONCEPTOS, conceptos)):
+        carga = CargaMasiva(tabla)
+        for renglon in datos.itertuples(index=False):
+            carga.agregar(**renglon._asdict())
+        carga.guardar()
+
+    # Columnas de las tablas temporales y un alias para las subconsultas entre filas
+    f = EXPLOTACION_FILAS.c
+    c = EXPLOTACION_CONCEPTOS.c
+    otra = EXPLOTACION_FILAS.alias("otra")
+
+    # Insertar los centros de trabajo, plazas y conceptos que faltan, en el orden en que aparecen
+    insertados = {}
+    for nombre, modelo, clave, orden, descripcion in (
+        ("centros_trabajos", CentroTrabajo, f.centro_trabajo_clave, f.fila, "ND"),
+        ("plazas", Plaza, f.plaza_clave, f.fila, "ND"),
+        ("conceptos", Concepto, c.concepto_clave, c.fila * 1000 + c.bloque, "DESCONOCIDO"),
+    ):
+        faltantes = (
+            select(clave, literal(descripcion))
+            .where(~exists().where(modelo.clave == clave))
+            .group_by(clave)
+            .order_by(func.min(orden))
+        )
+        insertados[nombre] = list(conexion.execute(faltantes).scalars())
+        conexion.execute(insert(modelo.__table__).from_select(["clave", "descripcion"], faltantes, include_defaults=True))
+
+    # Tomar los id de los centros de trabajo, plazas y puestos, si la persona no trae su vigente es nueva
+    conexion.execute(
+        update(EXPLOTACION_FILAS).values(
+            centro_trabajo_id=select(CentroTrabajo.id).where(CentroTrabajo.clave == f.centro_trabajo_clave).scalar_subquery(),
+            plaza_id=select(Plaza.id).where(Plaza.clave == f.plaza_clave).scalar_subquery(),
+            puesto_id=select(Puesto.id).where(Puesto.clave == f.puesto_clave).scalar_subquery(),
+            persona_nueva=~exists().where(Persona.rfc == f.rfc),
+        )
+    )
+
+    # Las filas sin puesto se relacionan al puesto genérico
+    personas_sin_puestos = list(conexion.execute(select(f.rfc).where(f.puesto_id.is_(None)).order_by(f.fila)).scalars())
+    conexion.execute(update(EXPLOTACION_FILAS).where(f.puesto_id.is_(None)).values(puesto_id=puesto_generico_id))
+
+    # Marcar la fila que decide a cada persona, la última con quinquenios y si ninguna los trae la última
+    fila_decisiva = (
+        select(otra.c.fila)
+        .where(otra.c.rfc == f.rfc)
+        .order_by(case((otra.c.quinquenios.is_(None), 0), else_=1).desc(), otra.c.fila.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    conexion.execute(update(EXPLOTACION_FILAS).values(decisiva=(f.fila == fila_decisiva)))
+
+    # Tomar el tabulador de las filas decisivas con sus quinquenios, los del tabulador de la persona o los de su ingreso
+    quinquenio_vigente = (
+        select(Tabulador.quinquenio)
+        .join(Persona, Persona.tabulador_id == Tabulador.id)
+        .where(Persona.rfc == f.rfc)
+        .scalar_subquery()
+    )
+    tabulador = (
+        select(func.min(Tabulador.id))
+        .where(
+            Tabulador.puesto_id == f.puesto_id,
+            Tabulador.modelo == f.modelo,
+            Tabulador.nivel == f.nivel,
+            Tabulador.quinquenio == func.coalesce(f.quinquenios, quinquenio_vigente, f.quinquenios_ingreso),
+        )
+        .scalar_subquery()
+    )
+    conexion.execute(update(EXPLOTACION_FILAS).where(f.decisiva).values(tabulador_id=tabulador))
+
+    # Las filas decisivas sin tabulador se relacionan al tabulador genérico
+    personas_sin_tabulador = list(
+        conexion.execute(select(f.rfc).where(f.decisiva, f.tabulador_id.is_(None)).order_by(f.fila)).scalars()
+    )
+    conexion.execute(
+        update(EXPLOTACION_FILAS).where(f.decisiva, f.tabulador_id.is_(None)).values(tabulador_id=tabulador_generico_id)
+    )
+
+    # Insertar las personas nuevas, en el orden de su primera fila
+    primera_fila = select(func.min(otra.c.fila)).where(otra.c.rfc == f.rfc).scalar_subquery()
+    columnas_personas = ["tabulador_id", "rfc", "nombres", "apellido_primero", "apellido_segundo", "modelo", "num_empleado"]
+    personas_insertadas = conexion.execute(
+        insert(Persona.__table__).from_select(
+            columnas_personas,
+            select(*[f[columna] for columna in columnas_personas]).where(f.decisiva, f.persona_nueva).order_by(primera_fila),
+            include_defaults=True,
+        )
+    ).rowcount
+
+    # Comparar las filas decisivas con las personas que ya existían para reportar los cambios
+    personas_actualizadas_del_tabulador = []
+    personas_actualizadas_del_num_empleado = []
+    cambios = (
+        select(
+            f.rfc,
+            Persona.nombres,
+            Persona.apellido_primero,
+            Persona.apellido_segundo,
+            Persona.tabulador_id,
+            f.tabulador_id,
+            Persona.num_empleado,
+            f.num_empleado,
+        )
+        .join(Persona, Persona.rfc == f.rfc)
+        .where(f.decisiva, ~f.persona_nueva)
+        .where(or_(Persona.tabulador_id != f.tabulador_id, Persona.num_empleado != f.num_empleado))
+        .order_by(f.fila)
+    )
+    personas_actualizadas_contador = 0
+    for (
+        rfc,
+        nombres,
+        apellido_primero,
+        apellido_segundo,
+        tabulador_id,
+        tabulador_id_nuevo,
+        num_empleado,
+        num_empleado_nuevo,
+    ) in conexion.execute(cambios):
+        nombre_completo = f"{nombres} {apellido_primero} {apellido_segundo}"
+        if tabulador_id != tabulador_id_nuevo:
+            personas_actualizadas_del_tabulador.append(
+                f"{rfc} {nombre_completo}: Tabulador: {tabulador_id} -> {tabulador_id_nuevo}"
+            )
+        if num_empleado != num_empleado_nuevo:
+            personas_actualizadas_del_num_empleado.append(
+                f"{rfc} {nombre_completo}: Num. Emp. {num_empleado} -> {num_empleado_nuevo}"
+            )
+        personas_actualizadas_contador += 1
+
+    # Actualizar el tabulador y el número de empleado de las personas que cambiaron
+    decisiva = select(EXPLOTACION_FILAS).where(f.rfc == Persona.rfc, f.decisiva, ~f.persona_nueva)
+    conexion.execute(
+        update(Persona.__table__)
+        .where(decisiva.where(or_(Persona.tabulador_id != f.tabulador_id, Persona.num_empleado != f.num_empleado)).exists())
+        .values(
+            tabulador_id=decisiva.with_only_columns(f.tabulador_id).scalar_subquery(),
+            num_empleado=decisiva.with_only_columns(f.num_empleado).scalar_subquery(),
+        )
+    )
+
+    # Tomar el id de la persona de cada fila
+    conexion.execute(
+        update(EXPLOTACION_FILAS).values(persona_id=select(Persona.id).where(Persona.rfc == f.rfc).scalar_subquery())
+    )
+
+    # Las filas con la misma llave natural se juntan en una sola nómina sumando sus importes,
+    # el centro de trabajo es el de la última fila, como cuando se alimenta fila por fila
+    otra_llave = [
+        otra.c.persona_id == f.persona_id,
+        otra.c.plaza_id == f.plaza_id,
+        otra.c.tipo == f.tipo,
+        otra.c.desde_clave == f.desde_clave,
+        otra.c.hasta_clave == f.hasta_clave,
+    ]
+    ultimo_centro_trabajo = (
+        select(otra.c.centro_trabajo_id).where(*otra_llave).order_by(otra.c.fila.desc()).limit(1).scalar_subquery()
+    )
+
+    # Insertar las nóminas, si ya existen por su llave natural solo se actualizan las que cambiaron
+    # El WHERE en el SELECT evita la ambigüedad de ON CONFLICT en SQLite
+    nominas_alimentadas = conexion.execute(
+        insertar_con_llave(
+            Nomina.__table__,
+            Nomina.LLAVE_NATURAL,
+            (
+                "quincena_id",
+                "persona_id",
+                "plaza_id",
+                "tipo",
+                "desde_clave",
+                "hasta_clave",
+                "centro_trabajo_id",
+                "desde",
+                "hasta",
+                "percepcion",
+                "deduccion",
+                "importe",
+                "fecha_pago",
+                "fuente",
+            ),
+            conexion.dialect.name,
+            select(
+                literal(quincena_id),
+                f.persona_id,
+                f.plaza_id,
+                cast(f.tipo, Nomina.__table__.c.tipo.type),
+                f.desde_clave,
+                f.hasta_clave,
+                ultimo_centro_trabajo,
+                func.min(f.desde),
+                func.max(f.hasta),
+                func.sum(f.percepcion),
+                func.sum(f.deduccion),
+                func.sum(f.importe),
+                literal(fecha_pago, Nomina.__table__.c.fecha_pago.type),
+                literal(Nomina.FUENTE_EXPLOTACION),
+            )
+            .where(f.persona_id.is_not(None))
+            .group_by(f.persona_id, f.plaza_id, f.tipo, f.desde_clave, f.hasta_clave)
+            .order_by(func.min(f.fila)),
+        )
+    ).rowcount
+
+    # Lo mismo para las percepciones-deducciones, las del mismo concepto, persona y plaza se suman
+    otro_concepto = EXPLOTACION_CONCEPTOS.alias("otro_concepto")
+    ultimo_centro_trabajo = (
+        select(otra.c.centro_trabajo_id)
+        .select_from(otro_concepto)
+        .join(otra, otra.c.fila == otro_concepto.c.fila)
+        .where(
+            otra.c.persona_id == f.persona_id,
+            otra.c.plaza_id == f.plaza_id,
+            otro_concepto.c.concepto_clave == c.concepto_clave,
+        )
+        .order_by(otro_concepto.c.fila.desc(), otro_concepto.c.bloque.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    # Insertar las percepciones-deducciones, todas son de tipo SALARIO como en percepciones_deducciones alimentar
+    percepciones_deducciones_alimentadas = conexion.execute(
+        insertar_con_llave(
+            PercepcionDeduccion.__table__,
+            PercepcionDeduccion.LLAVE_NATURAL,
+            ("quincena_id", "persona_id", "concepto_id", "plaza_id", "tipo", "centro_trabajo_id", "importe", "fuente"),
+            conexion.dialect.name,
+            select(
+                literal(quincena_id),
+                f.persona_id,
+                Concepto.id,
+                f.plaza_id,
+                cast(literal(PercepcionDeduccion.TIPOS["SALARIO"]), PercepcionDeduccion.__table__.c.tipo.type),
+                ultimo_centro_trabajo,
+                func.sum(c.importe),
+                literal(PercepcionDeduccion.FUENTE_EXPLOTACION),
+            )
+            .select_from(EXPLOTACION_CONCEPTOS)
+            .join(EXPLOTACION_FILAS, f.fila == c.fila)
+            .join(Concepto, Concepto.clave == c.concepto_clave)
+            .where(f.persona_id.is_not(None))
+            .group_by(f.persona_id, f.plaza_id, Concepto.id, c.concepto_clave)
+            .order_by(func.min(c.fila * 1000 + c.bloque)),
+        )
+    ).rowcount
+
+    # Las filas con la misma llave natural que una anterior se sumaron, tomar sus RFC para avisar
+    nominas_repetidas = list(
+        conexion.execute(
+            select(f.rfc)
+            .where(f.persona_id.is_not(None))
+            .where(select(otra.c.fila).where(*otra_llave, otra.c.fila < f.fila).exists())
+            .order_by(f.fila)
+        ).scalars()
+    )
+
+    # Lo mismo para las percepciones-deducciones del mismo concepto, persona y plaza
+    percepciones_deducciones_repetidas = list(
+        conexion.execute(
+            select(f.rfc)
+            .select_from(EXPLOTACION_CONCEPTOS)
+            .join(EXPLOTACION_FILAS, f.fila == c.fila)
+            .join(Concepto, Concepto.clave == c.concepto_clave)
+            .where(f.persona_id.is_not(None))
+            .where(
+                select(otro_concepto.c.fila)
+                .join(otra, otra.c.fila == otro_concepto.c.fila)
+                .where(
+                    otra.c.persona_id == f.persona_id,
+                    otra.c.plaza_id == f.plaza_id,
+                    otro_concepto.c.concepto_clave == c.concepto_clave,
+                    otro_concepto.c.fila * 1000 + otro_concepto.c.bloque < c.fila * 1000 + c.bloque,
+                )
+                .exists()
+            )
+            .order_by(c.fila, c.bloque)
+        ).scalars()
+    )
+
+    # Dar de baja las nóminas de la quincena que alimentó la explotación y que ya no vienen en el archivo
+    nominas_bajas = conexion.execute(
+        update(Nomina.__table__)
+        .where(
+            Nomina.quincena_id == quincena_id,
+            Nomina.estatus == "A",
+            Nomina.tipo.in_([Nomina.TIPOS["SALARIO"], Nomina.TIPOS["DESPENSA"]]),
+            Nomina.fuente == Nomina.FUENTE_EXPLOTACION,
+            ~select(f.fila)
+            .where(
+                f.persona_id == Nomina.persona_id,
+                f.plaza_id == Nomina.plaza_id,
+                cast(f.tipo, Nomina.__table__.c.tipo.type) == Nomina.tipo,
+                f.desde_clave == Nomina.desde_clave,
+                f.hasta_clave == Nomina.hasta_clave,
+            )
+            .exists(),
+        )
+        .values(estatus="B", modificado=func.now())
+    ).rowcount
+
+    # Dar de baja las percepciones-deducciones de la quincena que alimentó la explotación y que ya no vienen en el archivo,
+    # de los conceptos del archivo
+    percepciones_deducciones_bajas = conexion.execute(
+        update(PercepcionDeduccion.__table__)
+        .where(
+            PercepcionDeduccion.quincena_id == quincena_id,
+            PercepcionDeduccion.estatus == "A",
+            PercepcionDeduccion.tipo == PercepcionDeduccion.TIPOS["SALARIO"],
+            PercepcionDeduccion.fuente == PercepcionDeduccion.FUENTE_EXPLOTACION,
+            PercepcionDeduccion.concepto_id.in_(
+                select(Concepto.id).join(EXPLOTACION_CONCEPTOS, Concepto.clave == c.concepto_clave)
+            ),
+            ~select(c.fila)
+            .join(EXPLOTACION_FILAS, f.fila == c.fila)
+            .join(Concepto, Concepto.clave == c.concepto_clave)
+            .where(
+                f.persona_id == PercepcionDeduccion.persona_id,
+                f.plaza_id == PercepcionDeduccion.plaza_id,
+                Concepto.id == PercepcionDeduccion.concepto_id,
+            )
+            .exists(),
+        )
+        .values(estatus="B", modificado=func.now())
+    ).rowcount
+
+    # Eliminar las tablas temporales
+    METADATA_TEMPORAL.drop_all(conexion)
+
+    # Entregar los contadores y los reportes
+    return {
+        "centros_trabajos_insertados": insertados["centros_trabajos"],
+        "plazas_insertadas": insertados["plazas"],
+        "conceptos_no_existentes": insertados["conceptos"],
+        "personas_insertadas_contador": personas_insertadas,
+        "personas_actualizadas_contador": personas_actualizadas_contador,
+        "personas_actualizadas_del_tabulador": personas_actualizadas_del_tabulador,
+        "personas_actualizadas_del_num_empleado": personas_actualizadas_del_num_empleado,
+        "personas_sin_puestos": personas_sin_puestos,
+        "personas_sin_tabulador": personas_sin_tabulador,
+        "nominas_alimentadas": nominas_alimentadas,
+        "percepciones_deducciones_alimentadas": percepciones_deducciones_alimentadas,
+        "nominas_repetidas": nominas_repetidas,
+        "percepciones_deducciones_repetidas": percepciones_deducciones_repetidas,
+        "nominas_bajas": nominas_bajas,
+        "percepciones_deducciones_bajas": percepciones_deducciones_bajas,
+    }
+
+
+def alimentar_quincena_con_tablas_temporales(hoja, quincena, fecha_final, fecha_pago, probar: bool = False, huella=None):
+    """Alimentar la quincena con tablas temporales y mostrar los reportes, con probar se deshacen los cambios"""
+
+    # Definir el puesto generico al que se van a relacionar las personas que no tengan su puesto
+    puesto_generico = Puesto.query.filter_by(clave="ND").first()
+    if puesto_generico is None:
+        click.echo("ERROR: Falta el puesto con clave ND.")
+        sys.exit(1)
+
+    # Definir el tabulador generico al que se van a relacionar los puestos que no tengan su tabulador
+    tabulador_generico = Tabulador.query.filter_by(puesto_id=puesto_generico.id).order_by(Tabulador.id).first()
+    if tabulador_generico is None:
+        click.echo("ERROR: Falta el tabulador del puesto con clave ND.")
+        sys.exit(1)
+
+    # Leer la hoja una sola vez y preparar las filas y las percepciones-deducciones
+    explotacion = Explotacion(hoja)
+    try:
+        filas = preparar_filas(explotacion, fecha_final)
+    except ValueError as error:
+        click.echo(click.style(f"ERROR: Quincena inválida en desde o hasta: {error}", fg="red"))
+        sys.exit(1)
+    conceptos = preparar_conceptos(explotacion)
+
+    # Si no hay filas, mostrar mensaje de error y terminar
+    if len(filas) == 0:
+        click.echo(click.style("ERROR: No se alimentaron registros en nominas.", fg="red"))
+        sys.exit(1)
+
+    # Conciliar en la base de datos
+    click.echo(f"Alimentar Nominas y Percepciones-Deducciones a la quincena {quincena.clave} con tablas temporales")
+    reportes = alimentar_con_tablas_temporales(
+        filas=filas,
+        conceptos=conceptos,
+        quincena_id=quincena.id,
+        fecha_pago=fecha_pago,
+        puesto_generico_id=puesto_generico.id,
+        tabulador_generico_id=tabulador_generico.id,
+    )
+
+    # Si se esta probando, deshacer los cambios, de lo contrario guardarlos en la misma transacción con la importación
+    sesion = database.session
+    if probar:
+        sesion.rollback()
+    else:
+        if huella is not None:
+            huella.registrar(
+                "nominas alimentar-quincena",
+                quincena,
+                len(filas),
+                reportes["nominas_alimentadas"] + reportes["percepciones_deducciones_alimentadas"],
+            )
+        sesion.commit()
+    sesion.close()
+
+    # Si hubo centros_trabajos_insertados, mostrar contador
+    if len(reportes["centros_trabajos_insertados"]) > 0:
+        click.echo(
+            click.style(f"  Se insertaron {len(reportes['centros_trabajos_insertados'])} Centros de Trabajo", fg="green")
+        )
+
+    # Si hubo personas actualizadas, mostrar contador
+    if reportes["personas_actualizadas_contador"] > 0:
+        click.echo(click.style(f"  Se actualizaron {reportes['personas_actualizadas_contador']} Personas", fg="green"))
+        for item in reportes["personas_actualizadas_del_tabulador"]:
+            click.echo(click.style(f"  {item}", fg="yellow"))
+        for item in reportes["personas_actualizadas_del_num_empleado"]:
+            click.echo(click.style(f"  {item}", fg="yellow"))
+
+    # Si hubo personas insertadas, mostrar contador
+    if reportes["personas_insertadas_contador"] > 0:
+        click.echo(click.style(f"  Se insertaron {reportes['personas_insertadas_contador']} Personas", fg="green"))
+
+    # Si hubo plazas insertadas, mostrar contador
+    if len(reportes["plazas_insertadas"]) > 0:
+        click.echo(click.style(f"  Se insertaron {len(reportes['plazas_insertadas'])} Plazas", fg="green"))
+
+    # Si hubo conceptos no existentes, mostrarlos
+    if len(reportes["conceptos_no_existentes"]) > 0:
+        click.echo(click.style(f"  Hubo {len(reportes['conceptos_no_existentes'])} Conceptos que no existen:", fg="yellow"))
+        click.echo(click.style(f"  {','.join(reportes['conceptos_no_existentes'])}", fg="yellow"))
+
+    # Si hubo personas_sin_puestos, mostrarlas en pantalla
+    if len(reportes["personas_sin_puestos"]) > 0:
+        click.echo(click.style(f"  Hubo {len(reportes['personas_sin_puestos'])} Personas sin puestos.", fg="yellow"))
+        click.echo(click.style(f"  {', '.join(reportes['personas_sin_puestos'])}", fg="yellow"))
+
+    # Si hubo personas_sin_tabulador, mostrarlas en pantalla
+    if len(reportes["personas_sin_tabulador"]) > 0:
+        click.echo(click.style(f"  Hubo {len(reportes['personas_sin_tabulador'])} Personas sin tabulador.", fg="yellow"))
+        click.echo(click.style(f"  {', '.join(reportes['personas_sin_tabulador'])}", fg="yellow"))
+
+    # Si hubo filas con la misma llave natural, se sumaron en una sola nómina
+    if len(reportes["nominas_repetidas"]) > 0:
+        click.echo(
+            click.style(
+                f"  Hubo {len(reportes['nominas_repetidas'])} filas con la misma llave que otra, se sumaron:", fg="yellow"
+            )
+        )
+        click.echo(click.style(f"  {', '.join(sorted(set(reportes['nominas_repetidas'])))}", fg="yellow"))
+
+    # Si hubo percepciones-deducciones con la misma llave natural, se sumaron en una sola
+    if len(reportes["percepciones_deducciones_repetidas"]) > 0:
+        click.echo(
+            click.style(
+                f"  Hubo {len(reportes['percepciones_deducciones_repetidas'])} P-D con la misma llave que otra, se sumaron:",
+                fg="yellow",
+            )
+        )
+        click.echo(click.style(f"  {', '.join(sorted(set(reportes['percepciones_deducciones_repetidas'])))}", fg="yellow"))
+
+    # Si hubo nóminas o percepciones-deducciones que ya no vienen en el archivo, mostrar contadores
+    if reportes["nominas_bajas"] > 0:
+        click.echo(
+            click.style(f"  Se dieron de baja {reportes['nominas_bajas']} nóminas que ya no vienen en el archivo.", fg="yellow")
+        )
+    if reportes["percepciones_deducciones_bajas"] > 0:
+        click.echo(
+            click.style(
+                f"  Se dieron de baja {reportes['percepciones_deducciones_bajas']} P-D que ya no vienen en el archivo.",
+                fg="yellow",
+            )
+        )
+
+    # Mensaje termino
+    click.echo(click.style(f"  Alimentar Nominas: {reportes['nominas_alimentadas']} insertadas o actualizadas.", fg="green"))
+    click.echo(
+        click.style(
+            f"  Alimentar Percepciones-Deducciones: {reportes['percepciones_deducciones_alimentadas']} insertadas o actualizadas.",
+            fg="green",
+        )
+    )
@@ -0,0 +1,62 @@
+"""
+Bancos, reservación de consecutivos
+
+Cada generador cuenta primero cuántos números de cheque necesita por banco y pide un bloque,
+el bloque se aparta incrementando consecutivo_generado con el renglón del banco bloqueado (SELECT ... FOR UPDATE),
+dentro de la transacción del generador, así varios generadores pueden correr al mismo tiempo sin repetir números de cheque
+y si el generador falla antes de su commit, al hacer rollback el bloque se devuelve y no quedan huecos
+por eso los generadores suben el archivo XLSX antes de su commit, si falla la subida hacen rollback
+"""
+
+from sqlalchemy import select, update
+
+from ...config.extensions import database
+from ...lib.exceptions import MyNotExistsError
+from .models import Banco
+
+
+def bloquear_bancos(bancos_ids) -> dict:
+    """Consultar y bloquear los bancos hasta el commit del generador, entrega por banco_id el renglón"""
+
+    # Bloquear en orden de id, para que dos generadores no se esperen entre sí
+    consulta = (
+        select(Banco.id, Banco.consecutivo, Banco.consecutivo_generado)
+        .where(Banco.id.in_(sorted(bancos_ids)))
+        .order_by(Banco.id)
+        .with_for_update()
+    )
+    bancos = {banco.id: banco for banco in database.session.execute(consulta).all()}
+
+    # Si falta algún banco, provocar error
+    if len(bancos) != len(set(bancos_ids)):
+        raise MyNotExistsError("No existen todos los bancos para reservar consecutivos")
+
+    # Entregar los bancos bloqueados
+    return bancos
+
+
+def reservar_consecutivos(cantidades: dict, reiniciar: bool = False) -> dict:
+    """Reservar un bloque de consecutivos por banco, entrega por banco_id el consecutivo anterior al bloque"""
+
+    # Si no hay cantidades, no hay nada que reservar
+    if len(cantidades) == 0:
+        return {}
+
+    # Bloquear los bancos en la sesión del generador, el bloqueo termina con su commit o rollback
+    # Si ya los bloqueó antes en la misma transacción, se leen los consecutivos que ya apartó
+    bancos = bloquear_bancos(cantidades.keys())
+
+    # Apartar el bloque de cada banco, si se pide reiniciar el bloque comienza en el consecutivo
+    # Se conserva modificado, el consecutivo generado es un resultado de los generadores y no debe cambiar la huella
+    consecutivos = {}
+    for banco in bancos.values():
+        consecutivos[banco.id] = banco.consecutivo if reiniciar else banco.consecutivo_generado
+        database.session.execute(
+            update(Banco)
+            .where(Banco.id == banco.id)
+            .values(consecutivo_generado=consecutivos[banco.id] + cantidades[banco.id], modificado=Banco.modificado)
+            .execution_options(synchronize_session=False)
+        )
+
+    # Entregar los consecutivos anteriores a cada bloque
+    return consecutivos
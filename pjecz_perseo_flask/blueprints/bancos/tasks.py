@@ -4,6 +4,8 @@ Bancos, tareas en el fondo
 
 import logging
 
+from sqlalchemy import update
+
 from pjecz_perseo_flask.blueprints.bancos.models import Banco
 from pjecz_perseo_flask.config.extensions import database
 from pjecz_perseo_flask.lib.exceptions import MyAnyError, MyNotExistsError
@@ -35,13 +37,18 @@ def reiniciar_consecutivos_generados():
         raise MyNotExistsError("No hay bancos activos.")
 
     # Igualar los consecutivos a los consecutivos_generado de los bancos
+    # Se conserva modificado, el consecutivo generado no es una entrada de la huella de los generadores
     bancos_actualizados = []
     for banco in bancos:
         if banco.consecutivo != banco.consecutivo_generado:
             valor_anterior = banco.consecutivo_generado
             valor_nuevo = banco.consecutivo
-            banco.consecutivo_generado = valor_nuevo
-            sesion.add(banco)
+            sesion.execute(
+                update(Banco)
+                .where(Banco.id == banco.id)
+                .values(consecutivo_generado=valor_nuevo, modificado=Banco.modificado)
+                .execution_options(synchronize_session=False)
+            )
             bancos_actualizados.append(f"{banco.nombre} {valor_anterior} -> {valor_nuevo}")
 
     # Si no hubo actualizaciones, mostrar mensaje y salir
@@ -7,7 +7,6 @@ from datetime import datetime
 from pathlib import Path
 
 import pytz
-from openpyxl import Workbook
 
 from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
 from pjecz_perseo_flask.config.settings import get_settings
@@ -19,8 +18,9 @@ from pjecz_perseo_flask.lib.exceptions import (
     MyFileNotFoundError,
     MyUploadError,
 )
-from pjecz_perseo_flask.lib.google_cloud_storage import upload_file_to_gcs
+from pjecz_perseo_flask.lib.google_cloud_storage import upload_fileobj_to_gcs
 from pjecz_perseo_flask.lib.tasks import set_task_error, set_task_progress
+from pjecz_perseo_flask.lib.xlsx import guardar_libro_xlsx, iniciar_libro_xlsx
 from pjecz_perseo_flask.main import app
 
 GCS_BASE_DIRECTORY = "conceptos"
@@ -45,15 +45,8 @@ def exportar_xlsx() -> tuple[str, str, str]:
     # Consultar Conceptos
     conceptos = Concepto.query.filter_by(estatus="A").order_by(Concepto.clave).all()
 
-    # Iniciar el archivo XLSX
-    libro = Workbook()
-
-    # Tomar la hoja del libro XLSX
-    hoja = libro.active
-    if hoja is None:
-        mensaje_error = "No se pudo crear la hoja del archivo XLSX."
-        bitacora.error(mensaje_error)
-        raise MyEmptyError(mensaje_error)
+    # Iniciar el archivo XLSX en modo de solo escritura, para que la memoria no crezca con las filas
+    libro, hoja = iniciar_libro_xlsx()
 
     # Agregar la fila con las cabeceras de las columnas
     hoja.append(
@@ -95,27 +88,21 @@ def exportar_xlsx() -> tuple[str, str, str]:
     ruta_local = Path(LOCAL_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
     ruta_gcs = Path(GCS_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
 
-    # Si no existe el directorio local, crearlo
-    Path(ruta_local).mkdir(parents=True, exist_ok=True)
-
-    # Guardar el archivo XLSX
-    ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
-    libro.save(ruta_local_archivo_xlsx)
-
-    # Si esta configurado Google Cloud Storage
-    mensaje_gcs = ""
-    public_url = ""
+    # Guardar el archivo XLSX en un buffer temporal, si esta configurado se conserva la copia local
     settings = get_settings()
-    if settings.CLOUD_STORAGE_DEPOSITO != "":
-        # Leer el contenido del archivo XLSX
-        with open(ruta_local_archivo_xlsx, "rb") as archivo:
-            # Subir el archivo XLSX a Google Cloud Storage
+    ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
+    with guardar_libro_xlsx(libro, ruta_local_archivo_xlsx) as buffer:
+        # Si esta configurado Google Cloud Storage
+        mensaje_gcs = ""
+        public_url = ""
+        if settings.CLOUD_STORAGE_DEPOSITO != "":
+            # Subir el archivo XLSX a Google Cloud Storage por partes desde el buffer
             try:
-                public_url = upload_file_to_gcs(
+                public_url = upload_fileobj_to_gcs(
                     bucket_name=settings.CLOUD_STORAGE_DEPOSITO,
                     blob_name=f"{ruta_gcs}/{nombre_archivo_xlsx}",
                     content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    data=archivo.read(),
+                    file_obj=buffer,
                 )
                 mensaje_gcs = f"Se subio el archivo XLSX a GCS {public_url}"
                 bitacora.info(mensaje_gcs)
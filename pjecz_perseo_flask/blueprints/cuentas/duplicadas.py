@@ -0,0 +1,72 @@
+"""
+Cuentas, índice de cuentas duplicadas
+"""
+
+from sqlalchemy import func, select, tuple_
+
+from ...config.extensions import database
+from ..bancos.models import Banco
+from ..personas.models import Persona
+from .models import Cuenta
+
+
+def consultar_cuentas_duplicadas() -> dict:
+    """Consultar las cuentas activas con el mismo banco y número de cuenta, en un diccionario por (banco_id, num_cuenta)"""
+
+    # Sub consulta que agrupa las cuentas activas por banco y número de cuenta, para tomar las que se repiten
+    repetidas = (
+        select(Cuenta.banco_id, Cuenta.num_cuenta)
+        .where(Cuenta.estatus == "A")
+        .group_by(Cuenta.banco_id, Cuenta.num_cuenta)
+        .having(func.count(Cuenta.id) > 1)
+    )
+
+    # Consultar las cuentas repetidas con los datos de la persona y del banco
+    consulta = (
+        select(
+            Cuenta.banco_id,
+            Cuenta.num_cuenta,
+            Cuenta.persona_id,
+            Persona.rfc.label("persona_rfc"),
+            Persona.nombres.label("persona_nombres"),
+            Persona.apellido_primero.label("persona_apellido_primero"),
+            Persona.apellido_segundo.label("persona_apellido_segundo"),
+            Banco.nombre.label("banco_nombre"),
+        )
+        .join(Persona, Cuenta.persona_id == Persona.id)
+        .join(Banco, Cuenta.banco_id == Banco.id)
+        .where(Cuenta.estatus == "A")
+        .where(tuple_(Cuenta.banco_id, Cuenta.num_cuenta).in_(repetidas))
+        .order_by(Banco.nombre, Cuenta.num_cuenta, Persona.rfc)
+    )
+
+    # Juntar en el diccionario las cuentas por (banco_id, num_cuenta)
+    cuentas_duplicadas = {}
+    for fila in database.session.execute(consulta):
+        cuentas_duplicadas.setdefault((fila.banco_id, fila.num_cuenta), []).append(fila)
+
+    # Entregar el diccionario
+    return cuentas_duplicadas
+
+
+def elaborar_mensajes_cuenta_duplicada(
+    cuentas_duplicadas: dict,
+    banco_id: int,
+    num_cuenta: str,
+    persona_id: int,
+    persona_rfc: str,
+) -> list:
+    """Elaborar los mensajes de las otras personas que tienen la misma cuenta"""
+
+    # Si la cuenta no esta en el diccionario, no hay mensajes
+    if (banco_id, num_cuenta) not in cuentas_duplicadas:
+        return []
+
+    # Un mensaje por cada cuenta de otra persona con el mismo banco y número de cuenta
+    mensajes = []
+    for otra in cuentas_duplicadas[(banco_id, num_cuenta)]:
+        if otra.persona_id != persona_id:
+            mensajes.append(f"  Duplicada {persona_rfc} {otra.banco_nombre} {num_cuenta}")
+
+    # Entregar los mensajes
+    return mensajes
@@ -0,0 +1,37 @@
+"""
+Importaciones, modelos
+"""
+
+from typing import Optional
+
+from sqlalchemy import BigInteger, ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from ...config.extensions import database
+from ...lib.universal_mixin import UniversalMixin
+
+
+class Importacion(database.Model, UniversalMixin):
+    """Importacion"""
+
+    # Nombre de la tabla
+    __tablename__ = "importaciones"
+
+    # Clave primaria
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # Clave foránea
+    quincena_id: Mapped[Optional[int]] = mapped_column(ForeignKey("quincenas.id"))
+    quincena: Mapped[Optional["Quincena"]] = relationship(back_populates="importaciones")
+
+    # Columnas
+    comando: Mapped[str] = mapped_column(String(64), index=True)
+    ruta: Mapped[str] = mapped_column(String(512), index=True)
+    tamano: Mapped[int] = mapped_column(BigInteger)
+    sha256: Mapped[str] = mapped_column(String(64))
+    renglones: Mapped[int] = mapped_column(default=0)
+    registros: Mapped[int] = mapped_column(default=0)
+
+    def __repr__(self):
+        """Representación"""
+        return f"<Importacion {self.id}>"
@@ -0,0 +1,82 @@
+"""
+Importaciones, vistas
+"""
+
+import json
+
+from flask import Blueprint, render_template, request, url_for
+from flask_login import login_required
+
+from ...lib.datatables import get_datatable_parameters, output_datatable_json
+from ..permisos.models import Permiso
+from ..usuarios.decorators import permission_required
+from .models import Importacion
+
+MODULO = "IMPORTACIONES"
+
+importaciones = Blueprint("importaciones", __name__, template_folder="templates")
+
+
+@importaciones.before_request
+@login_required
+@permission_required(MODULO, Permiso.VER)
+def before_request():
+    """Permiso por defecto"""
+
+
+@importaciones.route("/importaciones/datatable_json", methods=["GET", "POST"])
+def datatable_json():
+    """DataTable JSON para listado de Importaciones"""
+    # Tomar parámetros de Datatables
+    draw, start, rows_per_page = get_datatable_parameters()
+    # Consultar
+    consulta = Importacion.query
+    # Primero filtrar por columnas propias
+    if "estatus" in request.form:
+        consulta = consulta.filter_by(estatus=request.form["estatus"])
+    else:
+        consulta = consulta.filter_by(estatus="A")
+    if "quincena_id" in request.form:
+        consulta = consulta.filter_by(quincena_id=request.form["quincena_id"])
+    if "comando" in request.form:
+        consulta = consulta.filter_by(comando=request.form["comando"])
+    # Ordenar y paginar
+    registros = consulta.order_by(Importacion.id.desc()).offset(start).limit(rows_per_page).all()
+    total = consulta.count()
+    # Elaborar datos para DataTable
+    data = []
+    for resultado in registros:
+        data.append(
+            {
+                "detalle": {
+                    "id": resultado.id,
+                    "url": url_for("importaciones.detail", importacion_id=resultado.id),
+                },
+                "creado": resultado.creado.strftime("%Y-%m-%dT%H:%M:%S"),
+                "quincena_clave": resultado.quincena.clave if resultado.quincena else "",
+                "comando": resultado.comando,
+                "ruta": resultado.ruta,
+                "renglones": resultado.renglones,
+                "registros": resultado.registros,
+            }
+        )
+    # Entregar JSON
+    return output_datatable_json(draw, total, data)
+
+
+@importaciones.route("/importaciones")
+def list_active():
+    """Listado de Importaciones activas"""
+    return render_template(
+        "importaciones/list.jinja2",
+        filtros=json.dumps({"estatus": "A"}),
+        titulo="Importaciones",
+        estatus="A",
+    )
+
+
+@importaciones.route("/importaciones/<int:importacion_id>")
+def detail(importacion_id):
+    """Detalle de una Importacion"""
+    importacion = Importacion.query.get_or_404(importacion_id)
+    return render_template("importaciones/detail.jinja2", importacion=importacion)
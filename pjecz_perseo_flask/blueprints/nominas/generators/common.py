@@ -2,11 +2,25 @@
 Nóminas, comunes para los generadores
 """
 
+import hashlib
 import logging
 import re
 
+import pandas as pd
+from sqlalchemy import bindparam, func, select, update
+
+from pjecz_perseo_flask.blueprints.bancos.models import Banco
+from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
+from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
+from pjecz_perseo_flask.blueprints.cuentas.models import Cuenta
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
+from pjecz_perseo_flask.blueprints.personas.models import Persona
+from pjecz_perseo_flask.blueprints.plazas.models import Plaza
+from pjecz_perseo_flask.blueprints.puestos.models import Puesto
 from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
 from pjecz_perseo_flask.blueprints.quincenas_productos.models import QuincenaProducto
+from pjecz_perseo_flask.blueprints.tabuladores.models import Tabulador
 from pjecz_perseo_flask.config.extensions import database
 from pjecz_perseo_flask.lib.exceptions import MyNotExistsError, MyNotValidParamError
 from pjecz_perseo_flask.lib.safe_string import QUINCENA_REGEXP
@@ -15,6 +29,7 @@ from pjecz_perseo_flask.main import app
 GCS_BASE_DIRECTORY = "nominas"
 LOCAL_BASE_DIRECTORY = "reports/nominas"
 TIMEZONE = "America/Mexico_City"
+GENERADORES_VERSION = "1"  # Cambiar cuando cambie la forma de elaborar los archivos, para no reutilizar los anteriores
 
 bitacora = logging.getLogger(__name__)
 bitacora.setLevel(logging.INFO)
@@ -26,6 +41,34 @@ bitacora.addHandler(empunadura)
 # Inicializar el contexto de la aplicación Flask
 app.app_context().push()
 
+# Catálogos que se cargan completos al iniciar cada generador
+CATALOGOS_MODELOS = {
+    "bancos": Banco,
+    "centros_trabajos": CentroTrabajo,
+    "plazas": Plaza,
+    "puestos": Puesto,
+    "tabuladores": Tabulador,
+}
+
+
+class Catalogos:
+    """Catálogos de una ejecución de los generadores, con una consulta por tabla y búsquedas por id en diccionarios"""
+
+    def __init__(self):
+        """Cargar cada catálogo con una sola consulta"""
+        self.registros = {}
+        for nombre, modelo in CATALOGOS_MODELOS.items():
+            self.registros[nombre] = {registro.id: registro for registro in database.session.execute(select(modelo)).scalars()}
+
+    def tomar(self, nombre: str, registro_id: int):
+        """Tomar un registro del catálogo por su id, si no está se consulta y se agrega, si el id es nulo entrega None"""
+        if not registro_id:
+            return None
+        registros = self.registros[nombre]
+        if registro_id not in registros:
+            registros[registro_id] = database.session.get(CATALOGOS_MODELOS[nombre], registro_id)
+        return registros[registro_id]
+
 
 def consultar_validar_quincena(quincena_clave: str) -> Quincena:
     """Consultar y validar la quincena"""
@@ -61,6 +104,7 @@ def actualizar_quincena_producto(
     archivo: str = "",
     url: str = "",
     es_satisfactorio: bool = False,
+    huella: str = "",
 ) -> QuincenaProducto:
     """Actualizar la quincena_producto"""
 
@@ -76,6 +120,7 @@ def actualizar_quincena_producto(
             archivo=archivo,
             es_satisfactorio=es_satisfactorio,
             fuente=fuente,
+            huella=huella,
             mensajes="\n".join(mensajes),
             url=url,
         )
@@ -85,9 +130,237 @@ def actualizar_quincena_producto(
         quincena_producto.archivo = archivo
         quincena_producto.es_satisfactorio = es_satisfactorio
         quincena_producto.fuente = fuente
+        quincena_producto.huella = huella
         quincena_producto.mensajes = "\n".join(mensajes)
         quincena_producto.url = url
     quincena_producto.save()
 
     # Entregar la quincena_producto
     return quincena_producto
+
+
+def calcular_huella(quincena_id: int, fuente: str, tipo: str, *parametros) -> str:
+    """Calcular la huella de las entradas de un generador, con los conteos y la última modificación de sus tablas"""
+
+    # Sub consultas con las personas, plazas y centros de trabajo que tienen nóminas en la quincena y del tipo
+    nominas_condiciones = [Nomina.quincena_id == quincena_id, Nomina.tipo == tipo]
+    personas_ids = select(Nomina.persona_id).where(*nominas_condiciones)
+    plazas_ids = select(Nomina.plaza_id).where(*nominas_condiciones)
+    centros_trabajos_ids = select(Nomina.centro_trabajo_id).where(*nominas_condiciones)
+
+    # Sub consulta con los bancos de las cuentas de esas personas
+    bancos_ids = select(Cuenta.banco_id).where(Cuenta.persona_id.in_(personas_ids))
+
+    # Juntar por cada tabla la cantidad de registros y su última modificación, en una sola consulta
+    # Los puestos se leen por el tabulador, que no depende de la quincena, por eso van todos
+    tablas = [
+        (Nomina, nominas_condiciones),
+        (PercepcionDeduccion, [PercepcionDeduccion.quincena_id == quincena_id]),
+        (Cuenta, [Cuenta.persona_id.in_(personas_ids)]),
+        (Persona, [Persona.id.in_(personas_ids)]),
+        (Banco, [Banco.id.in_(bancos_ids)]),
+        (Plaza, [Plaza.id.in_(plazas_ids)]),
+        (CentroTrabajo, [CentroTrabajo.id.in_(centros_trabajos_ids)]),
+        (Concepto, []),
+        (Puesto, []),
+        (Tabulador, []),
+    ]
+    columnas = []
+    for modelo, condiciones in tablas:
+        columnas.append(select(func.count(modelo.id)).where(*condiciones).scalar_subquery())
+        columnas.append(select(func.max(modelo.modificado)).where(*condiciones).scalar_subquery())
+    valores = database.session.execute(select(*columnas)).one()
+
+    # Entregar el hash de la versión de los generadores, la fuente, el tipo, los parámetros y los valores
+    texto = "|".join(str(valor) for valor in [GENERADORES_VERSION, quincena_id, fuente, tipo, *parametros, *valores])
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def consultar_quincena_producto_misma_huella(
+    quincena_id: int,
+    fuente: str,
+    huella: str,
+    quincena_producto_id: int = 0,
+) -> QuincenaProducto:
+    """Consultar la última quincena_producto activa con archivo y la misma huella, sin contar la que se está generando"""
+    return (
+        QuincenaProducto.query.filter_by(quincena_id=quincena_id, fuente=fuente, huella=huella, estatus="A")
+        .filter(QuincenaProducto.archivo != "")
+        .filter(QuincenaProducto.id != quincena_producto_id)
+        .order_by(QuincenaProducto.id.desc())
+        .first()
+    )
+
+
+def reutilizar_quincena_producto(quincena_producto_id: int, quincena_id: int, fuente: str, huella: str) -> str:
+    """Si ya hay un archivo con la misma huella, copiarlo a la quincena_producto y entregar el mensaje de termino"""
+
+    # Consultar la quincena_producto con la misma huella, si no hay entregar texto vacío
+    anterior = consultar_quincena_producto_misma_huella(quincena_id, fuente, huella, quincena_producto_id)
+    if anterior is None:
+        return ""
+
+    # Copiar el archivo, el URL y los mensajes de la anterior
+    mensaje_termino = f"Sin cambios en las entradas, se entrega el archivo {anterior.archivo}"
+    actualizar_quincena_producto(
+        quincena_producto_id=quincena_producto_id,
+        quincena_id=quincena_id,
+        fuente=fuente,
+        mensajes=anterior.mensajes.split("\n") + [mensaje_termino],
+        archivo=anterior.archivo,
+        url=anterior.url,
+        es_satisfactorio=anterior.es_satisfactorio,
+        huella=huella,
+    )
+
+    # Entregar mensaje de termino
+    bitacora.info(mensaje_termino)
+    return mensaje_termino
+
+
+def consultar_nominas_filas(quincena_id: int, tipo: str | list) -> list:
+    """Consultar las nóminas de la quincena como filas planas, en una sola consulta, el tipo puede ser una lista de tipos"""
+
+    # Aceptar un tipo o una lista de tipos
+    tipos = [tipo] if isinstance(tipo, str) else tipo
+
+    # Consultar las nóminas con los datos de la persona, centro de trabajo, plaza y quincena
+    consulta = (
+        select(
+            Nomina.id.label("nomina_id"),
+            Nomina.persona_id,
+            Nomina.tipo,
+            Nomina.importe,
+            Quincena.clave.label("quincena_clave"),
+            CentroTrabajo.clave.label("centro_trabajo_clave"),
+            Persona.rfc,
+            Persona.nombres,
+            Persona.apellido_primero,
+            Persona.apellido_segundo,
+            Persona.num_empleado,
+            Persona.modelo,
+            Plaza.clave.label("plaza_clave"),
+        )
+        .join(Persona, Nomina.persona_id == Persona.id)
+        .join(CentroTrabajo, Nomina.centro_trabajo_id == CentroTrabajo.id)
+        .join(Plaza, Nomina.plaza_id == Plaza.id)
+        .join(Quincena, Nomina.quincena_id == Quincena.id)
+        .where(Nomina.quincena_id == quincena_id)
+        .where(Nomina.tipo.in_(tipos))
+        .where(Nomina.estatus == "A")
+        .order_by(Persona.rfc)
+    )
+
+    # Entregar la lista de filas
+    return database.session.execute(consulta).all()
+
+
+def consultar_cuentas_por_persona(quincena_id: int, tipo: str | list) -> dict:
+    """Consultar las cuentas activas de las personas con nóminas en la quincena, agrupadas por persona_id"""
+
+    # Aceptar un tipo o una lista de tipos
+    tipos = [tipo] if isinstance(tipo, str) else tipo
+
+    # Sub consulta con las personas que tienen nóminas en la quincena
+    personas_ids = (
+        select(Nomina.persona_id)
+        .where(Nomina.quincena_id == quincena_id)
+        .where(Nomina.tipo.in_(tipos))
+        .where(Nomina.estatus == "A")
+    )
+
+    # Consultar las cuentas activas con los datos de su banco
+    consulta = (
+        select(
+            Cuenta.persona_id,
+            Cuenta.banco_id,
+            Cuenta.num_cuenta,
+            Banco.clave.label("banco_clave"),
+            Banco.nombre.label("banco_nombre"),
+        )
+        .join(Banco, Cuenta.banco_id == Banco.id)
+        .where(Cuenta.persona_id.in_(personas_ids))
+        .where(Cuenta.estatus == "A")
+        .order_by(Cuenta.persona_id, Cuenta.id)
+    )
+
+    # Agrupar las cuentas por persona_id
+    cuentas_por_persona = {}
+    for fila in database.session.execute(consulta):
+        cuentas_por_persona.setdefault(fila.persona_id, []).append(fila)
+
+    # Entregar el diccionario
+    return cuentas_por_persona
+
+
+def consultar_matriz_percepciones_deducciones(quincena_id: int, claves: list, tipo: str = None) -> dict:
+    """Consultar las P-D de la quincena en una sola consulta y pivotearlas en una matriz persona por concepto"""
+
+    # Consultar las P-D de la quincena con la clave del concepto, en el orden en que se alimentaron
+    consulta = (
+        select(PercepcionDeduccion.persona_id, Concepto.clave, PercepcionDeduccion.importe)
+        .join(Concepto, PercepcionDeduccion.concepto_id == Concepto.id)
+        .where(PercepcionDeduccion.quincena_id == quincena_id)
+        .order_by(PercepcionDeduccion.id)
+    )
+    if tipo is not None:
+        consulta = consulta.where(PercepcionDeduccion.tipo == tipo)
+    tabla = pd.DataFrame(database.session.execute(consulta).all(), columns=["persona_id", "clave", "importe"])
+
+    # Si no hay P-D, entregar un diccionario vacío
+    if tabla.empty:
+        return {}
+
+    # Pivotear a personas por conceptos, si una persona tiene la misma clave repetida se conserva la última
+    matriz = (
+        tabla.drop_duplicates(subset=["persona_id", "clave"], keep="last")
+        .pivot(index="persona_id", columns="clave", values="importe")
+        .reindex(columns=claves)
+    )
+    matriz = matriz.where(matriz.notna(), 0)
+
+    # Entregar un diccionario con persona_id y la lista de importes en el orden de las claves
+    return dict(zip(matriz.index.tolist(), matriz.to_numpy().tolist()))
+
+
+def consultar_importes_conceptos(quincena_id: int, tipo: str, claves: list) -> dict:
+    """Consultar en una sola consulta los importes de las P-D de la quincena y del tipo con las claves de conceptos dadas"""
+
+    # Consultar las P-D de la quincena y del tipo con las claves de conceptos dadas
+    consulta = (
+        select(PercepcionDeduccion.persona_id, Concepto.clave, PercepcionDeduccion.importe)
+        .join(Concepto, PercepcionDeduccion.concepto_id == Concepto.id)
+        .where(PercepcionDeduccion.quincena_id == quincena_id)
+        .where(PercepcionDeduccion.tipo == tipo)
+        .where(Concepto.clave.in_(claves))
+        .order_by(PercepcionDeduccion.id)
+    )
+
+    # Juntar en un diccionario por persona_id otro diccionario con clave e importe, si se repite se conserva el primero
+    importes_por_persona = {}
+    for persona_id, clave, importe in database.session.execute(consulta):
+        importes_por_persona.setdefault(persona_id, {}).setdefault(clave, importe)
+
+    # Entregar el diccionario
+    return importes_por_persona
+
+
+def fijar_nums_cheques(nums_cheques: list) -> None:
+    """Fijar los números de cheque de las nóminas en una sola sentencia, recibe una lista de diccionarios con id y num_cheque"""
+
+    # Si no hay números de cheque, no hay nada que actualizar
+    if len(nums_cheques) == 0:
+        return
+
+    # Actualizar por la clave primaria con un solo executemany, dentro de la transacción de la sesión
+    # Se conserva modificado, el número de cheque es un resultado de los generadores y no debe cambiar la huella
+    tabla = Nomina.__table__
+    sentencia = (
+        update(tabla)
+        .where(tabla.c.id == bindparam("nomina_id"))
+        .values(num_cheque=bindparam("nomina_num_cheque"), modificado=tabla.c.modificado)
+    )
+    database.session.execute(
+        sentencia,
+        [{"nomina_id": item["id"], "nomina_num_cheque": item["num_cheque"]} for item in nums_cheques],
+    )
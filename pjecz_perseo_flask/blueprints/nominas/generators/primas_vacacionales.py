@@ -2,21 +2,25 @@
 Nóminas, generadores de primas vacacionales
 """
 
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
 
 import pytz
-from openpyxl import Workbook
 
-from pjecz_perseo_flask.blueprints.cuentas.models import Cuenta
+from pjecz_perseo_flask.blueprints.bancos.consecutivos import reservar_consecutivos
+from pjecz_perseo_flask.blueprints.cuentas.duplicadas import consultar_cuentas_duplicadas, elaborar_mensajes_cuenta_duplicada
 from pjecz_perseo_flask.blueprints.nominas.generators.common import (
     GCS_BASE_DIRECTORY,
     LOCAL_BASE_DIRECTORY,
     TIMEZONE,
     actualizar_quincena_producto,
     bitacora,
+    calcular_huella,
     consultar_validar_quincena,
     database,
+    fijar_nums_cheques,
+    reutilizar_quincena_producto,
 )
 from pjecz_perseo_flask.blueprints.nominas.models import Nomina
 from pjecz_perseo_flask.blueprints.personas.models import Persona
@@ -28,7 +32,8 @@ from pjecz_perseo_flask.lib.exceptions import (
     MyFileNotFoundError,
     MyUploadError,
 )
-from pjecz_perseo_flask.lib.google_cloud_storage import upload_file_to_gcs
+from pjecz_perseo_flask.lib.google_cloud_storage import upload_fileobj_to_gcs
+from pjecz_perseo_flask.lib.xlsx import guardar_libro_xlsx, iniciar_libro_xlsx
 
 FUENTE = "PRIMAS VACACIONALES"
 
@@ -37,6 +42,8 @@ def crear_primas_vacacionales(
     quincena_clave: str,
     quincena_producto_id: int,
     fijar_num_cheque=False,
+    indice_cuentas_duplicadas: dict = None,
+    forzar: bool = False,
 ) -> str:
     """Crear archivo XLSX con las primas vacacionales de una quincena"""
 
@@ -46,6 +53,13 @@ def crear_primas_vacacionales(
     # Mandar mensaje de inicio a la bitacora
     bitacora.info("Inicia crear primas vacacionales %s", quincena_clave)
 
+    # Si no se pide forzar y ya hay un archivo con la misma huella de las entradas, entregarlo sin volver a generarlo
+    huella = calcular_huella(quincena.id, FUENTE, "PRIMA VACACIONAL", fijar_num_cheque)
+    if not forzar:
+        mensaje_termino = reutilizar_quincena_producto(quincena_producto_id, quincena.id, FUENTE, huella)
+        if mensaje_termino != "":
+            return mensaje_termino
+
     # Iniciar sesion con la base de datos para que la alimentacion sea rapida
     sesion = database.session
 
@@ -65,15 +79,8 @@ def crear_primas_vacacionales(
         actualizar_quincena_producto(quincena_producto_id, quincena.id, FUENTE, [mensaje])
         raise MyEmptyError(mensaje)
 
-    # Iniciar el archivo XLSX
-    libro = Workbook()
-
-    # Tomar la hoja del libro XLSX
-    hoja = libro.active
-    if hoja is None:
-        mensaje = "No se pudo iniciar la hoja del archivo XLSX"
-        actualizar_quincena_producto(quincena_producto_id, quincena.id, FUENTE, [mensaje])
-        raise MyEmptyError(mensaje)
+    # Iniciar el archivo XLSX en modo de solo escritura, para que la memoria no crezca con las filas
+    libro, hoja = iniciar_libro_xlsx()
 
     # Agregar la fila con las cabeceras de las columnas
     hoja.append(
@@ -93,8 +100,13 @@ def crear_primas_vacacionales(
         ]
     )
 
-    # Bucle para crear cada fila del archivo XLSX
-    contador = 0
+    # Si no se recibió el índice de cuentas duplicadas, consultarlo una sola vez para todas las filas
+    if indice_cuentas_duplicadas is None:
+        indice_cuentas_duplicadas = consultar_cuentas_duplicadas()
+
+    # Bucle para elegir la cuenta de cada nomina y contar cuantos numeros de cheque se necesitan por banco
+    filas = []
+    cantidades = Counter()
     personas_sin_cuentas = []
     cuentas_duplicadas = []
     for nomina in nominas:
@@ -119,27 +131,39 @@ def crear_primas_vacacionales(
             continue
 
         # Validar que no haya otra persona con el mismo banco y numero de cuenta
-        hay_cuenta_duplicada = False
-        for posible_cuenta_duplicada in (
-            Cuenta.query.filter_by(banco_id=su_cuenta.banco_id)
-            .filter_by(num_cuenta=su_cuenta.num_cuenta)
-            .filter_by(estatus="A")
-            .all()
-        ):
-            if posible_cuenta_duplicada.persona_id != nomina.persona_id:
-                cuentas_duplicadas.append(f"  Duplicada {nomina.persona.rfc} {su_cuenta.banco.nombre} {su_cuenta.num_cuenta}")
-                hay_cuenta_duplicada = False
-        if hay_cuenta_duplicada:
-            continue
+        cuentas_duplicadas += elaborar_mensajes_cuenta_duplicada(
+            indice_cuentas_duplicadas,
+            su_cuenta.banco_id,
+            su_cuenta.num_cuenta,
+            nomina.persona_id,
+            nomina.persona.rfc,
+        )
+
+        # Juntar la fila y contar el numero de cheque para su banco
+        filas.append((nomina, su_cuenta))
+        cantidades[su_cuenta.banco_id] += 1
+
+    # Si no hay filas, provocar error
+    if len(filas) == 0:
+        mensaje = "No hubo filas que agregar al archivo XLSX"
+        actualizar_quincena_producto(quincena_producto_id, quincena.id, FUENTE, [mensaje])
+        raise MyEmptyError(mensaje)
+
+    # Reservar un bloque de consecutivos por banco, con las cantidades ya contadas
+    consecutivos = reservar_consecutivos(cantidades)
 
+    # Bucle para crear cada fila del archivo XLSX
+    contador = 0
+    nums_cheques = []
+    for nomina, su_cuenta in filas:
         # Tomar el banco de la cuenta de la persona
         su_banco = su_cuenta.banco
 
-        # Incrementar la consecutivo del banco
-        su_banco.consecutivo_generado += 1
+        # Tomar el siguiente consecutivo del bloque reservado para el banco
+        consecutivos[su_cuenta.banco_id] += 1
 
         # Elaborar el numero de cheque, juntando la clave del banco y la consecutivo, siempre de 9 digitos
-        num_cheque = f"{su_cuenta.banco.clave.zfill(2)}{su_banco.consecutivo_generado:07}"
+        num_cheque = f"{su_cuenta.banco.clave.zfill(2)}{consecutivos[su_cuenta.banco_id]:07}"
 
         # Agregar la fila
         hoja.append(
@@ -159,23 +183,13 @@ def crear_primas_vacacionales(
             ]
         )
 
-        # Si fijar_num_cheque es verdadero, entonces actualizar el registro de la nominas con el numero de cheque
+        # Si fijar_num_cheque es verdadero, entonces juntar el id de la nomina con su numero de cheque
         if fijar_num_cheque:
-            nomina.num_cheque = num_cheque
-            sesion.add(nomina)
+            nums_cheques.append({"id": nomina.id, "num_cheque": num_cheque})
 
         # Incrementar contador
         contador += 1
 
-    # Si el contador es cero, provocar error
-    if contador == 0:
-        mensaje = "No hubo filas que agregar al archivo XLSX"
-        actualizar_quincena_producto(quincena_producto_id, quincena.id, FUENTE, [mensaje])
-        raise MyEmptyError(mensaje)
-
-    # Actualizar los consecutivos de cada banco
-    sesion.commit()
-
     # Determinar el nombre del archivo XLSX
     ahora = datetime.now(tz=pytz.timezone(TIMEZONE))
     nombre_archivo_xlsx = f"primas_vacacionales_{quincena_clave}_{ahora.strftime('%Y-%m-%d_%H%M%S')}.xlsx"
@@ -184,35 +198,36 @@ def crear_primas_vacacionales(
     ruta_local = Path(LOCAL_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
     ruta_gcs = Path(GCS_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
 
-    # Si no existe el directorio local, crearlo
-    Path(ruta_local).mkdir(parents=True, exist_ok=True)
-
-    # Guardar el archivo XLSX
-    ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
-    libro.save(ruta_local_archivo_xlsx)
-
-    # Si esta configurado Google Cloud Storage
-    mensaje_gcs = ""
-    public_url = ""
+    # Guardar el archivo XLSX en un buffer temporal, si esta configurado se conserva la copia local
     settings = get_settings()
-    if settings.CLOUD_STORAGE_DEPOSITO != "":
-        # Leer el contenido del archivo XLSX
-        with open(ruta_local_archivo_xlsx, "rb") as archivo:
-            # Subir el archivo XLSX a Google Cloud Storage
+    ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
+    with guardar_libro_xlsx(libro, ruta_local_archivo_xlsx) as buffer:
+        # Si esta configurado Google Cloud Storage
+        mensaje_gcs = ""
+        public_url = ""
+        if settings.CLOUD_STORAGE_DEPOSITO != "":
+            # Subir el archivo XLSX a Google Cloud Storage por partes desde el buffer
             try:
-                public_url = upload_file_to_gcs(
+                public_url = upload_fileobj_to_gcs(
                     bucket_name=settings.CLOUD_STORAGE_DEPOSITO,
                     blob_name=f"{ruta_gcs}/{nombre_archivo_xlsx}",
                     content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    data=archivo.read(),
+                    file_obj=buffer,
                 )
                 mensaje_gcs = f"Se subio el archivo XLSX a GCS {public_url}"
                 bitacora.info(mensaje_gcs)
             except (MyEmptyError, MyBucketNotFoundError, MyFileNotAllowedError, MyFileNotFoundError, MyUploadError) as error:
+                # Deshacer la reservación de los consecutivos, para que no queden huecos
+                sesion.rollback()
                 mensaje_fallo_gcs = str(error)
                 actualizar_quincena_producto(quincena_producto_id, quincena.id, FUENTE, [mensaje_fallo_gcs])
                 raise error
 
+    # Ya subido el archivo XLSX, fijar los números de cheque en una sola sentencia y guardar los consecutivos reservados
+    if fijar_num_cheque:
+        fijar_nums_cheques(nums_cheques)
+    sesion.commit()
+
     # Si hubo personas sin cuentas, entonces juntarlas para mensajes
     mensajes = []
     if len(personas_sin_cuentas) > 0:
@@ -244,6 +259,7 @@ def crear_primas_vacacionales(
         archivo=nombre_archivo_xlsx,
         url=public_url,
         es_satisfactorio=es_satisfactorio,
+        huella=huella,
     )
 
     # Entregar mensaje de termino
@@ -0,0 +1,465 @@
+"""
+Nóminas, generador en un solo recorrido de nóminas, monederos, pensionados y dispersiones pensionados
+
+Consulta una sola vez las nóminas de tipo SALARIO y DESPENSA de la quincena y las cuentas de sus personas,
+cada nómina se reparte al archivo XLSX que le corresponde
+
+- DESPENSA va a monederos con la cuenta del banco con clave 9
+- SALARIO de una persona que no es modelo 3 va a nóminas
+- SALARIO de una persona modelo 3 va a pensionados y a dispersiones pensionados
+
+Si se dan las quincenas_productos solo crea los productos de esas fuentes,
+los generadores de cada producto lo usan con su sola fuente, asi las reglas de las filas y los cheques están en un solo lugar
+"""
+
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import pytz
+from openpyxl import Workbook
+
+from pjecz_perseo_flask.blueprints.bancos.consecutivos import bloquear_bancos, reservar_consecutivos
+from pjecz_perseo_flask.blueprints.cuentas.duplicadas import consultar_cuentas_duplicadas, elaborar_mensajes_cuenta_duplicada
+from pjecz_perseo_flask.blueprints.nominas.generators.common import (
+    GCS_BASE_DIRECTORY,
+    LOCAL_BASE_DIRECTORY,
+    TIMEZONE,
+    Catalogos,
+    actualizar_quincena_producto,
+    bitacora,
+    calcular_huella,
+    consultar_cuentas_por_persona,
+    consultar_nominas_filas,
+    consultar_quincena_producto_misma_huella,
+    consultar_validar_quincena,
+    database,
+    fijar_nums_cheques,
+    reutilizar_quincena_producto,
+)
+from pjecz_perseo_flask.config.settings import get_settings
+from pjecz_perseo_flask.lib.exceptions import (
+    MyBucketNotFoundError,
+    MyEmptyError,
+    MyFileNotAllowedError,
+    MyFileNotFoundError,
+    MyNotExistsError,
+    MyNotValidParamError,
+    MyUploadError,
+)
+from pjecz_perseo_flask.lib.google_cloud_storage import upload_fileobj_to_gcs
+from pjecz_perseo_flask.lib.xlsx import guardar_libro_xlsx, iniciar_libro_xlsx
+
+ENCABEZADOS_NOMINAS = [
+    "QUINCENA",
+    "CENTRO DE TRABAJO",
+    "RFC",
+    "NOMBRE COMPLETO",
+    "NUMERO DE EMPLEADO",
+    "MODELO",
+    "PLAZA",
+    "NOMBRE DEL BANCO",
+    "BANCO ADMINISTRADOR",
+    "NUMERO DE CUENTA",
+    "MONTO A DEPOSITAR",
+    "NO DE CHEQUE",
+]
+ENCABEZADOS_MONEDEROS = [
+    "CT_CLASIF",
+    "RFC",
+    "TOT NET CHEQUE",
+    "NUM CHEQUE",
+    "NUM TARJETA",
+    "QUINCENA",
+    "MODELO",
+]
+ENCABEZADOS_DISPERSIONES = [
+    "CONSECUTIVO",
+    "FORMA DE PAGO",
+    "TIPO DE CUENTA",
+    "BANCO RECEPTOR",
+    "CUENTA ABONO",
+    "IMPORTE PAGO",
+    "CLAVE BENEFICIARIO",
+    "RFC",
+    "NOMBRE",
+    "REFERENCIA PAGO",
+    "CONCEPTO PAGO",
+]
+
+# Por cada producto su fuente, el tipo de nómina, los parámetros de su huella y el prefijo de su archivo
+PRODUCTOS = {
+    "NOMINAS": ("SALARIO", True, "nominas"),
+    "MONEDEROS": ("DESPENSA", True, "monederos"),
+    "PENSIONADOS": ("SALARIO", True, "pensionados"),
+    "DISPERSIONES PENSIONADOS": ("SALARIO", False, "dispersiones_pensionados"),
+}
+
+# Tipos de nómina que se pueden dar en lugar de SALARIO a nóminas, pensionados y dispersiones pensionados
+TIPOS = ["SALARIO", "AGUINALDO", "RETROACTIVO AGUINALDO"]
+
+
+def tomar_tipo_producto(fuente: str, tipo: str = "SALARIO") -> str:
+    """Tomar el tipo de nómina del producto, los de SALARIO toman el tipo que se da"""
+    return tipo if PRODUCTOS[fuente][0] == "SALARIO" else PRODUCTOS[fuente][0]
+
+
+def calcular_huellas_productos(
+    quincena_id: int,
+    fijar_num_cheque: bool = False,
+    fuentes: list = None,
+    tipo: str = "SALARIO",
+) -> dict:
+    """Calcular la huella de cada producto"""
+    huellas = {}
+    for fuente in fuentes or PRODUCTOS:
+        parametros = [fijar_num_cheque] if PRODUCTOS[fuente][1] else []
+        huellas[fuente] = calcular_huella(quincena_id, fuente, tomar_tipo_producto(fuente, tipo), *parametros)
+    return huellas
+
+
+def subir_producto(quincena_clave: str, fuente: str, libro: Workbook) -> tuple:
+    """Guardar y subir el archivo XLSX de un producto, entrega el nombre del archivo y su URL"""
+
+    # Determinar el nombre del archivo XLSX
+    ahora = datetime.now(tz=pytz.timezone(TIMEZONE))
+    nombre_archivo_xlsx = f"{PRODUCTOS[fuente][2]}_{quincena_clave}_{ahora.strftime('%Y-%m-%d_%H%M%S')}.xlsx"
+
+    # Determinar las rutas con directorios con el año y el número de mes en dos dígitos
+    ruta_local = Path(LOCAL_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
+    ruta_gcs = Path(GCS_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
+
+    # Guardar el archivo XLSX en un buffer temporal, si esta configurado se conserva la copia local
+    settings = get_settings()
+    ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
+    with guardar_libro_xlsx(libro, ruta_local_archivo_xlsx) as buffer:
+        # Si esta configurado Google Cloud Storage, subir el archivo XLSX por partes desde el buffer
+        public_url = ""
+        if settings.CLOUD_STORAGE_DEPOSITO != "":
+            public_url = upload_fileobj_to_gcs(
+                bucket_name=settings.CLOUD_STORAGE_DEPOSITO,
+                blob_name=f"{ruta_gcs}/{nombre_archivo_xlsx}",
+                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                file_obj=buffer,
+            )
+            bitacora.info("Se subio el archivo XLSX a GCS %s", public_url)
+
+    # Entregar el nombre del archivo XLSX y su URL
+    return nombre_archivo_xlsx, public_url
+
+
+def actualizar_producto(
+    quincena_id: int,
+    quincena_producto_id: int,
+    fuente: str,
+    nombre_archivo_xlsx: str,
+    public_url: str,
+    contador: int,
+    personas_sin_cuentas: list,
+    huella: str,
+    cuentas_duplicadas: list = None,
+) -> str:
+    """Actualizar la quincena_producto de un producto ya subido y entregar el mensaje de termino"""
+
+    # Si hubo personas sin cuentas, entonces juntarlas para mensajes
+    mensajes = []
+    if len(personas_sin_cuentas) > 0:
+        mensajes.append(f"AVISO: Hubo {len(personas_sin_cuentas)} personas sin cuentas:")
+        mensajes += personas_sin_cuentas
+
+    # Si hubo mensajes, entonces no es satisfactorio
+    es_satisfactorio = True
+    if len(mensajes) > 0:
+        es_satisfactorio = False
+        for m in mensajes:
+            bitacora.warning(m)
+
+    # Agregar el último mensaje con la cantidad de filas en el archivo XLSX
+    mensaje_termino = f"Se generaron {contador} filas"
+    mensajes.append(mensaje_termino)
+
+    # Si hubo cuentas duplicadas, entonces juntarlas para mensajes
+    if cuentas_duplicadas:
+        mensajes.append(f"AVISO: Hubo {len(cuentas_duplicadas)} cuentas duplicadas:")
+        mensajes += cuentas_duplicadas
+
+    # Actualizar quincena_producto
+    actualizar_quincena_producto(
+        quincena_producto_id=quincena_producto_id,
+        quincena_id=quincena_id,
+        fuente=fuente,
+        mensajes=mensajes,
+        archivo=nombre_archivo_xlsx,
+        url=public_url,
+        es_satisfactorio=es_satisfactorio,
+        huella=huella,
+    )
+
+    # Entregar mensaje de termino
+    return mensaje_termino
+
+
+def crear_productos_quincena(
+    quincena_clave: str,
+    quincenas_productos_ids: dict = None,
+    fijar_num_cheque: bool = False,
+    forzar: bool = False,
+    catalogos: Catalogos = None,
+    indice_cuentas_duplicadas: dict = None,
+    tipo: str = "SALARIO",
+) -> str:
+    """Crear en un solo recorrido los archivos XLSX de nóminas, monederos, pensionados y dispersiones pensionados"""
+
+    # Validar el tipo
+    if tipo not in TIPOS:
+        raise MyNotValidParamError(f"El tipo {tipo} no es valido")
+
+    # Tomar la quincena_producto de cada fuente, si no se dan se crean todos los productos con una nueva cada uno
+    if not quincenas_productos_ids:
+        quincenas_productos_ids = {fuente: 0 for fuente in PRODUCTOS}
+    fuentes = [fuente for fuente in PRODUCTOS if fuente in quincenas_productos_ids]
+    ids = {fuente: quincenas_productos_ids[fuente] for fuente in fuentes}
+
+    # Tomar los tipos de nómina de los productos que se piden, en el orden de PRODUCTOS
+    tipos = list(dict.fromkeys(tomar_tipo_producto(fuente, tipo) for fuente in fuentes))
+
+    # Consultar y validar quincena
+    quincena = consultar_validar_quincena(quincena_clave)  # Puede provocar una excepción
+
+    # Mandar mensaje de inicio a la bitácora
+    bitacora.info("Inicia crear %s de la quincena %s %s", ", ".join(fuentes), quincena_clave, tipo)
+
+    # Si no se pide forzar y todos los productos tienen un archivo con la misma huella, entregarlos sin volver a generarlos
+    # Si alguno cambió se generan todos, porque los números de cheque se reparten de nuevo desde los consecutivos
+    huellas = calcular_huellas_productos(quincena.id, fijar_num_cheque, fuentes, tipo)
+    if not forzar:
+        anteriores = [
+            consultar_quincena_producto_misma_huella(quincena.id, fuente, huellas[fuente], ids[fuente]) for fuente in fuentes
+        ]
+        if None not in anteriores:
+            mensajes = [reutilizar_quincena_producto(ids[fuente], quincena.id, fuente, huellas[fuente]) for fuente in fuentes]
+            return "\n".join(mensajes)
+
+    # Iniciar sesión con la base de datos para que la alimentación sea rápida
+    sesion = database.session
+
+    # Si no se recibieron los catálogos, cargarlos con una consulta por tabla, de ahí se toman los bancos
+    if catalogos is None:
+        catalogos = Catalogos()
+
+    # Tomar del catálogo el banco con la clave 9 que es PREVIVALE, al que van los monederos
+    banco_previvale = next((banco for banco in catalogos.registros["bancos"].values() if banco.clave == "9"), None)
+
+    # Si se piden los monederos y no existe el banco, provocar error y salir
+    if "MONEDEROS" in fuentes and banco_previvale is None:
+        mensaje = "No existe el banco con clave 9"
+        for fuente in fuentes:
+            actualizar_quincena_producto(ids[fuente], quincena.id, fuente, [mensaje])
+        raise MyNotExistsError(mensaje)
+
+    # Consultar en un solo recorrido las nóminas de la quincena de los tipos de los productos
+    nominas = consultar_nominas_filas(quincena.id, tipos)
+
+    # Si no hay registros, provocar error
+    if len(nominas) == 0:
+        mensaje = f"No hay registros en nóminas de tipo {' ni '.join(tipos)}"
+        for fuente in fuentes:
+            actualizar_quincena_producto(ids[fuente], quincena.id, fuente, [mensaje])
+        raise MyEmptyError(mensaje)
+
+    # Consultar una sola vez las cuentas activas de las personas, agrupadas por persona_id
+    cuentas_por_persona = consultar_cuentas_por_persona(quincena.id, tipos)
+
+    # Si se piden las nóminas y no se recibió el índice de cuentas duplicadas, consultarlo una sola vez para todas las filas
+    if "NOMINAS" in fuentes and indice_cuentas_duplicadas is None:
+        indice_cuentas_duplicadas = consultar_cuentas_duplicadas()
+
+    # Bucle para repartir cada nómina al producto que le corresponde y contar los números de cheque por banco
+    filas = {fuente: [] for fuente in PRODUCTOS}
+    cantidades = {fuente: Counter() for fuente in PRODUCTOS}
+    personas_sin_cuentas = {fuente: [] for fuente in PRODUCTOS}
+    cuentas_duplicadas = []
+    for nomina in nominas:
+        # Tomar el nombre completo y las cuentas activas de la persona
+        nombre_completo = f"{nomina.nombres} {nomina.apellido_primero} {nomina.apellido_segundo}"
+        cuentas = cuentas_por_persona.get(nomina.persona_id, [])
+
+        # Si es DESPENSA va a monederos, con la cuenta del banco con clave 9
+        if nomina.tipo == "DESPENSA":
+            su_cuenta = next((cuenta for cuenta in cuentas if cuenta.banco_clave == "9"), None)
+            if su_cuenta is None:
+                personas_sin_cuentas["MONEDEROS"].append(f"- {nomina.rfc} {nombre_completo}")
+                continue
+            filas["MONEDEROS"].append((nomina, nombre_completo, su_cuenta))
+            cantidades["MONEDEROS"][su_cuenta.banco_id] += 1
+            continue
+
+        # Si es SALARIO, o el tipo que se dio, tomar la cuenta que no tenga la clave 9, porque esa clave es la de DESPENSA
+        su_cuenta = next((cuenta for cuenta in cuentas if cuenta.banco_clave != "9"), None)
+
+        # Si el modelo de la persona es 3, va a pensionados y a dispersiones pensionados
+        if nomina.modelo == 3:
+            if su_cuenta is None:
+                personas_sin_cuentas["PENSIONADOS"].append(f"- {nomina.rfc} {nombre_completo}")
+                personas_sin_cuentas["DISPERSIONES PENSIONADOS"].append(f"- {nomina.rfc} {nombre_completo}")
+                continue
+            filas["PENSIONADOS"].append((nomina, nombre_completo, su_cuenta))
+            filas["DISPERSIONES PENSIONADOS"].append((nomina, nombre_completo, su_cuenta))
+            cantidades["PENSIONADOS"][su_cuenta.banco_id] += 1
+            continue
+
+        # Si no, va a nóminas, si no se piden se salta
+        if "NOMINAS" not in fuentes:
+            continue
+        if su_cuenta is None:
+            personas_sin_cuentas["NOMINAS"].append(f"- {nomina.rfc} {nombre_completo}")
+            continue
+
+        # Validar que no haya otra persona con el mismo banco y número de cuenta
+        cuentas_duplicadas += elaborar_mensajes_cuenta_duplicada(
+            indice_cuentas_duplicadas,
+            su_cuenta.banco_id,
+            su_cuenta.num_cuenta,
+            nomina.persona_id,
+            nomina.rfc,
+        )
+        filas["NOMINAS"].append((nomina, nombre_completo, su_cuenta))
+        cantidades["NOMINAS"][su_cuenta.banco_id] += 1
+
+    # Si ninguno de los productos tiene filas, provocar error
+    if all(len(filas[fuente]) == 0 for fuente in fuentes):
+        mensaje = "No hubo filas que agregar al archivo XLSX"
+        for fuente in fuentes:
+            actualizar_quincena_producto(ids[fuente], quincena.id, fuente, [mensaje])
+        raise MyEmptyError(mensaje)
+
+    # Bloquear de una vez todos los bancos de los productos, para no esperar a otro generador a la mitad
+    bloquear_bancos(set().union(*(cantidades[fuente].keys() for fuente in fuentes)))
+
+    # Reservar los bloques de consecutivos en el mismo orden en que se generaban los productos uno tras otro
+    # Los monederos comienzan en el consecutivo de su banco
+    consecutivos = {}
+    for fuente, reiniciar in (("NOMINAS", False), ("MONEDEROS", True), ("PENSIONADOS", False)):
+        if fuente in fuentes:
+            consecutivos[fuente] = reservar_consecutivos(cantidades[fuente], reiniciar=reiniciar)
+
+    # Bucle por cada producto para crear las filas de su archivo XLSX
+    libros = {}
+    nums_cheques = []
+    for fuente in fuentes:
+        # Si el producto no tiene filas, se salta
+        if len(filas[fuente]) == 0:
+            continue
+
+        # Iniciar el archivo XLSX en modo de solo escritura, con las cabeceras de las columnas
+        if fuente == "MONEDEROS":
+            libro, hoja = iniciar_libro_xlsx(ENCABEZADOS_MONEDEROS)
+        elif fuente == "DISPERSIONES PENSIONADOS":
+            libro, hoja = iniciar_libro_xlsx(ENCABEZADOS_DISPERSIONES)
+        else:
+            libro, hoja = iniciar_libro_xlsx(ENCABEZADOS_NOMINAS)
+        libros[fuente] = libro
+
+        # Bucle para crear cada fila del archivo XLSX
+        for contador, (nomina, nombre_completo, su_cuenta) in enumerate(filas[fuente], start=1):
+            # Tomar el banco de la cuenta de la persona
+            su_banco = catalogos.tomar("bancos", su_cuenta.banco_id)
+
+            # Las dispersiones pensionados no llevan número de cheque
+            if fuente == "DISPERSIONES PENSIONADOS":
+                hoja.append(
+                    [
+                        contador,
+                        "04",
+                        "9",
+                        su_banco.clave_dispersion_pensionados,
+                        su_cuenta.num_cuenta,
+                        nomina.importe,
+                        contador,
+                        nomina.rfc,
+                        nombre_completo,
+                        f"{quincena_clave[-2:]}{quincena_clave[2:4]}",
+                        f"QUINCENA {quincena_clave[-2:]} PENSIONADOS",
+                    ]
+                )
+                continue
+
+            # Tomar el siguiente consecutivo del bloque reservado y elaborar el número de cheque, siempre de 9 dígitos
+            consecutivos[fuente][su_cuenta.banco_id] += 1
+            num_cheque = f"{su_banco.clave.zfill(2)}{consecutivos[fuente][su_cuenta.banco_id]:07}"
+
+            # Agregar la fila
+            if fuente == "MONEDEROS":
+                hoja.append(
+                    ["J", nomina.rfc, nomina.importe, num_cheque, su_cuenta.num_cuenta, nomina.quincena_clave, nomina.modelo]
+                )
+            else:
+                hoja.append(
+                    [
+                        nomina.quincena_clave,
+                        nomina.centro_trabajo_clave,
+                        nomina.rfc,
+                        nombre_completo,
+                        nomina.num_empleado,
+                        nomina.modelo,
+                        nomina.plaza_clave,
+                        su_banco.nombre,
+                        su_banco.clave,
+                        su_cuenta.num_cuenta,
+                        nomina.importe,
+                        num_cheque,
+                    ]
+                )
+
+            # Si fijar_num_cheque es verdadero, entonces juntar el id de la nómina con su número de cheque
+            if fijar_num_cheque:
+                nums_cheques.append({"id": nomina.nomina_id, "num_cheque": num_cheque})
+
+    # Guardar y subir los archivos XLSX antes del commit, los bancos siguen bloqueados mientras se suben
+    # Si falla la subida, el rollback devuelve los consecutivos reservados y no quedan huecos ni números de cheque sin archivo
+    archivos = {}
+    try:
+        for fuente, libro in libros.items():
+            archivos[fuente] = subir_producto(quincena_clave, fuente, libro)
+    except (MyEmptyError, MyBucketNotFoundError, MyFileNotAllowedError, MyFileNotFoundError, MyUploadError) as error:
+        sesion.rollback()
+        mensaje_fallo_gcs = str(error)
+        for fuente in fuentes:
+            actualizar_quincena_producto(ids[fuente], quincena.id, fuente, [mensaje_fallo_gcs])
+        bitacora.error(mensaje_fallo_gcs)
+        raise error
+
+    # Ya subidos los archivos XLSX, fijar los números de cheque de todos los productos en una sola sentencia y guardar
+    if fijar_num_cheque:
+        fijar_nums_cheques(nums_cheques)
+    sesion.commit()
+
+    # Bucle por cada producto para actualizar su quincena_producto
+    mensajes = []
+    for fuente in fuentes:
+        # Si el producto no tiene filas, actualizar su quincena_producto con el aviso y seguir con los demás
+        if fuente not in libros:
+            mensaje = "No hubo filas que agregar al archivo XLSX"
+            actualizar_quincena_producto(ids[fuente], quincena.id, fuente, [mensaje])
+            bitacora.warning("%s: %s", fuente, mensaje)
+            mensajes.append(f"{fuente}: {mensaje}")
+            continue
+
+        # Actualizar la quincena_producto con el archivo XLSX ya subido
+        mensaje_termino = actualizar_producto(
+            quincena_id=quincena.id,
+            quincena_producto_id=ids[fuente],
+            fuente=fuente,
+            nombre_archivo_xlsx=archivos[fuente][0],
+            public_url=archivos[fuente][1],
+            contador=len(filas[fuente]),
+            personas_sin_cuentas=personas_sin_cuentas[fuente],
+            huella=huellas[fuente],
+            cuentas_duplicadas=cuentas_duplicadas if fuente == "NOMINAS" else None,
+        )
+        mensajes.append(f"{fuente}: {mensaje_termino}")
+
+    # Entregar mensaje de termino
+    mensaje_termino = f"Termina crear {', '.join(fuentes)} de la quincena {quincena_clave}:\n" + "\n".join(mensajes)
+    bitacora.info(mensaje_termino)
+    return mensaje_termino
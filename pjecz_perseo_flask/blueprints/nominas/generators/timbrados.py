@@ -6,26 +6,26 @@ from datetime import datetime
 from pathlib import Path
 
 import pytz
-from openpyxl import Workbook
+from sqlalchemy.orm import contains_eager
 
-from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
 from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
-from pjecz_perseo_flask.blueprints.cuentas.models import Cuenta
 from pjecz_perseo_flask.blueprints.nominas.generators.common import (
     GCS_BASE_DIRECTORY,
     LOCAL_BASE_DIRECTORY,
     TIMEZONE,
+    Catalogos,
     actualizar_quincena_producto,
     bitacora,
+    calcular_huella,
+    consultar_importes_conceptos,
+    consultar_matriz_percepciones_deducciones,
     consultar_validar_quincena,
     database,
+    reutilizar_quincena_producto,
 )
 from pjecz_perseo_flask.blueprints.nominas.models import Nomina
-from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
 from pjecz_perseo_flask.blueprints.personas.models import Persona
-from pjecz_perseo_flask.blueprints.plazas.models import Plaza
 from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
-from pjecz_perseo_flask.blueprints.tabuladores.models import Tabulador
 from pjecz_perseo_flask.config.settings import get_settings
 from pjecz_perseo_flask.lib.exceptions import (
     MyBucketNotFoundError,
@@ -37,19 +37,43 @@ from pjecz_perseo_flask.lib.exceptions import (
     MyUploadError,
 )
 from pjecz_perseo_flask.lib.fechas import quincena_to_fecha
-from pjecz_perseo_flask.lib.google_cloud_storage import upload_file_to_gcs
+from pjecz_perseo_flask.lib.google_cloud_storage import upload_fileobj_to_gcs
+from pjecz_perseo_flask.lib.xlsx import guardar_libro_xlsx, iniciar_libro_xlsx
 
 PATRON_RFC = "PJE901211TI9"
 COMPANIA_NOMBRE = "PODER JUDICIAL DEL ESTADO DE COAHUILA DE ZARAGOZA"
 COMPANIA_RFC = PATRON_RFC
 COMPANIA_CP = "25000"
 
+# Conceptos fijos de los tipos extraordinarios, en el orden de las columnas del archivo XLSX
+CONCEPTOS_FIJOS_POR_TIPO = {
+    "APOYO ANUAL": [
+        "PAZ",  # Percepcion de Apoyo Anual
+        "DAZ",  # Deduccion ISR Apoyo Anual
+        "D62",  # Deduccion Pension Alimenticia
+    ],
+    "APOYO DIA DE LA MADRE": [
+        "PA5",  # Percepcion de Apoyo para el Dia de la Madre
+        "DAZ",  # Deduccion ISR Apoyo Anual
+        "D62",  # Deduccion Pension Alimenticia
+    ],
+    "PRIMA VACACIONAL": [
+        "P20",  # Percepcion de Prima Vacacional Excenta
+        "PGP",  # Percepcion de Prima Vacacional Gravable
+        "PGV",  # Percepcion de Prima Vacacional Adicional Gravable
+        "D1R",  # Deduccion Impuesto Federal Retenido ISR
+        "D62",  # Deduccion Pension Alimenticia
+    ],
+}
+
 
 def crear_timbrados(
     quincena_clave: str,
     quincena_producto_id: int,
     modelos: list = None,
     tipo: str = "SALARIO",
+    forzar: bool = False,
+    catalogos: Catalogos = None,
 ) -> str:
     """Crear archivo XLSX con los timbrados de una quincena"""
 
@@ -123,31 +147,9 @@ def crear_timbrados(
             if not concepto.clave.startswith("P") and not concepto.clave.startswith("D"):
                 conceptos_dict[concepto.clave] = concepto
 
-    # Si el tipo es APOYO ANUAL armar un diccionario con PAZ, DAZ y D62
-    if tipo == "APOYO ANUAL":
-        conceptos_dict = {
-            "PAZ": None,  # Percepcion de Apoyo Anual
-            "DAZ": None,  # Deduccion ISR Apoyo Anual
-            "D62": None,  # Deduccion Pension Alimenticia
-        }
-
-    # Si el tipo es APOYO ANUAL armar un diccionario con PAZ, DAZ y D62
-    if tipo == "APOYO DIA DE LA MADRE":
-        conceptos_dict = {
-            "PA5": None,  # Percepcion de Apoyo para el Dia de la Madre
-            "DAZ": None,  # Deduccion ISR Apoyo Anual
-            "D62": None,  # Deduccion Pension Alimenticia
-        }
-
-    # Si el tipo es PRIMA VACACIONAL armar un diccionario con P20, PGP, PGV, D1R y D62
-    if tipo == "PRIMA VACACIONAL":
-        conceptos_dict = {
-            "P20": None,  # Percepcion de Prima Vacacional Excenta
-            "PGP": None,  # Percepcion de Prima Vacacional Gravable
-            "PGV": None,  # Percepcion de Prima Vacacional Adicional Gravable
-            "D1R": None,  # Deduccion Impuesto Federal Retenido ISR
-            "D62": None,  # Deduccion Pension Alimenticia
-        }
+    # Si el tipo tiene conceptos fijos, armar el diccionario con sus claves
+    if tipo in CONCEPTOS_FIJOS_POR_TIPO:
+        conceptos_dict = dict.fromkeys(CONCEPTOS_FIJOS_POR_TIPO[tipo])
 
     # Si no hay conceptos, provocar error y salir
     if len(conceptos_dict) == 0:
@@ -159,10 +161,18 @@ def crear_timbrados(
     descripcion = f"timbrados {quincena_clave} {tipo} modelos {modelos}"
     bitacora.info("Inicia crear %s", descripcion)
 
-    # Consultar Nominas activas de la quincena, del tipo dado, juntar con personas
+    # Si no se pide forzar y ya hay un archivo con la misma huella de las entradas, entregarlo sin volver a generarlo
+    huella = calcular_huella(quincena.id, fuente, tipo, modelos)
+    if not forzar:
+        mensaje_termino = reutilizar_quincena_producto(quincena_producto_id, quincena.id, fuente, huella)
+        if mensaje_termino != "":
+            return mensaje_termino
+
+    # Consultar Nominas activas de la quincena, del tipo dado, juntar con personas y cargar sus cuentas en una consulta
     nominas = (
         session.query(Nomina)
         .join(Persona)
+        .options(contains_eager(Nomina.persona).selectinload(Persona.cuentas))
         .filter(Nomina.quincena_id == quincena.id)
         .filter(Nomina.tipo == tipo)
         .filter(Nomina.estatus == "A")
@@ -178,16 +188,8 @@ def crear_timbrados(
         actualizar_quincena_producto(quincena_producto_id, quincena.id, fuente, [mensaje])
         raise MyEmptyError(mensaje)
 
-    # Iniciar el archivo XLSX
-    libro = Workbook()
-
-    # Tomar la hoja del libro XLSX
-    hoja = libro.active
-    if hoja is None:
-        mensaje_error = "No se pudo crear la hoja del archivo XLSX."
-        actualizar_quincena_producto(quincena_producto_id, quincena.id, fuente, [mensaje_error])
-        bitacora.error(mensaje_error)
-        raise MyEmptyError(mensaje_error)
+    # Iniciar el archivo XLSX en modo de solo escritura, para que la memoria no crezca con las filas
+    libro, hoja = iniciar_libro_xlsx()
 
     # Encabezados primera parte
     encabezados_parte_1 = [
@@ -252,6 +254,29 @@ def crear_timbrados(
     # Agregar la fila con las cabeceras de las columnas
     hoja.append(encabezados_parte_1 + encabezados_parte_2 + encabezados_parte_3)
 
+    # Si el tipo es AGUINALDO o SALARIO, consultar la matriz de P-D de la quincena, una fila por persona
+    matriz_percepciones_deducciones = {}
+    ceros_percepciones_deducciones = [0] * len(encabezados_parte_2)
+    if tipo in ["AGUINALDO", "SALARIO"]:
+        matriz_percepciones_deducciones = consultar_matriz_percepciones_deducciones(
+            quincena_id=quincena.id,
+            claves=encabezados_parte_2,
+            tipo=None if tipo == "SALARIO" else tipo,
+        )
+
+    # Si el tipo tiene conceptos fijos, consultar sus importes de la quincena, un diccionario por persona
+    importes_conceptos = {}
+    if tipo in CONCEPTOS_FIJOS_POR_TIPO:
+        importes_conceptos = consultar_importes_conceptos(
+            quincena_id=quincena.id,
+            tipo=tipo,
+            claves=encabezados_parte_2,
+        )
+
+    # Si no se recibieron los catálogos, cargarlos con una consulta por tabla, para que cada fila solo busque por id
+    if catalogos is None:
+        catalogos = Catalogos()
+
     # Inicializar el contador
     contador = 0
     personas_sin_cuentas = []
@@ -266,15 +291,21 @@ def crear_timbrados(
         su_cuenta = None
         su_cuenta_id = 0
         for cuenta in nomina.persona.cuentas:
-            if cuenta.estatus == "A" and cuenta.banco.clave != "9" and cuenta.id > su_cuenta_id:
+            if cuenta.estatus == "A" and catalogos.tomar("bancos", cuenta.banco_id).clave != "9" and cuenta.id > su_cuenta_id:
                 su_cuenta = cuenta
                 break
 
         # Si no tiene cuenta bancaria, entonces se agrega a la lista de personas_sin_cuentas y se salta
         if su_cuenta is None:
-            personas_sin_cuentas.append(nomina.persona.rfc)
+            personas_sin_cuentas.append(nomina.persona)
             continue
 
+        # Tomar de los catálogos el banco, el tabulador, el puesto y el centro de trabajo
+        su_banco = catalogos.tomar("bancos", su_cuenta.banco_id)
+        tabulador = catalogos.tomar("tabuladores", nomina.persona.tabulador_id)
+        puesto = catalogos.tomar("puestos", tabulador.puesto_id)
+        centro_trabajo = catalogos.tomar("centros_trabajos", nomina.centro_trabajo_id)
+
         # Incrementar contador
         contador += 1
 
@@ -291,11 +322,11 @@ def crear_timbrados(
             nomina.persona.ingreso_pj_fecha,  # FECHA DE INGRESO
             "O" if tipo == "SALARIO" else "E",  # CLAVE TIPO NOMINA ordinarias es O, extraordinarias es E
             "SI" if nomina.persona.modelo == 2 else "NO",  # SINDICALIZADO modelo es 2
-            su_cuenta.banco.clave_dispersion_pensionados,  # CLAVE BANCO SAT
+            su_banco.clave_dispersion_pensionados,  # CLAVE BANCO SAT
             su_cuenta.num_cuenta,  # NUMERO DE CUENTA
             "",  # PLANTA nula
-            nomina.persona.tabulador.salario_diario,  # SALARIO DIARIO
-            nomina.persona.tabulador.salario_diario_integrado,  # SALARIO INTEGRADO
+            tabulador.salario_diario,  # SALARIO DIARIO
+            tabulador.salario_diario_integrado,  # SALARIO INTEGRADO
             quincena_fecha_inicial,  # FECHA INICIAL PERIODO
             quincena_fecha_final,  # FECHA FINAL PERIODO
             nomina.fecha_pago,  # FECHA DE PAGO
@@ -319,134 +350,31 @@ def crear_timbrados(
             "",  # CLAVE CENTRO COSTOS nulo
             "",  # CENTRO COSTOS nulo
             "04" if tipo == "SALARIO" else "99",  # FORMA DE PAGO para la ayuda es 99 y para los salarios es 04
-            nomina.centro_trabajo.clave,  # CLAVE DEPARTAMENTO
-            nomina.centro_trabajo.descripcion,  # NOMBRE DEPARTAMENTO
-            nomina.persona.tabulador.puesto.clave,  # NOMBRE PUESTO por lo pronto es la clave del puesto
+            centro_trabajo.clave,  # CLAVE DEPARTAMENTO
+            centro_trabajo.descripcion,  # NOMBRE DEPARTAMENTO
+            puesto.clave,  # NOMBRE PUESTO por lo pronto es la clave del puesto
         ]
 
         # Fila parte 2
         fila_parte_2 = []
-        if tipo == "SALARIO":
-            # Consultar TODAS las P-D de la quincena y la persona
-            percepciones_deducciones = (
-                session.query(PercepcionDeduccion)
-                .filter_by(quincena_id=quincena.id)
-                .filter_by(persona_id=nomina.persona_id)
-                .all()
-            )
-            # Bucle por las P-D para definir un diccionario con las claves y los importes
-            percepciones_deducciones_dict = {}
-            for percepcion_deduccion in percepciones_deducciones:
-                percepciones_deducciones_dict[percepcion_deduccion.concepto.clave] = percepcion_deduccion.importe
-            # Bucle por los conceptos
-            for _, concepto in conceptos_dict.items():
-                # Si el concepto esta en el diccionario de P-D, entonces agregar el importe
-                if concepto.clave in percepciones_deducciones_dict:
-                    fila_parte_2.append(percepciones_deducciones_dict[concepto.clave])
-                else:
-                    fila_parte_2.append(0)  # De lo contrario agregar cero
-        elif tipo == "APOYO ANUAL":
-            # Consultar la PercepcionDeduccion con concepto PAZ
-            percepcion_deduccion_paz = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "APOYO ANUAL")
-                .filter(Concepto.clave == "PAZ")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_paz.importe if percepcion_deduccion_paz is not None else 0)
-            # Consultar la PercepcionDeduccion con concepto DAZ
-            percepcion_deduccion_daz = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "APOYO ANUAL")
-                .filter(Concepto.clave == "DAZ")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_daz.importe if percepcion_deduccion_daz is not None else 0)
-            # Consultar la PercepcionDeduccion con concepto D62
-            percepcion_deduccion_d62 = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "APOYO ANUAL")
-                .filter(Concepto.clave == "D62")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_d62.importe if percepcion_deduccion_d62 is not None else 0)
-        elif tipo == "PRIMA VACACIONAL":
-            # Consultar la PercepcionDeduccion con concepto P20
-            percepcion_deduccion_p20 = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "PRIMA VACACIONAL")
-                .filter(Concepto.clave == "P20")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_p20.importe if percepcion_deduccion_p20 is not None else 0)
-            # Consultar la PercepcionDeduccion con concepto PGP
-            percepcion_deduccion_pgp = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "PRIMA VACACIONAL")
-                .filter(Concepto.clave == "PGP")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_pgp.importe if percepcion_deduccion_pgp is not None else 0)
-            # Consultar la PercepcionDeduccion con concepto PGV
-            percepcion_deduccion_pgv = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "PRIMA VACACIONAL")
-                .filter(Concepto.clave == "PGV")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_pgv.importe if percepcion_deduccion_pgv is not None else 0)
-            # Consultar la PercepcionDeduccion con concepto D1R
-            percepcion_deduccion_d1r = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "PRIMA VACACIONAL")
-                .filter(Concepto.clave == "D1R")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_d1r.importe if percepcion_deduccion_d1r is not None else 0)
-            # Consultar la PercepcionDeduccion con concepto D62
-            percepcion_deduccion_d62 = (
-                session.query(PercepcionDeduccion)
-                .join(Concepto)
-                .filter(PercepcionDeduccion.quincena_id == quincena.id)
-                .filter(PercepcionDeduccion.persona_id == nomina.persona_id)
-                .filter(PercepcionDeduccion.tipo == "PRIMA VACACIONAL")
-                .filter(Concepto.clave == "D62")
-                .first()
-            )
-            fila_parte_2.append(percepcion_deduccion_d62.importe if percepcion_deduccion_d62 is not None else 0)
+        if tipo in ["AGUINALDO", "SALARIO"]:
+            # Tomar los importes de la matriz de P-D, en el orden de conceptos_dict, o ceros si no tiene
+            fila_parte_2 = matriz_percepciones_deducciones.get(nomina.persona_id, ceros_percepciones_deducciones)
+        elif tipo in CONCEPTOS_FIJOS_POR_TIPO:
+            # Tomar los importes de los conceptos fijos, o cero si no tiene
+            importes = importes_conceptos.get(nomina.persona_id, {})
+            fila_parte_2 = [importes.get(clave, 0) for clave in conceptos_dict]
 
         # Si el codigo postal fiscal es cero, entonces se usa 00000
         codigo_postal_fiscal = "00000"
         if nomina.persona.codigo_postal_fiscal:
             codigo_postal_fiscal = str(nomina.persona.codigo_postal_fiscal).zfill(5)
 
-        # Consultar la clave de la plaza a partir de persona.ultimo_plaza_id
+        # Tomar del catálogo la clave de la plaza a partir de persona.ultimo_plaza_id
         plaza_clave = ""
-        if nomina.persona.ultimo_plaza_id:
-            plaza = Plaza.query.filter_by(id=nomina.persona.ultimo_plaza_id).first()
-            if plaza is not None:
-                plaza_clave = plaza.clave
+        plaza = catalogos.tomar("plazas", nomina.persona.ultimo_plaza_id)
+        if plaza is not None:
+            plaza_clave = plaza.clave
 
         # Fila parte 3
         fila_parte_3 = [
@@ -494,27 +422,21 @@ def crear_timbrados(
     ruta_local = Path(LOCAL_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
     ruta_gcs = Path(GCS_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
 
-    # Si no existe el directorio local, crearlo
-    Path(ruta_local).mkdir(parents=True, exist_ok=True)
-
-    # Guardar el archivo XLSX
-    ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
-    libro.save(ruta_local_archivo_xlsx)
-
-    # Si esta configurado Google Cloud Storage
-    mensaje_gcs = ""
-    public_url = ""
+    # Guardar el archivo XLSX en un buffer temporal, si esta configurado se conserva la copia local
     settings = get_settings()
-    if settings.CLOUD_STORAGE_DEPOSITO != "":
-        # Leer el contenido del archivo XLSX
-        with open(ruta_local_archivo_xlsx, "rb") as archivo:
-            # Subir el archivo XLSX a Google Cloud Storage
+    ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
+    with guardar_libro_xlsx(libro, ruta_local_archivo_xlsx) as buffer:
+        # Si esta configurado Google Cloud Storage
+        mensaje_gcs = ""
+        public_url = ""
+        if settings.CLOUD_STORAGE_DEPOSITO != "":
+            # Subir el archivo XLSX a Google Cloud Storage por partes desde el buffer
             try:
-                public_url = upload_file_to_gcs(
+                public_url = upload_fileobj_to_gcs(
                     bucket_name=settings.CLOUD_STORAGE_DEPOSITO,
                     blob_name=f"{ruta_gcs}/{nombre_archivo_xlsx}",
                     content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    data=archivo.read(),
+                    file_obj=buffer,
                 )
                 mensaje_gcs = f"Se subio el archivo XLSX a GCS {public_url}"
                 bitacora.info(mensaje_gcs)
@@ -549,6 +471,7 @@ def crear_timbrados(
         archivo=nombre_archivo_xlsx,
         url=public_url,
         es_satisfactorio=es_satisfactorio,
+        huella=huella,
     )
 
     # Entregar mensaje de termino
@@ -6,7 +6,7 @@ from datetime import date
 from decimal import Decimal, getcontext
 from typing import List, Optional
 
-from sqlalchemy import Enum, ForeignKey, Numeric, String
+from sqlalchemy import Enum, ForeignKey, Index, Numeric, String, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ...config.extensions import database
@@ -31,9 +31,39 @@ class Nomina(database.Model, UniversalMixin):
         "RETROACTIVO AGUINALDO": "RETROACTIVO AGUINALDO",
     }
 
+    # Llave natural de las nóminas de la explotación, SALARIO y DESPENSA, para alimentar con INSERT ... ON CONFLICT
+    LLAVE_NATURAL = ("quincena_id", "persona_id", "plaza_id", "tipo", "desde_clave", "hasta_clave")
+
+    # Llave de las nóminas de pensiones alimenticias, una persona puede tener varias en la quincena con distinto cheque
+    LLAVE_PENSION_ALIMENTICIA = (*LLAVE_NATURAL, "num_cheque")
+
+    # Fuente de las nóminas que alimenta la explotación, solo a esas se les da de baja cuando ya no vienen en el archivo
+    FUENTE_EXPLOTACION = "EXPLOTACION"
+
     # Nombre de la tabla
     __tablename__ = "nominas"
 
+    # Índice único de la llave natural, solo para las nóminas vigentes de la explotación
+    __table_args__ = (
+        Index(
+            "nominas_llave_natural",
+            *LLAVE_NATURAL,
+            unique=True,
+            postgresql_where=text("estatus = 'A' AND tipo IN ('SALARIO', 'DESPENSA')"),
+            sqlite_where=text("estatus = 'A' AND tipo IN ('SALARIO', 'DESPENSA')"),
+        ),
+        # Índice único de la llave de las pensiones alimenticias vigentes
+        Index(
+            "nominas_llave_pension_alimenticia",
+            *LLAVE_PENSION_ALIMENTICIA,
+            unique=True,
+            postgresql_where=text("estatus = 'A' AND tipo = 'PENSION ALIMENTICIA'"),
+            sqlite_where=text("estatus = 'A' AND tipo = 'PENSION ALIMENTICIA'"),
+        ),
+        # Índice por quincena e id para paginar el listado con cursor
+        Index("nominas_quincena_id_id", "quincena_id", "id"),
+    )
+
     # Clave primaria
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -59,6 +89,7 @@ class Nomina(database.Model, UniversalMixin):
     num_cheque: Mapped[str] = mapped_column(String(24), default="", server_default="")
     fecha_pago: Mapped[date]
     timbrado_id: Mapped[Optional[int]]
+    fuente: Mapped[str] = mapped_column(String(16), default="", server_default="")
 
     # Hijos
     timbrados: Mapped[List["Timbrado"]] = relationship("Timbrado", back_populates="nomina")
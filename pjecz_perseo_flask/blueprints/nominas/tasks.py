@@ -2,21 +2,37 @@
 Nóminas, tareas en el fondo
 """
 
+from flask import current_app
+from rq import get_current_job
+from rq.job import Dependency
+
 from pjecz_perseo_flask.blueprints.bancos.tasks import reiniciar_consecutivos_generados
 from pjecz_perseo_flask.blueprints.nominas.generators.aguinaldos import crear_aguinaldos
-from pjecz_perseo_flask.blueprints.nominas.generators.common import bitacora
+from pjecz_perseo_flask.blueprints.nominas.generators.common import (
+    bitacora,
+    calcular_huella,
+    consultar_quincena_producto_misma_huella,
+)
 from pjecz_perseo_flask.blueprints.nominas.generators.dispersiones_pensionados import crear_dispersiones_pensionados
 from pjecz_perseo_flask.blueprints.nominas.generators.monederos import crear_monederos
 from pjecz_perseo_flask.blueprints.nominas.generators.nominas import crear_nominas
 from pjecz_perseo_flask.blueprints.nominas.generators.pensionados import crear_pensionados
 from pjecz_perseo_flask.blueprints.nominas.generators.primas_vacacionales import crear_primas_vacacionales
+from pjecz_perseo_flask.blueprints.nominas.generators.productos_quincena import crear_productos_quincena
 from pjecz_perseo_flask.blueprints.nominas.generators.timbrados import crear_timbrados
 from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
+from pjecz_perseo_flask.blueprints.quincenas_productos.models import QuincenaProducto
+from pjecz_perseo_flask.blueprints.tareas.models import Tarea
 from pjecz_perseo_flask.lib.exceptions import MyAnyError
 from pjecz_perseo_flask.lib.tasks import set_task_error, set_task_progress
 
 
-def lanzar_generar_aguinaldos(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_aguinaldos(
+    quincena_clave: str,
+    quincena_producto_id: int,
+    fijar_num_cheque: bool = False,
+    forzar: bool = False,
+) -> str:
     """Tarea en el fondo para crear un archivo XLSX con los aguinaldos de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -24,7 +40,12 @@ def lanzar_generar_aguinaldos(quincena_clave: str, quincena_producto_id: int) ->
 
     # Ejecutar el creador
     try:
-        mensaje_termino = crear_aguinaldos(quincena_clave, quincena_producto_id)
+        mensaje_termino = crear_aguinaldos(
+            quincena_clave,
+            quincena_producto_id,
+            fijar_num_cheque,
+            forzar=forzar,
+        )
     except MyAnyError as error:
         mensaje_error = str(error)
         set_task_error(mensaje_error)
@@ -36,7 +57,12 @@ def lanzar_generar_aguinaldos(quincena_clave: str, quincena_producto_id: int) ->
     return mensaje_termino
 
 
-def lanzar_generar_nominas(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_nominas(
+    quincena_clave: str,
+    quincena_producto_id: int,
+    fijar_num_cheque: bool = False,
+    forzar: bool = False,
+) -> str:
     """Tarea en el fondo para crear un archivo XLSX con las nominas de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -44,7 +70,7 @@ def lanzar_generar_nominas(quincena_clave: str, quincena_producto_id: int) -> st
 
     # Ejecutar el creador
     try:
-        mensaje_termino = crear_nominas(quincena_clave, quincena_producto_id)
+        mensaje_termino = crear_nominas(quincena_clave, quincena_producto_id, fijar_num_cheque, forzar=forzar)
     except MyAnyError as error:
         mensaje_error = str(error)
         set_task_error(mensaje_error)
@@ -56,7 +82,12 @@ def lanzar_generar_nominas(quincena_clave: str, quincena_producto_id: int) -> st
     return mensaje_termino
 
 
-def lanzar_generar_monederos(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_monederos(
+    quincena_clave: str,
+    quincena_producto_id: int,
+    fijar_num_cheque: bool = False,
+    forzar: bool = False,
+) -> str:
     """Tarea en el fondo para crear un archivo XLSX con los monederos de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -64,7 +95,7 @@ def lanzar_generar_monederos(quincena_clave: str, quincena_producto_id: int) ->
 
     # Ejecutar el creador
     try:
-        mensaje_termino = crear_monederos(quincena_clave, quincena_producto_id)
+        mensaje_termino = crear_monederos(quincena_clave, quincena_producto_id, fijar_num_cheque, forzar=forzar)
     except MyAnyError as error:
         mensaje_error = str(error)
         set_task_error(mensaje_error)
@@ -76,7 +107,12 @@ def lanzar_generar_monederos(quincena_clave: str, quincena_producto_id: int) ->
     return mensaje_termino
 
 
-def lanzar_generar_pensionados(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_pensionados(
+    quincena_clave: str,
+    quincena_producto_id: int,
+    fijar_num_cheque: bool = False,
+    forzar: bool = False,
+) -> str:
     """Tarea en el fondo para crear un archivo XLSX con los pensionados de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -84,7 +120,7 @@ def lanzar_generar_pensionados(quincena_clave: str, quincena_producto_id: int) -
 
     # Ejecutar el creador
     try:
-        mensaje_termino = crear_pensionados(quincena_clave, quincena_producto_id)
+        mensaje_termino = crear_pensionados(quincena_clave, quincena_producto_id, fijar_num_cheque, forzar=forzar)
     except MyAnyError as error:
         mensaje_error = str(error)
         set_task_error(mensaje_error)
@@ -96,7 +132,12 @@ def lanzar_generar_pensionados(quincena_clave: str, quincena_producto_id: int) -
     return mensaje_termino
 
 
-def lanzar_generar_primas_vacacionales(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_primas_vacacionales(
+    quincena_clave: str,
+    quincena_producto_id: int,
+    fijar_num_cheque: bool = False,
+    forzar: bool = False,
+) -> str:
     """Tarea en el fondo para crear un archivo XLSX con las primas vacacionales de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -104,7 +145,12 @@ def lanzar_generar_primas_vacacionales(quincena_clave: str, quincena_producto_id
 
     # Ejecutar el creador
     try:
-        mensaje_termino = crear_primas_vacacionales(quincena_clave, quincena_producto_id)
+        mensaje_termino = crear_primas_vacacionales(
+            quincena_clave,
+            quincena_producto_id,
+            fijar_num_cheque,
+            forzar=forzar,
+        )
     except MyAnyError as error:
         mensaje_error = str(error)
         set_task_error(mensaje_error)
@@ -116,7 +162,7 @@ def lanzar_generar_primas_vacacionales(quincena_clave: str, quincena_producto_id
     return mensaje_termino
 
 
-def lanzar_generar_dispersiones_pensionados(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_dispersiones_pensionados(quincena_clave: str, quincena_producto_id: int, forzar: bool = False) -> str:
     """Tarea en el fondo para crear un archivo XLSX con las dispersiones pensionados de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -124,7 +170,7 @@ def lanzar_generar_dispersiones_pensionados(quincena_clave: str, quincena_produc
 
     # Ejecutar el creador
     try:
-        mensaje_termino = crear_dispersiones_pensionados(quincena_clave, quincena_producto_id)
+        mensaje_termino = crear_dispersiones_pensionados(quincena_clave, quincena_producto_id, forzar=forzar)
     except MyAnyError as error:
         mensaje_error = str(error)
         set_task_error(mensaje_error)
@@ -136,7 +182,37 @@ def lanzar_generar_dispersiones_pensionados(quincena_clave: str, quincena_produc
     return mensaje_termino
 
 
-def lanzar_generar_timbrados(quincena_clave: str, quincena_producto_id: int, modelos: list) -> str:
+def lanzar_generar_productos_quincena(
+    quincena_clave: str,
+    quincenas_productos_ids: dict,
+    fijar_num_cheque: bool = False,
+    forzar: bool = False,
+) -> str:
+    """Tarea en el fondo para crear en un solo recorrido los archivos XLSX de nominas, monederos, pensionados y dispersiones"""
+
+    # Iniciar la tarea en el fondo
+    set_task_progress(0, f"Generar archivos XLSX con los productos de {quincena_clave}...")
+
+    # Ejecutar el creador
+    try:
+        mensaje_termino = crear_productos_quincena(
+            quincena_clave,
+            quincenas_productos_ids,
+            fijar_num_cheque,
+            forzar=forzar,
+        )
+    except MyAnyError as error:
+        mensaje_error = str(error)
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+
+    # Terminar la tarea en el fondo y entregar el mensaje de termino
+    set_task_progress(100, mensaje_termino)
+    return mensaje_termino
+
+
+def lanzar_generar_timbrados(quincena_clave: str, quincena_producto_id: int, modelos: list, forzar: bool = False) -> str:
     """Tarea en el fondo para crear un archivo XLSX con los timbrados de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -148,6 +224,7 @@ def lanzar_generar_timbrados(quincena_clave: str, quincena_producto_id: int, mod
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto_id,
             modelos=modelos,
+            forzar=forzar,
         )
     except MyAnyError as error:
         mensaje_error = str(error)
@@ -160,7 +237,7 @@ def lanzar_generar_timbrados(quincena_clave: str, quincena_producto_id: int, mod
     return mensaje_termino
 
 
-def lanzar_generar_timbrados_aguinaldos(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_timbrados_aguinaldos(quincena_clave: str, quincena_producto_id: int, forzar: bool = False) -> str:
     """Tarea en el fondo para crear un archivo XLSX con los timbrados aguinaldos de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -172,6 +249,7 @@ def lanzar_generar_timbrados_aguinaldos(quincena_clave: str, quincena_producto_i
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto_id,
             tipo="AGUINALDO",
+            forzar=forzar,
         )
     except MyAnyError as error:
         mensaje_error = str(error)
@@ -184,7 +262,7 @@ def lanzar_generar_timbrados_aguinaldos(quincena_clave: str, quincena_producto_i
     return mensaje_termino
 
 
-def lanzar_generar_timbrados_apoyos_anuales(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_timbrados_apoyos_anuales(quincena_clave: str, quincena_producto_id: int, forzar: bool = False) -> str:
     """Tarea en el fondo para crear un archivo XLSX con los timbrados apoyos anuales de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -196,6 +274,7 @@ def lanzar_generar_timbrados_apoyos_anuales(quincena_clave: str, quincena_produc
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto_id,
             tipo="APOYO ANUAL",
+            forzar=forzar,
         )
     except MyAnyError as error:
         mensaje_error = str(error)
@@ -208,7 +287,7 @@ def lanzar_generar_timbrados_apoyos_anuales(quincena_clave: str, quincena_produc
     return mensaje_termino
 
 
-def lanzar_generar_timbrados_primas_vacacionales(quincena_clave: str, quincena_producto_id: int) -> str:
+def lanzar_generar_timbrados_primas_vacacionales(quincena_clave: str, quincena_producto_id: int, forzar: bool = False) -> str:
     """Tarea en el fondo para crear un archivo XLSX con los timbrados primas vacacionales de una quincena"""
 
     # Iniciar la tarea en el fondo
@@ -220,6 +299,7 @@ def lanzar_generar_timbrados_primas_vacacionales(quincena_clave: str, quincena_p
             quincena_clave=quincena_clave,
             quincena_producto_id=quincena_producto_id,
             tipo="PRIMA VACACIONAL",
+            forzar=forzar,
         )
     except MyAnyError as error:
         mensaje_error = str(error)
@@ -232,8 +312,8 @@ def lanzar_generar_timbrados_primas_vacacionales(quincena_clave: str, quincena_p
     return mensaje_termino
 
 
-def lanzar_generar_todos(quincena_clave: str) -> str:
-    """Ejecutar todas las tareas en el fondo"""
+def lanzar_generar_todos(quincena_clave: str, forzar: bool = False) -> str:
+    """Lanzar cada generador como una tarea en el fondo independiente y al final juntar sus resultados"""
 
     # Iniciar la tarea en el fondo
     set_task_progress(0, f"Generar todos los archivos XLSX de {quincena_clave}...")
@@ -254,58 +334,126 @@ def lanzar_generar_todos(quincena_clave: str) -> str:
         bitacora.error(mensaje_error)
         return mensaje_error
 
-    # Ejecutar cada uno de los generadores
-    mensajes = []
+    # Elegir los generadores con su fuente, su tipo y los parámetros de su huella
+    # Nominas, monederos y pensionados se crean en un solo recorrido de la quincena
+    generadores = [
+        ("NOMINAS", "lanzar_generar_productos_quincena", "SALARIO", [True]),
+        ("MONEDEROS", "lanzar_generar_productos_quincena", "DESPENSA", [True]),
+        ("PENSIONADOS", "lanzar_generar_productos_quincena", "SALARIO", [True]),
+    ]
+    if quincena.tiene_primas_vacacionales is True:
+        generadores.append(("PRIMAS VACACIONALES", "lanzar_generar_primas_vacacionales", "PRIMA VACACIONAL", [True]))
+    if quincena.tiene_aguinaldos is True:
+        generadores.append(("NOMINAS", "lanzar_generar_aguinaldos", "AGUINALDO", [True, "1,2"]))
+
+    # Si no se pide forzar y todos los generadores tienen un archivo con la misma huella, no hay nada que generar
+    # Si alguno cambió se generan todos, porque los números de cheque se reparten de nuevo desde los consecutivos
+    if not forzar:
+        anteriores = []
+        for fuente, _, tipo, parametros in generadores:
+            huella = calcular_huella(quincena.id, fuente, tipo, *parametros)
+            anteriores.append(consultar_quincena_producto_misma_huella(quincena.id, fuente, huella))
+        if None not in anteriores:
+            mensajes = [f"Sin cambios en las entradas de {quincena_clave}, se conservan los archivos:"]
+            mensajes += [f"- {anterior.fuente}: {anterior.archivo}" for anterior in anteriores]
+            mensaje_termino = "\n".join(mensajes)
+            set_task_progress(100, mensaje_termino)
+            bitacora.info(mensaje_termino)
+            return mensaje_termino
+
+    # Reiniciar los consecutivos generados, cada generador reserva después su bloque de números de cheque
     try:
-        mensajes.append(msg := reiniciar_consecutivos_generados())
-        set_task_progress(25, msg)
-        mensajes.append(
-            msg := crear_nominas(
-                quincena_clave=quincena_clave,
-                quincena_producto_id=0,
-                fijar_num_cheque=True,
-            ),
-        )
-        set_task_progress(50, msg)
-        mensajes.append(
-            msg := crear_monederos(
-                quincena_clave=quincena_clave,
-                quincena_producto_id=0,
-                fijar_num_cheque=True,
-            ),
-        )
-        set_task_progress(75, msg)
-        mensajes.append(
-            msg := crear_pensionados(
-                quincena_clave=quincena_clave,
-                quincena_producto_id=0,
-                fijar_num_cheque=True,
-            ),
-        )
-        if quincena.tiene_primas_vacacionales is True:
-            mensajes.append(
-                msg := crear_primas_vacacionales(
-                    quincena_clave=quincena_clave,
-                    quincena_producto_id=0,
-                    fijar_num_cheque=True,
-                ),
-            )
-        if quincena.tiene_aguinaldos is True:
-            mensajes.append(
-                msg := crear_aguinaldos(
-                    quincena_clave=quincena_clave,
-                    quincena_producto_id=0,
-                    fijar_num_cheque=True,
-                ),
-            )
-        set_task_progress(100, msg)
+        mensaje_reiniciar = reiniciar_consecutivos_generados()
     except MyAnyError as error:
         mensaje_error = str(error)
         set_task_error(mensaje_error)
         bitacora.error(mensaje_error)
         return mensaje_error
 
-    # Entregar mensajes de termino
+    # Agregar una quincena_producto por cada generador
+    trabajos = []
+    quincenas_productos_ids = []
+    productos_quincena_ids = {}
+    for fuente, comando, _, _ in generadores:
+        quincena_producto = QuincenaProducto(
+            quincena_id=quincena.id,
+            archivo="",
+            es_satisfactorio=False,
+            fuente=fuente,
+            mensajes=f"Lanzando nominas.tasks.{comando}...",
+            url="",
+        )
+        quincena_producto.save()
+        quincenas_productos_ids.append(quincena_producto.id)
+
+        # Los productos de la quincena se juntan para encolarlos en una sola tarea
+        if comando == "lanzar_generar_productos_quincena":
+            productos_quincena_ids[fuente] = quincena_producto.id
+            continue
+
+        # Encolar el generador, asi se reparten entre los workers
+        trabajo = current_app.task_queue.enqueue(
+            f"pjecz_perseo_flask.blueprints.nominas.tasks.{comando}",
+            quincena_clave=quincena_clave,
+            quincena_producto_id=quincena_producto.id,
+            fijar_num_cheque=True,
+            forzar=True,
+        )
+        trabajos.append(trabajo)
+
+    # Encolar la tarea que crea los productos de la quincena con una sola consulta de sus nominas
+    trabajo = current_app.task_queue.enqueue(
+        "pjecz_perseo_flask.blueprints.nominas.tasks.lanzar_generar_productos_quincena",
+        quincena_clave=quincena_clave,
+        quincenas_productos_ids=productos_quincena_ids,
+        fijar_num_cheque=True,
+        forzar=True,
+    )
+    trabajos.append(trabajo)
+
+    # Encolar la tarea que junta los resultados, se ejecuta cuando terminen todos los generadores aunque alguno falle
+    trabajo_actual = get_current_job()
+    current_app.task_queue.enqueue(
+        "pjecz_perseo_flask.blueprints.nominas.tasks.lanzar_juntar_todos",
+        quincena_clave=quincena_clave,
+        quincenas_productos_ids=quincenas_productos_ids,
+        tarea_id=trabajo_actual.get_id() if trabajo_actual else "",
+        depends_on=Dependency(jobs=trabajos, allow_failure=True),
+    )
+
+    # Dejar la tarea en progreso, la tarea que junta los resultados la va a terminar
+    mensaje = f"{mensaje_reiniciar}\nSe lanzaron {len(trabajos)} generadores de {quincena_clave}..."
+    set_task_progress(50, mensaje)
+    bitacora.info(mensaje)
+    return mensaje
+
+
+def lanzar_juntar_todos(quincena_clave: str, quincenas_productos_ids: list, tarea_id: str = "") -> str:
+    """Juntar los resultados de los generadores lanzados por generar todos"""
+
+    # Consultar las quincenas_productos de los generadores
+    quincenas_productos = (
+        QuincenaProducto.query.filter(QuincenaProducto.id.in_(quincenas_productos_ids)).order_by(QuincenaProducto.id).all()
+    )
+
+    # Juntar un mensaje por cada generador, con su archivo o con su primer mensaje si no lo hubo
+    mensajes = [f"Generar todos los archivos XLSX de {quincena_clave}:"]
+    for quincena_producto in quincenas_productos:
+        if quincena_producto.archivo != "":
+            resultado = quincena_producto.archivo
+        else:
+            resultado = quincena_producto.mensajes.split("\n")[0]
+        estado = "satisfactorio" if quincena_producto.es_satisfactorio else "con avisos"
+        mensajes.append(f"- {quincena_producto.fuente} {estado}: {resultado}")
     mensaje_termino = "\n".join(mensajes)
-    set_task_progress(100, mensaje_termino)
+    bitacora.info(mensaje_termino)
+
+    # Terminar la tarea de generar todos
+    tarea = Tarea.query.get(tarea_id) if tarea_id != "" else None
+    if tarea is not None:
+        tarea.ha_terminado = True
+        tarea.mensaje = mensaje_termino
+        tarea.save()
+
+    # Entregar mensaje de termino
     return mensaje_termino
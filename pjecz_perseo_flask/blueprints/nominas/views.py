@@ -7,7 +7,13 @@ import json
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
-from ...lib.datatables import get_datatable_parameters, output_datatable_json
+from ...lib.datatables import (
+    count_datatable,
+    get_datatable_cursor,
+    get_datatable_parameters,
+    output_datatable_json,
+    paginate_datatable,
+)
 from ...lib.safe_string import safe_message, safe_quincena, safe_rfc, safe_string
 from ..bitacoras.models import Bitacora
 from ..centros_trabajos.models import CentroTrabajo
@@ -84,9 +90,10 @@ def datatable_json():
         consulta = consulta.filter(
             Persona.apellido_segundo.contains(safe_string(request.form["persona_apellido_segundo"], save_enie=True))
         )
-    # Ordenar y paginar
-    registros = consulta.order_by(Quincena.clave.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    # Ordenar por quincena e id y paginar, con el cursor de la página anterior se busca desde el último renglón
+    registros, cursor = paginate_datatable(consulta, (Quincena.clave, Nomina.id), start, rows_per_page, get_datatable_cursor())
+    # Contar, sin filtros se estima con PostgreSQL, con filtros el total se guarda en Redis unos segundos
+    total = count_datatable(consulta, Nomina.__tablename__, estimar_con={"estatus": "A"})
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -116,7 +123,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @nominas.route("/nominas")
@@ -4,7 +4,7 @@ Percepciones Deducciones, modelos
 
 from decimal import Decimal, getcontext
 
-from sqlalchemy import Enum, ForeignKey, Numeric
+from sqlalchemy import Enum, ForeignKey, Index, Numeric, String, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ...config.extensions import database
@@ -28,9 +28,28 @@ class PercepcionDeduccion(database.Model, UniversalMixin):
         "RETROACTIVO AGUINALDO": "RETROACTIVO AGUINALDO",
     }
 
+    # Llave natural de las percepciones-deducciones de tipo SALARIO, para alimentar con INSERT ... ON CONFLICT
+    LLAVE_NATURAL = ("quincena_id", "persona_id", "concepto_id", "plaza_id", "tipo")
+
+    # Fuente de las que alimenta la explotación, solo a esas se les da de baja cuando ya no vienen en el archivo
+    FUENTE_EXPLOTACION = "EXPLOTACION"
+
     # Nombre de la tabla
     __tablename__ = "percepciones_deducciones"
 
+    # Índice único de la llave natural, solo para las percepciones-deducciones vigentes de tipo SALARIO
+    __table_args__ = (
+        Index(
+            "percepciones_deducciones_llave_natural",
+            *LLAVE_NATURAL,
+            unique=True,
+            postgresql_where=text("estatus = 'A' AND tipo = 'SALARIO'"),
+            sqlite_where=text("estatus = 'A' AND tipo = 'SALARIO'"),
+        ),
+        # Índice por quincena e id para paginar el listado con cursor
+        Index("percepciones_deducciones_quincena_id_id", "quincena_id", "id"),
+    )
+
     # Clave primaria
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -49,6 +68,7 @@ class PercepcionDeduccion(database.Model, UniversalMixin):
     # Columnas
     tipo: Mapped[str] = mapped_column(Enum(*TIPOS, name="percepciones_deducciones_tipos"), index=True)
     importe: Mapped[Decimal] = mapped_column(Numeric(precision=24, scale=4))
+    fuente: Mapped[str] = mapped_column(String(16), default="", server_default="")
 
     def __repr__(self):
         """Representación"""
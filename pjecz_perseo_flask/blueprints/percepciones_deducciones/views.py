@@ -7,7 +7,13 @@ import json
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
-from ...lib.datatables import get_datatable_parameters, output_datatable_json
+from ...lib.datatables import (
+    count_datatable,
+    get_datatable_cursor,
+    get_datatable_parameters,
+    output_datatable_json,
+    paginate_datatable,
+)
 from ...lib.safe_string import safe_clave, safe_message, safe_rfc
 from ..bitacoras.models import Bitacora
 from ..conceptos.models import Concepto
@@ -66,9 +72,12 @@ def datatable_json():
     if "persona_rfc" in request.form:
         consulta = consulta.join(Persona)
         consulta = consulta.filter(Persona.rfc.contains(safe_rfc(request.form["persona_rfc"], search_fragment=True)))
-    # Ordenar y paginar
-    registros = consulta.order_by(Quincena.clave.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    # Ordenar por quincena e id y paginar, con el cursor de la página anterior se busca desde el último renglón
+    registros, cursor = paginate_datatable(
+        consulta, (Quincena.clave, PercepcionDeduccion.id), start, rows_per_page, get_datatable_cursor()
+    )
+    # Contar, sin filtros se estima con PostgreSQL, con filtros el total se guarda en Redis unos segundos
+    total = count_datatable(consulta, PercepcionDeduccion.__tablename__, estimar_con={"estatus": "A"})
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -90,7 +99,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @percepciones_deducciones.route("/percepciones_deducciones")
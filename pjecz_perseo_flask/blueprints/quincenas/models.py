@@ -36,6 +36,7 @@ class Quincena(database.Model, UniversalMixin):
     beneficiarios_quincenas: Mapped[List["BeneficiarioQuincena"]] = relationship(
         "BeneficiarioQuincena", back_populates="quincena"
     )
+    importaciones: Mapped[List["Importacion"]] = relationship("Importacion", back_populates="quincena")
     quincenas_productos: Mapped[List["QuincenaProducto"]] = relationship("QuincenaProducto", back_populates="quincena")
     nominas: Mapped[List["Nomina"]] = relationship("Nomina", back_populates="quincena")
     percepciones_deducciones: Mapped[List["PercepcionDeduccion"]] = relationship(
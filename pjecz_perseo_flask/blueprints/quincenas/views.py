@@ -10,6 +10,7 @@ from flask_login import current_user, login_required
 from ...lib.datatables import get_datatable_parameters, output_datatable_json
 from ...lib.safe_string import safe_message, safe_quincena, safe_string
 from ..bitacoras.models import Bitacora
+from ..cuentas.duplicadas import consultar_cuentas_duplicadas
 from ..modulos.models import Modulo
 from ..permisos.models import Permiso
 from ..quincenas_productos.models import QuincenaProducto
@@ -160,10 +161,16 @@ def detail(quincena_id):
         .first()
     )
 
+    # Si la quincena esta ABIERTA, consultar las cuentas duplicadas para avisar antes de generar los archivos
+    cuentas_duplicadas = {}
+    if quincena.estado == "ABIERTA":
+        cuentas_duplicadas = consultar_cuentas_duplicadas()
+
     # Entregar detalle
     return render_template(
         "quincenas/detail.jinja2",
         quincena=quincena,
+        cuentas_duplicadas=cuentas_duplicadas,
         quincena_producto_nominas=quincena_producto_nominas,
         quincena_producto_monederos=quincena_producto_monederos,
         quincena_producto_pensionados=quincena_producto_pensionados,
@@ -308,6 +315,8 @@ def generate_nominas(quincena_id):
     if quincena.estado != "ABIERTA":
         flash("Quincena no abierta", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Definir mensaje de inicio
     mensaje = f"Crear un archivo XLSX con las nominas de {quincena.clave}..."
     # Agregar producto
@@ -326,6 +335,7 @@ def generate_nominas(quincena_id):
         mensaje=mensaje,
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 30 segundos...", "info")
     # Redireccionar al detalle del producto
@@ -344,6 +354,8 @@ def generate_monederos(quincena_id):
     if quincena.estado != "ABIERTA":
         flash("Quincena no abierta", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Definir mensaje de inicio
     mensaje = f"Crear un archivo XLSX con los monederos de {quincena.clave}..."
     # Agregar producto
@@ -362,6 +374,7 @@ def generate_monederos(quincena_id):
         mensaje=mensaje,
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 30 segundos...", "info")
     # Redireccionar al detalle del producto
@@ -380,6 +393,8 @@ def generate_pensionados(quincena_id):
     if quincena.estado != "ABIERTA":
         flash("Quincena no abierta", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Definir mensaje de inicio
     mensaje = f"Crear un archivo XLSX con los pensionados de {quincena.clave}..."
     # Agregar producto
@@ -398,6 +413,7 @@ def generate_pensionados(quincena_id):
         mensaje=mensaje,
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 30 segundos...", "info")
     # Redireccionar al detalle del producto
@@ -416,6 +432,8 @@ def generate_primas_vacacionales(quincena_id):
     if quincena.estado != "ABIERTA":
         flash("Quincena no abierta", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Definir mensaje de inicio
     mensaje = f"Crear un archivo XLSX con las primas vacacionales de {quincena.clave}..."
     # Agregar producto
@@ -434,6 +452,7 @@ def generate_primas_vacacionales(quincena_id):
         mensaje=mensaje,
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 30 segundos...", "info")
     # Redireccionar al detalle del producto
@@ -452,6 +471,8 @@ def generate_dispersiones_pensionados(quincena_id):
     if quincena.estado != "ABIERTA":
         flash("Quincena no abierta", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Definir mensaje de inicio
     mensaje = f"Crear un archivo XLSX con las dispersiones pensionados de {quincena.clave}..."
     # Agregar producto
@@ -470,6 +491,7 @@ def generate_dispersiones_pensionados(quincena_id):
         mensaje=mensaje,
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 30 segundos...", "info")
     # Redireccionar al detalle del producto
@@ -485,6 +507,8 @@ def generate_timbrados_empleados_activos(quincena_id):
     if quincena.estatus != "A":
         flash("Quincena no activa", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Agregar producto
     quincena_producto = QuincenaProducto(
         quincena_id=quincena.id,
@@ -502,6 +526,7 @@ def generate_timbrados_empleados_activos(quincena_id):
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
         modelos=[1, 2],  # Modelos en Personas 1: "CONFIANZA", 2: "SINDICALIZADO"
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 4 minutos...", "info")
     # Redireccionar al detalle del producto
@@ -517,6 +542,8 @@ def generate_timbrados_pensionados(quincena_id):
     if quincena.estatus != "A":
         flash("Quincena no activa", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Agregar producto
     quincena_producto = QuincenaProducto(
         quincena_id=quincena.id,
@@ -534,6 +561,7 @@ def generate_timbrados_pensionados(quincena_id):
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
         modelos=[3],  # Modelos en Personas 3: "PENSIONADO"
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 4 minutos...", "info")
     # Redireccionar al detalle del producto
@@ -555,6 +583,8 @@ def generate_timbrados_aguinaldos(quincena_id):
     if quincena.tiene_aguinaldos is False:
         flash("Quincena no tiene aguinaldos", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Agregar producto
     quincena_producto = QuincenaProducto(
         quincena_id=quincena.id,
@@ -571,6 +601,7 @@ def generate_timbrados_aguinaldos(quincena_id):
         mensaje=f"Crear un archivo XLSX con los timbrados aguinaldos de {quincena.clave}...",
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 4 minutos...", "info")
     # Redireccionar al detalle del producto
@@ -592,6 +623,8 @@ def generate_timbrados_apoyos_anuales(quincena_id):
     if quincena.tiene_apoyos_anuales is False:
         flash("Quincena no tiene apoyos anuales", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Agregar producto
     quincena_producto = QuincenaProducto(
         quincena_id=quincena.id,
@@ -608,6 +641,7 @@ def generate_timbrados_apoyos_anuales(quincena_id):
         mensaje=f"Crear un archivo XLSX con los timbrados apoyos anuales de {quincena.clave}...",
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 4 minutos...", "info")
     # Redireccionar al detalle del producto
@@ -629,6 +663,8 @@ def generate_timbrados_primas_vacacionales(quincena_id):
     if quincena.tiene_primas_vacacionales is False:
         flash("Quincena no tiene primas vacacionales", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Agregar producto
     quincena_producto = QuincenaProducto(
         quincena_id=quincena.id,
@@ -645,6 +681,7 @@ def generate_timbrados_primas_vacacionales(quincena_id):
         mensaje=f"Crear un archivo XLSX con los timbrados primas vacacionales de {quincena.clave}...",
         quincena_clave=quincena.clave,
         quincena_producto_id=quincena_producto.id,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 4 minutos...", "info")
     # Redireccionar al detalle del producto
@@ -663,11 +700,14 @@ def generate_todos(quincena_id):
     if quincena.estado != "ABIERTA":
         flash("Quincena no abierta", "warning")
         return redirect(url_for("quincenas.detail", quincena_id=quincena.id))
+    # Si se pide forzar, se genera aunque ya haya un archivo con la misma huella
+    forzar = request.args.get("forzar", "") == "1"
     # Lanzar la tarea en el fondo
     current_user.launch_task(
         comando="nominas.tasks.lanzar_generar_todos",
         mensaje=f"Crear todos los archivo XLSX de {quincena.clave}...",
         quincena_clave=quincena.clave,
+        forzar=forzar,
     )
     flash("Se ha lanzado la tarea en el fondo. Esta página se va a recargar en 60 segundos...", "info")
     # Redireccionar al detalle de la quincena
@@ -4,6 +4,7 @@ Timbrados, modelos
 
 from datetime import date, datetime
 from decimal import Decimal, getcontext
+from typing import List
 
 from sqlalchemy import Enum, ForeignKey, Integer, Numeric, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -69,6 +70,9 @@ class Timbrado(database.Model, UniversalMixin):
     archivo_xml: Mapped[str] = mapped_column(String(256), default="", server_default="")
     url_xml: Mapped[str] = mapped_column(String(512), default="", server_default="")
 
+    # Hijos
+    timbrados_conceptos: Mapped[List["TimbradoConcepto"]] = relationship("TimbradoConcepto", back_populates="timbrado")
+
     def __repr__(self):
         """Representación"""
         return f"<Timbrado {self.id}>"
@@ -4,17 +4,19 @@ Timbrados, tareas en el fondo
 
 import logging
 import re
-import xml.etree.ElementTree as ET
 from datetime import datetime
 from pathlib import Path
 
 import pandas as pd
 import pytz
+from sqlalchemy import case, func
 
 from pjecz_perseo_flask.blueprints.nominas.models import Nomina
 from pjecz_perseo_flask.blueprints.personas.models import Persona
 from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
 from pjecz_perseo_flask.blueprints.timbrados.models import Timbrado
+from pjecz_perseo_flask.blueprints.timbrados_conceptos.models import TimbradoConcepto
+from pjecz_perseo_flask.config.extensions import database
 from pjecz_perseo_flask.config.settings import get_settings
 from pjecz_perseo_flask.lib.exceptions import (
     MyAnyError,
@@ -26,9 +28,10 @@ from pjecz_perseo_flask.lib.exceptions import (
     MyNotValidParamError,
     MyUploadError,
 )
-from pjecz_perseo_flask.lib.google_cloud_storage import upload_file_to_gcs
+from pjecz_perseo_flask.lib.google_cloud_storage import upload_fileobj_to_gcs
 from pjecz_perseo_flask.lib.safe_string import QUINCENA_REGEXP
 from pjecz_perseo_flask.lib.tasks import set_task_error, set_task_progress
+from pjecz_perseo_flask.lib.xlsx import guardar_libro_xlsx, iniciar_libro_xlsx
 from pjecz_perseo_flask.main import app
 
 GCS_BASE_DIRECTORY = "timbrados"
@@ -48,14 +51,7 @@ app.app_context().push()
 # Definir la constante con los tipos de nóminas que se pueden exportar
 NOMINAS_TIPOS = ["AGUINALDO", "APOYO ANUAL", "APOYO DIA DE LA MADRE", "SALARIO", "PRIMA VACACIONAL"]
 
-# Definir la constante con el espacio de nombres del XML
-NAMESPACES = {
-    "cfdi": "http://www.sat.gob.mx/cfd/3",
-    "tfd": "http://www.sat.gob.mx/TimbreFiscalDigital",
-    "nomina12": "http://www.sat.gob.mx/nomina12",
-}
-
-# Definir la constante con el listado de claves de deducciones a extraer del XML
+# Definir la constante con el listado de claves de deducciones a exportar
 CLAVES_DEDUCCIONES = ["D01", "D02", "D03", "D04", "D05", "DPL"]
 
 # Definir la constante con el orden de las columnas
@@ -63,7 +59,7 @@ COLUMNAS = ["QUINCENA", "RFC", "NOMBRES", "APELLIDO PRIMERO", "APELLIDO SEGUNDO"
 
 
 def exportar_xlsx(quincena_clave: str, nomina_tipo: str) -> tuple[str, str, str]:
-    """Exportar Timbrados (con datos particulares dentro de los XML) a un archivo XLSX"""
+    """Exportar Timbrados (con las deducciones de sus conceptos) a un archivo XLSX"""
 
     # Validar quincena_clave
     if re.match(QUINCENA_REGEXP, quincena_clave) is None:
@@ -91,77 +87,66 @@ def exportar_xlsx(quincena_clave: str, nomina_tipo: str) -> tuple[str, str, str]
     # Iniciar listado con los mensajes
     mensajes = []
 
-    # Iniciar sesión con la base de datos
-    session = database.session
-
-    # Consultar los Timbrados
-    timbrados = (
-        session.query(Timbrado)
+    # Sumar los importes de las deducciones de cada timbrado por clave, con los conceptos guardados al actualizar los timbrados
+    importes = [
+        func.sum(case((TimbradoConcepto.clave == clave, TimbradoConcepto.importe), else_=0)).label(clave)
+        for clave in CLAVES_DEDUCCIONES
+    ]
+
+    # Consultar los Timbrados con deducciones, uno por renglón con las columnas en el orden de COLUMNAS
+    renglones = (
+        database.session.query(
+            Quincena.clave,
+            Persona.rfc,
+            Persona.nombres,
+            Persona.apellido_primero,
+            Persona.apellido_segundo,
+            Persona.modelo,
+            *importes,
+        )
         .select_from(Timbrado)
         .join(Nomina)
         .join(Persona)
         .join(Quincena)
+        .join(TimbradoConcepto)
         .filter(Nomina.tipo == nomina_tipo)
         .filter(Quincena.clave == quincena_clave)
         .filter(Timbrado.estatus == "A")
-        .order_by(Persona.rfc)
+        .filter(TimbradoConcepto.tipo == "DEDUCCION")
+        .filter(TimbradoConcepto.estatus == "A")
+        .group_by(Timbrado.id, Persona.id, Quincena.id)
+        .order_by(Persona.rfc, Timbrado.id)
         .all()
     )
 
-    # Inicializar el contador
-    contador = 0
-
-    # Inicializar listado donde almacenaremos los datos de las nóminas
-    nominas = []
-
-    # Bucle por los timbrados
-    for timbrado in timbrados:
-        # La propiedad tfd es un XML en texto
-        tree = ET.ElementTree(ET.fromstring(timbrado.tfd))
-        # Iniciar el árbol
-        root = tree.getroot()
-        if root is None:
-            continue
-        # Buscar el nodo nomina12:Deducciones
-        deducciones = root.find(".//nomina12:Deducciones", NAMESPACES)
-        # Si NO hay deducciones se omite
-        if deducciones is None:
-            continue
-        # Inicializar el diccionario de la nomina
-        nomina = dict()
-        # Agregar los datos de la quincena
-        nomina["QUINCENA"] = timbrado.nomina.quincena.clave
-        # Agregar los datos de la persona
-        nomina["RFC"] = timbrado.nomina.persona.rfc
-        nomina["NOMBRES"] = timbrado.nomina.persona.nombres
-        nomina["APELLIDO PRIMERO"] = timbrado.nomina.persona.apellido_primero
-        nomina["APELLIDO SEGUNDO"] = timbrado.nomina.persona.apellido_segundo
-        nomina["MODELO"] = timbrado.nomina.persona.modelo
-        # Iterar sobre los nodos
-        for deduccion in deducciones.findall(".//nomina12:Deduccion", NAMESPACES):
-            # Obtener TipoDeduccion, Clave, Concepto e Importe
-            tipo_deduccion = deduccion.attrib.get("TipoDeduccion", "")
-            clave = deduccion.attrib.get("Clave", "")
-            concepto = deduccion.attrib.get("Concepto", "")
-            importe = deduccion.attrib.get("Importe", "")
-            # Si la clave NO está en el listado de claves de deducciones se omite
-            if clave not in CLAVES_DEDUCCIONES:
-                continue
-            # Agregar los datos de la deducción a la nomina
-            nomina[clave] = importe
-        # Agregar la nómina al listado
-        nominas.append(nomina)
-
     # Agregar mensajes
-    mensaje = f"Se encontraron {len(nominas)} timbrados en la quincena {quincena_clave} del tipo {nomina_tipo}"
+    mensaje = f"Se encontraron {len(renglones)} timbrados en la quincena {quincena_clave} del tipo {nomina_tipo}"
     bitacora.info(mensaje)
     mensajes.append(mensaje)
 
-    # Crear un DataFrame con las nóminas
-    df = pd.DataFrame(nominas)
-    df = df.fillna(0)  # Reemplazar NaN por 0
-    df = df.reindex(columns=COLUMNAS)  # Reordenar las columnas
-    df[CLAVES_DEDUCCIONES] = df[CLAVES_DEDUCCIONES].apply(pd.to_numeric)  # Convertir a numérico
+    # Contar los Timbrados sin conceptos guardados, no quedan en el archivo XLSX hasta que se guarden sus conceptos
+    timbrados_sin_conceptos = (
+        database.session.query(Timbrado)
+        .join(Nomina)
+        .join(Quincena)
+        .filter(Nomina.tipo == nomina_tipo)
+        .filter(Quincena.clave == quincena_clave)
+        .filter(Timbrado.estatus == "A")
+        .filter(~Timbrado.timbrados_conceptos.any())
+        .count()
+    )
+    aviso_sin_conceptos = ""
+    if timbrados_sin_conceptos > 0:
+        aviso_sin_conceptos = (
+            f"AVISO: Hubo {timbrados_sin_conceptos} timbrados sin conceptos que no están en el archivo XLSX, "
+            f"guarde sus conceptos con: cli timbrados actualizar-conceptos {quincena_clave} --tipo {nomina_tipo}"
+        )
+        bitacora.warning(aviso_sin_conceptos)
+        mensajes.append(aviso_sin_conceptos)
+
+    # Crear un DataFrame con los renglones
+    df = pd.DataFrame([tuple(renglon) for renglon in renglones], columns=COLUMNAS)
+    df[CLAVES_DEDUCCIONES] = df[CLAVES_DEDUCCIONES].astype(float)  # Convertir a numérico
 
     # Determinar el nombre del archivo XLSX
     ahora = datetime.now(tz=pytz.timezone(TIMEZONE))
@@ -172,25 +157,24 @@ def exportar_xlsx(quincena_clave: str, nomina_tipo: str) -> tuple[str, str, str]
     ruta_gcs = Path(GCS_BASE_DIRECTORY, ahora.strftime("%Y"), ahora.strftime("%m"))
     ruta_local_archivo_xlsx = str(Path(ruta_local, nombre_archivo_xlsx))
 
-    # Si no existe el directorio local, crearlo
-    Path(ruta_local).mkdir(parents=True, exist_ok=True)
-
-    # Guardar el DataFrame a un archivo XLSX
-    df.to_excel(ruta_local_archivo_xlsx, index=False, header=True)
+    # Llenar el libro XLSX en modo de solo escritura, fila por fila y con celdas vacías en lugar de NaN
+    libro, hoja = iniciar_libro_xlsx(COLUMNAS)
+    for fila in df.astype(object).where(df.notna(), None).itertuples(index=False):
+        hoja.append(list(fila))
 
-    # Si esta configurado Google Cloud Storage
-    public_url = ""
+    # Guardar el archivo XLSX en un buffer temporal, si esta configurado se conserva la copia local
     settings = get_settings()
-    if settings.CLOUD_STORAGE_DEPOSITO != "":
-        # Leer el contenido del archivo XLSX
-        with open(ruta_local_archivo_xlsx, "rb") as archivo:
-            # Subir el archivo XLSX a Google Cloud Storage
+    with guardar_libro_xlsx(libro, ruta_local_archivo_xlsx) as buffer:
+        # Si esta configurado Google Cloud Storage
+        public_url = ""
+        if settings.CLOUD_STORAGE_DEPOSITO != "":
+            # Subir el archivo XLSX a Google Cloud Storage por partes desde el buffer
             try:
-                public_url = upload_file_to_gcs(
+                public_url = upload_fileobj_to_gcs(
                     bucket_name=settings.CLOUD_STORAGE_DEPOSITO,
                     blob_name=f"{ruta_gcs}/{nombre_archivo_xlsx}",
                     content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    data=archivo.read(),
+                    file_obj=buffer,
                 )
                 mensaje = f"Se subió el archivo XLSX a GCS {public_url}"
                 bitacora.info(mensaje)
@@ -202,6 +186,8 @@ def exportar_xlsx(quincena_clave: str, nomina_tipo: str) -> tuple[str, str, str]
 
     # Entregar mensaje de término, el nombre del archivo XLSX y la URL pública
     mensaje_termino = f"Se exportaron los timbrados a {nombre_archivo_xlsx}"
+    if aviso_sin_conceptos != "":
+        mensaje_termino += f", {aviso_sin_conceptos}"
     bitacora.info(mensaje_termino)
     return mensaje_termino, nombre_archivo_xlsx, public_url
 
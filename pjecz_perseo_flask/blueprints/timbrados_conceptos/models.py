@@ -0,0 +1,49 @@
+"""
+Timbrados Conceptos, modelos
+"""
+
+from decimal import Decimal, getcontext
+
+from sqlalchemy import Enum, ForeignKey, Index, Numeric, String
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from ...config.extensions import database
+from ...lib.universal_mixin import UniversalMixin
+
+getcontext().prec = 4  # Cuatro decimales en los cálculos monetarios
+
+
+class TimbradoConcepto(database.Model, UniversalMixin):
+    """TimbradoConcepto"""
+
+    TIPOS = {
+        "PERCEPCION": "PERCEPCION",
+        "DEDUCCION": "DEDUCCION",
+        "OTRO PAGO": "OTRO PAGO",
+    }
+
+    # Nombre de la tabla
+    __tablename__ = "timbrados_conceptos"
+
+    # Índice para sumar los importes por tipo y clave de los timbrados
+    __table_args__ = (Index("timbrados_conceptos_timbrado_tipo_clave", "timbrado_id", "tipo", "clave"),)
+
+    # Clave primaria
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # Clave foránea
+    timbrado_id: Mapped[int] = mapped_column(ForeignKey("timbrados.id"))
+    timbrado: Mapped["Timbrado"] = relationship(back_populates="timbrados_conceptos")
+
+    # Columnas con los datos del XML en nomina12:Percepcion, nomina12:Deduccion o nomina12:OtroPago
+    tipo: Mapped[str] = mapped_column(Enum(*TIPOS, name="timbrados_conceptos_tipos"))
+    tipo_sat: Mapped[str] = mapped_column(String(8))  # TipoPercepcion, TipoDeduccion o TipoOtroPago
+    clave: Mapped[str] = mapped_column(String(16), index=True)
+    concepto: Mapped[str] = mapped_column(String(256))
+    importe_gravado: Mapped[Decimal] = mapped_column(Numeric(precision=24, scale=4), default=0)
+    importe_exento: Mapped[Decimal] = mapped_column(Numeric(precision=24, scale=4), default=0)
+    importe: Mapped[Decimal] = mapped_column(Numeric(precision=24, scale=4))
+
+    def __repr__(self):
+        """Representación"""
+        return f"<TimbradoConcepto {self.id}>"
@@ -0,0 +1,78 @@
+"""
+Timbrados Conceptos, vistas
+"""
+
+import json
+
+from flask import Blueprint, render_template, request, url_for
+from flask_login import login_required
+
+from ...lib.datatables import get_datatable_parameters, output_datatable_json
+from ..permisos.models import Permiso
+from ..usuarios.decorators import permission_required
+from .models import TimbradoConcepto
+
+MODULO = "TIMBRADOS CONCEPTOS"
+
+timbrados_conceptos = Blueprint("timbrados_conceptos", __name__, template_folder="templates")
+
+
+@timbrados_conceptos.before_request
+@login_required
+@permission_required(MODULO, Permiso.VER)
+def before_request():
+    """Permiso por defecto"""
+
+
+@timbrados_conceptos.route("/timbrados_conceptos/datatable_json", methods=["GET", "POST"])
+def datatable_json():
+    """DataTable JSON para listado de Timbrados Conceptos"""
+    # Tomar parámetros de Datatables
+    draw, start, rows_per_page = get_datatable_parameters()
+    # Consultar
+    consulta = TimbradoConcepto.query
+    # Primero filtrar por columnas propias
+    if "estatus" in request.form:
+        consulta = consulta.filter_by(estatus=request.form["estatus"])
+    else:
+        consulta = consulta.filter_by(estatus="A")
+    if "timbrado_id" in request.form:
+        consulta = consulta.filter_by(timbrado_id=request.form["timbrado_id"])
+    if "tipo" in request.form and request.form["tipo"] != "":
+        consulta = consulta.filter_by(tipo=request.form["tipo"])
+    if "clave" in request.form:
+        consulta = consulta.filter_by(clave=request.form["clave"].strip().upper())
+    # Ordenar y paginar
+    registros = consulta.order_by(TimbradoConcepto.id).offset(start).limit(rows_per_page).all()
+    total = consulta.count()
+    # Elaborar datos para DataTable
+    data = []
+    for resultado in registros:
+        data.append(
+            {
+                "timbrado": {
+                    "tfd_uuid": resultado.timbrado.tfd_uuid,
+                    "url": url_for("timbrados.detail", timbrado_id=resultado.timbrado_id),
+                },
+                "tipo": resultado.tipo,
+                "tipo_sat": resultado.tipo_sat,
+                "clave": resultado.clave,
+                "concepto": resultado.concepto,
+                "importe_gravado": resultado.importe_gravado,
+                "importe_exento": resultado.importe_exento,
+                "importe": resultado.importe,
+            }
+        )
+    # Entregar JSON
+    return output_datatable_json(draw, total, data)
+
+
+@timbrados_conceptos.route("/timbrados_conceptos")
+def list_active():
+    """Listado de Timbrados Conceptos activos"""
+    return render_template(
+        "timbrados_conceptos/list.jinja2",
+        filtros=json.dumps({"estatus": "A"}),
+        titulo="Timbrados Conceptos",
+        estatus="A",
+    )
@@ -45,6 +45,7 @@ class Settings(BaseSettings):
 
     # Variables de entorno
     CLOUD_STORAGE_DEPOSITO: str = get_secret("CLOUD_STORAGE_DEPOSITO", "")
+    CONSERVAR_COPIA_LOCAL: bool = get_secret("CONSERVAR_COPIA_LOCAL", "true").lower() == "true"
     ENVIRONMENT: str = get_secret("ENVIRONMENT", "development")
     HOST: str = get_secret("HOST", "http://127.0.0.1:5000")
     PREFIX: str = get_secret("PREFIX", "")
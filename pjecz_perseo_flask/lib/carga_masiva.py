@@ -0,0 +1,235 @@
+"""
+Carga masiva
+
+Junta los renglones a insertar como tuplas en memoria y los manda en lote,
+en PostgreSQL con COPY ... FROM STDIN y en otros motores, como SQLite, con un solo executemany
+
+Las columnas que no se dan, como creado, modificado, estatus o num_cheque, toman su valor por defecto del servidor
+
+Los valores pueden ser registros del ORM, como centro_trabajo=centro_trabajo,
+se convierten a su id al guardar, despues de un flush, asi sirven los registros nuevos del catálogo
+
+Con una llave natural, como Nomina.LLAVE_NATURAL, se manda con INSERT ... ON CONFLICT DO UPDATE,
+si el renglón ya existe solo se actualiza cuando cambia alguna columna, asi repetir la carga solo aplica las diferencias,
+los renglones con la misma llave en la misma carga se juntan en uno, sumando las columnas que se indiquen,
+los que se juntaron quedan en repetidos para que el comando avise de ellos
+
+Con dar_de_baja_ausentes, despues de guardar, se dan de baja los registros vigentes que no vinieron en la carga,
+asi los renglones que le quitaron al archivo tampoco quedan en la base de datos,
+los filtros deben limitarlos a los que alimenta el mismo archivo, como con la columna fuente
+
+"""
+
+import csv
+import io
+
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..config.extensions import database
+from .exceptions import MyNotValidParamError
+
+TAMANO_LOTE = 10000  # Cantidad de renglones que se juntan antes de mandarlos a la base de datos
+
+
+def insertar_con_llave(tabla, llave: tuple, columnas: tuple, dialecto: str, seleccion=None):
+    """Crear el INSERT ... ON CONFLICT DO UPDATE con la llave natural, con valores o con INSERT ... SELECT si se da la selección"""
+
+    # Tomar la condición del índice único de la llave, si es parcial
+    indice = next((i for i in tabla.indexes if i.unique and tuple(c.name for c in i.columns) == tuple(llave)), None)
+    if indice is None:
+        raise MyNotValidParamError(f"No hay un índice único con la llave {llave} en {tabla.name}")
+    condicion = indice.dialect_kwargs.get(f"{dialecto}_where")
+
+    # Crear el INSERT con el dialecto, PostgreSQL o SQLite, que tienen ON CONFLICT
+    if dialecto == "postgresql":
+        sentencia = postgresql.insert(tabla)
+    elif dialecto == "sqlite":
+        sentencia = sqlite.insert(tabla)
+    else:
+        raise MyNotValidParamError(f"No se puede usar ON CONFLICT con {dialecto}")
+    if seleccion is not None:
+        sentencia = sentencia.from_select(list(columnas), seleccion)
+
+    # Si la llave ya existe, actualizar las demás columnas solo si alguna cambió
+    actualizar = [columna for columna in columnas if columna not in llave]
+    return sentencia.on_conflict_do_update(
+        index_elements=list(llave),
+        index_where=condicion,
+        set_={**{columna: sentencia.excluded[columna] for columna in actualizar}, "modificado": func.now()},
+        where=or_(*[tabla.c[columna].is_distinct_from(sentencia.excluded[columna]) for columna in actualizar]),
+    )
+
+
+class CargaMasiva:
+    """Insertar en lote los renglones de un modelo o de una tabla"""
+
+    def __init__(self, modelo, tamano_lote: int = TAMANO_LOTE, llave: tuple = None, sumar: tuple = ()):
+        """Iniciar con el modelo, o con la tabla si no es un modelo, y sin renglones"""
+        self.tabla = getattr(modelo, "__table__", modelo)
+        self.tamano_lote = tamano_lote
+        self.llave = llave
+        self.sumar = sumar
+        self.columnas = None
+        self.renglones = []
+        self.renglones_por_llave = {}
+        self.llaves_guardadas = set()
+        self.repetidos = []
+        self.contador = 0
+
+    def agregar(self, **valores):
+        """Agregar un renglón, se usan los nombres de las columnas o de las relaciones del modelo"""
+
+        # Convertir los nombres de las relaciones, como persona, a su columna, como persona_id
+        columnas = tuple(nombre if nombre in self.tabla.columns else f"{nombre}_id" for nombre in valores.keys())
+
+        # Validar que las columnas existan y que sean las mismas en todos los renglones
+        if self.columnas is None:
+            for columna in columnas:
+                if columna not in self.tabla.columns:
+                    raise MyNotValidParamError(f"La columna {columna} no existe en {self.tabla.name}")
+            if self.llave is not None and not set(self.llave).issubset(columnas):
+                raise MyNotValidParamError(f"Los renglones para {self.tabla.name} deben tener la llave {self.llave}")
+            self.columnas = columnas
+        elif columnas != self.columnas:
+            raise MyNotValidParamError(f"Las columnas de los renglones para {self.tabla.name} deben ser las mismas")
+
+        # Con llave natural, juntar por la llave y sumar si se repite, se mandan todos juntos al guardar
+        if self.llave is not None:
+            renglon = dict(zip(self.columnas, valores.values()))
+            llave = tuple(renglon[columna] for columna in self.llave)
+            anterior = self.renglones_por_llave.get(llave)
+            if anterior is not None:
+                for columna in self.sumar:
+                    renglon[columna] = anterior[columna] + renglon[columna]
+                self.repetidos.append(valores)
+            self.renglones_por_llave[llave] = renglon
+            return
+
+        # Juntar el renglón como tupla
+        self.renglones.append(tuple(valores.values()))
+
+        # Si se llegó al tamaño del lote, mandar los renglones
+        if len(self.renglones) >= self.tamano_lote:
+            self.guardar()
+
+    def guardar(self) -> int:
+        """Mandar los renglones juntados a la base de datos, entrega la cantidad de renglones insertados"""
+
+        # Con llave natural, mandar con INSERT ... ON CONFLICT
+        if self.llave is not None:
+            return self.guardar_con_llave()
+
+        # Si no hay renglones, no hay nada que hacer
+        if len(self.renglones) == 0:
+            return self.contador
+
+        # Mandar los registros nuevos de la sesión para que tengan id
+        sesion = database.session
+        sesion.flush()
+
+        # Convertir los registros del ORM a su id
+        renglones = [tuple(getattr(valor, "id", valor) for valor in renglon) for renglon in self.renglones]
+
+        # Usar la conexión de la transacción de la sesión, el commit lo hace el comando
+        conexion = sesion.connection()
+        if conexion.dialect.name == "postgresql":
+            # Escribir los renglones como CSV, los textos van entre comillas y None queda vacío para que sea NULL
+            buffer = io.StringIO()
+            csv.writer(buffer, quoting=csv.QUOTE_STRINGS).writerows(renglones)
+            buffer.seek(0)
+
+            # Mandar el CSV con COPY FROM STDIN
+            cursor = conexion.connection.dbapi_connection.cursor()
+            try:
+                cursor.copy_expert(
+                    f"COPY {self.tabla.name} ({', '.join(self.columnas)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+            finally:
+                cursor.close()
+        else:
+            # Mandar los renglones con un solo executemany
+            conexion.execute(insert(self.tabla), [dict(zip(self.columnas, renglon)) for renglon in renglones])
+
+        # Vaciar los renglones y acumular el contador
+        self.contador += len(renglones)
+        self.renglones = []
+        return self.contador
+
+    def guardar_con_llave(self) -> int:
+        """Mandar los renglones con INSERT ... ON CONFLICT DO UPDATE, entrega la cantidad de renglones mandados"""
+
+        # Si no hay renglones, no hay nada que hacer
+        if len(self.renglones_por_llave) == 0:
+            return self.contador
+
+        # Mandar los registros nuevos de la sesión para que tengan id
+        sesion = database.session
+        sesion.flush()
+
+        # Convertir los registros del ORM a su id
+        renglones = [
+            {columna: getattr(valor, "id", valor) for columna, valor in renglon.items()}
+            for renglon in self.renglones_por_llave.values()
+        ]
+
+        # Recordar las llaves, ya con los id, para dar de baja las que no vinieron
+        self.llaves_guardadas.update(tuple(renglon[columna] for columna in self.llave) for renglon in renglones)
+
+        # Si la llave ya existe, actualizar las demás columnas solo si alguna cambió
+        conexion = sesion.connection()
+        sentencia = insertar_con_llave(self.tabla, self.llave, self.columnas, conexion.dialect.name)
+
+        # Mandar en lotes con executemany
+        for inicio in range(0, len(renglones), self.tamano_lote):
+            conexion.execute(sentencia, renglones[inicio : inicio + self.tamano_lote])
+
+        # Vaciar los renglones y acumular el contador
+        self.contador += len(renglones)
+        self.renglones_por_llave = {}
+        return self.contador
+
+    def dar_de_baja_ausentes(self, filtros: dict, por: tuple = ()) -> int:
+        """Dar de baja los registros vigentes con los filtros cuya llave no vino en la carga, entrega cuántos se dieron de baja
+
+        Los filtros son columna y valor, o columna y tupla de valores. Con por, como ("concepto_id",),
+        solo se consideran los registros con los valores de esas columnas de la llave que trae la carga
+        """
+
+        # Solo se puede con llave natural
+        if self.llave is None:
+            raise MyNotValidParamError(f"Para dar de baja en {self.tabla.name} se necesita la llave natural")
+
+        # Mandar los renglones que falten
+        self.guardar()
+
+        # Filtrar los registros vigentes
+        condiciones = [self.tabla.c.estatus == "A"]
+        for columna, valor in filtros.items():
+            if isinstance(valor, (list, set, tuple)):
+                condiciones.append(self.tabla.c[columna].in_(valor))
+            else:
+                condiciones.append(self.tabla.c[columna] == valor)
+        for columna in por:
+            posicion = self.llave.index(columna)
+            condiciones.append(self.tabla.c[columna].in_({llave[posicion] for llave in self.llaves_guardadas}))
+
+        # Tomar los id de los registros cuya llave no vino en la carga
+        conexion = database.session.connection()
+        ausentes = [
+            renglon[0]
+            for renglon in conexion.execute(
+                select(self.tabla.c.id, *[self.tabla.c[columna] for columna in self.llave]).where(*condiciones)
+            )
+            if tuple(renglon[1:]) not in self.llaves_guardadas
+        ]
+
+        # Darlos de baja en lotes
+        for inicio in range(0, len(ausentes), self.tamano_lote):
+            conexion.execute(
+                update(self.tabla)
+                .where(self.tabla.c.id.in_(ausentes[inicio : inicio + self.tamano_lote]))
+                .values(estatus="B", modificado=func.now())
+            )
+        return len(ausentes)
@@ -0,0 +1,256 @@
+"""
+CFDI
+
+Lee los CFDI 4.0 de nómina con el complemento nomina12, sin consultar la base de datos,
+para que leer_cfdi se pueda repartir entre varios procesos con leer_cfdis
+
+Se lee por bloques con XMLPullParser, que es el parser de iterparse sin su generador por cada tag,
+solo con los tags al abrirse, cada uno se busca en un diccionario con los atributos que se toman de él,
+y lo que está después de cfdi:Complemento, la cfdi:Addenda si la tiene, no se lee
+
+Los datos se entregan en un CFDI inmutable, los nodos nomina12:Percepcion, nomina12:Deduccion y nomina12:OtroPago
+van en conceptos, cada uno con las columnas de TimbradoConcepto
+"""
+
+import io
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Optional
+
+XML_TAG_CFD_PREFIX = "{http://www.sat.gob.mx/cfd/4}"
+XML_TAG_TFD_PREFIX = "{http://www.sat.gob.mx/TimbreFiscalDigital}"
+XML_TAG_NOMINA_PREFIX = "{http://www.sat.gob.mx/nomina12}"
+ARCHIVOS_POR_ENVIO = 32  # Cantidad de archivos que se mandan a la vez a cada proceso
+BLOQUE = 16 * 1024  # Bytes que se leen del archivo y se mandan a la vez al parser
+
+
+def leer_fecha(texto: str):
+    """Convertir el texto como 2024-01-15 a fecha, si no es válido entrega None"""
+    try:
+        return date.fromisoformat(texto)
+    except ValueError:
+        return None
+
+
+def leer_importe(texto):
+    """Convertir el texto, o el número, a Decimal con cuatro decimales, si no es válido entrega None"""
+    try:
+        return Decimal(format(float(texto), ".4f"))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+# Estructura del CFDI version 4.0
+# - cfdi:Comprobante [xmlns:xsi, xmlns:nomina12, xmlns:cfdi, Version, Serie, Folio, Fecha, SubTotal, Descuento, Moneda,
+#     Total, TipoDeComprobante, Exportacion, MetodoPago, LugarExpedicion, Sello, Certificado, NoCertificado]
+#   - cfdi:Emisor [Rfc, Nombre, RegimenFiscal]
+#   - cfdi:Receptor [Rfc, Nombre, DomicilioFiscalReceptor, RegimenFiscalReceptor, UsoCFDI]
+#   - cfdi:Conceptos
+#     - cfdi:Concepto [ClaveProdServ, Cantidad, ClaveUnidad, Descripcion, ValorUnitario, Importe, Descuento, ObjetoImp]
+#   - cfdi:Complemento
+#     - tfd:TimbreFiscalDigital [Version, UUID, FechaTimbrado, RfcProvCertif, SelloCFD, NoCertificadoSAT, SelloSAT]
+#     - nomina12:Nomina [Version, TipoNomina, FechaPago, FechaInicialPago, FechaFinalPago, NumDiasPagados,
+#         TotalPercepciones, TotalDeducciones, TotalOtrosPagos]
+#       - nomina12:Emisor [RegistroPatronal]
+#         - nomina12:EntidadSNCF [OrigenRecurso]
+#       - nomina12:Receptor [Curp, NumSeguridadSocial, FechaInicioRelLaboral, Antigüedad, TipoContrato, Sindicalizado,
+#           TipoJornada, TipoRegimen, NumEmpleado, Departamento, Puesto, RiesgoPuesto, PeriodicidadPago, Banco,
+#           CuentaBancaria, SalarioBaseCotApor, SalarioDiarioIntegrado, ClaveEntFed]
+#       - nomina12:Percepciones [TotalSueldos, TotalGravado, TotalExento]
+#         - nomina12:Percepcion [TipoPercepcion, Clave, Concepto, ImporteGravado, ImporteExento]
+#       - nomina12:Deducciones [TotalOtrasDeducciones]
+#         - nomina12:Deduccion [TipoDeduccion, Clave, Concepto, Importe]
+#       - nomina12:OtrosPagos
+#         - nomina12:OtroPago [TipoOtroPago, Clave, Concepto, Importe]
+
+# Tags con los atributos que se toman, el campo del CFDI y la función que los convierte, None si se toma el texto
+CAMPOS_POR_TAG = {
+    f"{XML_TAG_CFD_PREFIX}Emisor": (
+        ("Rfc", "cfdi_emisor_rfc", None),
+        ("Nombre", "cfdi_emisor_nombre", None),
+        ("RegimenFiscal", "cfdi_emisor_regimen_fiscal", None),
+    ),
+    f"{XML_TAG_CFD_PREFIX}Receptor": (
+        ("Rfc", "cfdi_receptor_rfc", None),
+        ("Nombre", "cfdi_receptor_nombre", None),
+    ),
+    f"{XML_TAG_TFD_PREFIX}TimbreFiscalDigital": (
+        ("Version", "tfd_version", None),
+        ("UUID", "tfd_uuid", None),
+        ("FechaTimbrado", "tfd_fecha_timbrado", None),
+        ("SelloCFD", "tfd_sello_cfd", None),
+        ("NoCertificadoSAT", "tfd_num_cert_sat", None),
+        ("SelloSAT", "tfd_sello_sat", None),
+    ),
+    f"{XML_TAG_NOMINA_PREFIX}Nomina": (
+        ("Version", "nomina12_nomina_version", None),
+        ("TipoNomina", "nomina12_nomina_tipo_nomina", None),
+        ("FechaPago", "nomina12_nomina_fecha_pago", leer_fecha),
+        ("FechaInicialPago", "nomina12_nomina_fecha_inicial_pago", leer_fecha),
+        ("FechaFinalPago", "nomina12_nomina_fecha_final_pago", leer_fecha),
+        ("TotalPercepciones", "nomina12_nomina_total_percepciones", leer_importe),
+        ("TotalDeducciones", "nomina12_nomina_total_deducciones", leer_importe),
+        ("TotalOtrosPagos", "nomina12_nomina_total_otros_pagos", leer_importe),
+    ),
+}
+
+# Tags de los conceptos con su tipo en TimbradoConcepto y el atributo con el tipo del SAT
+CONCEPTOS_POR_TAG = {
+    f"{XML_TAG_NOMINA_PREFIX}Percepcion": ("PERCEPCION", "TipoPercepcion"),
+    f"{XML_TAG_NOMINA_PREFIX}Deduccion": ("DEDUCCION", "TipoDeduccion"),
+    f"{XML_TAG_NOMINA_PREFIX}OtroPago": ("OTRO PAGO", "TipoOtroPago"),
+}
+
+TAG_COMPROBANTE = f"{XML_TAG_CFD_PREFIX}Comprobante"
+TAG_ADDENDA = f"{XML_TAG_CFD_PREFIX}Addenda"
+
+
+@dataclass(frozen=True, slots=True)
+class Concepto:
+    """Nodo nomina12:Percepcion, nomina12:Deduccion o nomina12:OtroPago con las columnas de TimbradoConcepto"""
+
+    tipo: str
+    tipo_sat: str
+    clave: str
+    concepto: str
+    importe_gravado: Decimal
+    importe_exento: Decimal
+    importe: Decimal
+
+    def columnas(self) -> dict:
+        """Entregar las columnas para agregarlo a una carga masiva de TimbradoConcepto"""
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+
+@dataclass(frozen=True, slots=True)
+class CFDI:
+    """Datos del CFDI de nómina, si el tag raiz no es cfdi:Comprobante solo tiene es_comprobante en falso"""
+
+    es_comprobante: bool
+    cfdi_emisor_rfc: Optional[str] = None  # cfdi:Emisor [Rfc]
+    cfdi_emisor_nombre: Optional[str] = None  # cfdi:Emisor [Nombre]
+    cfdi_emisor_regimen_fiscal: Optional[str] = None  # cfdi:Emisor [RegimenFiscal]
+    cfdi_receptor_rfc: Optional[str] = None  # cfdi:Receptor [Rfc]
+    cfdi_receptor_nombre: Optional[str] = None  # cfdi:Receptor [Nombre]
+    tfd_version: Optional[str] = None  # tfd:TimbreFiscalDigital [Version]
+    tfd_uuid: Optional[str] = None  # tfd:TimbreFiscalDigital [UUID]
+    tfd_fecha_timbrado: Optional[str] = None  # tfd:TimbreFiscalDigital [FechaTimbrado]
+    tfd_sello_cfd: Optional[str] = None  # tfd:TimbreFiscalDigital [SelloCFD]
+    tfd_num_cert_sat: Optional[str] = None  # tfd:TimbreFiscalDigital [NoCertificadoSAT]
+    tfd_sello_sat: Optional[str] = None  # tfd:TimbreFiscalDigital [SelloSAT]
+    nomina12_nomina_version: Optional[str] = None  # nomina12:Nomina [Version]
+    nomina12_nomina_tipo_nomina: Optional[str] = None  # nomina12:Nomina [TipoNomina]
+    nomina12_nomina_fecha_pago: Optional[date] = None  # nomina12:Nomina [FechaPago]
+    nomina12_nomina_fecha_inicial_pago: Optional[date] = None  # nomina12:Nomina [FechaInicialPago]
+    nomina12_nomina_fecha_final_pago: Optional[date] = None  # nomina12:Nomina [FechaFinalPago]
+    nomina12_nomina_total_percepciones: Optional[Decimal] = None  # nomina12:Nomina [TotalPercepciones]
+    nomina12_nomina_total_deducciones: Optional[Decimal] = None  # nomina12:Nomina [TotalDeducciones]
+    nomina12_nomina_total_otros_pagos: Optional[Decimal] = None  # nomina12:Nomina [TotalOtrosPagos]
+    conceptos: tuple[Concepto, ...] = ()  # nomina12:Percepcion, nomina12:Deduccion y nomina12:OtroPago
+
+
+NO_ES_COMPROBANTE = CFDI(es_comprobante=False)
+CERO = Decimal("0.0000")
+
+
+def leer_importe_concepto(atributos: dict, nombre: str) -> Decimal:
+    """Leer un importe de un concepto, si no viene o no es válido entrega cero"""
+    importe = leer_importe(atributos.get(nombre, 0))
+    if importe is None:
+        return CERO
+    return importe
+
+
+def leer_concepto(tag: str, atributos: dict) -> Concepto:
+    """Leer un nodo nomina12:Percepcion, nomina12:Deduccion o nomina12:OtroPago, los importes como en leer_importe"""
+    tipo, atributo_tipo = CONCEPTOS_POR_TAG[tag]
+    if tipo == "PERCEPCION":
+        # La percepción no tiene Importe, es la suma del gravado y del exento, se suma sin el contexto de Decimal
+        importe_gravado = leer_importe_concepto(atributos, "ImporteGravado")
+        importe_exento = leer_importe_concepto(atributos, "ImporteExento")
+        importe = Decimal(format(float(importe_gravado) + float(importe_exento), ".4f"))
+    else:
+        importe_gravado = importe_exento = CERO
+        importe = leer_importe_concepto(atributos, "Importe")
+    return Concepto(
+        tipo,
+        atributos.get(atributo_tipo, ""),
+        atributos.get("Clave", ""),
+        atributos.get("Concepto", ""),
+        importe_gravado,
+        importe_exento,
+        importe,
+    )
+
+
+def extraer_cfdi(archivo) -> CFDI:
+    """Extraer los datos del CFDI del archivo abierto, termina en cfdi:Addenda si la tiene"""
+    parser = ET.XMLPullParser(events=("start",))
+    datos = {}
+    conceptos = []
+    es_raiz = True
+    terminado = False
+
+    # Mandar el archivo al parser por bloques, hasta el final o hasta cfdi:Addenda
+    while not terminado:
+        bloque = archivo.read(BLOQUE)
+        if not bloque:
+            parser.close()  # Provoca ParseError si el XML está incompleto
+            break
+        parser.feed(bloque)
+
+        # Bucle por los tags al abrirse, con start ya se tienen sus atributos
+        for _, element in parser.read_events():
+            tag = element.tag
+
+            # Validar que el tag raiz sea cfdi:Comprobante
+            if es_raiz:
+                if tag != TAG_COMPROBANTE:
+                    return NO_ES_COMPROBANTE
+                es_raiz = False
+                continue
+
+            # Tomar los atributos de los tags con datos o de los conceptos
+            campos = CAMPOS_POR_TAG.get(tag)
+            if campos is not None:
+                atributos = element.attrib
+                for atributo, campo, convertir in campos:
+                    texto = atributos.get(atributo)
+                    if texto is not None:
+                        datos[campo] = texto if convertir is None else convertir(texto)
+            elif tag in CONCEPTOS_POR_TAG:
+                conceptos.append(leer_concepto(tag, element.attrib))
+            elif tag == TAG_ADDENDA:
+                # Después de cfdi:Complemento solo puede venir cfdi:Addenda, no tiene datos que se usen
+                terminado = True
+                break
+
+    # Entregar los datos
+    return CFDI(es_comprobante=True, conceptos=tuple(conceptos), **datos)
+
+
+def leer_cfdi(ruta: Path) -> CFDI:
+    """Leer los datos del archivo XML del CFDI"""
+    with open(ruta, "rb") as archivo:
+        return extraer_cfdi(archivo)
+
+
+def leer_cfdi_texto(texto: str) -> CFDI:
+    """Leer los datos del CFDI guardado en texto, como Timbrado.tfd"""
+    return extraer_cfdi(io.StringIO(texto))
+
+
+def leer_cfdis(rutas: list, procesos: int = 1) -> list[CFDI]:
+    """Leer los CFDI repartidos entre varios procesos, entrega los datos en el mismo orden de las rutas"""
+
+    # Con un solo proceso, o pocos archivos, no vale la pena repartir
+    if procesos <= 1 or len(rutas) < procesos:
+        return [leer_cfdi(ruta) for ruta in rutas]
+
+    # Repartir los archivos en envíos a los procesos
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        return list(ejecutor.map(leer_cfdi, rutas, chunksize=ARCHIVOS_POR_ENVIO))
@@ -2,7 +2,20 @@
 Datatables
 """
 
-from flask import request
+import base64
+import binascii
+import hashlib
+import json
+
+from flask import current_app, request
+from redis.exceptions import RedisError
+from sqlalchemy import and_, or_, text
+
+from ..config.extensions import database
+
+CONTEO_SEGUNDOS = 60  # Segundos que se guarda en Redis el total de cada combinación de filtros
+ESTIMAR_DESDE = 100000  # Renglones que debe tener la tabla para entregar el total estimado en lugar del exacto
+PARAMETROS_DATATABLES = ("draw", "start", "length", "cursor")  # Parámetros que no son filtros
 
 
 def get_datatable_parameters():
@@ -18,11 +31,110 @@ def get_datatable_parameters():
     return draw, start, rows_per_page
 
 
-def output_datatable_json(draw, total, data):
-    """Entregar JSON"""
+def get_datatable_cursor():
+    """Tomar el cursor que manda DataTables, entrega None si no viene o no se puede leer"""
+    cursor = request.form.get("cursor", "")
+    if cursor == "":
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (UnicodeError, binascii.Error, ValueError):
+        return None
+    if not isinstance(valores, list) or not all(isinstance(valor, (str, int)) for valor in valores):
+        return None
+    return valores
+
+
+def encode_datatable_cursor(valores):
+    """Elaborar el cursor opaco con los valores de las columnas del último renglón"""
+    return base64.urlsafe_b64encode(json.dumps(list(valores), separators=(",", ":")).encode("ascii")).decode("ascii")
+
+
+def paginate_datatable(consulta, columnas, start, rows_per_page, cursor=None):
+    """
+    Ordenar de forma descendente por las columnas y paginar, entrega los registros y el cursor del último
+
+    La última columna debe ser única, como el id, para que el orden no tenga empates.
+    Con el cursor de la página anterior se busca (keyset) desde el último renglón que se mandó,
+    asi el tiempo no crece con la página; sin cursor, como al saltar a otra página, se usa offset
+    """
+    consulta = consulta.add_columns(*columnas).order_by(*[columna.desc() for columna in columnas])
+    if cursor is not None and len(cursor) == len(columnas):
+        # Los renglones que van después del cursor en orden descendente, la primera columna va sola para usar su índice
+        condiciones = []
+        for posicion, columna in enumerate(columnas):
+            iguales = [columnas[anterior] == cursor[anterior] for anterior in range(posicion)]
+            condiciones.append(and_(*iguales, columna < cursor[posicion]))
+        consulta = consulta.filter(columnas[0] <= cursor[0], or_(*condiciones))
+    else:
+        consulta = consulta.offset(start)
+    renglones = consulta.limit(rows_per_page).all()
+    if len(renglones) == 0:
+        return [], None
+    return [renglon[0] for renglon in renglones], encode_datatable_cursor(renglones[-1][1:])
+
+
+def get_datatable_filters():
+    """Tomar los filtros que manda DataTables, sin sus propios parámetros ni los vacíos"""
     return {
+        llave: valor
+        for llave, valor in request.form.items()
+        if llave not in PARAMETROS_DATATABLES and "[" not in llave and valor != ""
+    }
+
+
+def estimate_table_rows(tabla):
+    """Entregar los renglones estimados de la tabla en PostgreSQL con pg_class.reltuples, None si no se puede"""
+    if database.engine.dialect.name != "postgresql":
+        return None
+    estimado = database.session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:tabla)"), {"tabla": tabla}
+    ).scalar()
+    if estimado is None or estimado < 0:
+        return None  # La tabla no existe o nunca se ha analizado
+    return estimado
+
+
+def count_datatable(consulta, tabla, estimar_con=None):
+    """
+    Contar los registros de la consulta para DataTables
+
+    Si los filtros son los de estimar_con, como el listado sin filtrar, y la tabla es grande,
+    se entrega el total estimado por PostgreSQL; si no, el exacto se guarda en Redis unos segundos
+    con la llave de la tabla y los filtros, asi al cambiar de página no se vuelve a contar
+    """
+    filtros = get_datatable_filters()
+    # Estimar cuando los filtros no reducen el listado, los que no vienen tienen el valor por defecto de estimar_con
+    if estimar_con is not None:
+        filtros = {**estimar_con, **filtros}
+    if filtros == estimar_con:
+        estimado = estimate_table_rows(tabla)
+        if estimado is not None and estimado >= ESTIMAR_DESDE:
+            return estimado
+    # Tomar el total de Redis, si no está o no hay Redis se cuenta
+    llave = f"datatables:{tabla}:{hashlib.sha1(json.dumps(filtros, sort_keys=True).encode('utf8')).hexdigest()}"
+    try:
+        guardado = current_app.redis.get(llave)
+        if guardado is not None:
+            return int(guardado)
+    except RedisError:
+        return consulta.count()
+    total = consulta.count()
+    try:
+        current_app.redis.set(llave, total, ex=CONTEO_SEGUNDOS)
+    except RedisError:
+        pass
+    return total
+
+
+def output_datatable_json(draw, total, data, cursor=None):
+    """Entregar JSON"""
+    salida = {
         "draw": draw,
         "iTotalRecords": total,
         "iTotalDisplayRecords": total,
         "aaData": data,
     }
+    if cursor is not None:
+        salida["cursor"] = cursor
+    return salida
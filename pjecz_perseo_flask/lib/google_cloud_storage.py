@@ -5,9 +5,13 @@ Functions to get and upload files from Google Cloud Storage
 
 For develpment you need the environment variable GOOGLE_APPLICATION_CREDENTIALS
 
+To upload many files use a backend from get_storage_backend, it keeps one client and one bucket,
+with a deposit like file:///path/to/directory the files are stored in a local directory instead
+
 """
 
 from pathlib import Path
+from typing import BinaryIO
 from urllib.parse import unquote, urlparse
 
 from google.cloud import storage
@@ -15,6 +19,8 @@ from google.cloud.exceptions import NotFound
 
 from .exceptions import MyBucketNotFoundError, MyFileNotAllowedError, MyFileNotFoundError, MyNotValidParamError, MyUploadError
 
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Must be a multiple of 256 KB
+
 EXTENSIONS_MEDIA_TYPES = {
     "doc": "application/msword",
     "docx": "application/msword",
@@ -195,3 +201,139 @@ def upload_file_to_gcs(
 
     # Return public URL
     return blob.public_url
+
+
+def upload_fileobj_to_gcs(
+    bucket_name: str,
+    blob_name: str,
+    content_type: str,
+    file_obj: BinaryIO,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> str:
+    """
+    Upload a file object to Google Cloud Storage with a resumable upload in chunks
+
+    :param bucket_name: Name of the bucket
+    :param blob_name: Path to the file
+    :param content_type: Content type of the file
+    :param file_obj: File object opened in binary mode, it is read from the beginning
+    :param chunk_size: Size of each chunk, must be a multiple of 256 KB
+    :return: Public URL
+    """
+
+    # Get bucket
+    storage_client = storage.Client()
+    try:
+        bucket = storage_client.get_bucket(bucket_name)
+    except NotFound as error:
+        raise MyBucketNotFoundError("Bucket not found") from error
+
+    # Create blob, with chunk size the upload is resumable
+    blob = bucket.blob(blob_name, chunk_size=chunk_size)
+
+    # Upload file
+    try:
+        blob.upload_from_file(file_obj, content_type=content_type, rewind=True)
+    except Exception as error:
+        raise MyUploadError("Error uploading file") from error
+
+    # Return public URL
+    return blob.public_url
+
+
+class GCSBackend:
+    """Bucket of Google Cloud Storage with one client, it can be shared by threads"""
+
+    def __init__(self, bucket_name: str):
+        """
+        Get the bucket once
+
+        :param bucket_name: Name of the bucket
+        """
+        self.client = storage.Client()
+        try:
+            self.bucket = self.client.get_bucket(bucket_name)
+        except NotFound as error:
+            raise MyBucketNotFoundError("Bucket not found") from error
+
+    def get_public_url(self, blob_name: str) -> str | None:
+        """
+        Get public URL of the file, if the file does not exist return None
+
+        :param blob_name: Path to the file
+        :return: Public URL or None
+        """
+        blob = self.bucket.get_blob(blob_name)
+        if blob is None:
+            return None
+        return blob.public_url
+
+    def upload(self, blob_name: str, content_type: str, data: bytes) -> str:
+        """
+        Upload file
+
+        :param blob_name: Path to the file
+        :param content_type: Content type of the file
+        :param data: File content
+        :return: Public URL
+        """
+        blob = self.bucket.blob(blob_name)
+        try:
+            blob.upload_from_string(data, content_type=content_type)
+        except Exception as error:
+            raise MyUploadError("Error uploading file") from error
+        return blob.public_url
+
+
+class LocalBackend:
+    """Local directory with the same methods as GCSBackend, for tests and development"""
+
+    def __init__(self, directory: str):
+        """
+        Create the directory if it does not exist
+
+        :param directory: Path to the directory
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get_public_url(self, blob_name: str) -> str | None:
+        """
+        Get file URL of the file, if the file does not exist return None
+
+        :param blob_name: Path to the file
+        :return: File URL or None
+        """
+        path = self.directory / blob_name
+        if not path.is_file():
+            return None
+        return path.resolve().as_uri()
+
+    def upload(self, blob_name: str, content_type: str, data: bytes) -> str:
+        """
+        Write file
+
+        :param blob_name: Path to the file
+        :param content_type: Content type of the file, not used
+        :param data: File content
+        :return: File URL
+        """
+        path = self.directory / blob_name
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        except OSError as error:
+            raise MyUploadError("Error uploading file") from error
+        return path.resolve().as_uri()
+
+
+def get_storage_backend(deposit: str) -> GCSBackend | LocalBackend:
+    """
+    Get the backend for the deposit, with file:// it is a local directory, otherwise it is a bucket
+
+    :param deposit: Name of the bucket or file:// URL of a local directory
+    :return: Backend
+    """
+    if deposit.startswith("file://"):
+        return LocalBackend(urlparse(deposit).path)
+    return GCSBackend(deposit)
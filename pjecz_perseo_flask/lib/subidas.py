@@ -0,0 +1,96 @@
+"""
+Subidas
+
+Sube muchos archivos al depósito con varios hilos que comparten el mismo backend, como GCSBackend o LocalBackend,
+cada subida se reintenta esperando cada vez el doble y las que terminan se anotan en un manifiesto,
+asi si se interrumpe, al repetir se toman del manifiesto y solo se sube lo que faltó
+
+El manifiesto es un archivo con un renglón JSON por archivo, con el depósito, el blob y la URL
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .exceptions import MyUploadError
+
+HILOS = 8  # Cantidad de subidas al mismo tiempo
+REINTENTOS = 3  # Cantidad de reintentos despues de la primera subida fallida
+ESPERA = 1.0  # Segundos que se espera antes del primer reintento, se duplica en cada uno
+
+
+class Manifiesto:
+    """Archivo con las subidas terminadas, se puede escribir desde varios hilos"""
+
+    def __init__(self, ruta: Path, deposito: str):
+        """Leer las subidas terminadas del depósito"""
+        self.ruta = Path(ruta)
+        self.deposito = deposito
+        self.urls = {}
+        self.candado = threading.Lock()
+        if self.ruta.is_file():
+            with open(self.ruta, "r", encoding="utf8") as archivo:
+                for linea in archivo:
+                    try:
+                        renglon = json.loads(linea)
+                    except json.JSONDecodeError:
+                        continue  # La última línea puede quedar incompleta si se interrumpió
+                    if renglon.get("deposito") == deposito:
+                        self.urls[renglon["blob"]] = renglon["url"]
+
+    def anotar(self, blob: str, url: str):
+        """Anotar la subida terminada, se escribe de inmediato para no perderla si se interrumpe"""
+        with self.candado:
+            self.urls[blob] = url
+            with open(self.ruta, "a", encoding="utf8") as archivo:
+                archivo.write(json.dumps({"deposito": self.deposito, "blob": blob, "url": url}) + "\n")
+
+
+def subir_con_reintentos(
+    backend, blob: str, tipo: str, datos: bytes, reintentos: int = REINTENTOS, espera: float = ESPERA
+) -> str:
+    """Subir el archivo, si falla se reintenta esperando cada vez el doble, entrega la URL"""
+    intento = 0
+    while True:
+        try:
+            return backend.upload(blob, tipo, datos)
+        except MyUploadError:
+            if intento >= reintentos:
+                raise
+            time.sleep(espera * 2**intento)
+            intento += 1
+
+
+def subir_archivos(backend, archivos: list, manifiesto: Manifiesto = None, hilos: int = HILOS) -> dict:
+    """
+    Subir los archivos, cada uno es una tupla con el blob, el tipo y la ruta local
+
+    Entrega un diccionario con el blob y su resultado: la URL si ya estaba o se subió,
+    None si no existe el archivo local o la excepción si no se pudo subir
+    """
+
+    def subir(blob: str, tipo: str, ruta: Path):
+        """Tomar la URL del manifiesto o del depósito, si no está subir el archivo local"""
+        if manifiesto is not None and blob in manifiesto.urls:
+            return manifiesto.urls[blob]
+        try:
+            url = backend.get_public_url(blob)
+            if url is None:
+                if not ruta.is_file():
+                    return None
+                url = subir_con_reintentos(backend, blob, tipo, ruta.read_bytes())
+        except Exception as error:
+            return error
+        if manifiesto is not None:
+            manifiesto.anotar(blob, url)
+        return url
+
+    # Subir con varios hilos, si un blob se repite se sube una sola vez, los resultados se juntan por blob
+    futuros = {}
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        for blob, tipo, ruta in archivos:
+            if blob not in futuros:
+                futuros[blob] = ejecutor.submit(subir, blob, tipo, ruta)
+    return {blob: futuro.result() for blob, futuro in futuros.items()}
@@ -5,6 +5,7 @@ Tareas en el fondo
 from rq import get_current_job
 
 from pjecz_perseo_flask.blueprints.tareas.models import Tarea
+from pjecz_perseo_flask.config.extensions import database
 
 
 def set_task_progress(progress: int, message: str, archivo: str = "", url: str = "") -> None:
@@ -37,6 +38,8 @@ def set_task_progress(progress: int, message: str, archivo: str = "", url: str =
 
 def set_task_error(message: str) -> str:
     """Al fallar la tarea debe tomar el message y terminarla"""
+    # Descartar lo pendiente en la sesión, como los consecutivos que reservó un generador que falló
+    database.session.rollback()
     job = get_current_job()
     if job:
         job.meta["progress"] = 100
@@ -0,0 +1,68 @@
+"""
+XLSX
+
+Libros XLSX en modo de solo escritura, las filas se escriben a un archivo temporal
+en lugar de conservarse en memoria, asi la memoria no crece con la cantidad de filas
+
+Al guardar, el libro se serializa en un buffer temporal que se mantiene en memoria
+hasta cierto tamaño y luego pasa a disco, de ese buffer se sube a Google Cloud Storage
+y se copia al archivo local si esta configurado CONSERVAR_COPIA_LOCAL o si no hay depósito de Google Cloud Storage
+
+"""
+
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterator
+
+from openpyxl import Workbook
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+
+from ..config.settings import get_settings
+
+BUFFER_MAX_SIZE = 32 * 1024 * 1024  # Tamaño máximo del buffer en memoria antes de pasar a disco
+
+
+def iniciar_libro_xlsx(encabezados: list = None) -> tuple[Workbook, WriteOnlyWorksheet]:
+    """Iniciar un libro XLSX en modo de solo escritura, entrega el libro y su hoja"""
+
+    # Iniciar el libro en modo de solo escritura, no tiene hoja activa y hay que crearla
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+
+    # Si se dan los encabezados, agregar la fila con las cabeceras de las columnas
+    if encabezados is not None:
+        hoja.append(encabezados)
+
+    # Entregar el libro y la hoja
+    return libro, hoja
+
+
+@contextmanager
+def guardar_libro_xlsx(
+    libro: Workbook,
+    ruta_local_archivo_xlsx: str,
+    conservar_copia_local: bool = None,
+) -> Iterator[BinaryIO]:
+    """Guardar el libro XLSX en un buffer temporal, entrega el buffer al inicio para subirlo"""
+
+    # Si no se da conservar_copia_local, se conserva si esta configurado o si no hay depósito de Google Cloud Storage
+    if conservar_copia_local is None:
+        settings = get_settings()
+        conservar_copia_local = settings.CONSERVAR_COPIA_LOCAL or settings.CLOUD_STORAGE_DEPOSITO == ""
+
+    with SpooledTemporaryFile(max_size=BUFFER_MAX_SIZE) as buffer:
+        # Serializar el libro en el buffer
+        libro.save(buffer)
+
+        # Si se conserva la copia local, crear el directorio si no existe y copiar el buffer
+        if conservar_copia_local:
+            Path(ruta_local_archivo_xlsx).parent.mkdir(parents=True, exist_ok=True)
+            buffer.seek(0)
+            with open(ruta_local_archivo_xlsx, "wb") as archivo:
+                shutil.copyfileobj(buffer, archivo)
+
+        # Entregar el buffer al inicio
+        buffer.seek(0)
+        yield buffer
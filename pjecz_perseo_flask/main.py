@@ -19,6 +19,7 @@ from .blueprints.conceptos_productos.views import conceptos_productos
 from .blueprints.cuentas.views import cuentas
 from .blueprints.distritos.views import distritos
 from .blueprints.entradas_salidas.views import entradas_salidas
+from .blueprints.importaciones.views import importaciones
 from .blueprints.modulos.views import modulos
 from .blueprints.nominas.views import nominas
 from .blueprints.percepciones_deducciones.views import percepciones_deducciones
@@ -34,6 +35,7 @@ from .blueprints.sistemas.views import sistemas
 from .blueprints.tabuladores.views import tabuladores
 from .blueprints.tareas.views import tareas
 from .blueprints.timbrados.views import timbrados
+from .blueprints.timbrados_conceptos.views import timbrados_conceptos
 from .blueprints.usuarios.models import Usuario
 from .blueprints.usuarios.views import usuarios
 from .blueprints.usuarios_roles.views import usuarios_roles
@@ -79,6 +81,7 @@ app.register_blueprint(cuentas)
 app.register_blueprint(bitacoras)
 app.register_blueprint(distritos)
 app.register_blueprint(entradas_salidas)
+app.register_blueprint(importaciones)
 app.register_blueprint(permisos)
 app.register_blueprint(modulos)
 app.register_blueprint(nominas)
@@ -93,6 +96,7 @@ app.register_blueprint(roles)
 app.register_blueprint(sistemas)
 app.register_blueprint(tabuladores)
 app.register_blueprint(timbrados)
+app.register_blueprint(timbrados_conceptos)
 app.register_blueprint(tareas)
 app.register_blueprint(usuarios)
 app.register_blueprint(usuarios_roles)
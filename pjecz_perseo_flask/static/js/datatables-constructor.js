@@ -42,4 +42,28 @@ class ConfigDataTable {
       },
     };
   }
+
+  // Entregar configuracion con paginacion por cursor (keyset)
+  // El servidor entrega el cursor del ultimo renglon y se manda de regreso al pedir la pagina que sigue,
+  // los cursores se guardan por renglon de inicio para volver a paginas ya vistas, al saltar a otra se usa offset
+  configConCursor() {
+    const config = this.config();
+    config.on = {
+      preXhr: function (e, settings, data) {
+        if (data.start == 0 || settings.cursores === undefined) {
+          settings.cursores = {};
+        }
+        if (data.start in settings.cursores) {
+          data.cursor = settings.cursores[data.start];
+        }
+        settings.cursorInicio = data.start;
+      },
+      xhr: function (e, settings, json) {
+        if (json && json.cursor && settings.cursores !== undefined) {
+          settings.cursores[settings.cursorInicio + json.aaData.length] = json.cursor;
+        }
+      },
+    };
+    return config;
+  }
 }
@@ -0,0 +1,39 @@
+"""
+Pruebas, configuración
+
+Las pruebas usan una base de datos SQLite temporal, se define antes de cargar la aplicación,
+cada prueba que pide la sesión empieza con las tablas vacías
+
+Las pruebas corren en el directorio temporal, asi las bitácoras logs/*.log de las tareas y los generadores
+no se escriben en el directorio del proyecto
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Usar una base de datos SQLite temporal, se define antes de cargar la aplicación
+directorio_temporal = tempfile.TemporaryDirectory()
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{Path(directorio_temporal.name, 'pruebas.db')}"
+
+# Cambiar al directorio temporal con su directorio logs, antes de cargar los módulos con bitácoras en logs/*.log
+Path(directorio_temporal.name, "logs").mkdir()
+os.chdir(directorio_temporal.name)
+
+from pjecz_perseo_flask.config.extensions import database  # noqa: E402
+from pjecz_perseo_flask.main import app  # noqa: E402
+
+# Inicializar el contexto de la aplicación Flask
+app.app_context().push()
+
+
+@pytest.fixture
+def sesion():
+    """Crear las tablas vacías y entregar la sesión, al terminar se borran las tablas"""
+    database.create_all()
+    yield database.session
+    database.session.rollback()
+    database.session.remove()
+    database.drop_all()
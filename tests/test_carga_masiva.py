@@ -0,0 +1,163 @@
+"""
+Pruebas de la carga masiva con llave natural
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, update
+
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.lib.carga_masiva import CargaMasiva
+from pjecz_perseo_flask.lib.exceptions import MyNotValidParamError
+
+MODIFICADO = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def agregar_nomina(
+    carga: CargaMasiva,
+    persona_id: int,
+    importe: int,
+    tipo: str = "SALARIO",
+    quincena_id: int = 1,
+    fuente: str = Nomina.FUENTE_EXPLOTACION,
+):
+    """Agregar a la carga una nómina de la persona con el importe"""
+    carga.agregar(
+        centro_trabajo_id=1,
+        persona_id=persona_id,
+        plaza_id=1,
+        quincena_id=quincena_id,
+        tipo=tipo,
+        desde=date(2024, 1, 1),
+        desde_clave="240101",
+        hasta=date(2024, 1, 15),
+        hasta_clave="240115",
+        percepcion=importe,
+        deduccion=0,
+        importe=importe,
+        fecha_pago=date(2024, 1, 15),
+        fuente=fuente,
+    )
+
+
+def nueva_carga() -> CargaMasiva:
+    """Iniciar una carga de nóminas con la llave natural que suma los importes de las repetidas"""
+    return CargaMasiva(Nomina, llave=Nomina.LLAVE_NATURAL, sumar=("percepcion", "deduccion", "importe"))
+
+
+def consultar(sesion) -> dict:
+    """Consultar por persona_id el importe, el estatus y modificado de las nóminas"""
+    consulta = select(Nomina.persona_id, Nomina.importe, Nomina.estatus, Nomina.modificado).order_by(Nomina.id)
+    return {renglon.persona_id: renglon for renglon in sesion.execute(consulta)}
+
+
+def test_sumar_repetidos(sesion):
+    """Los renglones con la misma llave se juntan en uno sumando los importes y quedan en repetidos"""
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    agregar_nomina(carga, 2, 50)
+    agregar_nomina(carga, 1, 25)
+    assert carga.guardar() == 2
+    sesion.commit()
+    nominas = consultar(sesion)
+    assert nominas[1].importe == Decimal("125")
+    assert nominas[2].importe == Decimal("50")
+    assert [valores["persona_id"] for valores in carga.repetidos] == [1]
+
+
+def test_actualizar_solo_si_cambia(sesion):
+    """Repetir la carga no duplica, solo actualiza los renglones en los que cambia alguna columna"""
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    agregar_nomina(carga, 2, 50)
+    carga.guardar()
+    sesion.execute(update(Nomina).values(modificado=MODIFICADO))
+    sesion.commit()
+
+    # Volver a cargar con el importe de la persona 2 cambiado
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    agregar_nomina(carga, 2, 75)
+    carga.guardar()
+    sesion.commit()
+    nominas = consultar(sesion)
+    assert len(nominas) == 2
+    assert nominas[1].modificado == MODIFICADO
+    assert nominas[2].importe == Decimal("75")
+    assert nominas[2].modificado != MODIFICADO
+
+
+def test_dar_de_baja_ausentes(sesion):
+    """Al volver a cargar, se dan de baja las vigentes con los filtros que no vinieron, las demás no se tocan"""
+    carga = nueva_carga()
+    for persona_id in (1, 2, 3):
+        agregar_nomina(carga, persona_id, 100)
+    agregar_nomina(carga, 4, 100, quincena_id=2)
+    carga.guardar()
+    sesion.commit()
+
+    # Volver a cargar la quincena 1 sin la persona 3
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    agregar_nomina(carga, 2, 100)
+    assert carga.dar_de_baja_ausentes({"quincena_id": 1, "tipo": ("SALARIO", "DESPENSA")}) == 1
+    sesion.commit()
+    nominas = consultar(sesion)
+    assert {persona_id: nomina.estatus for persona_id, nomina in nominas.items()} == {1: "A", 2: "A", 3: "B", 4: "A"}
+
+
+def test_dar_de_baja_por_columna(sesion):
+    """Con por, solo se consideran los registros con los valores de esa columna que trae la carga"""
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    agregar_nomina(carga, 2, 100)
+    agregar_nomina(carga, 3, 100, tipo="DESPENSA")
+    carga.guardar()
+    sesion.commit()
+
+    # Volver a cargar solo la despensa, con otra persona
+    carga = nueva_carga()
+    agregar_nomina(carga, 4, 100, tipo="DESPENSA")
+    assert carga.dar_de_baja_ausentes({"quincena_id": 1}, por=("tipo",)) == 1
+    sesion.commit()
+    nominas = consultar(sesion)
+    assert {persona_id: nomina.estatus for persona_id, nomina in nominas.items()} == {1: "A", 2: "A", 3: "B", 4: "A"}
+
+
+def test_dar_de_baja_solo_de_la_fuente(sesion):
+    """Al volver a cargar la explotación, las nóminas SALARIO que alimentó otro archivo no se dan de baja"""
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    agregar_nomina(carga, 2, 100)
+    carga.guardar()
+
+    # Alimentar como los salarios RL, sin llave natural y sin fuente
+    carga_salarios_rl = CargaMasiva(Nomina)
+    agregar_nomina(carga_salarios_rl, 3, 100, fuente="")
+    carga_salarios_rl.guardar()
+    sesion.commit()
+
+    # Volver a cargar la explotación sin la persona 2
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    filtros = {"quincena_id": 1, "tipo": ("SALARIO", "DESPENSA"), "fuente": Nomina.FUENTE_EXPLOTACION}
+    assert carga.dar_de_baja_ausentes(filtros) == 1
+    sesion.commit()
+    nominas = consultar(sesion)
+    assert {persona_id: nomina.estatus for persona_id, nomina in nominas.items()} == {1: "A", 2: "B", 3: "A"}
+
+
+def test_dar_de_baja_sin_llave(sesion):
+    """Sin llave natural no se sabe qué registros vinieron, se provoca error"""
+    with pytest.raises(MyNotValidParamError):
+        CargaMasiva(Nomina).dar_de_baja_ausentes({"quincena_id": 1})
+
+
+def test_columnas_distintas(sesion):
+    """Todos los renglones deben tener las mismas columnas"""
+    carga = nueva_carga()
+    agregar_nomina(carga, 1, 100)
+    with pytest.raises(MyNotValidParamError):
+        carga.agregar(persona_id=2)
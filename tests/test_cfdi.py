@@ -0,0 +1,110 @@
+"""
+Pruebas del lector de CFDI
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from pjecz_perseo_flask.lib.cfdi import BLOQUE, Concepto, leer_cfdi, leer_cfdi_texto, leer_cfdis, leer_fecha, leer_importe
+
+CFDI_NOMINA = """<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" xmlns:nomina12="http://www.sat.gob.mx/nomina12"
+    xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" Version="4.0" Total="1234.50">
+  <cfdi:Emisor Rfc="PJE901211TI9" Nombre="PODER JUDICIAL" RegimenFiscal="603"/>
+  <cfdi:Receptor Rfc="XAXX010101000" Nombre="PERSONA DE PRUEBA"/>
+  <cfdi:Conceptos>
+    <cfdi:Concepto ClaveProdServ="84111505" Importe="1500.00"/>
+  </cfdi:Conceptos>
+  <cfdi:Complemento>
+    <tfd:TimbreFiscalDigital Version="1.1" UUID="11111111-2222-3333-4444-555555555555"
+        FechaTimbrado="2024-01-15T10:20:30" SelloCFD="SELLOCFD" NoCertificadoSAT="00001000000504465028" SelloSAT="SELLOSAT"/>
+    <nomina12:Nomina Version="1.2" TipoNomina="O" FechaPago="2024-01-15" FechaInicialPago="2024-01-01"
+        FechaFinalPago="2024-01-15" TotalPercepciones="1500.00" TotalDeducciones="265.50" TotalOtrosPagos="0.00">
+      <nomina12:Percepciones>
+        <nomina12:Percepcion TipoPercepcion="001" Clave="P07" Concepto="SUELDO" ImporteGravado="1000.10" ImporteExento="499.90"/>
+      </nomina12:Percepciones>
+      <nomina12:Deducciones>
+        <nomina12:Deduccion TipoDeduccion="002" Clave="D01" Concepto="ISR" Importe="265.50"/>
+      </nomina12:Deducciones>
+      <nomina12:OtrosPagos>
+        <nomina12:OtroPago TipoOtroPago="002" Clave="OP1" Concepto="SUBSIDIO" Importe="0.00"/>
+      </nomina12:OtrosPagos>
+    </nomina12:Nomina>
+  </cfdi:Complemento>
+  {addenda}
+</cfdi:Comprobante>
+"""
+
+
+def test_leer_cfdi_texto():
+    """Tomar los atributos del emisor, receptor, timbre y nómina con sus tipos"""
+    cfdi = leer_cfdi_texto(CFDI_NOMINA.format(addenda=""))
+    assert cfdi.es_comprobante is True
+    assert cfdi.cfdi_emisor_rfc == "PJE901211TI9"
+    assert cfdi.cfdi_receptor_nombre == "PERSONA DE PRUEBA"
+    assert cfdi.tfd_uuid == "11111111-2222-3333-4444-555555555555"
+    assert cfdi.tfd_fecha_timbrado == "2024-01-15T10:20:30"
+    assert cfdi.nomina12_nomina_fecha_pago == date(2024, 1, 15)
+    assert cfdi.nomina12_nomina_total_deducciones == Decimal("265.5000")
+
+
+def test_leer_conceptos():
+    """Los conceptos van en orden, la percepción tiene como importe la suma del gravado y el exento"""
+    cfdi = leer_cfdi_texto(CFDI_NOMINA.format(addenda=""))
+    assert [concepto.tipo for concepto in cfdi.conceptos] == ["PERCEPCION", "DEDUCCION", "OTRO PAGO"]
+    percepcion, deduccion, _ = cfdi.conceptos
+    assert percepcion == Concepto(
+        "PERCEPCION", "001", "P07", "SUELDO", Decimal("1000.1000"), Decimal("499.9000"), Decimal("1500.0000")
+    )
+    assert deduccion.importe_gravado == deduccion.importe_exento == Decimal("0.0000")
+    assert deduccion.columnas()["importe"] == Decimal("265.5000")
+
+
+def test_addenda_no_se_lee():
+    """Lo que viene en la cfdi:Addenda no se lee, aunque sea más largo que un bloque"""
+    addenda = f'<cfdi:Addenda><Relleno Texto="{"X" * (BLOQUE * 2)}"/></cfdi:Addenda>'
+    assert leer_cfdi_texto(CFDI_NOMINA.format(addenda=addenda)) == leer_cfdi_texto(CFDI_NOMINA.format(addenda=""))
+
+
+def test_no_es_comprobante():
+    """Si el tag raiz no es cfdi:Comprobante solo se entrega es_comprobante en falso"""
+    cfdi = leer_cfdi_texto('<?xml version="1.0"?><Otro><cfdi:Emisor xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Rfc="X"/></Otro>')
+    assert cfdi.es_comprobante is False
+    assert cfdi.cfdi_emisor_rfc is None
+
+
+def test_leer_cfdis_en_orden(tmp_path):
+    """Leer varios archivos entrega los datos en el mismo orden de las rutas"""
+    rutas = []
+    for numero in range(3):
+        ruta = tmp_path / f"{numero}.xml"
+        ruta.write_text(CFDI_NOMINA.format(addenda="").replace('Rfc="XAXX010101000"', f'Rfc="RFC{numero}"'), encoding="utf8")
+        rutas.append(ruta)
+    assert [cfdi.cfdi_receptor_rfc for cfdi in leer_cfdis(rutas)] == ["RFC0", "RFC1", "RFC2"]
+    assert leer_cfdi(rutas[1]) == leer_cfdis(rutas)[1]
+
+
+@pytest.mark.parametrize("texto", ["", "no es fecha", "2024-13-01"])
+def test_leer_fecha_invalida(texto):
+    """Si la fecha no es válida se entrega None"""
+    assert leer_fecha(texto) is None
+
+
+@pytest.mark.parametrize("texto,esperado", [("12.3", Decimal("12.3000")), ("0.00005", Decimal("0.0001")), ("x", None)])
+def test_leer_importe(texto, esperado):
+    """El importe tiene cuatro decimales, si no es válido se entrega None"""
+    assert leer_importe(texto) == esperado
+
+
+@pytest.mark.parametrize("texto", ["", "no es importe"])
+def test_leer_concepto_importe_invalido(texto):
+    """Si el importe de un concepto viene vacío o no es válido se lee como cero, sin detener la lectura"""
+    cfdi = leer_cfdi_texto(
+        CFDI_NOMINA.format(addenda="").replace('Importe="265.50"', f'Importe="{texto}"').replace('"499.90"', f'"{texto}"')
+    )
+    percepcion, deduccion, _ = cfdi.conceptos
+    assert deduccion.importe == Decimal("0.0000")
+    assert percepcion.importe_exento == Decimal("0.0000")
+    assert percepcion.importe == Decimal("1000.1000")
@@ -0,0 +1,100 @@
+"""
+Pruebas de la reservación de consecutivos de los bancos
+"""
+
+from datetime import datetime
+
+import pytest
+
+from pjecz_perseo_flask.blueprints.bancos.consecutivos import reservar_consecutivos
+from pjecz_perseo_flask.blueprints.bancos.models import Banco
+from pjecz_perseo_flask.blueprints.bancos.tasks import reiniciar_consecutivos_generados
+from pjecz_perseo_flask.lib.exceptions import MyNotExistsError
+
+MODIFICADO = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def agregar_bancos(sesion) -> tuple:
+    """Agregar dos bancos, solo el primero tiene el consecutivo distinto al generado"""
+    banamex = Banco(
+        clave="2",
+        clave_dispersion_pensionados="002",
+        nombre="BANAMEX",
+        consecutivo=100,
+        consecutivo_generado=130,
+        modificado=MODIFICADO,
+    )
+    previvale = Banco(
+        clave="9",
+        clave_dispersion_pensionados="009",
+        nombre="PREVIVALE",
+        consecutivo=500,
+        consecutivo_generado=500,
+        modificado=MODIFICADO,
+    )
+    sesion.add_all([banamex, previvale])
+    sesion.commit()
+    return banamex.id, previvale.id
+
+
+def consultar(sesion, banco_id: int) -> Banco:
+    """Consultar el banco desde la base de datos"""
+    sesion.expire_all()
+    return sesion.get(Banco, banco_id)
+
+
+def test_reservar_bloques_seguidos(sesion):
+    """Cada reservación entrega el consecutivo anterior a su bloque y el siguiente bloque empieza donde terminó"""
+    banamex_id, previvale_id = agregar_bancos(sesion)
+    assert reservar_consecutivos({banamex_id: 10, previvale_id: 3}) == {banamex_id: 130, previvale_id: 500}
+    assert reservar_consecutivos({banamex_id: 5}) == {banamex_id: 140}
+    sesion.commit()
+    assert consultar(sesion, banamex_id).consecutivo_generado == 145
+    assert consultar(sesion, previvale_id).consecutivo_generado == 503
+
+
+def test_reservar_reiniciando(sesion):
+    """Al reiniciar el bloque comienza en el consecutivo, no en el generado"""
+    banamex_id, _ = agregar_bancos(sesion)
+    assert reservar_consecutivos({banamex_id: 10}, reiniciar=True) == {banamex_id: 100}
+    sesion.commit()
+    assert consultar(sesion, banamex_id).consecutivo_generado == 110
+
+
+def test_rollback_devuelve_el_bloque(sesion):
+    """Si el generador falla antes de su commit, el bloque reservado se devuelve"""
+    banamex_id, _ = agregar_bancos(sesion)
+    reservar_consecutivos({banamex_id: 10})
+    sesion.rollback()
+    assert consultar(sesion, banamex_id).consecutivo_generado == 130
+
+
+def test_reservar_conserva_modificado(sesion):
+    """El consecutivo generado es un resultado de los generadores, no cambia modificado"""
+    banamex_id, _ = agregar_bancos(sesion)
+    reservar_consecutivos({banamex_id: 10})
+    sesion.commit()
+    assert consultar(sesion, banamex_id).modificado == MODIFICADO
+
+
+def test_reservar_sin_cantidades(sesion):
+    """Sin cantidades no se reserva nada"""
+    assert reservar_consecutivos({}) == {}
+
+
+def test_reservar_banco_inexistente(sesion):
+    """Si falta algún banco se provoca error"""
+    banamex_id, _ = agregar_bancos(sesion)
+    with pytest.raises(MyNotExistsError):
+        reservar_consecutivos({banamex_id: 1, banamex_id + 100: 1})
+
+
+def test_reiniciar_consecutivos_generados(sesion):
+    """Reiniciar iguala el consecutivo generado al consecutivo, solo en los bancos que son distintos"""
+    banamex_id, previvale_id = agregar_bancos(sesion)
+    assert reiniciar_consecutivos_generados() == "Reiniciar Consecutivos Generados: 1 cambios en BANAMEX 130 -> 100"
+    banamex = consultar(sesion, banamex_id)
+    assert banamex.consecutivo_generado == 100
+    assert banamex.modificado == MODIFICADO
+    assert consultar(sesion, previvale_id).consecutivo_generado == 500
+    assert reiniciar_consecutivos_generados() == "No se hicieron actualizaciones."
@@ -0,0 +1,93 @@
+"""
+Pruebas de la paginación con cursor de DataTables
+"""
+
+from datetime import date
+
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
+from pjecz_perseo_flask.lib.datatables import encode_datatable_cursor, get_datatable_cursor, paginate_datatable
+from pjecz_perseo_flask.main import app
+
+
+def llenar(sesion, quincenas: int, filas: int):
+    """Insertar quincenas y nóminas, varias por quincena para que la primera columna tenga empates"""
+    sesion.execute(
+        Quincena.__table__.insert(),
+        [{"clave": f"2024{numero + 1:02d}", "estado": "CERRADA"} for numero in range(quincenas)],
+    )
+    sesion.execute(
+        Nomina.__table__.insert(),
+        [
+            {
+                "centro_trabajo_id": 1,
+                "persona_id": numero + 1,
+                "plaza_id": 1,
+                "quincena_id": numero % quincenas + 1,
+                "tipo": "SALARIO",
+                "desde": date(2024, 1, 1),
+                "desde_clave": "240101",
+                "hasta": date(2024, 1, 15),
+                "hasta_clave": "240115",
+                "percepcion": 100,
+                "deduccion": 10,
+                "importe": 90,
+                "fecha_pago": date(2024, 1, 15),
+            }
+            for numero in range(filas)
+        ],
+    )
+    sesion.commit()
+
+
+def leer_cursor(cursor):
+    """Leer el cursor como lo manda DataTables en el formulario"""
+    with app.test_request_context(method="POST", data={"cursor": cursor}):
+        return get_datatable_cursor()
+
+
+def test_cursor_igual_que_offset(sesion):
+    """Recorrer las páginas con el cursor entrega los mismos renglones, en el mismo orden, que con offset"""
+    llenar(sesion, quincenas=4, filas=23)
+    consulta = Nomina.query.join(Quincena).filter(Nomina.estatus == "A")
+    columnas = (Quincena.clave, Nomina.id)
+
+    # Con offset, página por página
+    con_offset = []
+    for start in range(0, 23, 5):
+        registros, _ = paginate_datatable(consulta, columnas, start, 5)
+        con_offset.extend(registro.id for registro in registros)
+
+    # Con el cursor que entrega la página anterior
+    con_cursor = []
+    registros, cursor = paginate_datatable(consulta, columnas, 0, 5)
+    while registros:
+        con_cursor.extend(registro.id for registro in registros)
+        registros, cursor = paginate_datatable(consulta, columnas, len(con_cursor), 5, leer_cursor(cursor))
+
+    assert len(con_offset) == 23
+    assert con_cursor == con_offset
+    assert cursor is None
+
+
+def test_cursor_respeta_filtros(sesion):
+    """El cursor se agrega a los filtros de la consulta, no los reemplaza"""
+    llenar(sesion, quincenas=3, filas=12)
+    consulta = Nomina.query.join(Quincena).filter(Nomina.quincena_id == 2)
+    columnas = (Quincena.clave, Nomina.id)
+    registros, cursor = paginate_datatable(consulta, columnas, 0, 2)
+    siguientes, _ = paginate_datatable(consulta, columnas, 2, 10, leer_cursor(cursor))
+    assert [registro.quincena_id for registro in registros + siguientes] == [2, 2, 2, 2]
+
+
+def test_codificar_y_leer_cursor():
+    """El cursor opaco se lee con los mismos valores"""
+    assert leer_cursor(encode_datatable_cursor(("202401", 17))) == ["202401", 17]
+
+
+def test_cursor_invalido():
+    """Si el cursor no viene o no se puede leer se entrega None, y se pagina con offset"""
+    assert leer_cursor("") is None
+    assert leer_cursor("no es base64!") is None
+    assert leer_cursor(encode_datatable_cursor([None])) is None
+    assert leer_cursor(encode_datatable_cursor([1.5])) is None
@@ -0,0 +1,112 @@
+"""
+Pruebas de la huella de las entradas de los generadores
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import update
+
+from pjecz_perseo_flask.blueprints.nominas.generators.common import calcular_huella, reutilizar_quincena_producto
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
+from pjecz_perseo_flask.blueprints.quincenas_productos.models import QuincenaProducto
+
+
+def agregar_nomina(sesion, quincena_id: int, persona_id: int, tipo: str = "SALARIO") -> Nomina:
+    """Agregar una nómina de la persona en la quincena"""
+    nomina = Nomina(
+        centro_trabajo_id=1,
+        persona_id=persona_id,
+        plaza_id=1,
+        quincena_id=quincena_id,
+        tipo=tipo,
+        desde=date(2024, 1, 1),
+        desde_clave="240101",
+        hasta=date(2024, 1, 15),
+        hasta_clave="240115",
+        percepcion=100,
+        deduccion=10,
+        importe=90,
+        fecha_pago=date(2024, 1, 15),
+    )
+    sesion.add(nomina)
+    sesion.commit()
+    return nomina
+
+
+def agregar_quincenas(sesion) -> tuple:
+    """Agregar dos quincenas abiertas"""
+    primera = Quincena(clave="202401", estado="ABIERTA")
+    segunda = Quincena(clave="202402", estado="ABIERTA")
+    sesion.add_all([primera, segunda])
+    sesion.commit()
+    return primera.id, segunda.id
+
+
+def test_huella_sin_cambios(sesion):
+    """Sin cambios en las entradas la huella es la misma, con otros parámetros es distinta"""
+    quincena_id, _ = agregar_quincenas(sesion)
+    agregar_nomina(sesion, quincena_id, 1)
+    huella = calcular_huella(quincena_id, "NOMINAS", "SALARIO")
+    assert len(huella) == 64
+    assert calcular_huella(quincena_id, "NOMINAS", "SALARIO") == huella
+    assert calcular_huella(quincena_id, "NOMINAS", "SALARIO", True) != huella
+    assert calcular_huella(quincena_id, "MONEDEROS", "SALARIO") != huella
+
+
+def test_huella_cambia_con_las_nominas(sesion):
+    """La huella cambia al agregar o modificar nóminas de la quincena y del tipo, no las de otras"""
+    quincena_id, otra_quincena_id = agregar_quincenas(sesion)
+    nomina = agregar_nomina(sesion, quincena_id, 1)
+    huella = calcular_huella(quincena_id, "NOMINAS", "SALARIO")
+
+    # Las nóminas de otra quincena o de otro tipo no cambian la huella
+    agregar_nomina(sesion, otra_quincena_id, 2)
+    agregar_nomina(sesion, quincena_id, 3, tipo="DESPENSA")
+    assert calcular_huella(quincena_id, "NOMINAS", "SALARIO") == huella
+
+    # Modificar la nómina de la quincena y del tipo cambia la huella
+    sesion.execute(update(Nomina).where(Nomina.id == nomina.id).values(modificado=datetime(2030, 1, 1)))
+    sesion.commit()
+    modificada = calcular_huella(quincena_id, "NOMINAS", "SALARIO")
+    assert modificada != huella
+
+    # Agregar una nómina de la quincena y del tipo cambia la huella
+    agregar_nomina(sesion, quincena_id, 4)
+    assert calcular_huella(quincena_id, "NOMINAS", "SALARIO") not in (huella, modificada)
+
+
+def test_reutilizar_archivo_misma_huella(sesion):
+    """Con la misma huella se copia el archivo de la quincena_producto anterior a la que se está generando"""
+    quincena_id, _ = agregar_quincenas(sesion)
+    anterior = QuincenaProducto(
+        quincena_id=quincena_id,
+        fuente="NOMINAS",
+        huella="H" * 64,
+        archivo="nominas.xlsx",
+        url="https://storage/nominas.xlsx",
+        es_satisfactorio=True,
+        mensajes="Se generaron 10 nominas",
+    ).save()
+    generando = QuincenaProducto(quincena_id=quincena_id, fuente="NOMINAS", mensajes="Generando").save()
+
+    mensaje = reutilizar_quincena_producto(generando.id, quincena_id, "NOMINAS", "H" * 64)
+    assert mensaje == "Sin cambios en las entradas, se entrega el archivo nominas.xlsx"
+    sesion.refresh(generando)
+    assert generando.archivo == anterior.archivo
+    assert generando.url == anterior.url
+    assert generando.es_satisfactorio is True
+    assert generando.huella == "H" * 64
+    assert generando.mensajes.split("\n") == ["Se generaron 10 nominas", mensaje]
+
+
+def test_no_reutilizar_sin_archivo_o_con_otra_huella(sesion):
+    """Sin archivo, con otra huella o con otra fuente no se reutiliza y se entrega texto vacío"""
+    quincena_id, _ = agregar_quincenas(sesion)
+    QuincenaProducto(quincena_id=quincena_id, fuente="NOMINAS", huella="H" * 64, archivo="").save()
+    QuincenaProducto(quincena_id=quincena_id, fuente="MONEDEROS", huella="H" * 64, archivo="monederos.xlsx").save()
+    QuincenaProducto(quincena_id=quincena_id, fuente="NOMINAS", huella="O" * 64, archivo="nominas.xlsx").save()
+    generando = QuincenaProducto(quincena_id=quincena_id, fuente="NOMINAS").save()
+    assert reutilizar_quincena_producto(generando.id, quincena_id, "NOMINAS", "H" * 64) == ""
+    sesion.refresh(generando)
+    assert generando.archivo == ""
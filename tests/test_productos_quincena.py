@@ -0,0 +1,154 @@
+"""
+Pruebas del generador de los productos de la quincena
+"""
+
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from pjecz_perseo_flask.blueprints.bancos.models import Banco
+from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
+from pjecz_perseo_flask.blueprints.cuentas.models import Cuenta
+from pjecz_perseo_flask.blueprints.nominas.generators import productos_quincena
+from pjecz_perseo_flask.blueprints.nominas.generators.monederos import crear_monederos
+from pjecz_perseo_flask.blueprints.nominas.generators.nominas import crear_nominas
+from pjecz_perseo_flask.blueprints.nominas.generators.productos_quincena import crear_productos_quincena
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.personas.models import Persona
+from pjecz_perseo_flask.blueprints.plazas.models import Plaza
+from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
+from pjecz_perseo_flask.blueprints.quincenas_productos.models import QuincenaProducto
+from pjecz_perseo_flask.lib.exceptions import MyEmptyError, MyUploadError
+
+
+@pytest.fixture
+def quincena(sesion, monkeypatch, tmp_path):
+    """Agregar una quincena con una persona modelo 1 y una modelo 3, cada una con SALARIO y DESPENSA"""
+
+    # Guardar los archivos XLSX en un directorio temporal
+    monkeypatch.chdir(tmp_path)
+
+    # Agregar los bancos, el centro de trabajo, la plaza y la quincena
+    banamex = Banco(clave="2", clave_dispersion_pensionados="002", nombre="BANAMEX", consecutivo=100, consecutivo_generado=100)
+    previvale = Banco(
+        clave="9", clave_dispersion_pensionados="009", nombre="PREVIVALE", consecutivo=500, consecutivo_generado=500
+    )
+    centro_trabajo = CentroTrabajo(clave="CT01", descripcion="CENTRO DE TRABAJO")
+    plaza = Plaza(clave="PLAZA01", descripcion="PLAZA")
+    quincena = Quincena(clave="202401", estado="ABIERTA")
+    sesion.add_all([banamex, previvale, centro_trabajo, plaza, quincena])
+    sesion.commit()
+
+    # Agregar las personas con su cuenta de banco, su monedero y sus nóminas
+    for numero, (rfc, modelo) in enumerate((("AAAA000101AAA", 1), ("BBBB000101BBB", 3)), start=1):
+        persona = Persona(
+            tabulador_id=1,
+            rfc=rfc,
+            nombres="NOMBRE",
+            apellido_primero="PRIMERO",
+            apellido_segundo="SEGUNDO",
+            num_empleado=numero,
+            ingreso_gobierno_fecha=date(2000, 1, 1),
+            ingreso_pj_fecha=date(2000, 1, 1),
+            nacimiento_fecha=date(1980, 1, 1),
+            seguridad_social="",
+            modelo=modelo,
+        )
+        sesion.add(persona)
+        sesion.flush()
+        sesion.add(Cuenta(banco_id=banamex.id, persona_id=persona.id, num_cuenta=f"100{numero}"))
+        sesion.add(Cuenta(banco_id=previvale.id, persona_id=persona.id, num_cuenta=f"900{numero}"))
+        for tipo in ("SALARIO", "DESPENSA"):
+            sesion.add(
+                Nomina(
+                    centro_trabajo_id=centro_trabajo.id,
+                    persona_id=persona.id,
+                    plaza_id=plaza.id,
+                    quincena_id=quincena.id,
+                    tipo=tipo,
+                    desde=date(2024, 1, 1),
+                    desde_clave="240101",
+                    hasta=date(2024, 1, 15),
+                    hasta_clave="240115",
+                    percepcion=100,
+                    deduccion=0,
+                    importe=100,
+                    fecha_pago=date(2024, 1, 15),
+                )
+            )
+    sesion.commit()
+    return quincena
+
+
+def agregar_quincena_producto(quincena: Quincena, fuente: str) -> int:
+    """Agregar la quincena_producto de la fuente, entrega su id"""
+    return QuincenaProducto(quincena_id=quincena.id, fuente=fuente, mensajes="").save().id
+
+
+def consultar_nums_cheques(sesion) -> dict:
+    """Consultar por RFC y tipo los números de cheque de las nóminas"""
+    consulta = select(Persona.rfc, Nomina.tipo, Nomina.num_cheque).join(Persona, Nomina.persona_id == Persona.id)
+    return {(rfc, tipo): num_cheque for rfc, tipo, num_cheque in sesion.execute(consulta)}
+
+
+def test_crear_nominas_solo_su_producto(sesion, quincena):
+    """El generador de nóminas usa el de los productos de la quincena, solo con la persona que no es modelo 3"""
+    quincena_producto_id = agregar_quincena_producto(quincena, "NOMINAS")
+    assert "NOMINAS: Se generaron 1 filas" in crear_nominas("202401", quincena_producto_id, fijar_num_cheque=True)
+    assert sesion.get(QuincenaProducto, quincena_producto_id).archivo.startswith("nominas_202401_")
+    assert consultar_nums_cheques(sesion) == {
+        ("AAAA000101AAA", "SALARIO"): "020000101",
+        ("AAAA000101AAA", "DESPENSA"): "",
+        ("BBBB000101BBB", "SALARIO"): "",
+        ("BBBB000101BBB", "DESPENSA"): "",
+    }
+
+
+def test_mismos_cheques_que_todos_los_productos(sesion, quincena):
+    """Los monederos solos reparten los mismos números de cheque que con todos los productos de la quincena"""
+    crear_monederos("202401", agregar_quincena_producto(quincena, "MONEDEROS"), fijar_num_cheque=True)
+    solos = consultar_nums_cheques(sesion)
+    crear_productos_quincena("202401", fijar_num_cheque=True, forzar=True)
+    todos = consultar_nums_cheques(sesion)
+    assert {llave: solos[llave] for llave in solos if llave[1] == "DESPENSA"} == {
+        llave: todos[llave] for llave in todos if llave[1] == "DESPENSA"
+    }
+    assert todos[("BBBB000101BBB", "SALARIO")] == "020000102"
+
+
+def test_sin_filas(sesion, quincena):
+    """Si el producto no tiene filas se provoca error y se deja el mensaje en su quincena_producto"""
+    sesion.query(Cuenta).delete()
+    sesion.commit()
+    quincena_producto_id = agregar_quincena_producto(quincena, "NOMINAS")
+    with pytest.raises(MyEmptyError):
+        crear_nominas("202401", quincena_producto_id)
+    assert sesion.get(QuincenaProducto, quincena_producto_id).mensajes == "No hubo filas que agregar al archivo XLSX"
+
+
+def test_fallo_al_subir_no_deja_huecos(sesion, quincena, monkeypatch):
+    """Si falla la subida del archivo XLSX, se devuelven los consecutivos reservados y no se fijan números de cheque"""
+
+    # Configurar un depósito y provocar error al subir
+    def subir_con_error(**kwargs):
+        raise MyUploadError("Error al subir el archivo XLSX")
+
+    monkeypatch.setattr(
+        productos_quincena,
+        "get_settings",
+        lambda: SimpleNamespace(CLOUD_STORAGE_DEPOSITO="deposito", CONSERVAR_COPIA_LOCAL=False),
+    )
+    monkeypatch.setattr(productos_quincena, "upload_fileobj_to_gcs", subir_con_error)
+
+    # Crear las nóminas
+    quincena_producto_id = agregar_quincena_producto(quincena, "NOMINAS")
+    with pytest.raises(MyUploadError):
+        crear_nominas("202401", quincena_producto_id, fijar_num_cheque=True)
+
+    # El banco conserva su consecutivo generado, las nóminas no tienen número de cheque y queda el mensaje del error
+    sesion.expire_all()
+    assert sesion.scalars(select(Banco.consecutivo_generado).where(Banco.clave == "2")).one() == 100
+    assert set(consultar_nums_cheques(sesion).values()) == {""}
+    assert sesion.get(QuincenaProducto, quincena_producto_id).mensajes == "Error al subir el archivo XLSX"
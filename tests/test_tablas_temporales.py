@@ -0,0 +1,140 @@
+"""
+Pruebas de alimentar la quincena con tablas temporales
+"""
+
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import select
+
+from cli.commands.tablas_temporales import alimentar_con_tablas_temporales
+from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
+from pjecz_perseo_flask.blueprints.conceptos.models import Concepto
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.percepciones_deducciones.models import PercepcionDeduccion
+from pjecz_perseo_flask.blueprints.personas.models import Persona
+from pjecz_perseo_flask.blueprints.plazas.models import Plaza
+from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
+
+RFC = ("AAAA000101AAA", "BBBB000101BBB", "CCCC000101CCC")
+
+
+def agregar_catalogo(sesion) -> tuple:
+    """Agregar la quincena, el centro de trabajo, la plaza, el concepto P01 y las personas, entrega sus id"""
+    quincena = Quincena(clave="202401", estado="ABIERTA")
+    centro_trabajo = CentroTrabajo(clave="CT01", descripcion="CENTRO DE TRABAJO")
+    plaza = Plaza(clave="PLAZA01", descripcion="PLAZA")
+    concepto = Concepto(clave="P01", descripcion="SUELDO")
+    personas = [
+        Persona(
+            tabulador_id=1,
+            rfc=rfc,
+            nombres="NOMBRE",
+            apellido_primero="PRIMERO",
+            apellido_segundo="SEGUNDO",
+            num_empleado=numero,
+            ingreso_gobierno_fecha=date(2000, 1, 1),
+            ingreso_pj_fecha=date(2000, 1, 1),
+            nacimiento_fecha=date(1980, 1, 1),
+            seguridad_social="",
+            modelo=1,
+        )
+        for numero, rfc in enumerate(RFC, start=1)
+    ]
+    sesion.add_all([quincena, centro_trabajo, plaza, concepto, *personas])
+    sesion.commit()
+    return quincena.id, centro_trabajo.id, plaza.id, concepto.id, [persona.id for persona in personas]
+
+
+def preparar(rfcs: list) -> tuple:
+    """Preparar las filas y las percepciones-deducciones de la explotación con una fila SALARIO por RFC"""
+    filas = pd.DataFrame(
+        [
+            {
+                "fila": fila,
+                "centro_trabajo_clave": "CT01",
+                "plaza_clave": "PLAZA01",
+                "rfc": rfc,
+                "nombres": "NOMBRE",
+                "apellido_primero": "PRIMERO",
+                "apellido_segundo": "SEGUNDO",
+                "modelo": 1,
+                "nivel": 1,
+                "num_empleado": RFC.index(rfc) + 1,
+                "puesto_clave": "ND",
+                "quinquenios": None,
+                "quinquenios_ingreso": None,
+                "desde": date(2024, 1, 1),
+                "desde_clave": "240101",
+                "hasta": date(2024, 1, 15),
+                "hasta_clave": "240115",
+                "percepcion": 100,
+                "deduccion": 0,
+                "importe": 100,
+                "tipo": "SALARIO",
+            }
+            for fila, rfc in enumerate(rfcs, start=1)
+        ]
+    ).astype(object)
+    conceptos = pd.DataFrame(
+        [{"fila": fila, "bloque": 1, "concepto_clave": "P01", "importe": 100} for fila in range(1, len(rfcs) + 1)]
+    ).astype(object)
+    return filas, conceptos
+
+
+def alimentar(sesion, quincena_id: int, rfcs: list) -> dict:
+    """Alimentar la quincena con la explotación de los RFC"""
+    filas, conceptos = preparar(rfcs)
+    reportes = alimentar_con_tablas_temporales(filas, conceptos, quincena_id, date(2024, 1, 15), 1, 1)
+    sesion.commit()
+    return reportes
+
+
+def test_dar_de_baja_solo_de_la_explotacion(sesion):
+    """Al volver a alimentar, lo que ya no viene se da de baja, pero no el SALARIO que alimentó otro archivo"""
+    quincena_id, centro_trabajo_id, plaza_id, concepto_id, (persona_a, persona_b, persona_c) = agregar_catalogo(sesion)
+
+    # Alimentar la explotación con las personas A y B
+    alimentar(sesion, quincena_id, [RFC[0], RFC[1]])
+
+    # Alimentar como los salarios RL la persona C, sin fuente
+    sesion.add_all(
+        [
+            Nomina(
+                centro_trabajo_id=centro_trabajo_id,
+                persona_id=persona_c,
+                plaza_id=plaza_id,
+                quincena_id=quincena_id,
+                tipo="SALARIO",
+                desde=date(2024, 1, 1),
+                desde_clave="240101",
+                hasta=date(2024, 1, 15),
+                hasta_clave="240115",
+                percepcion=100,
+                deduccion=0,
+                importe=100,
+                fecha_pago=date(2024, 1, 15),
+            ),
+            PercepcionDeduccion(
+                centro_trabajo_id=centro_trabajo_id,
+                concepto_id=concepto_id,
+                persona_id=persona_c,
+                plaza_id=plaza_id,
+                quincena_id=quincena_id,
+                tipo="SALARIO",
+                importe=100,
+            ),
+        ]
+    )
+    sesion.commit()
+
+    # Volver a alimentar la explotación sin la persona B
+    reportes = alimentar(sesion, quincena_id, [RFC[0]])
+    assert reportes["nominas_bajas"] == 1
+    assert reportes["percepciones_deducciones_bajas"] == 1
+
+    # La persona B se dio de baja, la persona C que alimentó otro archivo sigue vigente
+    esperado = {persona_a: "A", persona_b: "B", persona_c: "A"}
+    for modelo in (Nomina, PercepcionDeduccion):
+        estatus = dict(sesion.execute(select(modelo.persona_id, modelo.estatus)).all())
+        assert estatus == esperado
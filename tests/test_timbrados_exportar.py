@@ -0,0 +1,101 @@
+"""
+Pruebas de exportar los timbrados con sus deducciones a un archivo XLSX
+"""
+
+from datetime import date, datetime
+
+from openpyxl import load_workbook
+
+from pjecz_perseo_flask.blueprints.centros_trabajos.models import CentroTrabajo
+from pjecz_perseo_flask.blueprints.nominas.models import Nomina
+from pjecz_perseo_flask.blueprints.personas.models import Persona
+from pjecz_perseo_flask.blueprints.plazas.models import Plaza
+from pjecz_perseo_flask.blueprints.quincenas.models import Quincena
+from pjecz_perseo_flask.blueprints.timbrados.models import Timbrado
+from pjecz_perseo_flask.blueprints.timbrados.tasks import exportar_xlsx
+from pjecz_perseo_flask.blueprints.timbrados_conceptos.models import TimbradoConcepto
+
+
+def agregar_timbrado(sesion, quincena: Quincena, centro_trabajo: CentroTrabajo, plaza: Plaza, numero: int) -> Timbrado:
+    """Agregar una persona con su nómina SALARIO y su timbrado"""
+    persona = Persona(
+        tabulador_id=1,
+        rfc=f"AAAA00010{numero}AAA",
+        nombres="NOMBRE",
+        apellido_primero="PRIMERO",
+        apellido_segundo="SEGUNDO",
+        num_empleado=numero,
+        ingreso_gobierno_fecha=date(2000, 1, 1),
+        ingreso_pj_fecha=date(2000, 1, 1),
+        nacimiento_fecha=date(1980, 1, 1),
+        seguridad_social="",
+        modelo=1,
+    )
+    nomina = Nomina(
+        centro_trabajo=centro_trabajo,
+        persona=persona,
+        plaza=plaza,
+        quincena=quincena,
+        tipo="SALARIO",
+        desde=date(2024, 1, 1),
+        desde_clave="240101",
+        hasta=date(2024, 1, 15),
+        hasta_clave="240115",
+        percepcion=1500,
+        deduccion=265.50,
+        importe=1234.50,
+        fecha_pago=date(2024, 1, 15),
+    )
+    timbrado = Timbrado(
+        nomina=nomina,
+        estado="TIMBRADO",
+        tfd="",
+        cfdi_emisor_rfc="PJE901211TI9",
+        cfdi_emisor_nombre="PODER JUDICIAL",
+        cfdi_emisor_regimen_fiscal="603",
+        cfdi_receptor_rfc=persona.rfc,
+        cfdi_receptor_nombre="NOMBRE PRIMERO SEGUNDO",
+        tfd_version="1.1",
+        tfd_uuid=f"UUID-{numero}",
+        tfd_fecha_timbrado=datetime(2024, 1, 15, 10, 20, 30),
+        tfd_sello_cfd="",
+        tfd_num_cert_sat="",
+        tfd_sello_sat="",
+        nomina12_nomina_version="1.2",
+        nomina12_nomina_tipo_nomina="O",
+        nomina12_nomina_fecha_pago=date(2024, 1, 15),
+        nomina12_nomina_fecha_inicial_pago=date(2024, 1, 1),
+        nomina12_nomina_fecha_final_pago=date(2024, 1, 15),
+        nomina12_nomina_total_percepciones=1500,
+        nomina12_nomina_total_deducciones=265.50,
+        nomina12_nomina_total_otros_pagos=0,
+    )
+    sesion.add_all([persona, nomina, timbrado])
+    return timbrado
+
+
+def test_avisar_timbrados_sin_conceptos(sesion, monkeypatch, tmp_path):
+    """Los timbrados sin conceptos guardados no quedan en el archivo XLSX y se avisa cómo guardarlos"""
+    monkeypatch.chdir(tmp_path)
+
+    # Agregar dos timbrados, solo el primero con sus conceptos guardados
+    quincena = Quincena(clave="202401", estado="ABIERTA")
+    centro_trabajo = CentroTrabajo(clave="CT01", descripcion="CENTRO DE TRABAJO")
+    plaza = Plaza(clave="PLAZA01", descripcion="PLAZA")
+    con_conceptos = agregar_timbrado(sesion, quincena, centro_trabajo, plaza, 1)
+    agregar_timbrado(sesion, quincena, centro_trabajo, plaza, 2)
+    sesion.add(
+        TimbradoConcepto(timbrado=con_conceptos, tipo="DEDUCCION", tipo_sat="002", clave="D01", concepto="ISR", importe=265.50)
+    )
+    sesion.commit()
+
+    # Exportar, el mensaje de término avisa del timbrado sin conceptos
+    mensaje_termino, nombre_archivo_xlsx, _ = exportar_xlsx("202401", "SALARIO")
+    assert "Hubo 1 timbrados sin conceptos" in mensaje_termino
+    assert "cli timbrados actualizar-conceptos 202401 --tipo SALARIO" in mensaje_termino
+
+    # El archivo XLSX solo tiene el timbrado con conceptos
+    ruta = next(tmp_path.rglob(nombre_archivo_xlsx))
+    renglones = list(load_workbook(ruta).active.iter_rows(values_only=True))
+    assert len(renglones) == 2
+    assert renglones[1][1] == "AAAA000101AAA"